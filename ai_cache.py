@@ -0,0 +1,129 @@
+# ai_cache.py
+"""Two-tier cache for Gemini analysis results.
+
+Keys are a hash of the normalised observation text, floor input, location and the
+prompt version (see ai_module.PROMPT_VERSION), so re-submissions and duplicate reports of
+the same hazard skip the model call entirely.
+
+- Memory tier: a per-process LRU with TTL, bounded by the approximate size of the cached
+  results rather than by entry count.
+- Database tier: the ai_analysis_cache table, shared by every gunicorn worker and kept
+  across restarts.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+from cachetools import TTLCache
+
+import database
+
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+AI_CACHE_MEMORY_MAX_BYTES = int(os.getenv('AI_CACHE_MEMORY_MAX_BYTES', str(8 * 1024 * 1024)))
+AI_CACHE_MEMORY_TTL_SECONDS = float(os.getenv('AI_CACHE_MEMORY_TTL_SECONDS', '3600'))
+AI_CACHE_DB_TTL_SECONDS = float(os.getenv('AI_CACHE_DB_TTL_SECONDS', str(30 * 24 * 3600)))
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION_RE = re.compile(r'[\s.!,;:]+$')
+
+
+def _normalise(value):
+    """Case, whitespace and trailing punctuation differences don't change the analysis."""
+    value = _WHITESPACE_RE.sub(' ', str(value or '')).strip().lower()
+    return _TRAILING_PUNCTUATION_RE.sub('', value)
+
+
+def make_key(observation_text, floor_input, location, prompt_version):
+    """Returns the content-addressed cache key for one analysis request."""
+    payload = json.dumps([_normalise(observation_text), _normalise(floor_input), _normalise(location), prompt_version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _result_size(result):
+    return len(json.dumps(result))
+
+
+_memory = TTLCache(maxsize=AI_CACHE_MEMORY_MAX_BYTES, ttl=AI_CACHE_MEMORY_TTL_SECONDS, getsizeof=_result_size)
+_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'db_errors': 0}
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+def get(key):
+    """Returns a copy of the cached analysis for `key`, or None."""
+    if not AI_CACHE_ENABLED:
+        return None
+    with _lock:
+        result = _memory.get(key)
+        if result is not None:
+            _stats['memory_hits'] += 1
+            return dict(result)
+
+    try:
+        result = database.get_cached_ai_analysis(key, AI_CACHE_DB_TTL_SECONDS)
+    except Exception as e:
+        # The cache must never make an analysis fail; fall through to the model.
+        print(f"AI Cache: Database lookup failed: {e}")
+        _count('db_errors')
+        result = None
+
+    if result is None:
+        _count('misses')
+        return None
+    _count('db_hits')
+    _remember(key, result)
+    return dict(result)
+
+
+def put(key, prompt_version, result):
+    """Stores an analysis in both tiers."""
+    if not AI_CACHE_ENABLED:
+        return
+    _remember(key, result)
+    _count('stores')
+    try:
+        database.store_cached_ai_analysis(key, prompt_version, result)
+    except Exception as e:
+        print(f"AI Cache: Database store failed: {e}")
+        _count('db_errors')
+
+
+def _remember(key, result):
+    with _lock:
+        try:
+            _memory[key] = dict(result)
+        except ValueError:
+            pass  # Larger than the whole memory tier; keep it in the database only.
+
+
+def invalidate(current_prompt_version=None):
+    """Clears the memory tier and deletes database entries.
+
+    With `current_prompt_version`, only entries made with other prompt versions are deleted
+    (they can no longer be hit anyway); without it, everything is deleted.
+    Returns the number of database rows removed.
+    """
+    with _lock:
+        _memory.clear()
+    return database.delete_cached_ai_analyses(keep_prompt_version=current_prompt_version)
+
+
+def get_cache_stats():
+    """Returns hit/miss counters for this process plus the memory tier's current size."""
+    with _lock:
+        stats = dict(_stats)
+        stats.update({
+            'memory_entries': len(_memory),
+            'memory_bytes': int(_memory.currsize),
+            'memory_max_bytes': int(_memory.maxsize),
+        })
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else None
+    return stats
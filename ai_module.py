@@ -1,88 +1,589 @@
 import os
 import json
+import hashlib
+import random
+import threading
+import time
 import traceback
-import google.generativeai as genai
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 
+import ai_cache
+import floor_normalizer
+import metrics
+
 load_dotenv()
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+AI_MODEL_NAME = 'gemini-1.5-flash-latest'
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    try:
-        ai_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        print("AI Module: Gemini AI Model initialized successfully.")
-    except Exception as e:
-        print(f"AI Module ERROR: Could not initialize Gemini: {e}")
-        ai_model = None
-else:
-    print("AI Module WARNING: GEMINI_API_KEY not found in .env file.")
-    ai_model = None
+# The Gemini client library takes about half a second to import, so it is loaded and
+# configured by get_model() on the first analysis rather than when the app starts.
+# Benchmarks install a stand-in model by assigning ai_model directly.
+ai_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
 
-def get_ai_analysis(observation_text, floor_input, location):
-    if not ai_model:
-        return {k: "AI Error - Model Not Initialized" for k in ['CorrectedDescription', 'StandardizedFloor', 'ImpactOnOperations', 'Likelihood', 'Severity', 'CorrectiveAction', 'ResponsiblePerson', 'DeadlineSuggestion']}
+def get_model():
+    """Returns the Gemini model, creating it on first use; None without GEMINI_API_KEY."""
+    global ai_model, _model_loaded
+    if ai_model is not None or _model_loaded:
+        return ai_model
+    with _model_lock:
+        if ai_model is None and not _model_loaded:
+            if GEMINI_API_KEY:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                try:
+                    ai_model = genai.GenerativeModel(AI_MODEL_NAME)
+                    print("AI Module: Gemini AI Model initialized successfully.")
+                except Exception as e:
+                    print(f"AI Module ERROR: Could not initialize Gemini: {e}")
+            else:
+                print("AI Module WARNING: GEMINI_API_KEY not found in .env file.")
+            _model_loaded = True
+    return ai_model
 
-    valid_floors_list = [
-        "basement 4", "basement 3", "basement 2", "basement 1", "groundfloor",
-        "first floor", "second floor", "third floor", "forth floor", "fifth floor",
-        "sixth floor", "seventh floor", "eighth floor", "nineth floor", "roof top"
-    ]
-    
-    prompt = f"""
+AI_RESULT_KEYS = ['CorrectedDescription', 'StandardizedFloor', 'ImpactOnOperations', 'Likelihood', 'Severity', 'CorrectiveAction', 'ResponsiblePerson', 'DeadlineSuggestion']
+
+def is_ai_error(analysis):
+    """True if `analysis` is one of the placeholder results returned when the AI call fails."""
+    return not (isinstance(analysis.get('Likelihood'), int) and isinstance(analysis.get('Severity'), int))
+
+# Placeholder returned when the model could not be reached in time (timeouts, retries used
+# up, circuit breaker open). Unlike the other errors it says nothing about the observation,
+# so callers should try again later rather than record a failure.
+AI_UNAVAILABLE = "AI Error (Unavailable)"
+
+def is_ai_unavailable(analysis):
+    return analysis.get('Likelihood') == AI_UNAVAILABLE
+
+# The standard floor labels for this deployment (see floor_normalizer.FLOOR_SET).
+VALID_FLOORS = floor_normalizer.get_normalizer().floors
+
+# Instructions for the keys of one analysis object; shared by the single and batch prompts.
+ANALYSIS_KEYS_INSTRUCTIONS = """    -   "CorrectedDescription": A professionally rephrased and spell-checked version of the original observation.
+    -   "ImpactOnOperations": Describe the potential impact on hotel operations, guest experience, or staff safety if the hazard is not addressed.
+    -   "Likelihood": An integer from 1 (very unlikely) to 5 (very likely).
+    -   "Severity": An integer from 1 (minor) to 5 (critical).
+    -   "CorrectiveAction": A clear, actionable recommendation.
+    -   "ResponsiblePerson": Assign ONE role from: 'chief engineer', 'head of IT', 'director of marketing', 'director of rooms', 'director of p&c', 'director of f&b', 'director of sales', 'financial controller', 'executive sous chef'.
+    -   "DeadlineSuggestion": Suggest a realistic deadline (e.g., "Immediately", "24 Hours", "1 Week").
+"""
+
+PROMPT_TEMPLATE = """
     Analyze the safety observation from a hotel environment.
-    User's Floor Input: "{floor_input}"
+    {floor_line}
     Location: "{location}"
     Original Observation: "{observation_text}"
 
     Your task is to return a SINGLE, VALID JSON object. Do NOT include any text or markdown formatting before or after the JSON object.
 
     The JSON object must have the following keys:
-    1.  "StandardizedFloor": Analyze the "User's Floor Input". Map it to ONE of the following standard labels: {json.dumps(valid_floors_list)}. Use context clues like "G" for "groundfloor", "B1" for "basement 1". If you cannot confidently map it, return the original "User's Floor Input".
-    2.  "CorrectedDescription": A professionally rephrased and spell-checked version of the original observation.
-    3.  "ImpactOnOperations": Describe the potential impact on hotel operations, guest experience, or staff safety if the hazard is not addressed.
-    4.  "Likelihood": An integer from 1 (very unlikely) to 5 (very likely).
-    5.  "Severity": An integer from 1 (minor) to 5 (critical).
-    6.  "CorrectiveAction": A clear, actionable recommendation.
-    7.  "ResponsiblePerson": Assign ONE role from: 'chief engineer', 'head of IT', 'director of marketing', 'director of rooms', 'director of p&c', 'director of f&b', 'director of sales', 'financial controller', 'executive sous chef'.
-    8.  "DeadlineSuggestion": Suggest a realistic deadline (e.g., "Immediately", "24 Hours", "1 Week").
+{floor_task}{analysis_keys}    """
+
+BATCH_PROMPT_TEMPLATE = """
+    Analyze each of the following {count} safety observations from a hotel environment.
+{observations}
+    Your task is to return a SINGLE, VALID JSON array containing exactly {count} objects, one per observation, in the same order. Do NOT include any text or markdown formatting before or after the JSON array.
+
+    Each object must have the key "Index" (the number of the observation it belongs to) and the following keys:
+{floor_task}{analysis_keys}    """
+
+BATCH_OBSERVATION_TEMPLATE = """
+    Observation {index}:
+    {floor_line}
+    Location: "{location}"
+    Original Observation: "{observation_text}"
+"""
+
+# Only included when floor_normalizer could not map the user's input itself.
+FLOOR_LINE_UNRESOLVED = 'User\'s Floor Input: "{floor_input}"'
+FLOOR_LINE_RESOLVED = 'Floor: "{floor_input}"'
+FLOOR_TASK = """    -   "StandardizedFloor": Analyze the "User's Floor Input". Map it to ONE of the following standard labels: {valid_floors}. Use context clues like "G" for "groundfloor", "B1" for "basement 1". If you cannot confidently map it, return the original "User's Floor Input".
+"""
+
+# Identifies the prompt and model that produced a cached analysis. It is derived from the
+# templates themselves, so editing the prompt automatically stops old cache entries being used.
+PROMPT_VERSION = hashlib.sha256(
+    f"{AI_MODEL_NAME}\n{PROMPT_TEMPLATE}\n{BATCH_PROMPT_TEMPLATE}\n{ANALYSIS_KEYS_INSTRUCTIONS}\n{FLOOR_TASK}\n{VALID_FLOORS}".encode('utf-8')
+).hexdigest()[:16]
+
+# Upper bound on observations per batched model call; larger batches risk truncated output.
+AI_BATCH_MAX_SIZE = int(os.getenv('AI_BATCH_MAX_SIZE', '10'))
+
+# --- Call Policy ---
+# Every model call goes through ModelCallPolicy, which bounds how long it can take and how
+# much load it puts on Gemini. The limits are per process (each gunicorn worker and each
+# analysis process has its own), so size AI_RATE_LIMIT_PER_MINUTE as the API quota divided
+# by the number of processes.
+AI_CALL_TIMEOUT_SECONDS = float(os.getenv('AI_CALL_TIMEOUT_SECONDS', '30'))    # one attempt
+AI_CALL_DEADLINE_SECONDS = float(os.getenv('AI_CALL_DEADLINE_SECONDS', '90'))  # all attempts, waits included
+AI_RETRY_ATTEMPTS = int(os.getenv('AI_RETRY_ATTEMPTS', '3'))
+AI_RETRY_BASE_DELAY_SECONDS = float(os.getenv('AI_RETRY_BASE_DELAY_SECONDS', '1'))
+AI_RETRY_MAX_DELAY_SECONDS = float(os.getenv('AI_RETRY_MAX_DELAY_SECONDS', '20'))
+AI_MAX_CONCURRENT_CALLS = int(os.getenv('AI_MAX_CONCURRENT_CALLS', '4'))
+AI_RATE_LIMIT_PER_MINUTE = float(os.getenv('AI_RATE_LIMIT_PER_MINUTE', '0'))  # 0 disables the limiter
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv('AI_BREAKER_FAILURE_THRESHOLD', '5'))
+AI_BREAKER_RESET_SECONDS = float(os.getenv('AI_BREAKER_RESET_SECONDS', '30'))
+# Number of recent attempts the latency percentiles are computed over.
+AI_LATENCY_WINDOW = 1000
+
+# Errors worth another attempt: overload, rate limiting and network trouble. Anything else
+# (bad request, permission denied) would fail the same way again. The google.api_core
+# exceptions are named here and looked up on the first failure, by which time the model
+# has imported them.
+RETRYABLE_ERRORS = (TimeoutError, ConnectionError)
+RETRYABLE_API_ERRORS = (
+    'TooManyRequests', 'ResourceExhausted', 'ServiceUnavailable', 'InternalServerError',
+    'BadGateway', 'GatewayTimeout', 'DeadlineExceeded', 'Aborted',
+)
+_retryable_errors = None
+
+def is_retryable(error):
+    """True if a failed model call is worth another attempt (see RETRYABLE_ERRORS)."""
+    global _retryable_errors
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    if _retryable_errors is None:
+        from google.api_core import exceptions as google_exceptions
+        _retryable_errors = RETRYABLE_ERRORS + tuple(getattr(google_exceptions, name) for name in RETRYABLE_API_ERRORS)
+    return isinstance(error, _retryable_errors)
+
+
+class AIUnavailableError(Exception):
+    """The model could not be reached in time; `reason` is 'circuit_open', 'rate_limited',
+    'busy' (no free call slot), 'timeout' or 'retries_exhausted'."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """Takes a token, waiting up to `timeout` seconds for one. Returns False if it can't."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Stops calling the model after `threshold` consecutive failures.
+
+    While open, calls fail immediately. After `reset_seconds` one trial call is let through
+    (half-open): success closes the breaker, failure opens it for another period.
     """
-    try:
-        response = ai_model.generate_content(prompt)
-        raw_ai_text = response.text.strip()
-        
-        cleaned_response_text = raw_ai_text
-        if cleaned_response_text.startswith("```json"):
-            cleaned_response_text = cleaned_response_text[len("```json"):].strip()
-        if cleaned_response_text.endswith("```"):
-            cleaned_response_text = cleaned_response_text[:-len("```")].strip()
-        
-        if not (cleaned_response_text.startswith("{") and cleaned_response_text.endswith("}")):
-            first_brace = cleaned_response_text.find('{')
-            last_brace = cleaned_response_text.rfind('}')
-            if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                cleaned_response_text = cleaned_response_text[first_brace : last_brace + 1]
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = max(1, threshold)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def cancel_trial(self):
+        """Gives back a half-open trial that was allowed but never made."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("AI Module: Model calls are succeeding again; circuit breaker closed.")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.consecutive_failures >= self.threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.opened_count += 1
+                print(f"AI Module: Circuit breaker opened after {self.consecutive_failures} consecutive failures; "
+                      f"failing fast for {self.reset_seconds:.0f}s.")
+
+    def stats(self):
+        with self._lock:
+            retry_in = self.reset_seconds - (time.monotonic() - self._opened_at) if self.state == self.OPEN else 0
+            return {'state': self.state, 'consecutive_failures': self.consecutive_failures,
+                    'opened_count': self.opened_count, 'retry_in_seconds': round(max(0.0, retry_in), 1)}
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class ModelCallPolicy:
+    """Runs model calls with a deadline, retries, a concurrency limit, a rate limit and a
+    circuit breaker, and keeps latency statistics."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        workers = max(1, AI_MAX_CONCURRENT_CALLS)
+        # Attempts run on their own threads so a hung request can be abandoned at its deadline.
+        # The slot is only freed when the request really returns, so hung requests keep
+        # counting against the limit instead of piling up.
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-call')
+        self._slots = threading.BoundedSemaphore(workers)
+        self._rate_limiter = TokenBucket(AI_RATE_LIMIT_PER_MINUTE / 60, workers) if AI_RATE_LIMIT_PER_MINUTE > 0 else None
+        self.breaker = CircuitBreaker(AI_BREAKER_FAILURE_THRESHOLD, AI_BREAKER_RESET_SECONDS)
+        self._latencies = deque(maxlen=AI_LATENCY_WINDOW)
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'succeeded': 0, 'failed': 0, 'attempts': 0, 'retries': 0, 'timeouts': 0,
+                       'in_flight': 0, 'short_circuited': 0, 'rate_limited': 0, 'busy': 0}
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def _attempt(self, model, prompt, timeout):
+        self._count('in_flight')
+        try:
+            return model.generate_content(prompt, request_options={'timeout': timeout})
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+    def _give_up(self, reason, message, cause=None):
+        if reason in ('rate_limited', 'busy'):
+            self.breaker.cancel_trial()
+        self._count(reason if reason in ('short_circuited', 'rate_limited', 'busy') else 'failed')
+        raise AIUnavailableError('circuit_open' if reason == 'short_circuited' else reason, message) from cause
+
+    def call(self, model, prompt):
+        """Returns `model.generate_content(prompt)`.
+
+        Raises AIUnavailableError if the model can't answer within AI_CALL_DEADLINE_SECONDS,
+        or the error itself if it isn't one worth retrying.
+        """
+        self._count('calls')
+        deadline = time.monotonic() + AI_CALL_DEADLINE_SECONDS
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                self._give_up('short_circuited', "Circuit breaker is open.")
+            if self._rate_limiter and not self._rate_limiter.acquire(deadline - time.monotonic()):
+                self._give_up('rate_limited', "Rate limit leaves no room before the deadline.")
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._give_up('busy', f"All {AI_MAX_CONCURRENT_CALLS} model call slots stayed busy until the deadline.")
+
+            started = time.monotonic()
+            timeout = max(0.0, min(AI_CALL_TIMEOUT_SECONDS, deadline - started))
+            self._count('attempts')
+            future = self._executor.submit(self._attempt, model, prompt, timeout)
+            try:
+                response = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                error = TimeoutError(f"Model call timed out after {timeout:.1f}s")
+                self._count('timeouts')
+            except Exception as e:
+                error = e
             else:
-                raise json.JSONDecodeError("No valid JSON structure found in AI response.", cleaned_response_text, 0)
-        
+                with self._stats_lock:
+                    self._latencies.append(time.monotonic() - started)
+                    self._stats['succeeded'] += 1
+                self.breaker.record_success()
+                return response
+
+            with self._stats_lock:
+                self._latencies.append(time.monotonic() - started)
+            if not is_retryable(error):
+                # The model answered; it just didn't like the request. Not an outage.
+                self.breaker.record_success()
+                self._count('failed')
+                raise error
+            self.breaker.record_failure()
+            # Exponential backoff with full jitter, so workers that failed together don't retry together.
+            delay = random.uniform(0, min(AI_RETRY_MAX_DELAY_SECONDS, AI_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+            if attempt >= AI_RETRY_ATTEMPTS or time.monotonic() + delay >= deadline:
+                reason = 'timeout' if isinstance(error, TimeoutError) else 'retries_exhausted'
+                self._give_up(reason, f"Model call failed after {attempt} attempts: {error}", error)
+            print(f"AI Module: Attempt {attempt} failed ({error}); retrying in {delay:.1f}s.")
+            self._count('retries')
+            time.sleep(delay)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats.update({f'latency_{name}_ms': round(_percentile(latencies, fraction) * 1000, 1)
+                          for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))})
+            stats['latency_max_ms'] = round(latencies[-1] * 1000, 1)
+        stats.update(pid=self.pid, max_concurrent_calls=AI_MAX_CONCURRENT_CALLS, breaker=self.breaker.stats())
+        return stats
+
+
+_call_policy = None
+_call_policy_lock = threading.Lock()
+
+def get_call_policy():
+    """Returns this process's ModelCallPolicy, keyed to the PID like the DB pool so forked
+    workers don't share the parent's threads or breaker."""
+    global _call_policy
+    pid = os.getpid()
+    if _call_policy is not None and _call_policy.pid == pid:
+        return _call_policy
+    with _call_policy_lock:
+        if _call_policy is None or _call_policy.pid != pid:
+            _call_policy = ModelCallPolicy()
+    return _call_policy
+
+def is_available():
+    """False while the circuit breaker is open, i.e. calls would fail immediately."""
+    return not get_call_policy().breaker.is_open()
+
+def get_ai_call_stats():
+    """Returns call counters, latency percentiles and the circuit breaker state for this process."""
+    return get_call_policy().stats()
+
+def _token_counts(response):
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'prompt_token_count', None), getattr(usage, 'candidates_token_count', None)
+
+def _generate(prompt, kind='single'):
+    started = time.monotonic()
+    outcome, response = 'error', None
+    try:
+        response = get_call_policy().call(get_model(), prompt)
+        outcome = 'ok'
+        return response
+    except AIUnavailableError as e:
+        outcome = e.reason
+        raise
+    finally:
+        metrics.observe_ai_call(kind, outcome, time.monotonic() - started, *_token_counts(response))
+
+def get_ai_analysis(observation_text, floor_input, location):
+    """Returns the AI analysis of an observation, from the cache when the same input was seen before."""
+    resolved_floor = floor_normalizer.resolve_floor(floor_input)
+    # Key on the resolved label so that "B1" and "basement 1" share a cache entry.
+    cache_key = ai_cache.make_key(observation_text, resolved_floor or floor_input, location, PROMPT_VERSION)
+    cached = ai_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    analysis = _analyse_with_model(observation_text, floor_input, location, resolved_floor)
+    # Errors are transient (timeouts, parse failures); only cache real analyses.
+    if not is_ai_error(analysis):
+        ai_cache.put(cache_key, PROMPT_VERSION, analysis)
+    return analysis
+
+def get_ai_analysis_batch(observations):
+    """Analyses several observations, sending the uncached ones to the model in batches.
+
+    `observations` is a list of dicts with 'observation_text', 'floor_input' and 'location'.
+    Returns one analysis per input, in the same order. Each batch is a single model call
+    that returns a JSON array; any entry that is missing or fails validation is retried
+    on its own with get_ai_analysis's single-item prompt.
+    """
+    results = [None] * len(observations)
+    misses = []
+    for i, obs in enumerate(observations):
+        resolved_floor = floor_normalizer.resolve_floor(obs['floor_input'])
+        cache_key = ai_cache.make_key(obs['observation_text'], resolved_floor or obs['floor_input'], obs['location'], PROMPT_VERSION)
+        cached = ai_cache.get(cache_key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            misses.append((i, obs, resolved_floor, cache_key))
+
+    for start in range(0, len(misses), max(1, AI_BATCH_MAX_SIZE)):
+        chunk = misses[start:start + max(1, AI_BATCH_MAX_SIZE)]
+        if len(chunk) == 1:
+            batch_results = [None]  # Not worth the batch preamble; use the single prompt.
+        else:
+            batch_results = _analyse_batch_with_model([(obs, resolved_floor) for _, obs, resolved_floor, _ in chunk])
+        for (i, obs, resolved_floor, cache_key), analysis in zip(chunk, batch_results):
+            if analysis is None:
+                analysis = _analyse_with_model(obs['observation_text'], obs['floor_input'], obs['location'], resolved_floor)
+            if not is_ai_error(analysis):
+                ai_cache.put(cache_key, PROMPT_VERSION, analysis)
+            results[i] = analysis
+    return results
+
+def _floor_prompt_parts(floor_input, resolved_floor):
+    if resolved_floor:
+        return FLOOR_LINE_RESOLVED.format(floor_input=resolved_floor)
+    return FLOOR_LINE_UNRESOLVED.format(floor_input=floor_input)
+
+def build_prompt(observation_text, floor_input, location, resolved_floor=None):
+    """Builds the analysis prompt; the floor-mapping task is left out if the floor is already resolved."""
+    return PROMPT_TEMPLATE.format(
+        floor_line=_floor_prompt_parts(floor_input, resolved_floor),
+        floor_task="" if resolved_floor else FLOOR_TASK.format(valid_floors=json.dumps(VALID_FLOORS)),
+        analysis_keys=ANALYSIS_KEYS_INSTRUCTIONS,
+        location=location,
+        observation_text=observation_text,
+    )
+
+def build_batch_prompt(items):
+    """Builds one prompt for several (observation dict, resolved_floor) pairs, numbered from 1."""
+    blocks = [
+        BATCH_OBSERVATION_TEMPLATE.format(
+            index=index,
+            floor_line=_floor_prompt_parts(obs['floor_input'], resolved_floor),
+            location=obs['location'],
+            observation_text=obs['observation_text'],
+        )
+        for index, (obs, resolved_floor) in enumerate(items, 1)
+    ]
+    needs_floor_task = any(resolved_floor is None for _, resolved_floor in items)
+    return BATCH_PROMPT_TEMPLATE.format(
+        count=len(items),
+        observations="".join(blocks),
+        floor_task=FLOOR_TASK.format(valid_floors=json.dumps(VALID_FLOORS)) if needs_floor_task else "",
+        analysis_keys=ANALYSIS_KEYS_INSTRUCTIONS,
+    )
+
+def _extract_json(raw_ai_text, open_char, close_char):
+    """Strips markdown fences and surrounding chatter from a model response."""
+    cleaned_response_text = raw_ai_text.strip()
+    if cleaned_response_text.startswith("```json"):
+        cleaned_response_text = cleaned_response_text[len("```json"):].strip()
+    if cleaned_response_text.endswith("```"):
+        cleaned_response_text = cleaned_response_text[:-len("```")].strip()
+
+    if not (cleaned_response_text.startswith(open_char) and cleaned_response_text.endswith(close_char)):
+        first_brace = cleaned_response_text.find(open_char)
+        last_brace = cleaned_response_text.rfind(close_char)
+        if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
+            cleaned_response_text = cleaned_response_text[first_brace : last_brace + 1]
+        else:
+            raise json.JSONDecodeError("No valid JSON structure found in AI response.", cleaned_response_text, 0)
+    return cleaned_response_text
+
+# Batch entries missing any of these are retried individually rather than defaulted.
+BATCH_REQUIRED_KEYS = ('CorrectedDescription', 'Likelihood', 'Severity', 'CorrectiveAction')
+
+def _build_result(parsed_json_data, observation_text, floor_input, resolved_floor, required_keys=()):
+    """Validates one parsed analysis object and fills in defaults. Raises ValueError if unusable."""
+    if not isinstance(parsed_json_data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(parsed_json_data).__name__}")
+    missing = [key for key in required_keys if key not in parsed_json_data]
+    if missing:
+        raise ValueError(f"Missing keys: {', '.join(missing)}")
+    # --- MODIFIED: Removed 'HazardType' from the final output dict ---
+    return {
+        'StandardizedFloor': resolved_floor or parsed_json_data.get('StandardizedFloor', floor_input),
+        'CorrectedDescription': parsed_json_data.get('CorrectedDescription', f"AI Rephrase Failed. Original: {observation_text}"),
+        'ImpactOnOperations': parsed_json_data.get('ImpactOnOperations', 'N/A'),
+        'Likelihood': int(parsed_json_data.get('Likelihood', 0)),
+        'Severity': int(parsed_json_data.get('Severity', 0)),
+        'CorrectiveAction': parsed_json_data.get('CorrectiveAction', 'N/A'),
+        'ResponsiblePerson': parsed_json_data.get('ResponsiblePerson', 'N/A'),
+        'DeadlineSuggestion': parsed_json_data.get('DeadlineSuggestion', 'N/A'),
+    }
+
+def _analyse_with_model(observation_text, floor_input, location, resolved_floor=None):
+    if not get_model():
+        return {k: "AI Error - Model Not Initialized" for k in AI_RESULT_KEYS}
+
+    prompt = build_prompt(observation_text, floor_input, location, resolved_floor)
+    cleaned_response_text = ""
+    try:
+        response = _generate(prompt)
+        cleaned_response_text = _extract_json(response.text, "{", "}")
         parsed_json_data = json.loads(cleaned_response_text)
-        
-        # --- MODIFIED: Removed 'HazardType' from the final output dict ---
-        final_data = {
-            'StandardizedFloor': parsed_json_data.get('StandardizedFloor', floor_input),
-            'CorrectedDescription': parsed_json_data.get('CorrectedDescription', f"AI Rephrase Failed. Original: {observation_text}"),
-            'ImpactOnOperations': parsed_json_data.get('ImpactOnOperations', 'N/A'),
-            'Likelihood': int(parsed_json_data.get('Likelihood', 0)),
-            'Severity': int(parsed_json_data.get('Severity', 0)),
-            'CorrectiveAction': parsed_json_data.get('CorrectiveAction', 'N/A'),
-            'ResponsiblePerson': parsed_json_data.get('ResponsiblePerson', 'N/A'),
-            'DeadlineSuggestion': parsed_json_data.get('DeadlineSuggestion', 'N/A'),
-        }
-        return final_data
+        return _build_result(parsed_json_data, observation_text, floor_input, resolved_floor)
 
     except (json.JSONDecodeError, ValueError) as je:
+        metrics.count_ai_parse_failure('single')
         print(f"AI Module JSON/Value Error: {je}\nText that failed: {cleaned_response_text[:500]}\n{traceback.format_exc()}")
-        return {k: f"AI Error (Parsing)" for k in ['CorrectedDescription', 'StandardizedFloor', 'ImpactOnOperations', 'Likelihood', 'Severity', 'CorrectiveAction', 'ResponsiblePerson', 'DeadlineSuggestion']}
+        return {k: "AI Error (Parsing)" for k in AI_RESULT_KEYS}
+    except AIUnavailableError as e:
+        if e.reason != 'circuit_open':  # Already reported when the breaker opened.
+            print(f"AI Module: Model unavailable ({e.reason}): {e}")
+        return {k: AI_UNAVAILABLE for k in AI_RESULT_KEYS}
     except Exception as e:
         print(f"AI Module Error in get_ai_analysis: {e}\n{traceback.format_exc()}")
-        return {k: f"AI Error (General)" for k in ['CorrectedDescription', 'StandardizedFloor', 'ImpactOnOperations', 'Likelihood', 'Severity', 'CorrectiveAction', 'ResponsiblePerson', 'DeadlineSuggestion']}
\ No newline at end of file
+        return {k: "AI Error (General)" for k in AI_RESULT_KEYS}
+
+def _analyse_batch_with_model(items):
+    """Analyses (observation dict, resolved_floor) pairs in one model call.
+
+    Returns a list aligned with `items`; entries are None where the batch response had no
+    valid result for that observation (the caller retries those individually). If the model
+    is unavailable every entry is the AI_UNAVAILABLE placeholder instead, as single calls
+    would fail the same way.
+    """
+    if not get_model():
+        return [None] * len(items)
+
+    prompt = build_batch_prompt(items)
+    results = [None] * len(items)
+    try:
+        response = _generate(prompt, kind='batch')
+        parsed = json.loads(_extract_json(response.text, "[", "]"))
+        if not isinstance(parsed, list):
+            raise ValueError("Batch response is not a JSON array.")
+    except AIUnavailableError as e:
+        print(f"AI Module: Model unavailable ({e.reason}) for a batch of {len(items)} observations: {e}")
+        return [{k: AI_UNAVAILABLE for k in AI_RESULT_KEYS} for _ in items]
+    except Exception as e:
+        if isinstance(e, ValueError):  # includes json.JSONDecodeError
+            metrics.count_ai_parse_failure('batch')
+        print(f"AI Module Error in batch analysis of {len(items)} observations: {e}")
+        return results
+
+    for position, entry in enumerate(parsed):
+        # Prefer the model's own Index; fall back to the array position.
+        index = entry.get('Index') if isinstance(entry, dict) else None
+        try:
+            index = int(index) - 1 if index is not None else position
+        except (TypeError, ValueError):
+            index = position
+        if not 0 <= index < len(items) or results[index] is not None:
+            continue
+        obs, resolved_floor = items[index]
+        try:
+            results[index] = _build_result(entry, obs['observation_text'], obs['floor_input'], resolved_floor, BATCH_REQUIRED_KEYS)
+        except (TypeError, ValueError) as e:
+            metrics.count_ai_parse_failure('batch_entry')
+            print(f"AI Module: Invalid batch entry for observation {index + 1}: {e}")
+    return results
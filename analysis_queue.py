@@ -0,0 +1,355 @@
+# analysis_queue.py
+"""Runs AI analysis of saved observations in the background.
+
+The form callback saves an observation with analysis_status 'pending' and calls
+submit_analysis(); a bounded pool of workers calls Gemini and writes the result back
+through database.py, so submit latency no longer depends on model latency.
+
+Two backends are available, chosen with AI_QUEUE_BACKEND:
+- 'thread' (default): an in-process queue served by worker threads. The AI call spends
+  its time waiting on the network, so threads are enough and share the DB pool.
+- 'process': a process pool, for deployments that want AI work fully isolated from the
+  web worker. Results are still written to the database by the parent process.
+
+Both backends also sweep the database while idle, so observations that were never queued
+(queue full, worker restarted mid-analysis) are picked up without manual intervention.
+When the model is unavailable (see ai_module.ModelCallPolicy) observations go back to
+'pending' rather than 'failed', and the sweep waits until the circuit breaker lets calls
+through again.
+"""
+
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+import database
+import ai_module
+
+AI_QUEUE_BACKEND = os.getenv('AI_QUEUE_BACKEND', 'thread')
+AI_QUEUE_WORKERS = int(os.getenv('AI_QUEUE_WORKERS', '2'))
+AI_QUEUE_MAX_SIZE = int(os.getenv('AI_QUEUE_MAX_SIZE', '200'))
+# How often an idle worker checks the database for orphaned work (0 disables the sweep).
+AI_QUEUE_SWEEP_SECONDS = float(os.getenv('AI_QUEUE_SWEEP_SECONDS', '30'))
+# A 'processing' row older than this is assumed to belong to a dead worker.
+AI_QUEUE_STALE_SECONDS = float(os.getenv('AI_QUEUE_STALE_SECONDS', '300'))
+# A thread worker that finds several jobs waiting analyses up to this many in one model call.
+AI_QUEUE_BATCH_SIZE = int(os.getenv('AI_QUEUE_BATCH_SIZE', '5'))
+
+
+def _store_result(observation_id, analysis):
+    if ai_module.is_ai_unavailable(analysis):
+        print(f"Analysis Queue: AI unavailable; observation #{observation_id} stays pending.")
+        database.release_analysis(observation_id)
+    elif ai_module.is_ai_error(analysis):
+        print(f"Analysis Queue: AI analysis failed for observation #{observation_id}.")
+        database.update_observation_analysis(observation_id, None)
+    else:
+        database.update_observation_analysis(observation_id, analysis)
+
+
+def _analyse(job):
+    """Runs one claimed job (a dict from database.claim_analysis) to completion."""
+    try:
+        analysis = ai_module.get_ai_analysis(job['observation_text'], job['floor_input'], job['location'])
+        _store_result(job['id'], analysis)
+    except Exception as e:
+        print(f"Analysis Queue: Error analysing observation #{job['id']}: {e}\n{traceback.format_exc()}")
+        try:
+            database.update_observation_analysis(job['id'], None)
+        except Exception:
+            pass  # Left as 'processing'; the sweep retries it once it goes stale.
+
+
+def _analyse_many(jobs):
+    """Runs several claimed jobs with one batched model call (see ai_module.get_ai_analysis_batch)."""
+    if len(jobs) == 1:
+        _analyse(jobs[0])
+        return
+    try:
+        analyses = ai_module.get_ai_analysis_batch([
+            {'observation_text': job['observation_text'], 'floor_input': job['floor_input'], 'location': job['location']}
+            for job in jobs
+        ])
+    except Exception as e:
+        print(f"Analysis Queue: Batch of {len(jobs)} failed, analysing one by one: {e}")
+        for job in jobs:
+            _analyse(job)
+        return
+    for job, analysis in zip(jobs, analyses):
+        try:
+            _store_result(job['id'], analysis)
+        except Exception as e:
+            print(f"Analysis Queue: Error storing analysis of observation #{job['id']}: {e}")
+
+
+class ThreadQueueBackend:
+    """A bounded in-process queue served by a fixed number of daemon threads."""
+
+    name = 'thread'
+
+    def __init__(self, workers, max_size):
+        self.pid = os.getpid()
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'swept': 0, 'busy': 0}
+        self._threads = [
+            threading.Thread(target=self._run, name=f"ai-analysis-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def submit(self, observation_id):
+        try:
+            self._queue.put_nowait(observation_id)
+        except queue.Full:
+            self._count('rejected')
+            return False
+        self._count('submitted')
+        return True
+
+    def _run(self):
+        backlog = False
+        while True:
+            timeout = AI_QUEUE_SWEEP_SECONDS if AI_QUEUE_SWEEP_SECONDS > 0 else None
+            if backlog:
+                # The last sweep found work (e.g. after a bulk import); keep draining it
+                # while still serving newly submitted observations first.
+                timeout = 0
+            try:
+                observation_ids = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                backlog = self._sweep()
+                continue
+            # Take whatever else is already waiting, up to a batch, without blocking.
+            while len(observation_ids) < AI_QUEUE_BATCH_SIZE:
+                try:
+                    observation_ids.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                jobs = []
+                for observation_id in observation_ids:
+                    job = database.claim_analysis(observation_id)
+                    if job:
+                        jobs.append(job)
+                if jobs:
+                    self._run_jobs(jobs)
+            except Exception as e:
+                print(f"Analysis Queue: Error processing observations {observation_ids}: {e}")
+            finally:
+                for _ in observation_ids:
+                    self._queue.task_done()
+
+    def _run_jobs(self, jobs):
+        self._count('busy')
+        try:
+            _analyse_many(jobs)
+        finally:
+            self._count('busy', -1)
+            self._count('completed', len(jobs))
+
+    def _sweep(self):
+        """Analyses one batch of orphaned observations. Returns True if it found any."""
+        if not ai_module.is_available():
+            return False  # They would only bounce off the open circuit breaker.
+        try:
+            jobs = database.claim_pending_analyses(max(1, AI_QUEUE_BATCH_SIZE), AI_QUEUE_STALE_SECONDS)
+            if jobs:
+                self._count('swept', len(jobs))
+                self._run_jobs(jobs)
+                return True
+        except Exception as e:
+            print(f"Analysis Queue: Sweep failed: {e}")
+        return False
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({'backend': self.name, 'pid': self.pid, 'workers': len(self._threads), 'queued': self._queue.qsize()})
+        return stats
+
+
+def _run_analysis_in_child(observation_text, floor_input, location):
+    # Runs in a pool process: only the AI call happens here, the DB write stays in the parent.
+    return ai_module.get_ai_analysis(observation_text, floor_input, location)
+
+
+class ProcessPoolBackend:
+    """Runs AI calls in a process pool, with a semaphore bounding jobs in flight."""
+
+    name = 'process'
+
+    def __init__(self, workers, max_size):
+        self.pid = os.getpid()
+        self._workers = max(1, workers)
+        # 'spawn' avoids forking a web worker that already has DB and HTTP threads running.
+        self._executor = ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(self._workers + max_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'swept': 0, 'in_flight': 0}
+        # Set when a job finishes while the last sweep left work behind, to sweep again.
+        self._wake = threading.Event()
+        self._backlog = False
+        # The pool processes keep their own circuit breakers, which this process can't
+        # see; an unavailable result pauses the sweep for the breaker's reset time instead.
+        self._sweep_paused_until = 0.0
+        if AI_QUEUE_SWEEP_SECONDS > 0:
+            threading.Thread(target=self._run_sweeps, name='ai-analysis-sweep', daemon=True).start()
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def submit(self, observation_id):
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            return False
+        try:
+            job = database.claim_analysis(observation_id)
+        except Exception:
+            self._slots.release()
+            raise
+        if not job:
+            self._slots.release()
+            return True  # Someone else is already on it.
+        self._count('submitted')
+        self._start(job)
+        return True
+
+    def _start(self, job):
+        """Sends a claimed job, whose slot is already taken, to the pool."""
+        self._count('in_flight')
+        future = self._executor.submit(_run_analysis_in_child, job['observation_text'], job['floor_input'], job['location'])
+        future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+
+    def _on_done(self, job, future):
+        try:
+            analysis = future.result()
+            if ai_module.is_ai_unavailable(analysis):
+                self._sweep_paused_until = time.monotonic() + ai_module.AI_BREAKER_RESET_SECONDS
+            _store_result(job['id'], analysis)
+        except Exception as e:
+            print(f"Analysis Queue: Error analysing observation #{job['id']}: {e}")
+            try:
+                database.update_observation_analysis(job['id'], None)
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+            self._count('in_flight', -1)
+            self._count('completed')
+            if self._backlog:
+                self._wake.set()
+
+    def _run_sweeps(self):
+        while True:
+            self._wake.wait(AI_QUEUE_SWEEP_SECONDS)
+            self._wake.clear()
+            self._backlog = self._sweep()
+
+    def _sweep(self):
+        """Sends orphaned observations to the pool, at most one per idle pool process so
+        claimed rows don't sit in the executor's queue. Returns True if more may be waiting."""
+        if time.monotonic() < self._sweep_paused_until:
+            return False
+        with self._stats_lock:
+            idle = self._workers - self._stats['in_flight']
+        taken = 0
+        while taken < min(idle, max(1, AI_QUEUE_BATCH_SIZE)) and self._slots.acquire(blocking=False):
+            taken += 1
+        if not taken:
+            return True  # Every pool process is busy; look again when a job finishes.
+        try:
+            jobs = database.claim_pending_analyses(taken, AI_QUEUE_STALE_SECONDS)
+        except Exception as e:
+            print(f"Analysis Queue: Sweep failed: {e}")
+            jobs = []
+        for _ in range(taken - len(jobs)):
+            self._slots.release()
+        if jobs:
+            self._count('swept', len(jobs))
+        for job in jobs:
+            self._start(job)
+        return len(jobs) == taken
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({'backend': self.name, 'pid': self.pid, 'workers': self._workers})
+        return stats
+
+
+BACKENDS = {
+    ThreadQueueBackend.name: ThreadQueueBackend,
+    ProcessPoolBackend.name: ProcessPoolBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns this process's queue backend, starting it on first use.
+
+    Like the DB pool, the backend is keyed to the PID so that each gunicorn worker starts
+    its own threads after the fork instead of inheriting dead ones from the master.
+    """
+    global _backend
+    pid = os.getpid()
+    if _backend is not None and _backend.pid == pid:
+        return _backend
+    with _backend_lock:
+        if _backend is None or _backend.pid != pid:
+            backend_class = BACKENDS.get(AI_QUEUE_BACKEND)
+            if backend_class is None:
+                raise ValueError(f"Unknown AI_QUEUE_BACKEND '{AI_QUEUE_BACKEND}'. Choose from: {', '.join(BACKENDS)}")
+            _backend = backend_class(AI_QUEUE_WORKERS, AI_QUEUE_MAX_SIZE)
+    return _backend
+
+
+def submit_analysis(observation_id):
+    """Queues a saved 'pending' observation for AI analysis.
+
+    Returns False if the queue is full; the observation stays pending and is picked up
+    by a later sweep (or `python manage.py process-pending-analyses`).
+    """
+    return get_backend().submit(observation_id)
+
+
+def process_pending(limit=None, include_failed=False, batch_size=None):
+    """Synchronously analyses pending (and optionally failed) observations in batches.
+
+    Returns the number of observations analysed.
+    """
+    batch_size = max(1, batch_size or AI_QUEUE_BATCH_SIZE)
+    processed = 0
+    attempted = set()
+    while limit is None or processed < limit:
+        claim = batch_size if limit is None else min(batch_size, limit - processed)
+        # With include_failed, rows that fail again would come straight back; try each once.
+        jobs = database.claim_pending_analyses(claim, AI_QUEUE_STALE_SECONDS, include_failed=include_failed, exclude_ids=attempted)
+        if not jobs:
+            break
+        attempted.update(job['id'] for job in jobs)
+        _analyse_many(jobs)
+        processed += len(jobs)
+        if not ai_module.is_available():
+            print("Analysis Queue: Circuit breaker opened; leaving the remaining observations pending.")
+            break
+    return processed
+
+
+def get_queue_stats():
+    """Returns queue statistics for monitoring (empty if the queue hasn't started in this process)."""
+    if _backend is None or _backend.pid != os.getpid():
+        return {'backend': AI_QUEUE_BACKEND, 'pid': os.getpid()}
+    return _backend.stats()
@@ -4,11 +4,18 @@ from dash import dcc, html, Input, Output
 # Import the feature-specific modules
 import observation_app
 import near_miss_app
+import dashboard_app
 import landing_page  # --- MODULE IS ALREADY IMPORTED ---
 
-# Import and initialize the database
+# The schema is created and upgraded by `python manage.py migrate` (see database.MIGRATIONS),
+# not here, so workers start without touching the database.
 import database
-database.init_db()
+
+import ai_cache
+import ai_module
+import analysis_queue
+import live_events
+import metrics
 
 
 # --- Dash App Initialization ---
@@ -27,27 +34,60 @@ app.layout = html.Div([
 
 # --- Register Callbacks from Modules ---
 # This crucial step connects the callbacks defined in your feature modules to the main app.
-observation_app.register_callbacks(app)
-near_miss_app.register_callbacks(app)
-landing_page.register_callbacks(app) # <<<--- THIS WAS THE MISSING LINE. IT IS NOW ADDED.
+# Callbacks are registered through `callbacks` so that each one is timed (see metrics.py).
+callbacks = metrics.instrument_callbacks(app)
+observation_app.register_callbacks(callbacks)
+near_miss_app.register_callbacks(callbacks)
+dashboard_app.register_callbacks(callbacks)
+landing_page.register_callbacks(callbacks) # <<<--- THIS WAS THE MISSING LINE. IT IS NOW ADDED.
+
+# --- Register Plain Flask Routes ---
+# Binary content such as photos is served directly by Flask rather than through callbacks.
+observation_app.register_routes(server)
+
+# --- Metrics ---
+# Prometheus-format metrics at /metrics, including the modules' own statistics.
+metrics.register_routes(server, {
+    'db_pool': database.get_pool_stats,
+    'report_cache': database.get_report_cache_stats,
+    'ai_calls': ai_module.get_ai_call_stats,
+    'ai_cache': ai_cache.get_cache_stats,
+    'analysis_queue': analysis_queue.get_queue_stats,
+    'live_events': live_events.get_live_events_stats,
+})
+
 
+# --- Static Page Layouts ---
+# The landing, observation form and near-miss pages never change, so each worker builds
+# their component trees once and display_page hands back the same tree on every visit.
+STATIC_PAGES = {
+    '/observation': observation_app.build_observation_form_page,
+    '/near-miss': near_miss_app.build_near_miss_page,
+    '/': lambda: landing_page.create_layout(app),
+}
+_static_layouts = {}
 
-# --- PAGE LAYOUTS ARE NOW HANDLED BY THE ROUTING CALLBACK ---
+def get_static_layout(pathname):
+    """Returns the layout of one of the STATIC_PAGES, building it on first use."""
+    layout = _static_layouts.get(pathname)
+    if layout is None:
+        layout = _static_layouts[pathname] = STATIC_PAGES[pathname]()
+    return layout
 
 
 # --- Main Routing Callback ---
 # This callback reads the URL and returns the correct page layout from the appropriate module.
-@app.callback(Output('page-content', 'children'), Input('url', 'pathname'))
+@callbacks.callback(Output('page-content', 'children'), Input('url', 'pathname'))
 def display_page(pathname):
-    if pathname == '/observation':
-        return observation_app.build_observation_form_page()
-    elif pathname == '/report':
+    if pathname == '/report':
         return observation_app.build_report_page()
-    elif pathname == '/near-miss':
-        return near_miss_app.build_near_miss_page()
+    elif pathname == '/dashboard':
+        return dashboard_app.build_dashboard_page()
+    elif pathname in STATIC_PAGES:
+        return get_static_layout(pathname)
     else:
-        # --- CALL THE LAYOUT FUNCTION FROM THE DEDICATED MODULE ---
-        return landing_page.create_layout(app)
+        # Unknown paths show the landing page, as before.
+        return get_static_layout('/')
 
 
 # --- Main Entry Point ---
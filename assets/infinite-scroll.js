@@ -0,0 +1,52 @@
+// assets/infinite-scroll.js
+// Clicks the report's "Load More" button when it scrolls into view, so the next page
+// of observations is fetched without the user having to click it.
+
+(function () {
+    if (!('IntersectionObserver' in window)) {
+        return; // The button still works when clicked by hand.
+    }
+
+    var watched = null;
+    // True from the automatic click until the new cards arrive, so one page is never requested twice.
+    var pending = false;
+
+    var observer = new IntersectionObserver(function (entries) {
+        entries.forEach(function (entry) {
+            var button = entry.target;
+            if (entry.isIntersecting && !pending && button.style.display !== 'none') {
+                pending = true;
+                button.click();
+            }
+        });
+    }, { rootMargin: '400px 0px' });
+
+    function rearm() {
+        // Observing again forces a fresh intersection check, so a short page that leaves
+        // the button on screen keeps loading.
+        if (watched) {
+            observer.unobserve(watched);
+            observer.observe(watched);
+        }
+    }
+
+    new MutationObserver(function (mutations) {
+        var button = document.getElementById('load-more-button');
+        if (button !== watched) {
+            if (watched) { observer.unobserve(watched); }
+            watched = button;
+            pending = false;
+            rearm();
+            return;
+        }
+        var container = document.getElementById('report-content-container');
+        var cardsChanged = container && mutations.some(function (m) {
+            return m.type === 'childList' && (m.target === container || container.contains(m.target));
+        });
+        var buttonShown = mutations.some(function (m) { return m.target === button && m.type === 'attributes'; });
+        if (cardsChanged || buttonShown) {
+            pending = false;
+            rearm();
+        }
+    }).observe(document.documentElement, { childList: true, subtree: true, attributes: true, attributeFilter: ['style'] });
+})();
@@ -0,0 +1,59 @@
+// assets/lazy-photos.js
+// Report cards render photos as <img data-src="..."> so the browser only downloads
+// the ones scrolled into view. Dash loads every .js file in assets/ automatically.
+
+(function () {
+    var observer = null;
+
+    function loadPhoto(img) {
+        var src = img.getAttribute('data-src');
+        if (src && img.getAttribute('src') !== src) {
+            img.setAttribute('src', src);
+        }
+    }
+
+    function watch(root) {
+        var photos = root.querySelectorAll ? root.querySelectorAll('img.lazy-photo[data-src]') : [];
+        for (var i = 0; i < photos.length; i++) {
+            if (observer) {
+                observer.observe(photos[i]);
+            } else {
+                loadPhoto(photos[i]);
+            }
+        }
+    }
+
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting) {
+                    loadPhoto(entry.target);
+                    observer.unobserve(entry.target);
+                }
+            });
+        }, { rootMargin: '300px 0px' });
+    }
+
+    // Cards are added and replaced by Dash callbacks, so watch the DOM for new photos.
+    new MutationObserver(function (mutations) {
+        mutations.forEach(function (mutation) {
+            if (mutation.type === 'attributes') {
+                if (observer) { observer.observe(mutation.target); } else { loadPhoto(mutation.target); }
+                return;
+            }
+            mutation.addedNodes.forEach(function (node) {
+                if (node.nodeType === 1) {
+                    if (node.matches && node.matches('img.lazy-photo[data-src]')) {
+                        if (observer) { observer.observe(node); } else { loadPhoto(node); }
+                    }
+                    watch(node);
+                }
+            });
+        });
+    }).observe(document.documentElement, {
+        childList: true,
+        subtree: true,
+        attributes: true,
+        attributeFilter: ['data-src']
+    });
+})();
@@ -0,0 +1,68 @@
+// assets/live-updates.js
+// Keeps open report and dashboard pages current: listens to the server's event stream
+// (see live_events.py) and hands each new data version to the page's store, which makes
+// sync_report_changes patch in the changed cards or update_dashboard redraw the charts.
+
+(function () {
+    if (!('EventSource' in window)) {
+        return; // The pages fall back to polling for changes.
+    }
+
+    // Element that marks a live page -> store that receives the versions.
+    var LIVE_PAGES = {
+        'report-content-container': 'store-live-version',
+        'dashboard-container': 'store-dashboard-live-version'
+    };
+
+    var source = null;
+    // After the server turns the stream away (e.g. too many clients), wait before trying again.
+    var retryAt = 0;
+    var REFUSED_RETRY_MS = 60000;
+
+    function connect() {
+        source = new EventSource('/events/observations');
+        source.addEventListener('version', function (event) {
+            var store = liveStore();
+            if (store && window.dash_clientside && window.dash_clientside.set_props) {
+                window.dash_clientside.set_props(store, { data: Number(event.data) });
+            }
+        });
+        source.onerror = function () {
+            // EventSource reconnects by itself after network errors, but not after an error response.
+            if (source && source.readyState === EventSource.CLOSED) {
+                disconnect();
+                retryAt = Date.now() + REFUSED_RETRY_MS;
+                setTimeout(update, REFUSED_RETRY_MS);
+            }
+        };
+    }
+
+    function disconnect() {
+        if (source) {
+            source.close();
+            source = null;
+        }
+    }
+
+    function liveStore() {
+        for (var id in LIVE_PAGES) {
+            if (document.getElementById(id)) {
+                return LIVE_PAGES[id];
+            }
+        }
+        return null;
+    }
+
+    function update() {
+        var onLivePage = liveStore() !== null;
+        if (onLivePage && !source && Date.now() >= retryAt) {
+            connect();
+        } else if (!onLivePage && source) {
+            disconnect();
+        }
+    }
+
+    // Dash swaps pages without a reload, so watch for a live page being shown or left.
+    new MutationObserver(update).observe(document.documentElement, { childList: true, subtree: true });
+    update();
+})();
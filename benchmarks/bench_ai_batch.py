@@ -0,0 +1,81 @@
+# benchmarks/bench_ai_batch.py
+"""Measures batched vs one-at-a-time AI analysis against a stubbed model.
+
+Uses benchmarks.fake_ai.FakeGeminiModel (no API key or network needed) with a fixed
+per-call overhead and a smaller per-observation cost, checks that every batched result
+belongs to the right observation (including after per-item fallbacks for malformed
+entries), and reports throughput. The analysis cache is disabled so every run calls
+the model.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_ai_batch [--count 60] [--base-latency 0.05] [--bad-item-rate 0.1]
+"""
+
+import argparse
+import sys
+import time
+
+import ai_cache
+import ai_module
+from benchmarks.fake_ai import FakeGeminiModel
+
+
+def _observations(count):
+    return [
+        {'observation_text': f"Loose handrail on staircase number {i}", 'floor_input': ['B1', 'G', 'lvl 2', 'mezz'][i % 4], 'location': f"Stairwell {i % 7}"}
+        for i in range(count)
+    ]
+
+
+def _check(observations, results):
+    errors = 0
+    for obs, result in zip(observations, results):
+        expected = FakeGeminiModel.expected_result(obs['observation_text'])
+        if ai_module.is_ai_error(result) or any(result[k] != v for k, v in expected.items()):
+            errors += 1
+    return errors
+
+
+def run(count, base_latency, per_item_latency, bad_item_rate, batch_size):
+    ai_cache.AI_CACHE_ENABLED = False
+    ai_module.AI_BATCH_MAX_SIZE = batch_size
+    observations = _observations(count)
+
+    model = ai_module.ai_model = FakeGeminiModel(base_latency, per_item_latency, bad_item_rate=0.0)
+    started = time.perf_counter()
+    single_results = [ai_module.get_ai_analysis(**obs) for obs in observations]
+    single_seconds = time.perf_counter() - started
+    single_calls = model.calls
+
+    model = ai_module.ai_model = FakeGeminiModel(base_latency, per_item_latency, bad_item_rate=bad_item_rate)
+    started = time.perf_counter()
+    batch_results = ai_module.get_ai_analysis_batch(observations)
+    batch_seconds = time.perf_counter() - started
+
+    return {
+        'observations': count,
+        'batch_size': batch_size,
+        'single': {'seconds': round(single_seconds, 3), 'model_calls': single_calls, 'per_second': round(count / single_seconds, 1), 'errors': _check(observations, single_results)},
+        'batched': {'seconds': round(batch_seconds, 3), 'model_calls': model.calls, 'per_second': round(count / batch_seconds, 1), 'errors': _check(observations, batch_results)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=60)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--base-latency', type=float, default=0.05, help="Seconds of fixed overhead per model call.")
+    parser.add_argument('--per-item-latency', type=float, default=0.005, help="Extra seconds per observation in a call.")
+    parser.add_argument('--bad-item-rate', type=float, default=0.1, help="Fraction of batch entries returned malformed.")
+    args = parser.parse_args()
+
+    result = run(args.count, args.base_latency, args.per_item_latency, args.bad_item_rate, args.batch_size)
+    for mode in ('single', 'batched'):
+        r = result[mode]
+        print(f"{mode:>8}: {r['seconds']:7.3f}s  {r['model_calls']:4d} model calls  {r['per_second']:7.1f} obs/s  {r['errors']} wrong results")
+    print(f"Speed-up: {result['single']['seconds'] / result['batched']['seconds']:.1f}x")
+    return 1 if result['single']['errors'] or result['batched']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
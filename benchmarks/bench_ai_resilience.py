@@ -0,0 +1,102 @@
+# benchmarks/bench_ai_resilience.py
+"""Measures how AI analysis latency holds up when the model stalls, fails or goes down.
+
+Runs concurrent get_ai_analysis calls against benchmarks.fake_ai.FakeGeminiModel in
+four phases and prints the call policy's statistics (see ai_module.ModelCallPolicy):
+
+- stalls:   most calls are quick, some hang far past the per-attempt timeout.
+- outage:   every call fails with a retryable error until the circuit breaker opens,
+            after which calls fail fast with the AI_UNAVAILABLE placeholder.
+- recovery: the model is healthy again. Right after the breaker's reset period one trial
+            call goes through and the rest of that burst still fails fast.
+- recovered: the breaker is closed and every call succeeds.
+
+The analysis cache is disabled so every call reaches the model.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_ai_resilience [--calls 200] [--threads 16] [--timeout 0.5]
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ai_cache
+import ai_module
+from benchmarks.fake_ai import FakeGeminiModel
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def _run_phase(model, calls, threads):
+    ai_module.ai_model = model
+
+    def analyse(i):
+        started = time.perf_counter()
+        result = ai_module.get_ai_analysis(f"Trip hazard {i}: cable across corridor", 'G', f"Corridor {i % 5}")
+        return time.perf_counter() - started, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(analyse, range(calls)))
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        'seconds': round(time.perf_counter() - started, 3),
+        'ok': sum(not ai_module.is_ai_error(result) for _, result in outcomes),
+        'unavailable': sum(ai_module.is_ai_unavailable(result) for _, result in outcomes),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 1),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+        'model_calls': model.calls,
+        'breaker': ai_module.get_call_policy().breaker.stats()['state'],
+    }
+
+
+def run(calls, threads, timeout, stall_latency, reset_seconds):
+    ai_cache.AI_CACHE_ENABLED = False
+    ai_module.AI_CALL_TIMEOUT_SECONDS = timeout
+    ai_module.AI_CALL_DEADLINE_SECONDS = timeout * 4
+    ai_module.AI_RETRY_BASE_DELAY_SECONDS = timeout / 10
+    ai_module.AI_MAX_CONCURRENT_CALLS = threads
+    ai_module.AI_BREAKER_RESET_SECONDS = reset_seconds
+    ai_module._call_policy = None
+
+    results = {'stalls': _run_phase(FakeGeminiModel(base_latency=0.02, stall_rate=0.05, stall_latency=stall_latency, error_rate=0.05, seed=1), calls, threads)}
+    results['outage'] = _run_phase(FakeGeminiModel(base_latency=0.02, error_rate=1.0, seed=2), calls, threads)
+    time.sleep(reset_seconds)
+    results['recovery'] = _run_phase(FakeGeminiModel(base_latency=0.02, seed=3), calls, threads)
+    results['recovered'] = _run_phase(FakeGeminiModel(base_latency=0.02, seed=4), calls, threads)
+    results['policy'] = ai_module.get_ai_call_stats()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=0.5, help="Per-attempt timeout in seconds.")
+    parser.add_argument('--stall-latency', type=float, default=5.0, help="How long a stalled call hangs.")
+    parser.add_argument('--reset-seconds', type=float, default=1.0, help="Circuit breaker reset period.")
+    args = parser.parse_args()
+
+    results = run(args.calls, args.threads, args.timeout, args.stall_latency, args.reset_seconds)
+    for phase in ('stalls', 'outage', 'recovery', 'recovered'):
+        r = results[phase]
+        print(f"{phase:>10}: {r['seconds']:7.3f}s  {r['ok']:4d} ok  {r['unavailable']:4d} unavailable  "
+              f"p50 {r['p50_ms']:7.1f} ms  p99 {r['p99_ms']:7.1f} ms  max {r['max_ms']:7.1f} ms  "
+              f"{r['model_calls']:4d} model calls  breaker {r['breaker']}")
+    policy = results['policy']
+    print(f"Policy: {policy['attempts']} attempts, {policy['retries']} retries, {policy['timeouts']} timeouts, "
+          f"{policy['short_circuited']} short-circuited, breaker opened {policy['breaker']['opened_count']}x")
+    # Every call must finish within its deadline, and once recovered every call must succeed.
+    deadline_ms = args.timeout * 4 * 1000 + 100
+    bounded = all(results[phase]['max_ms'] <= deadline_ms for phase in ('stalls', 'outage', 'recovery', 'recovered'))
+    return 0 if bounded and results['recovered']['ok'] == args.calls else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+# benchmarks/bench_excel_export.py
+"""Measures time and peak Python memory of the streaming Excel export at several sizes.
+
+Feeds excel_export.write_report synthetic observations, each with its own pre-sized
+JPEG thumbnail. The rows are generated on the fly, the way the server-side cursor
+delivers them, so no database is needed. The peak should stay about the same as the row
+count grows, while the file size grows linearly.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_excel_export [--sizes 500 2000 8000] [--json out.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+import excel_export
+import photo_processing
+
+
+def _thumbnail(i):
+    img = Image.new('RGB', photo_processing.EXCEL_THUMB_SIZE_PX, ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=photo_processing.EXCEL_THUMB_JPEG_QUALITY)
+    return out.getvalue()
+
+
+def _observations(count):
+    # A small pool of distinct thumbnails keeps JPEG encoding out of the timings.
+    thumbnails = [_thumbnail(i) for i in range(50)]
+    for i in range(1, count + 1):
+        likelihood, severity = i % 5 + 1, (i * 3) % 5 + 1
+        yield {
+            'id': i, 'date_str': '05-Mar-2024', 'floor': 'groundfloor', 'location': f"Kitchen bay {i % 40}",
+            'description': f"Wet floor near the dishwasher without a warning sign (report {i}).",
+            'impact': "Slip hazard for staff carrying hot trays.", 'likelihood': likelihood, 'severity': severity,
+            'risk_rating': likelihood * severity, 'corrective_action': "Place a wet floor sign and mop the area.",
+            'responsible_person': 'executive sous chef', 'deadline': 'Immediately',
+            'photo_excel_thumb': thumbnails[i % len(thumbnails)], 'photo_bytes': None,
+        }
+
+
+def run(count):
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    photo_dir = tempfile.mkdtemp()
+    try:
+        tracemalloc.start()
+        started = time.perf_counter()
+        excel_export.write_report(path, _observations(count), photo_dir)
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'rows': count, 'seconds': round(seconds, 2), 'rows_per_second': round(count / seconds), 'peak_mib': round(peak / 2**20, 1), 'file_mib': round(os.path.getsize(path) / 2**20, 1)}
+    finally:
+        os.remove(path)
+        shutil.rmtree(photo_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 8000])
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.sizes:
+        result = run(count)
+        results.append(result)
+        print(f"{result['rows']:>7} rows: {result['seconds']:7.2f}s  {result['rows_per_second']:6d} rows/s  peak {result['peak_mib']:6.1f} MiB  file {result['file_mib']:6.1f} MiB")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
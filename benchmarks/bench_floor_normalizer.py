@@ -0,0 +1,91 @@
+# benchmarks/bench_floor_normalizer.py
+"""Checks floor_normalizer against a corpus of real-world floor inputs and times it.
+
+The corpus pairs inputs typed into the observation form with the label they should map
+to (None = must NOT be guessed; these are left to the AI). The script exits non-zero if
+any input is mapped wrongly, so it can run in CI.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_floor_normalizer [--iterations 20000]
+"""
+
+import argparse
+import sys
+import time
+
+import floor_normalizer
+
+CORPUS = [
+    # Basements
+    ("B1", "basement 1"), ("b1", "basement 1"), ("B-1", "basement 1"), ("b 2", "basement 2"),
+    ("Basement 2", "basement 2"), ("basement3", "basement 3"), ("BSMT 4", "basement 4"),
+    ("-1", "basement 1"), ("level -2", "basement 2"), ("basment 3", "basement 3"),
+    ("Basemnt 1", "basement 1"), ("2nd basement", "basement 2"), ("B", None), ("B5", None),
+    # Ground
+    ("G", "groundfloor"), ("g", "groundfloor"), ("GF", "groundfloor"), ("G/F", "groundfloor"),
+    ("Ground", "groundfloor"), ("Ground Floor", "groundfloor"), ("groundfloor", "groundfloor"),
+    ("ground flr", "groundfloor"), ("grund floor", "groundfloor"), ("L0", "groundfloor"),
+    ("Level 0", "groundfloor"), ("G floor", "groundfloor"),
+    # Numbered floors
+    ("1", "first floor"), ("1st", "first floor"), ("1st floor", "first floor"), ("first", "first floor"),
+    ("Floor 1", "first floor"), ("lvl 2", "second floor"), ("Lvl2", "second floor"), ("L2", "second floor"),
+    ("Level 2", "second floor"), ("2nd Floor", "second floor"), ("second", "second floor"),
+    ("secnd floor", "second floor"), ("3rd flr", "third floor"), ("Lvl. 3", "third floor"),
+    ("thrid floor", "third floor"), ("4th floor", "forth floor"), ("fourth floor", "forth floor"),
+    ("forth floor", "forth floor"), ("5", "fifth floor"), ("fifht floor", "fifth floor"),
+    ("6th", "sixth floor"), ("seventh flr", "seventh floor"), ("8th floor", "eighth floor"),
+    ("eigth floor", "eighth floor"), ("9th", "nineth floor"), ("ninth floor", "nineth floor"),
+    ("nineth floor", "nineth floor"), ("floor nine", "nineth floor"),
+    # Roof
+    ("roof", "roof top"), ("Rooftop", "roof top"), ("roof top", "roof top"), ("RT", "roof top"),
+    ("roof-top", "roof top"), ("rooftp", "roof top"),
+    # Things the normaliser must not guess at
+    ("12th floor", None), ("lobby", None), ("kitchen", None), ("mezzanine", None), ("", None),
+    ("between 2 and 3", None), ("ground and first", None),
+]
+
+
+def check_corpus(normalizer):
+    failures = []
+    for text, expected in CORPUS:
+        match = normalizer.normalise(text)
+        got = match.label if match and match.confident else None
+        if got != expected:
+            failures.append((text, expected, match))
+    return failures
+
+
+def time_normalizer(iterations):
+    inputs = [text for text, _ in CORPUS]
+    # A fresh normaliser per run measures the uncached path; the warm run shows memo hits.
+    cold = floor_normalizer.FloorNormalizer(floor_normalizer.DEFAULT_FLOORS)
+    started = time.perf_counter()
+    for text in inputs:
+        cold.normalise(text)
+    cold_us = (time.perf_counter() - started) / len(inputs) * 1e6
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        cold.normalise(inputs[i % len(inputs)])
+    warm_us = (time.perf_counter() - started) / iterations * 1e6
+    return cold_us, warm_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    normalizer = floor_normalizer.FloorNormalizer(floor_normalizer.DEFAULT_FLOORS)
+    failures = check_corpus(normalizer)
+    print(f"Corpus: {len(CORPUS) - len(failures)}/{len(CORPUS)} inputs mapped correctly.")
+    for text, expected, match in failures:
+        print(f"  MISMATCH {text!r}: expected {expected!r}, got {match!r}")
+
+    cold_us, warm_us = time_normalizer(args.iterations)
+    print(f"Uncached: {cold_us:.1f} us/input   Memoised: {warm_us:.2f} us/input")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+# benchmarks/bench_pipeline.py
+"""End-to-end benchmark of the observation pipeline at several table sizes.
+
+For each size, with and without photos, the script seeds a scratch copy of the schema
+and times the operations the app performs:
+
+- insert:   the form's save path (duplicate check, photo processing and storage,
+            add_observation_to_db), one observation at a time
+- analyse:  analysis_queue.process_pending on those observations, against
+            benchmarks.fake_ai.FakeGeminiModel with a fixed latency
+- search:   the first report page for a mix of search terms
+- sort:     the first report page in every sort order
+- paginate: following the report's "load more" cursors
+- list_all: database.get_observations_from_db, the unpaginated query
+- render:   the report page's full render (update_report_view) including the JSON
+            encoding Dash sends to the browser
+- export:   the full Excel report (excel_export.export_report)
+
+Each operation reports latency percentiles, throughput and peak RSS while it ran (peak
+RSS is reset per operation on Linux; elsewhere it is the process-wide peak so far).
+Seeding goes through the bulk importer; the report query cache and the AI cache are off,
+so every call reaches the database or the fake model.
+
+Everything happens in the schema riskwatch_bench of DATABASE_URL's database, which is
+dropped at the end; the real tables are not touched (open report pages may still be
+nudged to refresh, since change notifications are per database). Photos go to a
+temporary local photo store.
+
+Results can be written as JSON and compared with an earlier run; the script exits
+non-zero if any p95 latency got worse than --tolerance allows.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline [--sizes 1000 10000 100000] [--photos both]
+        [--json out.json] [--compare baseline.json] [--tolerance 0.25]
+"""
+
+import argparse
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+from plotly.utils import PlotlyJSONEncoder
+
+import ai_cache
+import ai_module
+import analysis_queue
+import bulk_import
+import database
+import excel_export
+import floor_normalizer
+import near_duplicates
+import observation_app
+import photo_processing
+import photo_store
+from benchmarks.fake_ai import FakeGeminiModel
+
+BENCH_SCHEMA = 'riskwatch_bench'
+
+FLOORS = ["B2", "B1", "G", "1st floor", "lvl 2", "3rd flr", "roof"]
+LOCATIONS = ["Main Lobby", "Kitchen", "Laundry", "Pool Deck", "Loading Bay", "Ballroom", "Staff Canteen", "Car Park", "Guest Corridor", "Plant Room"]
+HAZARDS = [
+    "wet floor without warning sign", "exposed electrical wiring", "blocked fire exit",
+    "loose handrail on staircase", "broken glass near entrance", "missing fire extinguisher",
+    "trailing cable across walkway", "uneven paving slab", "chemical containers unlabelled",
+    "emergency light not working", "damaged ceiling tile", "spilled oil near fryer",
+]
+DETAILS = ["reported by night shift", "close to guest area", "second time this week", "near the service lift", "during delivery hours", ""]
+PEOPLE = ["maintenance team", "housekeeping", "security", "f&b manager", "engineering"]
+SEARCHES = ["extinguisher", "fire exit", "Lobby", "Laundary", "basement 1", "asbestos"]
+SORTS = ['date_newest', 'date_oldest', 'risk_high']
+
+
+# --- Measurement ---
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+), so each operation gets its own peak.
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _measure(op, fn, repeat):
+    """Calls fn(i) `repeat` times. fn returns the number of items it handled (rows
+    imported, observations analysed, ...) or None for one."""
+    _reset_peak_rss()
+    latencies = []
+    items = 0
+    started = time.perf_counter()
+    for i in range(repeat):
+        call_started = time.perf_counter()
+        handled = fn(i)
+        latencies.append(time.perf_counter() - call_started)
+        items += 1 if handled is None else handled
+    seconds = time.perf_counter() - started
+    return {
+        'op': op,
+        'calls': repeat,
+        'items': items,
+        'seconds': round(seconds, 3),
+        'throughput_per_s': round(items / seconds, 1) if seconds else None,
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else 0.0,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+# --- Synthetic Data ---
+def _observation_text(rng):
+    floor, location = rng.choice(FLOORS), rng.choice(LOCATIONS)
+    description = f"{rng.choice(HAZARDS).capitalize()} {rng.choice(DETAILS)} (ref {rng.randint(1, 10**6)})".replace('  ', ' ')
+    return floor, location, description
+
+
+def _seed_records(count, rng):
+    today = datetime.date.today()
+    for i in range(count):
+        floor, location, description = _observation_text(rng)
+        likelihood, severity = rng.randint(1, 5), rng.randint(1, 5)
+        yield i + 1, {
+            'date': (today - datetime.timedelta(days=rng.randint(0, 730))).isoformat(),
+            'floor': floor, 'location': location, 'description': description,
+            'impact': "Risk of injury to guests and staff.", 'likelihood': likelihood, 'severity': severity,
+            'corrective action': f"Fix the {description.split()[0].lower()} hazard and inspect the area.",
+            'responsible person': rng.choice(PEOPLE), 'deadline': "Within 24 hours" if likelihood * severity >= 15 else "Within 1 week",
+        }
+
+
+def _photo(i):
+    """A camera-sized JPEG with enough detail to compress like a real photo."""
+    rng = random.Random(i)
+    img = Image.new('RGB', (1600, 1200), (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(300):
+        x, y = rng.randint(0, 1600), rng.randint(0, 1200)
+        draw.rectangle((x, y, x + rng.randint(5, 200), y + rng.randint(5, 200)), fill=(rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+
+def _attach_photos(stored_photos):
+    """Gives every seeded observation one of `stored_photos` (photo_store.store_photo dicts)."""
+    with database.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            params = {field: [photo[field] for photo in stored_photos] for field in photo_store.PHOTO_KEY_FIELDS.values()}
+            params['count'] = len(stored_photos)
+            cur.execute('''
+                UPDATE observations SET
+                    photo_key = (%(photo_key)s::text[])[id %% %(count)s + 1],
+                    photo_thumb_key = (%(photo_thumb_key)s::text[])[id %% %(count)s + 1],
+                    photo_excel_thumb_key = (%(photo_excel_thumb_key)s::text[])[id %% %(count)s + 1]
+            ''', params)
+
+
+# --- Scenario ---
+def _use_bench_schema():
+    # Every pooled connection puts the scratch schema first on its search_path, so init_db
+    # and every query below create and read tables there (extensions stay in public).
+    os.environ['PGOPTIONS'] = f"{os.environ.get('PGOPTIONS', '')} -c search_path={BENCH_SCHEMA},public".strip()
+
+
+def _reset_schema(drop_only=False):
+    with database.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            if not drop_only:
+                cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    if not drop_only:
+        database.init_db()
+
+
+def run_scenario(rows, with_photos, args, raw_photos, work_dir):
+    """Seeds `rows` observations into a fresh schema and times every operation on them."""
+    rng = random.Random(rows)
+    _reset_schema()
+    inserts = min(args.inserts, rows)
+    results = []
+
+    def seed(_):
+        summary = bulk_import.import_rows(_seed_records(rows - inserts, rng), analyse=bulk_import.ANALYSE_NONE)
+        if with_photos:
+            _attach_photos([photo_store.store_photo(photo_processing.process_photo(photo)) for photo in raw_photos])
+        return summary['imported']
+    results.append(_measure('seed', seed, 1))
+
+    def insert(i):
+        # Same steps as the form's add_observation / _submit_observation.
+        floor, location, description = _observation_text(rng)
+        near_duplicates.find_duplicates(floor, location, description)
+        photo = photo_store.store_photo(photo_processing.process_photo(raw_photos[i % len(raw_photos)])) if with_photos else {}
+        entry = {'date_str': datetime.datetime.now().strftime("%d-%b-%Y"), 'location_from_user': location, 'observation_text': description, **photo,
+                 'floor_from_user': floor_normalizer.resolve_floor(floor) or floor}
+        fingerprint = near_duplicates.fingerprint(floor, location, description)
+        if fingerprint:
+            entry.update(dedup_bands=fingerprint.bands, dedup_signature=fingerprint.signature.tolist())
+        database.add_observation_to_db(entry)
+    results.append(_measure('insert', insert, inserts))
+
+    ai_module.ai_model = FakeGeminiModel(base_latency=args.ai_latency, per_item_latency=args.ai_item_latency, seed=rows)
+    batch_size = analysis_queue.AI_QUEUE_BATCH_SIZE
+    results.append(_measure('analyse', lambda _: analysis_queue.process_pending(limit=batch_size), math.ceil(inserts / batch_size)))
+    database.analyze_observations()
+
+    results.append(_measure('search', lambda i: len(database.get_observations_page(SEARCHES[i % len(SEARCHES)], 'relevance')['observations']), args.repeat))
+    results.append(_measure('sort', lambda i: len(database.get_observations_page(None, SORTS[i % len(SORTS)])['observations']), args.repeat))
+
+    cursor = [None]
+    def next_page(i):
+        page = database.get_observations_page(None, SORTS[i % len(SORTS)] if cursor[0] is None else 'date_newest', cursor=cursor[0], with_total=False)
+        cursor[0] = page['next_cursor']
+        return len(page['observations'])
+    results.append(_measure('paginate', next_page, args.repeat))
+
+    results.append(_measure('list_all', lambda i: len(database.get_observations_from_db(None, SORTS[i % len(SORTS)])), args.list_repeat))
+
+    payload_sizes = []
+    def render(i):
+        outputs = observation_app._render_report(SEARCHES[i % len(SEARCHES)] if i % 2 else None, SORTS[i % len(SORTS)])
+        payload_sizes.append(len(json.dumps(outputs, cls=PlotlyJSONEncoder)))
+        return len(outputs[0]) if isinstance(outputs[0], list) else 0
+    result = _measure('render', render, args.repeat)
+    result['payload_kb_p50'] = round(_percentile(payload_sizes, 0.5) / 1024, 1)
+    results.append(result)
+
+    export_path = os.path.join(work_dir, 'report.xlsx')
+    result = _measure('export', lambda _: excel_export.export_report(export_path), args.export_repeat)
+    result['file_mb'] = round(os.path.getsize(export_path) / 2**20, 2)
+    results.append(result)
+
+    for result in results:
+        result.update(rows=rows, photos=with_photos)
+    return results
+
+
+# --- Reporting ---
+def _print_result(r):
+    extra = ''
+    if 'payload_kb_p50' in r:
+        extra = f"  payload {r['payload_kb_p50']:,.1f} KB"
+    elif 'file_mb' in r:
+        extra = f"  file {r['file_mb']:,.2f} MB"
+    print(f"{r['rows']:>9,} {'photos' if r['photos'] else 'plain':<7} {r['op']:<9} n={r['calls']:<4} "
+          f"p50 {r['p50_ms']:9.2f}  p95 {r['p95_ms']:9.2f}  p99 {r['p99_ms']:9.2f} ms  "
+          f"{r['throughput_per_s'] or 0:10,.1f}/s  peak RSS {r['peak_rss_mb']:7.1f} MB{extra}")
+
+
+def compare(results, baseline_path, tolerance):
+    """Prints p95 changes against an earlier run's JSON. Returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {(r['rows'], r['photos'], r['op']): r for r in json.load(f)['results']}
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (p95, regression above +{tolerance:.0%}):")
+    for r in results:
+        old = baseline.get((r['rows'], r['photos'], r['op']))
+        if not old or not old['p95_ms']:
+            continue
+        change = r['p95_ms'] / old['p95_ms'] - 1
+        regressed = change > tolerance
+        regressions += regressed
+        print(f"{r['rows']:>9,} {'photos' if r['photos'] else 'plain':<7} {r['op']:<9} {old['p95_ms']:9.2f} -> {r['p95_ms']:9.2f} ms  "
+              f"{change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--photos', choices=['both', 'with', 'without'], default='both')
+    parser.add_argument('--inserts', type=int, default=200, help="Observations saved one at a time through the form path.")
+    parser.add_argument('--repeat', type=int, default=60, help="Calls per search/sort/paginate/render measurement.")
+    parser.add_argument('--list-repeat', type=int, default=3, help="Calls of the unpaginated query.")
+    parser.add_argument('--export-repeat', type=int, default=2, help="Full Excel exports per scenario.")
+    parser.add_argument('--ai-latency', type=float, default=0.05, help="Fake model latency per call, in seconds.")
+    parser.add_argument('--ai-item-latency', type=float, default=0.01, help="Extra fake model latency per batched observation.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    parser.add_argument('--compare', help="A previous --json output to compare p95 latencies with.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 slowdown before --compare reports a regression.")
+    args = parser.parse_args()
+
+    photo_modes = {'both': (False, True), 'with': (True,), 'without': (False,)}[args.photos]
+    work_dir = tempfile.mkdtemp(prefix='riskwatch-bench-')
+    _use_bench_schema()
+    ai_cache.AI_CACHE_ENABLED = False
+    database.REPORT_CACHE_ENABLED = False
+    photo_store.PHOTO_STORE_URL = 'file://' + os.path.join(work_dir, 'photos')
+    photo_store._store = None
+    raw_photos = [_photo(i) for i in range(8)]
+
+    started_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    results = []
+    try:
+        for rows in sorted(args.sizes):
+            for with_photos in photo_modes:
+                for result in run_scenario(rows, with_photos, args, raw_photos, work_dir):
+                    _print_result(result)
+                    results.append(result)
+    finally:
+        _reset_schema(drop_only=True)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        settings = {key: value for key, value in vars(args).items() if key not in ('json', 'compare')}
+        with open(args.json, 'w') as f:
+            json.dump({'started_at': started_at, 'python': platform.python_version(), 'platform': platform.platform(),
+                       'settings': settings, 'results': results}, f, indent=2)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# benchmarks/bench_report_cache.py
+"""Measures the report query cache under many supervisors viewing the report at once.
+
+Simulates `--readers` threads that repeatedly load the first report page with a mix of
+searches and sort orders (the inputs of update_report_view), while one writer thread
+saves a new observation every `--write-interval` seconds. Prints the hit ratio, the
+query time saved and the read latency with the cache on and off.
+
+Needs DATABASE_URL pointing at a database with the observations schema (python manage.py migrate).
+Observations added by the writer are deleted again at the end.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_report_cache [--readers 20] [--seconds 10] [--write-interval 2]
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+import database
+
+SEARCHES = [None, None, None, 'lobby', 'kitchen', 'wet floor']
+SORTS = ['date_newest', 'date_newest', 'risk_high', 'relevance']
+
+
+def _reader(stop, latencies):
+    rng = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        database.get_observations_page(rng.choice(SEARCHES), rng.choice(SORTS))
+        latencies.append(time.perf_counter() - started)
+
+
+def _writer(stop, interval, written_ids):
+    while not stop.wait(interval):
+        written_ids.append(database.add_observation_to_db({
+            'date_str': '01-Jan-2024', 'floor_from_user': 'groundfloor', 'location_from_user': 'Benchmark lobby',
+            'ai_analysis': {'CorrectedDescription': "Benchmark observation.", 'Likelihood': 1, 'Severity': 1},
+        }))
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def run(readers, seconds, write_interval, cache_enabled):
+    database.REPORT_CACHE_ENABLED = cache_enabled
+    stop = threading.Event()
+    latencies, written_ids = [], []
+    threads = [threading.Thread(target=_reader, args=(stop, latencies)) for _ in range(readers)]
+    if write_interval:
+        threads.append(threading.Thread(target=_writer, args=(stop, write_interval, written_ids)))
+    before = database.get_report_cache_stats()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for observation_id in written_ids:
+        database.delete_observation_from_db(observation_id)
+
+    after = database.get_report_cache_stats()
+    result = {
+        'cache': cache_enabled, 'requests': len(latencies), 'requests_per_second': round(len(latencies) / seconds),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 2), 'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+        'writes': len(written_ids),
+    }
+    if cache_enabled:
+        hits = (after['hits'] - before.get('hits', 0)) + (after['coalesced'] - before.get('coalesced', 0))
+        lookups = hits + after['misses'] - before.get('misses', 0)
+        result.update({
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+            'saved_db_seconds': round(after['saved_seconds'] - before.get('saved_seconds', 0.0), 3),
+            'invalidations': after['invalidations'] - before.get('invalidations', 0),
+        })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-interval', type=float, default=2, help="Seconds between writes (0 disables the writer).")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    results = []
+    for cache_enabled in (False, True):
+        result = run(args.readers, args.seconds, args.write_interval, cache_enabled)
+        results.append(result)
+        line = f"cache {'on ' if cache_enabled else 'off'}: {result['requests_per_second']:6d} req/s  p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms"
+        if cache_enabled:
+            line += f"  hit ratio {result['hit_ratio']}  saved {result['saved_db_seconds']}s of queries  ({result['invalidations']} invalidations)"
+        print(line)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
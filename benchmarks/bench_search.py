@@ -0,0 +1,119 @@
+# benchmarks/bench_search.py
+"""Compares report search query time before/after the full-text and trigram indexes.
+
+Seeds a scratch copy of the observations table (same columns and indexes, separate
+data) at increasing sizes and times the legacy ILIKE search against the indexed search
+used by database.get_observations_page. Needs DATABASE_URL to point at a Postgres
+database you can create tables in; the real observations table is not modified.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_search [--sizes 1000 10000 100000] [--repeat 7] [--json out.json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import database
+
+BENCH_TABLE = 'bench_observations'
+
+FLOORS = ["basement 2", "basement 1", "groundfloor", "first floor", "second floor", "third floor", "roof top"]
+LOCATIONS = ["Main Lobby", "Kitchen", "Laundry", "Pool Deck", "Loading Bay", "Ballroom", "Staff Canteen", "Car Park", "Guest Corridor", "Plant Room"]
+PHRASES = [
+    "wet floor without warning sign", "exposed electrical wiring", "blocked fire exit",
+    "loose handrail on staircase", "broken glass near entrance", "missing fire extinguisher",
+    "trailing cable across walkway", "uneven paving slab", "chemical containers unlabelled",
+    "emergency light not working", "damaged ceiling tile", "spilled oil near fryer",
+]
+
+# (label, search term) pairs covering full-text, fuzzy location and floor lookups.
+SEARCHES = [
+    ("description word", "extinguisher"),
+    ("description phrase", "fire exit"),
+    ("location substring", "Lobby"),
+    ("location typo", "Laundary"),
+    ("floor", "basement 1"),
+    ("no match", "asbestos"),
+]
+
+LEGACY_FILTER = " WHERE description ILIKE %(search_pattern)s OR location ILIKE %(search_pattern)s OR floor ILIKE %(search_pattern)s"
+
+
+def _seed(cur, start_id, stop_id):
+    cur.execute(f'''
+        INSERT INTO {BENCH_TABLE} (id, date_str, floor, location, description, risk_rating)
+        SELECT g, '01-Jan-2025',
+               (%(floors)s::text[])[1 + floor(random() * %(n_floors)s)::int],
+               (%(locations)s::text[])[1 + floor(random() * %(n_locations)s)::int],
+               initcap((%(phrases)s::text[])[1 + floor(random() * %(n_phrases)s)::int]) || ' by the ' ||
+               lower((%(locations)s::text[])[1 + floor(random() * %(n_locations)s)::int]) || ', also ' ||
+               (%(phrases)s::text[])[1 + floor(random() * %(n_phrases)s)::int] || '.',
+               1 + floor(random() * 25)::int
+        FROM generate_series(%(start)s, %(stop)s) AS g
+    ''', {
+        'floors': FLOORS, 'n_floors': len(FLOORS),
+        'locations': LOCATIONS, 'n_locations': len(LOCATIONS),
+        'phrases': PHRASES, 'n_phrases': len(PHRASES),
+        'start': start_id, 'stop': stop_id,
+    })
+    cur.execute(f"ANALYZE {BENCH_TABLE}")
+
+
+def _time_query(cur, where_sql, params, repeat):
+    query = f"SELECT id, location, floor, description FROM {BENCH_TABLE}{where_sql} ORDER BY id DESC LIMIT 25"
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cur.execute(query, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(sizes, repeat):
+    results = []
+    with database.get_db_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+                cur.execute(f"CREATE TABLE {BENCH_TABLE} (LIKE observations INCLUDING ALL)")
+                seeded = 0
+                for size in sorted(sizes):
+                    _seed(cur, seeded + 1, size)
+                    seeded = size
+                    for label, term in SEARCHES:
+                        new_where, params = database._build_search_filter(term)
+                        before_ms = _time_query(cur, LEGACY_FILTER, params, repeat)
+                        after_ms = _time_query(cur, new_where, params, repeat)
+                        results.append({
+                            'rows': size, 'search': label, 'term': term,
+                            'ilike_ms': round(before_ms, 3), 'indexed_ms': round(after_ms, 3),
+                            'speedup': round(before_ms / after_ms, 1) if after_ms else None,
+                        })
+                        print(f"{size:>9,} rows  {label:<20} ILIKE {before_ms:9.2f} ms   indexed {after_ms:9.2f} ms")
+        finally:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            conn.autocommit = False
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=7, help="Runs per query; the median is reported.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    database.init_db()
+    results = run(args.sizes, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
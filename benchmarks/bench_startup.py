@@ -0,0 +1,145 @@
+# benchmarks/bench_startup.py
+"""Measures how long `import app` takes and where that time goes, module by module.
+
+Each run imports the app in a fresh interpreter with `python -X importtime` and reports
+the median over --repeat runs:
+- the total time of `import app`;
+- the app's own modules, with everything they import (cumulative);
+- every other package (third-party and standard library), by its own import time;
+- whether the dependencies that are meant to load lazily (LAZY_DEPENDENCIES) were
+  imported anyway;
+- what each lazy dependency costs on first use, i.e. the time moved off startup.
+
+Importing the app doesn't connect to the database, so no DATABASE_URL is needed.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup [--repeat 5] [--top 15] [--json out.json]
+        [--compare baseline.json] [--tolerance 0.25]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = {name[:-3] for name in os.listdir(ROOT) if name.endswith('.py')}
+
+# Loaded on first use rather than by `import app`, with the code that loads them.
+LAZY_DEPENDENCIES = {
+    'google.generativeai': "import ai_module; ai_module.GEMINI_API_KEY = 'unused'; ai_module.get_model()",
+    'openpyxl': "import excel_export",
+    'psycopg2': "import database; database.load_driver()",
+}
+
+_IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def _run(code):
+    """Runs `code` after `import app` in a fresh interpreter. Returns (import app seconds,
+    seconds taken by `code`, [(module, self us, cumulative us)])."""
+    script = (
+        "import time\n"
+        "started = time.perf_counter()\nimport app\nimported = time.perf_counter()\n"
+        f"{code}\n"
+        "print(imported - started, time.perf_counter() - imported)\n"
+    )
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    import_seconds, code_seconds = map(float, result.stdout.split()[-2:])
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            modules.append((match[4], int(match[1]), int(match[2])))
+    return import_seconds, code_seconds, modules
+
+
+def profile(repeat):
+    """Median import times over `repeat` runs of `import app`."""
+    totals, app_modules, packages, loaded = [], {}, {}, set()
+    for _ in range(repeat):
+        import_seconds, _, modules = _run("pass")
+        totals.append(import_seconds)
+        per_package = {}
+        for name, self_us, cumulative_us in modules:
+            top = name.split('.')[0]
+            if name in APP_MODULES:
+                app_modules.setdefault(name, []).append(cumulative_us / 1000)
+            elif top not in APP_MODULES:
+                per_package[top] = per_package.get(top, 0) + self_us / 1000
+            loaded.update(dependency for dependency in LAZY_DEPENDENCIES if name == dependency)
+        for top, ms in per_package.items():
+            packages.setdefault(top, []).append(ms)
+    return {
+        'import_app_ms': statistics.median(totals) * 1000,
+        'app_modules_ms': {name: statistics.median(values) for name, values in app_modules.items()},
+        'packages_ms': {name: statistics.median(values) for name, values in packages.items()},
+        'loaded_at_startup': sorted(loaded),
+    }
+
+
+def first_use(repeat):
+    """Median time each LAZY_DEPENDENCIES entry takes to load once the app is imported."""
+    return {dependency: statistics.median(_run(code)[1] for _ in range(repeat)) * 1000
+            for dependency, code in LAZY_DEPENDENCIES.items()}
+
+
+def _print_table(title, times, top):
+    print(f"\n{title}:")
+    for name, ms in sorted(times.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {name:<28} {ms:9.1f} ms")
+
+
+def compare(result, baseline_path, tolerance):
+    """Prints startup time changes against an earlier run's JSON. Returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows = [('import app', baseline['import_app_ms'], result['import_app_ms'])]
+    rows += [(name, baseline['app_modules_ms'][name], ms) for name, ms in sorted(result['app_modules_ms'].items())
+             if name in baseline['app_modules_ms']]
+    regressions = 0
+    print(f"\nCompared with {baseline_path} (regression above +{tolerance:.0%}):")
+    for name, old, new in rows:
+        change = new / old - 1 if old else 0.0
+        regressed = change > tolerance and new - old > 5  # ignore noise on tiny modules
+        regressions += regressed
+        print(f"  {name:<28} {old:9.1f} -> {new:9.1f} ms  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    for dependency in result['loaded_at_startup']:
+        if dependency not in baseline['loaded_at_startup']:
+            print(f"  {dependency} is imported at startup again  REGRESSION")
+            regressions += 1
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per measurement; the median is reported.")
+    parser.add_argument('--top', type=int, default=15, help="Rows shown per table.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    parser.add_argument('--compare', help="A previous --json output to compare with.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown before --compare reports a regression.")
+    args = parser.parse_args()
+
+    result = profile(args.repeat)
+    result['first_use_ms'] = first_use(args.repeat)
+    print(f"import app: {result['import_app_ms']:.0f} ms (median of {args.repeat} runs)")
+    _print_table("App modules (cumulative, including what they import)", result['app_modules_ms'], args.top)
+    _print_table("Other packages, incl. the standard library (own import time)", result['packages_ms'], args.top)
+    print("\nLazily loaded dependencies:")
+    for dependency, ms in result['first_use_ms'].items():
+        state = "imported at startup" if dependency in result['loaded_at_startup'] else "deferred"
+        print(f"  {dependency:<28} {state:<20} {ms:9.1f} ms on first use")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    regressions = compare(result, args.compare, args.tolerance) if args.compare else 0
+    return 1 if regressions or result['loaded_at_startup'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,431 @@
+# benchmarks/bench_storage.py
+"""Conformance checks and comparative timings for the storage backends.
+
+For each --url (default: a temporary SQLite file, plus DATABASE_URL if it is a
+PostgreSQL URL) the script runs, in a separate process since database.py picks its
+backend at import:
+
+1. the conformance checks: one small scenario per area of the database API (saving and
+   analysing observations, report pages and cursors, search and filters, change
+   tracking, dashboard, duplicates, AI cache, photos, export, bulk import), each on
+   fresh data. A check fails on a broken expectation; its result is also compared
+   across backends, so both must answer every scenario the same way;
+2. the benchmark: --rows observations are bulk imported, then the app's common calls
+   are timed (single inserts, analysis claims, report pages, search, cursors, filter
+   options, dashboard, export).
+
+PostgreSQL runs in the scratch schema riskwatch_bench (see bench_pipeline.py), which is
+dropped at the end; SQLite runs in a temporary file. The report cache is off, so every
+call reaches the database. Exits non-zero if a check fails or the backends disagree.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_storage [--url sqlite:///tmp/riskwatch.db] [--url postgresql://...]
+        [--rows 10000] [--repeat 50] [--json out.json] [--checks-only]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import traceback
+
+DAY = datetime.datetime(2025, 3, 1, 9, 0, tzinfo=datetime.timezone.utc)
+
+
+def _entry(i, floor='G', location='Lobby', description=None, risk=None, person=None, days=0, **extra):
+    """An add_observation_to_db entry observed `days` after DAY (analysed if `risk` is given)."""
+    entry = {'date_str': (DAY + datetime.timedelta(days=days)).strftime('%d-%b-%Y'), 'observed_at': DAY + datetime.timedelta(days=days, minutes=i),
+             'floor_from_user': floor, 'location_from_user': location, 'observation_text': description or f"Observation {i}", **extra}
+    if risk is not None:
+        likelihood, severity = risk
+        entry['ai_analysis'] = {'CorrectedDescription': description or f"Observation {i}", 'Likelihood': likelihood, 'Severity': severity,
+                                'ImpactOnOperations': "Guest injury", 'CorrectiveAction': "Fix it", 'ResponsiblePerson': person, 'DeadlineSuggestion': "Today"}
+    return entry
+
+
+def _all_pages(database, search_term, sort_by, page_size, filters=None):
+    page = database.get_observations_page(search_term, sort_by, page_size=page_size, filters=filters)
+    total, ids = page['total_estimate'], [row['id'] for row in page['observations']]
+    while page['next_cursor']:
+        page = database.get_observations_page(search_term, sort_by, cursor=page['next_cursor'], page_size=page_size, filters=filters)
+        ids += [row['id'] for row in page['observations']]
+    return total, ids
+
+
+# --- Conformance ---
+def check_save_and_analyse(database):
+    first = database.add_observation_to_db(_entry(1, risk=(2, 3), person="Housekeeping"))
+    pending = database.add_observation_to_db(_entry(2, description="Loose handrail on stairs"))
+    assert pending > first
+    rows = database.get_observations_from_db()
+    assert [row['id'] for row in rows] == [pending, first]
+    assert rows[1]['risk_rating'] == 6 and rows[1]['analysis_status'] == database.ANALYSIS_COMPLETE and rows[1]['has_photo'] is False
+    assert rows[0]['analysis_status'] == database.ANALYSIS_PENDING
+
+    job = database.claim_analysis(pending)
+    assert dict(job) == {'id': pending, 'observation_text': "Loose handrail on stairs", 'floor_input': 'G', 'location': 'Lobby'}
+    assert database.claim_analysis(pending) is None
+    assert database.claim_pending_analyses(10, stale_after_seconds=3600) == []
+    assert [row['id'] for row in database.claim_pending_analyses(10, stale_after_seconds=0)] == [pending]
+    database.release_analysis(pending)
+    assert database.get_analysis_statuses([pending, first, 10**6]) == {pending: 'pending', first: 'complete'}
+    database.update_observation_analysis(pending, None)
+    assert [row['id'] for row in database.claim_pending_analyses(10, 3600, include_failed=True)] == [pending]
+    database.update_observation_analysis(pending, {'StandardizedFloor': 'groundfloor', 'CorrectedDescription': "Loose handrail on the stairs.",
+                                                   'Likelihood': 4, 'Severity': 4, 'ResponsiblePerson': "Engineering"})
+    row = database.get_observations_from_db()[0]
+    assert (row['floor'], row['description'], row['risk_rating'], row['analysis_status']) == ('groundfloor', "Loose handrail on the stairs.", 16, 'complete')
+    return [dict(row, id=None) for row in database.get_observations_from_db()]
+
+
+def check_report_pages(database):
+    rng = random.Random(7)
+    for i in range(23):
+        # Repeated risk ratings and timestamps make the id tiebreaker matter.
+        database.add_observation_to_db(_entry(i % 5, risk=(rng.randint(1, 3), rng.randint(1, 3)), days=i % 4))
+    result = {}
+    for sort_by in ('date_newest', 'date_oldest', 'risk_high'):
+        full = [row['id'] for row in database.get_observations_from_db(None, sort_by)]
+        total, ids = _all_pages(database, None, sort_by, 5)
+        assert ids == full, f"{sort_by}: paged {ids} != {full}"
+        assert total == 23
+        result[sort_by] = ids
+    assert database.is_descending_sort('risk_high') and not database.is_descending_sort('date_oldest')
+    return result
+
+
+def check_search_and_filters(database):
+    data = [
+        ('G', 'Main Lobby', "Fire extinguisher missing from its bracket", (3, 4), "Security", 0),
+        ('1', 'Kitchen', "Spilled oil near the fryer, slippery floor", (4, 3), "F&B manager", 1),
+        ('1', 'Kitchen', "Extinguishers not inspected this month", (2, 2), "Security", 2),
+        ('B1', 'Car Park', "Emergency light not working near the lift", (2, 3), None, 3),
+        ('B1', 'Laundry', "Wet floor without a warning sign", (3, 3), "housekeeping", 4),
+    ]
+    ids = [database.add_observation_to_db(_entry(i, floor, location, text, risk, person, days))
+           for i, (floor, location, text, risk, person, days) in enumerate(data)]
+    result = {}
+    for term in ('extinguisher', 'fire extinguisher', '"warning sign"', 'lobby', 'kitch', 'oil or light', 'floor -oil', 'asbestos'):
+        total, found = _all_pages(database, term, 'relevance', 2)
+        assert total == len(found), term
+        result[term] = sorted(found)
+    assert result['extinguisher'] == [ids[0], ids[2]], result['extinguisher']
+    assert result['lobby'] == [ids[0]] and result['kitch'] == [ids[1], ids[2]] and result['asbestos'] == []
+    page = database.get_observations_page('extinguisher', 'relevance')
+    assert any(database.HIGHLIGHT_START in (row['description_highlighted'] or '') for row in page['observations'])
+
+    filters = {
+        'floor': {'floor': '1'},
+        'person': {'responsible_person': 'SECURITY'},
+        'dates': {'date_from': '2025-03-02', 'date_to': '2025-03-04'},
+        'combined': {'date_from': '2025-03-02', 'floor': 'B1'},
+    }
+    for name, value in filters.items():
+        total, found = _all_pages(database, None, 'date_oldest', 2, filters=value)
+        assert total == len(found) == database.get_report_total(None, value)
+        result[name] = found
+    assert result['dates'] == ids[1:4], result['dates']
+    assert [row['id'] for row in database.get_report_rows(ids, 'kitchen', 'date_oldest')] == [ids[1], ids[2]]
+    options = database.get_report_filter_options()
+    assert options == {'floors': ['1', 'B1', 'G'], 'responsible_people': ['f&b manager', 'housekeeping', 'security']}, options
+    return result
+
+
+def check_change_tracking(database):
+    start = database.get_data_version()
+    first = database.add_observation_to_db(_entry(1))
+    second = database.add_observation_to_db(_entry(2))
+    after_insert = database.get_data_version()
+    assert after_insert > start
+    database.update_observation_analysis(first, {'Likelihood': 1, 'Severity': 1})
+    database.delete_observation_from_db(second)
+    delta = database.get_observation_changes(after_insert, 100)
+    assert delta['version'] == database.get_data_version() and delta['changes'] == {first: 'U', second: 'D'}, delta
+    assert database.get_observation_changes(start, 100)['changes'] == {first: 'U', second: 'D'}
+    assert database.get_observation_changes(start, 1) is None
+    assert database.get_observation_changes(delta['version'], 100) == {'version': delta['version'], 'changes': {}}
+    return sorted(delta['changes'].values())
+
+
+def check_dashboard(database):
+    for i, days in enumerate((0, 1, 9, 31, 40, 70)):
+        database.add_observation_to_db(_entry(i, floor=['G', '1'][i % 2], risk=(i % 5 + 1, 3), person=['Security', None][i % 2], days=days))
+    full = database.get_dashboard_aggregates(trend_bucket='month')
+    assert full['total'] == 6 and full['risk_sum'] == sum((i % 5 + 1) * 3 for i in range(6))
+    assert full['high_risk'] == sum(1 for i in range(6) if (i % 5 + 1) * 3 >= database.HIGH_RISK_THRESHOLD)
+    ranged = database.get_dashboard_aggregates(datetime.date(2025, 3, 2), datetime.date(2025, 4, 10), 'week')
+    assert ranged['total'] == 4, ranged
+    # A reassessment moves the observation between risk buckets.
+    last = database.get_observations_from_db()[0]['id']
+    database.update_observation_analysis(last, {'Likelihood': 5, 'Severity': 5})
+    after = database.get_dashboard_aggregates(trend_bucket='day')
+    assert after['total'] == 6 and (25, 1) in after['risk_distribution']
+    assert database.rebuild_dashboard_rollups() > 0
+    assert database.get_dashboard_aggregates(trend_bucket='day') == dict(after, version=database.get_data_version())
+    return {name: [list(map(str, row)) for row in value] if isinstance(value, list) else value
+            for name, value in dict(ranged, version=None).items()}
+
+
+def check_duplicates(database):
+    original = database.add_observation_to_db(_entry(1, days=0, dedup_bands=[11, -12, 2**62], dedup_signature=[5, 6, 7]))
+    other = database.add_observation_to_db(_entry(2, days=0, dedup_bands=[99], dedup_signature=[1, 1, 1]))
+    window_hours = (datetime.datetime.now(datetime.timezone.utc) - DAY).total_seconds() / 3600 + 24
+    candidates = database.find_duplicate_candidates([-12, 500], window_hours, 5)
+    assert [row['id'] for row in candidates] == [original] and list(candidates[0]['dedup_signature']) == [5, 6, 7]
+    assert database.find_duplicate_candidates([-12], window_hours, 5, exclude_id=original) == []
+    assert database.find_duplicate_candidates([-12], 1, 5) == []
+    assert database.link_duplicate_report(original) == 2 and database.link_duplicate_report(10**6) is None
+    repeat = database.add_observation_to_db(_entry(3, days=1, duplicate_of=original))
+    assert database.find_duplicate_candidates([99], window_hours, 5)[0]['id'] == other
+    todo = database.get_observations_for_fingerprinting(10)
+    assert [row['id'] for row in todo] == [repeat]
+    database.update_dedup_fingerprints([(repeat, [11], [5, 6, 8])])
+    assert database.get_observations_for_fingerprinting(10) == []
+    fingerprints = [(row['id'], list(row['dedup_bands']), list(row['dedup_signature'])) for row in database.iter_dedup_fingerprints(fetch_size=1)]
+    assert fingerprints == [(original, [11, -12, 2**62], [5, 6, 7]), (other, [99], [1, 1, 1])], fingerprints
+    assert database.link_duplicate_clusters([(original, [other, original])]) == 1
+    assert database.link_duplicate_clusters([(original, [other])]) == 0
+    rows = {row['id']: row for row in database.get_observations_from_db()}
+    assert rows[original]['report_count'] == 3 and rows[other]['duplicate_of'] == original
+    database.delete_observation_from_db(original)
+    assert {row['duplicate_of'] for row in database.get_observations_from_db()} == {None}
+    reusable = database.get_reusable_analysis(database.add_observation_to_db(_entry(4, risk=(2, 2), person="Security")))
+    assert reusable['Likelihood'] == 2 and reusable['ResponsiblePerson'] == "Security"
+    return reusable
+
+
+def check_ai_cache(database):
+    database.store_cached_ai_analysis('a', 'v1', {'Likelihood': 2, 'nested': {'x': [1, 2]}})
+    database.store_cached_ai_analysis('b', 'v2', {'Likelihood': 3})
+    database.store_cached_ai_analysis('a', 'v2', {'Likelihood': 4})
+    assert database.get_cached_ai_analysis('a', 60) == {'Likelihood': 4} and database.get_cached_ai_analysis('c', 60) is None
+    assert database.get_cached_ai_analysis('a', 0) is None
+    assert database.delete_cached_ai_analyses(keep_prompt_version='v2') == 0
+    assert database.delete_cached_ai_analyses() == 2
+    return True
+
+
+def check_photos(database):
+    inline = database.add_observation_to_db(_entry(1, photo_bytes=b'original', photo_thumb=b'thumb'))
+    stored = database.add_observation_to_db(_entry(2, photo_key='k-original', photo_excel_thumb_key='k-excel'))
+    bare = database.add_observation_to_db(_entry(3))
+    assert database.get_photo_from_db(inline, 'thumb') == (b'thumb', True)
+    assert database.get_photo_from_db(inline, 'excel') == (b'original', False)
+    assert database.get_photo_from_db(bare) == (None, False)
+    assert database.get_photo_etag_from_db(inline, 'thumb') == f"obs-{inline}-8-thumb-5" and database.get_photo_etag_from_db(bare) is None
+    assert database.get_photo_key_from_db(stored, 'excel') == ('k-excel', True)
+    assert database.get_photo_key_from_db(stored, 'thumb') == ('k-original', False)
+    assert database.get_observations_missing_thumbnails(10) == [(inline, b'original', None), (stored, None, 'k-original')]
+    database.update_photo_variants([(inline, {'photo_bytes': None, 'photo_thumb': None, 'photo_excel_thumb': None,
+                                              'photo_key': 'k2', 'photo_thumb_key': 'k2-thumb', 'photo_excel_thumb_key': 'k2-excel'})])
+    assert database.get_inline_photos(10) == []
+    assert database.get_referenced_photo_keys(['k2', 'k-excel', 'gone']) == {'k2', 'k-excel'}
+    assert [row['has_photo'] for row in database.get_observations_from_db(None, 'date_oldest')] == [True, True, False]
+    assert database.delete_observation_from_db(stored) == ['k-original', 'k-excel']
+    return True
+
+
+def check_export(database):
+    ids = [database.add_observation_to_db(_entry(i, location=['Lobby', 'Kitchen'][i % 2], risk=(i % 3 + 1, 2), days=i)) for i in range(7)]
+    version = database.get_export_version()
+    assert (version['max_id'], version['row_count']) == (ids[-1], 7)
+    assert database.get_export_version('kitchen')['row_count'] == 3
+    rows = list(database.iter_observations_for_export(fetch_size=2))
+    assert [row['id'] for row in rows] == ids and rows[0]['risk_rating'] == 2
+    assert [row['id'] for row in database.iter_observations_for_export('lobby', 'risk_high', fetch_size=3)] == [ids[2], ids[4], ids[6], ids[0]]
+    database.update_observation_analysis(ids[0], {'Likelihood': 5, 'Severity': 5})
+    assert database.get_export_version()['last_modified'] > version['last_modified']
+    return [row['id'] - ids[0] for row in database.iter_observations_for_export(None, 'date_newest', filters={'date_from': '2025-03-03'})]
+
+
+def check_bulk_import(database):
+    import bulk_import
+    records = [(i + 2, {'date': f'2025-03-{i + 1:02d}', 'floor': 'G', 'location': 'Spa', 'description': f"Imported hazard {i}",
+                        'likelihood': 2 if i % 2 else None, 'severity': 2 if i % 2 else None}) for i in range(10)]
+    summary = bulk_import.import_rows(records, analyse=bulk_import.ANALYSE_MISSING, chunk_size=4)
+    assert summary['imported'] == 10, summary
+    rows = database.get_observations_from_db(None, 'date_oldest')
+    assert [row['description'] for row in rows] == [f"Imported hazard {i}" for i in range(10)]
+    assert [row['analysis_status'] for row in rows[:2]] == ['pending', 'complete']
+    assert database.get_dashboard_aggregates(trend_bucket='month')['total'] == 10
+    database.analyze_observations()
+    return [(row['date_str'], row['risk_rating']) for row in rows]
+
+
+CHECKS = [
+    check_save_and_analyse, check_report_pages, check_search_and_filters, check_change_tracking,
+    check_dashboard, check_duplicates, check_ai_cache, check_photos, check_export, check_bulk_import,
+]
+
+
+# --- Worker (one backend per process) ---
+def _reset(database, url):
+    """Gives the checks and the benchmark an empty database."""
+    if database.STORAGE_BACKEND == 'sqlite':
+        import sqlite_backend
+        database.close_pool()
+        path = sqlite_backend.database_path(url)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        database.init_db()
+    else:
+        from benchmarks import bench_pipeline
+        bench_pipeline._reset_schema()
+
+
+def run_checks(database, url):
+    results = {}
+    for check in CHECKS:
+        _reset(database, url)
+        try:
+            results[check.__name__] = {'ok': True, 'result': json.loads(json.dumps(check(database), default=str))}
+        except Exception as e:
+            results[check.__name__] = {'ok': False, 'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}
+    return results
+
+
+def _discard(result):
+    """Counts a timed call as one item whatever it returns."""
+    return None
+
+
+def run_benchmark(database, url, rows, repeat):
+    import bulk_import
+    import near_duplicates
+    from benchmarks.bench_pipeline import SEARCHES, SORTS, _measure, _observation_text, _seed_records
+
+    _reset(database, url)
+    rng = random.Random(rows)
+    results = [_measure('seed', lambda _: bulk_import.import_rows(_seed_records(rows, rng), analyse=bulk_import.ANALYSE_NONE)['imported'], 1)]
+    database.analyze_observations()
+
+    inserted = []
+    def insert(_):
+        # The form's save path: duplicate lookup, then the insert.
+        floor, location, description = _observation_text(rng)
+        near_duplicates.find_duplicates(floor, location, description)
+        fingerprint = near_duplicates.fingerprint(floor, location, description)
+        inserted.append(database.add_observation_to_db({
+            'date_str': datetime.date.today().strftime('%d-%b-%Y'), 'floor_from_user': floor, 'location_from_user': location,
+            'observation_text': description, 'dedup_bands': fingerprint.bands, 'dedup_signature': fingerprint.signature.tolist()}))
+    results.append(_measure('insert', insert, repeat))
+
+    def analyse(i):
+        job = database.claim_analysis(inserted[i])
+        database.update_observation_analysis(job['id'], {'Likelihood': 3, 'Severity': 4, 'ResponsiblePerson': "engineering"})
+    results.append(_measure('analyse', analyse, repeat))
+
+    results.append(_measure('first_page', lambda i: len(database.get_observations_page(None, SORTS[i % len(SORTS)])['observations']), repeat))
+    results.append(_measure('search', lambda i: len(database.get_observations_page(SEARCHES[i % len(SEARCHES)], 'relevance')['observations']), repeat))
+    cursor = [None]
+    def next_page(_):
+        page = database.get_observations_page(None, 'date_newest', cursor=cursor[0], with_total=False)
+        cursor[0] = page['next_cursor']
+        return len(page['observations'])
+    results.append(_measure('paginate', next_page, repeat))
+    today = datetime.date.today()
+    filters = {'date_from': (today - datetime.timedelta(days=90)).isoformat(), 'floor': 'groundfloor'}
+    results.append(_measure('filtered', lambda _: len(database.get_observations_page(None, 'risk_high', filters=filters)['observations']), repeat))
+    results.append(_measure('filter_options', lambda _: _discard(database.get_report_filter_options()), repeat))
+    results.append(_measure('dashboard', lambda _: _discard(database.get_dashboard_aggregates(today - datetime.timedelta(days=365), today, 'week')), repeat))
+    results.append(_measure('export', lambda _: sum(1 for _ in database.iter_observations_for_export()), max(1, repeat // 10)))
+    results.append(_measure('delete', lambda i: _discard(database.delete_observation_from_db(inserted[i])), repeat))
+    return results
+
+
+def worker(args):
+    from benchmarks import bench_pipeline
+    url = os.environ.get('DATABASE_URL')
+    if not url.startswith('sqlite:'):
+        bench_pipeline._use_bench_schema()
+    import database
+    database.REPORT_CACHE_ENABLED = False
+    output = {'backend': database.STORAGE_BACKEND, 'checks': run_checks(database, url), 'results': []}
+    try:
+        if not args.checks_only:
+            output['results'] = run_benchmark(database, url, args.rows, args.repeat)
+    finally:
+        if database.STORAGE_BACKEND != 'sqlite':
+            bench_pipeline._reset_schema(drop_only=True)
+    with open(args.output, 'w') as f:
+        json.dump(output, f)
+    return 0
+
+
+# --- Reporting ---
+def _label(url):
+    return url.split('://', 1)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', action='append', help="A database URL to test; repeat for several backends.")
+    parser.add_argument('--rows', type=int, default=10000, help="Observations bulk imported for the benchmark.")
+    parser.add_argument('--repeat', type=int, default=50, help="Calls per timed operation.")
+    parser.add_argument('--checks-only', action='store_true', help="Run the conformance checks without the benchmark.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    work_dir = tempfile.mkdtemp(prefix='riskwatch-storage-')
+    urls = args.url or ['sqlite:///' + os.path.join(work_dir, 'bench.db')]
+    if not args.url and os.getenv('DATABASE_URL', '').startswith(('postgres://', 'postgresql://')):
+        urls.append(os.environ['DATABASE_URL'])
+
+    runs = {}
+    for i, url in enumerate(urls):
+        output_path = os.path.join(work_dir, f'result-{i}.json')
+        command = [sys.executable, '-m', 'benchmarks.bench_storage', '--worker', '--output', output_path,
+                   '--rows', str(args.rows), '--repeat', str(args.repeat)] + (['--checks-only'] if args.checks_only else [])
+        print(f"--- {_label(url)} ---", flush=True)
+        subprocess.run(command, env=dict(os.environ, DATABASE_URL=url), check=True, stdout=subprocess.DEVNULL)
+        with open(output_path) as f:
+            runs[f"{_label(url)}#{i}" if _label(url) in (_label(u) for u in urls[:i]) else _label(url)] = json.load(f)
+
+    failures = 0
+    print("\nConformance:")
+    for name in (check.__name__ for check in CHECKS):
+        outcomes = {label: run['checks'][name] for label, run in runs.items()}
+        failed = {label: outcome['error'] for label, outcome in outcomes.items() if not outcome['ok']}
+        answers = {json.dumps(outcome['result'], sort_keys=True) for outcome in outcomes.values() if outcome['ok']}
+        if failed:
+            status = "FAIL " + "; ".join(f"{label}: {error}" for label, error in failed.items())
+        elif len(answers) > 1:
+            status = "MISMATCH between backends"
+        else:
+            status = "ok"
+        failures += status != "ok"
+        print(f"  {name:<28} {status}")
+        for label, outcome in outcomes.items():
+            if not outcome['ok']:
+                print('    ' + outcome['traceback'].strip().replace('\n', '\n    '))
+            elif len(answers) > 1:
+                print(f"    {label}: {json.dumps(outcome['result'], sort_keys=True)[:400]}")
+
+    if not args.checks_only:
+        labels = list(runs)
+        print(f"\nBenchmark ({args.rows:,} rows, p50 / p95 ms):")
+        print(f"  {'op':<15}" + "".join(f"{label:>24}" for label in labels))
+        for index, result in enumerate(runs[labels[0]]['results']):
+            cells = []
+            for label in labels:
+                r = runs[label]['results'][index]
+                cells.append(f"{r['p50_ms']:>10.2f} / {r['p95_ms']:<10.2f}" if r['op'] != 'seed' else f"{r['throughput_per_s']:>15,.0f} rows/s")
+            print(f"  {result['op']:<15}" + "".join(f"{cell:>24}" for cell in cells))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'rows': args.rows, 'repeat': args.repeat, 'runs': runs}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
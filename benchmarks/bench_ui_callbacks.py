@@ -0,0 +1,217 @@
+# benchmarks/bench_ui_callbacks.py
+"""Measures the server round trips of a mobile visit to the static pages.
+
+Replays a scripted visit through the Flask test client: open the landing page, open the
+menu and the Services dropdown, go to the observation form, open and close its menu,
+choose a photo, then visit the near-miss page and go home. A step costs one
+/_dash-update-component request per server callback it triggers. Clientside callbacks
+cost none.
+
+The visit runs twice:
+- "before": a scratch app with the menu toggles and the file name echo as server
+  callbacks, and every page layout rebuilt per visit, as app.py used to do;
+- "after": app.py as it is now.
+Both register their callbacks through metrics.instrument_callbacks.
+
+Each request is timed and its size recorded. Time to interactive is then modelled for
+mobile network profiles: every request costs a round trip plus the server time plus its
+bytes over the link. The first load of the page shell (HTML, scripts, _dash-layout) is
+the same in both runs and is left out.
+
+The visit doesn't read or write observations, so no database is needed.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_ui_callbacks [--repeat 20] [--json results.json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import dash
+from dash import dcc, html, Input, Output, State
+
+import app as riskwatch
+import landing_page
+import metrics
+import near_miss_app
+import observation_app
+
+# (label, triggering prop, its new value, {state prop: value}).
+VISIT = [
+    ("Open the landing page", 'url.pathname', '/', {}),
+    ("Open the menu", 'mobile-menu-toggle.n_clicks', 1, {'nav-links-ul.className': 'nav-links'}),
+    ("Open Services", 'services-dropdown-toggle.n_clicks', 1, {'services-dropdown-content.style': None}),
+    ("Go to the observation form", 'url.pathname', '/observation', {}),
+    ("Open the form's menu", 'obs-mobile-menu-toggle.n_clicks', 1, {'obs-header-nav.className': 'header-nav'}),
+    ("Close the form's menu", 'obs-mobile-menu-toggle.n_clicks', 2, {'obs-header-nav.className': 'header-nav active'}),
+    ("Choose a photo", 'photo-upload.filename', 'site-photo.jpg', {}),
+    ("Go to the near-miss page", 'url.pathname', '/near-miss', {}),
+    ("Go home", 'url.pathname', '/', {}),
+]
+
+# (round trip ms, download kbit/s, upload kbit/s): Chrome DevTools' Slow 3G and Fast 3G
+# presets, and Lighthouse's mobile throttling.
+NETWORKS = {
+    'slow-3g': (2000, 400, 400),
+    'fast-3g': (563, 1475, 675),
+    'slow-4g': (150, 1638, 675),
+}
+
+
+# --- The App Before The Change ---
+def _baseline_app():
+    """Scratch app with the pre-change server callbacks for the UI toggles, and a routing
+    callback that rebuilds every layout on each visit."""
+    app = dash.Dash(__name__, suppress_callback_exceptions=True)
+    app.layout = html.Div([dcc.Location(id='url', refresh=False), html.Div(id='page-content')])
+    callbacks = metrics.instrument_callbacks(app)
+
+    @callbacks.callback(Output('page-content', 'children'), Input('url', 'pathname'))
+    def display_page(pathname):
+        if pathname == '/observation':
+            return observation_app.build_observation_form_page()
+        elif pathname == '/near-miss':
+            return near_miss_app.build_near_miss_page()
+        return landing_page.create_layout(app)
+
+    @callbacks.callback(Output('services-dropdown-content', 'style'), Input('services-dropdown-toggle', 'n_clicks'),
+                        State('services-dropdown-content', 'style'), prevent_initial_call=True)
+    def toggle_services_dropdown(n_clicks, current_style):
+        return {'display': 'none'} if current_style and current_style.get('display') == 'block' else {'display': 'block'}
+
+    @callbacks.callback(Output('nav-links-ul', 'className'), Input('mobile-menu-toggle', 'n_clicks'),
+                        State('nav-links-ul', 'className'), prevent_initial_call=True)
+    def toggle_mobile_menu(n_clicks, current_class):
+        return "nav-links" if 'active' in current_class else "nav-links active"
+
+    @callbacks.callback(Output('obs-header-nav', 'className'), Input('obs-mobile-menu-toggle', 'n_clicks'),
+                        State('obs-header-nav', 'className'), prevent_initial_call=True)
+    def toggle_obs_mobile_menu(n_clicks, current_class):
+        return "header-nav" if 'active' in current_class else "header-nav active"
+
+    @callbacks.callback(Output('selected-file-name', 'children'), Input('photo-upload', 'filename'), prevent_initial_call=True)
+    def update_filename_display(filename):
+        return f"File selected: {filename}" if filename else ""
+
+    return app
+
+
+# --- Replaying The Visit ---
+def _prop(key):
+    component_id, prop = key.split('@')[0].rsplit('.', 1)
+    return {'id': component_id, 'property': prop}
+
+
+def _component_ids(tree):
+    """IDs of the components in a JSON layout tree."""
+    if isinstance(tree, list):
+        return set().union(*map(_component_ids, tree)) if tree else set()
+    if not isinstance(tree, dict):
+        return set()
+    ids = set().union(*map(_component_ids, tree.values())) if tree else set()
+    if isinstance(tree.get('props'), dict) and isinstance(tree['props'].get('id'), str):
+        ids.add(tree['props']['id'])
+    return ids
+
+
+def _server_callbacks(app, trigger, page_ids):
+    """Server callbacks of `app` that `trigger` ('id.prop') sets off. Like the browser,
+    skips callbacks whose components aren't on the page."""
+    triggered = []
+    for output, entry in app.callback_map.items():
+        if 'callback' not in entry or not any(f"{i['id']}.{i['property']}" == trigger for i in entry['inputs']):
+            continue
+        outputs = [_prop(key)['id'] for key in output.strip('.').split('...')]
+        if page_ids.issuperset(outputs + [i['id'] for i in entry['inputs']]):
+            triggered.append((output, entry))
+    return triggered
+
+
+def _request_body(output, entry, trigger, value, state):
+    outputs = [_prop(key) for key in output.strip('.').split('...')]
+    inputs = [dict(i, value=value if f"{i['id']}.{i['property']}" == trigger else None) for i in entry['inputs']]
+    return {
+        'output': output, 'outputs': outputs if output.startswith('..') else outputs[0], 'inputs': inputs,
+        'state': [dict(s, value=state.get(f"{s['id']}.{s['property']}")) for s in entry['state']],
+        'changedPropIds': [trigger],
+    }
+
+
+def replay(app, repeat):
+    """Runs VISIT against `app`. Returns one dict per step: requests made, median server
+    time and the bytes sent each way."""
+    client = app.server.test_client()
+    root_ids = page_ids = {'url', 'page-content'}
+    steps = []
+    for label, trigger, value, state in VISIT:
+        step = {'step': label, 'requests': 0, 'server_ms': 0.0, 'request_bytes': 0, 'response_bytes': 0}
+        for output, entry in _server_callbacks(app, trigger, page_ids):
+            body = json.dumps(_request_body(output, entry, trigger, value, state))
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                response = client.post('/_dash-update-component', data=body, content_type='application/json')
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code not in (200, 204):
+                    raise RuntimeError(f"{label}: {output} answered {response.status_code}: {response.get_data(as_text=True)[:300]}")
+            step['requests'] += 1
+            step['server_ms'] += statistics.median(timings)
+            step['request_bytes'] += len(body)
+            step['response_bytes'] += len(response.get_data())
+            if output == 'page-content.children':
+                page_ids = root_ids | _component_ids(response.get_json()['response'])
+        steps.append(step)
+    return steps
+
+
+def waiting_ms(step, network):
+    """Modelled time the user waits on `step` over `network`."""
+    rtt_ms, down_kbps, up_kbps = NETWORKS[network]
+    if not step['requests']:
+        return 0.0
+    return (step['requests'] * rtt_ms + step['server_ms']
+            + step['request_bytes'] * 8 / up_kbps + step['response_bytes'] * 8 / down_kbps)
+
+
+# --- Reporting ---
+def _print_visit(before, after):
+    print(f"{'step':<28}{'requests':>12}{'server ms':>18}{'response bytes':>22}")
+    for old, new in zip(before, after):
+        print(f"{old['step']:<28}{old['requests']:>6} -> {new['requests']:<3}{old['server_ms']:>9.2f} -> {new['server_ms']:<6.2f}"
+              f"{old['response_bytes']:>11,} -> {new['response_bytes']:<8,}")
+    print(f"{'total':<28}{sum(s['requests'] for s in before):>6} -> {sum(s['requests'] for s in after):<3}"
+          f"{sum(s['server_ms'] for s in before):>9.2f} -> {sum(s['server_ms'] for s in after):<6.2f}")
+
+
+def _print_networks(before, after):
+    print("\nModelled waiting time, ms (before -> after):")
+    print(f"{'step':<28}" + "".join(f"{network:>22}" for network in NETWORKS))
+    for old, new in zip(before, after):
+        print(f"{old['step']:<28}" + "".join(f"{waiting_ms(old, n):>10.0f} -> {waiting_ms(new, n):<8.0f}" for n in NETWORKS))
+    print(f"{'whole visit':<28}" + "".join(
+        f"{sum(waiting_ms(s, n) for s in before):>10.0f} -> {sum(waiting_ms(s, n) for s in after):<8.0f}" for n in NETWORKS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20, help="Times each request is sent; the median is used.")
+    parser.add_argument('--json', help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    before = replay(_baseline_app(), args.repeat)
+    after = replay(riskwatch.app, args.repeat)
+    _print_visit(before, after)
+    _print_networks(before, after)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'before': before, 'after': after, 'networks': NETWORKS,
+                       'waiting_ms': {n: {'before': sum(waiting_ms(s, n) for s in before),
+                                          'after': sum(waiting_ms(s, n) for s in after)} for n in NETWORKS}}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# benchmarks/fake_ai.py
+"""A deterministic stand-in for the Gemini model, for benchmarks and offline runs.
+
+It understands the prompts built by ai_module (single and batched), answers every
+observation with a result derived from its text, and can simulate latency and bad output.
+Install it with `ai_module.ai_model = FakeGeminiModel(...)`.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+_OBSERVATION_RE = re.compile(r'Original Observation: "(.*)"')
+_FLOOR_INPUT_RE = re.compile(r'User\'s Floor Input: "(.*)"')
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Fake `GenerativeModel` with configurable latency and failure injection.
+
+    - base_latency / per_item_latency: seconds per call, and extra per observation in it.
+    - bad_item_rate: fraction of batch entries returned malformed (single-item calls are
+      always well formed, as they are the fallback path).
+    - error_rate: fraction of calls that raise a transient API error (503, retryable).
+    - stall_rate / stall_latency: fraction of calls that hang for stall_latency seconds
+      before answering, like a request stuck on an overloaded backend.
+    """
+
+    def __init__(self, base_latency=0.0, per_item_latency=0.0, bad_item_rate=0.0, error_rate=0.0, seed=0,
+                 stall_rate=0.0, stall_latency=0.0):
+        self.base_latency = base_latency
+        self.per_item_latency = per_item_latency
+        self.bad_item_rate = bad_item_rate
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.items = 0
+
+    @staticmethod
+    def expected_result(observation_text):
+        """The analysis this model gives for `observation_text` (for correctness checks)."""
+        digest = int(hashlib.sha256(observation_text.encode('utf-8')).hexdigest(), 16)
+        return {
+            'CorrectedDescription': f"Checked: {observation_text}",
+            'ImpactOnOperations': "Potential injury to guests or staff.",
+            'Likelihood': 1 + digest % 5,
+            'Severity': 1 + (digest // 5) % 5,
+            'CorrectiveAction': "Rectify the hazard and brief the team.",
+            'ResponsiblePerson': "chief engineer",
+            'DeadlineSuggestion': "24 Hours",
+        }
+
+    def generate_content(self, prompt, **kwargs):
+        observations = _OBSERVATION_RE.findall(prompt)
+        floors = _FLOOR_INPUT_RE.findall(prompt)
+        with self._lock:
+            self.calls += 1
+            self.items += len(observations)
+            fail = self._random.random() < self.error_rate
+            stall = self._random.random() < self.stall_rate
+            batched = '"Index"' in prompt
+            bad = [batched and self._random.random() < self.bad_item_rate for _ in observations]
+
+        time.sleep(self.base_latency + self.per_item_latency * len(observations) + (self.stall_latency if stall else 0))
+        if fail:
+            raise google_exceptions.ServiceUnavailable("Simulated model error")
+
+        results = []
+        for index, text in enumerate(observations, 1):
+            result = self.expected_result(text)
+            if floors:
+                result['StandardizedFloor'] = "groundfloor"
+            if bad[index - 1]:
+                # Alternate between the two ways models get it wrong: dropped and mistyped fields.
+                if index % 2:
+                    del result['Likelihood']
+                else:
+                    result['Severity'] = "high"
+            results.append({'Index': index, **result})
+
+        if batched:
+            return FakeResponse("```json\n" + json.dumps(results) + "\n```")
+        return FakeResponse(json.dumps(results[0]))
@@ -0,0 +1,259 @@
+# bulk_import.py
+"""Bulk loading of historical observations from CSV, XLSX or JSONL files.
+
+Files are read as a stream, each row is validated and normalised, and valid rows are
+loaded with PostgreSQL COPY in chunks, one transaction per chunk. That makes the load
+resumable and keeps memory use flat. Rows that fail validation are reported by line
+number and skipped.
+
+Column headers may be the ones in the Excel report ("Date of Observation", "Corrective
+Action Required", ...) or the database field names (date_str, corrective_action, ...).
+Photos are not imported. Rows without a risk assessment can be left 'pending' so
+analysis_queue.py (or `python manage.py process-pending-analyses`) enriches them later.
+"""
+
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import time
+
+import database
+import floor_normalizer
+import near_duplicates
+
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv('BULK_IMPORT_CHUNK_SIZE', '5000'))
+SUPPORTED_FORMATS = ('csv', 'xlsx', 'jsonl')
+MAX_REPORTED_ERRORS = 50
+
+# How imported rows are handed to the AI analysis queue.
+ANALYSE_MISSING = 'missing'  # rows without a Likelihood/Severity assessment
+ANALYSE_ALL = 'all'
+ANALYSE_NONE = 'none'
+ANALYSE_MODES = (ANALYSE_MISSING, ANALYSE_ALL, ANALYSE_NONE)
+
+# Accepted headers for each field, compared after _normalise_header.
+FIELD_ALIASES = {
+    'date_str': ('date str', 'date', 'date of observation', 'observation date'),
+    'floor': ('floor', 'floor from user'),
+    'location': ('location', 'location from user'),
+    'description': ('description', 'observation', 'observation text'),
+    'impact': ('impact', 'impact on operations'),
+    'likelihood': ('likelihood',),
+    'severity': ('severity',),
+    'corrective_action': ('corrective action', 'corrective action required'),
+    'responsible_person': ('responsible person',),
+    'deadline': ('deadline', 'deadline suggestion'),
+}
+REQUIRED_FIELDS = ('date_str', 'floor', 'location', 'description')
+DATE_INPUT_FORMATS = ('%d-%b-%Y', '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d %b %Y', '%d %B %Y', '%d-%B-%Y')
+DATE_OUTPUT_FORMAT = '%d-%b-%Y'  # same as observations entered through the form
+
+_HEADER_RE = re.compile(r'[^a-z0-9]+')
+_HEADER_LOOKUP = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+
+class RowError(ValueError):
+    """Raised for a row that cannot be imported."""
+
+
+class ImportStopped(Exception):
+    """Raised when loading a chunk fails. `summary` counts the rows already committed."""
+
+    def __init__(self, message, summary):
+        super().__init__(message)
+        self.summary = summary
+
+
+def _normalise_header(header):
+    return _HEADER_RE.sub(' ', str(header or '').lower()).strip()
+
+
+def detect_format(filename):
+    """Returns 'csv', 'xlsx' or 'jsonl' based on the file extension."""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension == 'json' or extension == 'ndjson':
+        extension = 'jsonl'
+    if extension not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported file type '.{extension}'. Use one of: {', '.join(SUPPORTED_FORMATS)}.")
+    return extension
+
+
+# --- Streaming Readers ---
+# Each reader yields (line_number, {header: value}) without loading the whole file.
+
+def iter_csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+
+def iter_xlsx_rows(path):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = next(rows, None) or ()
+        for line_number, values in enumerate(rows, start=2):
+            if values is None or all(v is None or v == '' for v in values):
+                continue
+            yield line_number, dict(zip(headers, values))
+    finally:
+        workbook.close()
+
+def iter_jsonl_rows(path):
+    with open(path, encoding='utf-8-sig') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, RowError(f"invalid JSON ({e.msg})")
+                continue
+            yield line_number, record if isinstance(record, dict) else RowError("expected a JSON object")
+
+READERS = {'csv': iter_csv_rows, 'xlsx': iter_xlsx_rows, 'jsonl': iter_jsonl_rows}
+
+
+# --- Validation ---
+def _clean_text(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+def _parse_date(value):
+    """Returns the date (or datetime, if the input has a time) of an observation."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value
+    text = _clean_text(value)
+    if text is None:
+        return None
+    for fmt in DATE_INPUT_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise RowError(f"unrecognised date '{text}'")
+
+def _parse_score(value, field):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be a number from 1 to 5, got '{value}'")
+    if number != int(number) or not 1 <= number <= 5:
+        raise RowError(f"{field} must be a number from 1 to 5, got '{value}'")
+    return int(number)
+
+def validate_row(record, analyse=ANALYSE_MISSING):
+    """Maps one input record onto observation fields. Raises RowError if it is unusable."""
+    fields = {}
+    for header, value in record.items():
+        field = _HEADER_LOOKUP.get(_normalise_header(header))
+        if field and fields.get(field) is None:
+            fields[field] = value
+
+    row = {
+        'observed_at': _parse_date(fields.get('date_str')),
+        'floor': _clean_text(fields.get('floor')),
+        'location': _clean_text(fields.get('location')),
+        'description': _clean_text(fields.get('description')),
+        'impact': _clean_text(fields.get('impact')),
+        'likelihood': _parse_score(fields.get('likelihood'), 'Likelihood'),
+        'severity': _parse_score(fields.get('severity'), 'Severity'),
+        'corrective_action': _clean_text(fields.get('corrective_action')),
+        'responsible_person': _clean_text(fields.get('responsible_person')),
+        'deadline': _clean_text(fields.get('deadline')),
+    }
+    row['date_str'] = row['observed_at'].strftime(DATE_OUTPUT_FORMAT) if row['observed_at'] else None
+    missing = [field for field in REQUIRED_FIELDS if row[field] is None]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    row['observed_at'] = row['observed_at'].isoformat()
+
+    row['floor'] = floor_normalizer.resolve_floor(row['floor']) or row['floor']
+    assessed = row['likelihood'] is not None and row['severity'] is not None
+    needs_analysis = analyse == ANALYSE_ALL or (analyse == ANALYSE_MISSING and not assessed)
+    # Same defaults as observations saved through the form while their analysis is pending.
+    row['likelihood'] = row['likelihood'] or 0
+    row['severity'] = row['severity'] or 0
+    row['risk_rating'] = row['likelihood'] * row['severity']
+    row['analysis_status'] = database.ANALYSIS_PENDING if needs_analysis else database.ANALYSIS_COMPLETE
+    # Imported rows take part in duplicate detection like submitted ones; linking them is
+    # left to `python manage.py find-duplicates`.
+    fingerprint = near_duplicates.fingerprint(row['floor'], row['location'], row['description'])
+    row['dedup_bands'], row['dedup_signature'] = fingerprint.copy_values() if fingerprint else ('{}', '{}')
+    return row
+
+
+# --- Loading ---
+def _copy_chunk(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # Empty strings were turned into None by validation, so an empty field means NULL.
+        writer.writerow(['' if row[column] is None else row[column] for column in database.BULK_IMPORT_COLUMNS])
+    buffer.seek(0)
+    return database.copy_observations_to_db(buffer)
+
+def import_rows(records, analyse=ANALYSE_MISSING, chunk_size=BULK_IMPORT_CHUNK_SIZE, dry_run=False, progress=None):
+    """Validates and loads (line_number, record) pairs. Returns a summary dict.
+
+    Valid rows are committed chunk by chunk, so if loading stops part-way the summary's
+    'imported' count says how many rows are already in the table.
+    `progress`, if given, is called with the summary after every chunk.
+    """
+    if analyse not in ANALYSE_MODES:
+        raise ValueError(f"analyse must be one of {ANALYSE_MODES}")
+    summary = {'read': 0, 'imported': 0, 'rejected': 0, 'pending_analysis': 0, 'errors': [], 'elapsed_seconds': 0.0}
+    started = time.monotonic()
+    chunk = []
+
+    def flush():
+        if not dry_run:
+            try:
+                _copy_chunk(chunk)
+            except Exception as e:
+                summary['elapsed_seconds'] = time.monotonic() - started
+                raise ImportStopped(f"{e} ({summary['imported']} rows were imported before the failure)", summary) from e
+        summary['imported'] += len(chunk)
+        summary['pending_analysis'] += sum(1 for row in chunk if row['analysis_status'] == database.ANALYSIS_PENDING)
+        summary['elapsed_seconds'] = time.monotonic() - started
+        chunk.clear()
+        if progress:
+            progress(summary)
+
+    for line_number, record in records:
+        summary['read'] += 1
+        try:
+            if isinstance(record, RowError):
+                raise record
+            chunk.append(validate_row(record, analyse))
+        except RowError as e:
+            summary['rejected'] += 1
+            if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                summary['errors'].append((line_number, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    if summary['imported'] and not dry_run:
+        database.analyze_observations()
+    summary['elapsed_seconds'] = time.monotonic() - started
+    return summary
+
+def import_file(path, file_format=None, **kwargs):
+    """Streams a CSV/XLSX/JSONL file into the observations table. See import_rows for options."""
+    file_format = file_format or detect_format(path)
+    return import_rows(READERS[file_format](path), **kwargs)
@@ -0,0 +1,169 @@
+# dashboard_app.py
+"""Risk analytics dashboard: risk distribution, floor x severity heatmap, open items per
+responsible person and trends over time.
+
+Everything is read from the rollup table maintained by triggers on observations (see
+database.get_dashboard_aggregates), so the page costs the same whatever the number of
+observations. The finished figures are cached per data version as well, so a dashboard
+left open by many supervisors is built once per change.
+"""
+
+import datetime
+import os
+from zoneinfo import ZoneInfo
+
+import dash
+from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate
+import plotly.graph_objects as go
+
+import database
+import observation_app
+
+# Fallback refresh for pages without a live event stream (see assets/live-updates.js).
+DASHBOARD_POLL_MS = int(os.getenv('DASHBOARD_POLL_MS', '60000'))
+# How many responsible people the "open items" chart shows.
+DASHBOARD_TOP_PEOPLE = 15
+
+# Range choices: (label, days back or None for all time, trend bucket).
+DASHBOARD_RANGES = {
+    '30d': ("Last 30 days", 30, 'day'),
+    '90d': ("Last 90 days", 90, 'week'),
+    '365d': ("Last 12 months", 365, 'week'),
+    'all': ("All time", None, 'month'),
+}
+SEVERITIES = [1, 2, 3, 4, 5]
+# Same bands as the risk boxes on the report cards.
+RISK_COLORS = [(16, '#c0392b'), (10, '#e67e22'), (5, '#f1c40f'), (0, '#27ae60')]
+
+
+# --- Layout ---
+def build_dashboard_page():
+    """Builds the layout for the risk analytics dashboard."""
+    return html.Div([
+        dcc.Store(id='store-dashboard-version'),
+        # Latest data version pushed by the server; set from assets/live-updates.js.
+        dcc.Store(id='store-dashboard-live-version'),
+        dcc.Interval(id='dashboard-refresh-interval', interval=DASHBOARD_POLL_MS),
+        html.Div(className="report-page-container", children=[
+            observation_app._build_app_header(page_type='dashboard'),
+            html.Div(id='dashboard-container', className="report-main-content", children=[
+                html.H1("Risk Dashboard", className="form-title"),
+                html.Div(className="report-controls", children=[
+                    html.Div(className="sort-dropdown-wrapper", children=[
+                        dcc.Dropdown(
+                            id='dashboard-range',
+                            options=[{'label': label, 'value': key} for key, (label, _, _) in DASHBOARD_RANGES.items()],
+                            value='90d', clearable=False
+                        )
+                    ]),
+                ]),
+                html.Div(id='dashboard-kpis', className='dashboard-kpis'),
+                html.Div(className='dashboard-grid', children=[
+                    dcc.Graph(id='dashboard-trend', className='dashboard-graph dashboard-graph-wide', config={'displayModeBar': False}),
+                    dcc.Graph(id='dashboard-risk-distribution', className='dashboard-graph', config={'displayModeBar': False}),
+                    dcc.Graph(id='dashboard-heatmap', className='dashboard-graph', config={'displayModeBar': False}),
+                    dcc.Graph(id='dashboard-people', className='dashboard-graph dashboard-graph-wide', config={'displayModeBar': False}),
+                ]),
+            ])
+        ])
+    ])
+
+
+# --- Figures ---
+def _range_dates(range_key):
+    """Returns (date_from, date_to, trend bucket) for a DASHBOARD_RANGES key."""
+    _, days, bucket = DASHBOARD_RANGES.get(range_key, DASHBOARD_RANGES['90d'])
+    if days is None:
+        return None, None, bucket
+    today = datetime.datetime.now(ZoneInfo(database.ROLLUP_TIME_ZONE)).date()
+    return today - datetime.timedelta(days=days - 1), today, bucket
+
+
+def _risk_color(risk_rating):
+    return next(color for threshold, color in RISK_COLORS if risk_rating >= threshold)
+
+
+def _layout(title, **kwargs):
+    return dict(title=title, margin=dict(l=50, r=20, t=50, b=40), plot_bgcolor='#ffffff', paper_bgcolor='#ffffff', **kwargs)
+
+
+def _kpi(label, value):
+    return html.Div(className='dashboard-kpi', children=[html.P(label, className='risk-title'), html.P(value, className='dashboard-kpi-value')])
+
+
+def _build_dashboard(range_key):
+    """Returns (KPI children, trend, risk distribution, heatmap, people figure dicts)."""
+    date_from, date_to, bucket = _range_dates(range_key)
+    data = database.get_dashboard_aggregates(date_from, date_to, bucket)
+    total = data['total']
+    kpis = [
+        _kpi("Observations", f"{total:,}"),
+        _kpi("Average risk", f"{data['risk_sum'] / total:.1f}" if total else "-"),
+        _kpi("High risk", f"{data['high_risk']:,}" + (f" ({100 * data['high_risk'] / total:.0f}%)" if total else "")),
+        _kpi("Responsible people", f"{sum(1 for person, _, _ in data['people'] if person):,}"),
+    ]
+
+    buckets = [row[0] for row in data['trend']]
+    trend = go.Figure([
+        go.Bar(x=buckets, y=[row[1] for row in data['trend']], name="Observations", marker_color='#95a5a6'),
+        go.Scatter(x=buckets, y=[row[3] for row in data['trend']], name=f"High risk ({database.HIGH_RISK_THRESHOLD}+)",
+                   mode='lines+markers', line=dict(color='#c0392b')),
+    ], layout=_layout(f"Observations per {bucket}", legend=dict(orientation='h', y=-0.15)))
+
+    risks = [risk for risk, _ in data['risk_distribution']]
+    distribution = go.Figure(
+        go.Bar(x=risks, y=[count for _, count in data['risk_distribution']], marker_color=[_risk_color(risk) for risk in risks]),
+        layout=_layout("Risk rating distribution", xaxis=dict(title="Risk rating (likelihood x severity)", dtick=1), yaxis=dict(title="Observations")),
+    )
+
+    floors = sorted({floor for floor, _, _ in data['floor_severity']})
+    counts = {(floor, severity): count for floor, severity, count in data['floor_severity']}
+    heatmap = go.Figure(
+        go.Heatmap(z=[[counts.get((floor, severity), 0) for severity in SEVERITIES] for floor in floors],
+                   x=SEVERITIES, y=floors, colorscale='Reds', hovertemplate="%{y}, severity %{x}: %{z}<extra></extra>"),
+        layout=_layout("Floor x severity", xaxis=dict(title="Severity", dtick=1), yaxis=dict(type='category')),
+    )
+
+    top_people = data['people'][:DASHBOARD_TOP_PEOPLE][::-1]
+    people = go.Figure(
+        go.Bar(x=[count for _, count, _ in top_people], y=[person.title() if person else "Unassigned" for person, _, _ in top_people],
+               orientation='h', marker_color=[_risk_color(risk_sum / count if count else 0) for _, count, risk_sum in top_people],
+               hovertemplate="%{y}: %{x} open items<extra></extra>"),
+        layout=_layout("Open items per responsible person (colour: average risk)", yaxis=dict(type='category'), height=max(300, 40 + 28 * len(top_people))),
+    )
+    return kpis, trend.to_dict(), distribution.to_dict(), heatmap.to_dict(), people.to_dict()
+
+
+def get_dashboard(range_key):
+    """Returns the dashboard for `range_key` and the data version it shows, building the
+    figures only once per version (the report cache holds them)."""
+    cache = database.get_report_cache()
+    version = cache.current_version()
+    return cache.get_or_load(version, ('dashboard_figures', range_key), lambda: _build_dashboard(range_key)), version
+
+
+# --- Callback Registration Function ---
+def register_callbacks(app):
+    """Registers the dashboard callbacks."""
+
+    @app.callback(
+        Output('dashboard-kpis', 'children'),
+        Output('dashboard-trend', 'figure'),
+        Output('dashboard-risk-distribution', 'figure'),
+        Output('dashboard-heatmap', 'figure'),
+        Output('dashboard-people', 'figure'),
+        Output('store-dashboard-version', 'data'),
+        Input('url', 'pathname'),
+        Input('dashboard-range', 'value'),
+        Input('store-dashboard-live-version', 'data'),
+        Input('dashboard-refresh-interval', 'n_intervals'),
+        State('store-dashboard-version', 'data'),
+    )
+    def update_dashboard(pathname, range_key, live_version, n_intervals, shown_version):
+        if pathname != '/dashboard': raise PreventUpdate
+        refresh_only = dash.callback_context.triggered_id in ('store-dashboard-live-version', 'dashboard-refresh-interval')
+        if refresh_only and shown_version is not None and database.get_report_cache().current_version() == shown_version:
+            raise PreventUpdate
+        (kpis, trend, distribution, heatmap, people), version = get_dashboard(range_key)
+        return kpis, trend, distribution, heatmap, people, version
@@ -1,134 +1,2262 @@
 # database.py
 
+import datetime
+import functools
+import importlib
+import inspect
 import os
-import base64
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import select
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
+import metrics
+
 # Load environment variables from .env file
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
+# --- Connection Pool Settings ---
+# Each gunicorn worker gets its own pool, so the total number of server connections
+# is roughly (workers x DB_POOL_MAX_SIZE). Keep that below Postgres' max_connections.
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '10'))
+# Connections idle for longer than this are pinged with "SELECT 1" before being handed out.
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.getenv('DB_POOL_HEALTHCHECK_IDLE_SECONDS', '30'))
+
+
+# --- Storage Backend ---
+# DATABASE_URL's scheme selects where observations are stored. The functions marked
+# @storage_function below are the PostgreSQL implementations; calling one runs the
+# selected backend's function of the same name, so callers always go through `database.*`
+# and `from database import ...` works whatever the backend. Other backends are modules
+# providing every storage function, with the same signature, plus STORAGE_ATTRIBUTES.
+# The report cache, filters and result shaping in this module are shared by all of them.
+STORAGE_BACKENDS = {
+    'postgres': None,
+    'postgresql': None,
+    'sqlite': 'sqlite_backend',
+}
+# Non-function parts of a backend: query parameter syntax, sort expressions, the classes
+# behind get_pool and get_data_change_listener, and its step for each of MIGRATIONS.
+STORAGE_ATTRIBUTES = ('PARAMETER_FORMAT', 'REPORT_SORT_KEYS', 'ConnectionPool', 'DataChangeListener', 'MIGRATION_STEPS')
+
+def storage_backend(url=DATABASE_URL):
+    """Returns the STORAGE_BACKENDS scheme of a database URL. Unset URLs and libpq
+    key=value strings mean PostgreSQL."""
+    if not url or '://' not in url:
+        return 'postgresql'
+    scheme = url.split('://', 1)[0].lower()
+    if scheme not in STORAGE_BACKENDS:
+        raise ValueError(f"Unsupported DATABASE_URL scheme '{scheme}'; expected one of {', '.join(STORAGE_BACKENDS)}")
+    return scheme
+
+STORAGE_BACKEND = storage_backend()
+
+_postgres_functions = {}  # name -> PostgreSQL implementation, filled in by @storage_function
+_storage = None
+_storage_lock = threading.Lock()
+
+def storage_function(function):
+    """Registers `function` as the PostgreSQL implementation of a storage function and
+    returns a wrapper that calls the selected backend's version."""
+    name = function.__name__
+    _postgres_functions[name] = function
+
+    @functools.wraps(function)
+    def call_backend(*args, **kwargs):
+        return getattr(_storage or get_storage(), name)(*args, **kwargs)
+
+    return call_backend
+
+def _check_storage(module):
+    """Raises TypeError unless `module` has every storage function, with the PostgreSQL
+    signature, every STORAGE_ATTRIBUTES name, and a step for each of MIGRATIONS."""
+    for name in STORAGE_ATTRIBUTES:
+        if not hasattr(module, name):
+            raise TypeError(f"Storage backend {module.__name__} has no {name}")
+    if sorted(module.MIGRATION_STEPS) != [version for version, _ in MIGRATIONS]:
+        raise TypeError(f"Storage backend {module.__name__} has MIGRATION_STEPS for versions {sorted(module.MIGRATION_STEPS)}, "
+                        f"expected 1 to {SCHEMA_VERSION}")
+    for name, function in _postgres_functions.items():
+        implementation = getattr(module, name, None)
+        if not callable(implementation):
+            raise TypeError(f"Storage backend {module.__name__} has no {name}()")
+        if inspect.signature(implementation) != inspect.signature(function):
+            raise TypeError(f"{module.__name__}.{name}{inspect.signature(implementation)} doesn't match "
+                            f"database.{name}{inspect.signature(function)}")
+
+def get_storage():
+    """Returns the backend selected by DATABASE_URL: an object with every storage function
+    and STORAGE_ATTRIBUTES name. Other backends' modules are imported and checked on first use."""
+    global _storage
+    if _storage is not None:
+        return _storage
+    with _storage_lock:
+        if _storage is None:
+            module_name = STORAGE_BACKENDS[STORAGE_BACKEND]
+            if module_name is None:
+                storage = SimpleNamespace(**_postgres_functions, **{name: globals()[name] for name in STORAGE_ATTRIBUTES})
+            else:
+                storage = importlib.import_module(module_name)
+                _check_storage(storage)
+            _storage = storage
+    return _storage
+
+def _param(name):
+    # A named query parameter in the selected backend's syntax.
+    return get_storage().PARAMETER_FORMAT.format(name)
+
+
+# --- Query Instrumentation ---
+def _query_origin():
+    """Name of the function in this module that ran the current query, used as its metric label."""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals is not globals():
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else 'other'
+
+_timed_cursor_classes = {}
+
+def _timed_cursor_class(base):
+    """Subclass of the cursor class `base` that reports each query to metrics.py."""
+    cls = _timed_cursor_classes.get(base)
+    if cls is not None:
+        return cls
+
+    class TimedCursor(base):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                metrics.observe_query(_query_origin(), time.perf_counter() - started, self.rowcount)
+
+        def copy_expert(self, sql, file, size=8192):
+            started = time.perf_counter()
+            try:
+                return super().copy_expert(sql, file, size)
+            finally:
+                metrics.observe_query(_query_origin(), time.perf_counter() - started, self.rowcount)
+
+    cls = _timed_cursor_classes[base] = TimedCursor
+    return cls
+
+def _instrumented_connection_class(driver):
+    class InstrumentedConnection(driver.extensions.connection):
+        """Connection whose cursors (of any cursor_factory) time every query they run."""
+
+        def cursor(self, *args, **kwargs):
+            kwargs['cursor_factory'] = _timed_cursor_class(kwargs.get('cursor_factory') or self.cursor_factory or driver.extensions.cursor)
+            return super().cursor(*args, **kwargs)
+
+    return InstrumentedConnection
+
+
+# --- PostgreSQL Driver ---
+# psycopg2 is imported when the first connection is opened rather than with this module,
+# so importing the app doesn't pay for it and the SQLite backend never loads it.
+# load_driver() binds these names for the functions below.
+psycopg2 = None
+Json = RealDictCursor = execute_values = InstrumentedConnection = None
+TRANSACTION_STATUS_IDLE = TRANSACTION_STATUS_UNKNOWN = None
+_driver_lock = threading.Lock()
+# Named query parameters, as psycopg2 writes them (see _param).
+PARAMETER_FORMAT = '%({})s'
+
+def load_driver():
+    """Imports psycopg2 on first use and returns it."""
+    global psycopg2, Json, RealDictCursor, execute_values, InstrumentedConnection
+    global TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+    if psycopg2 is not None:
+        return psycopg2
+    with _driver_lock:
+        if psycopg2 is None:
+            driver = importlib.import_module('psycopg2')
+            extras = importlib.import_module('psycopg2.extras')
+            Json, RealDictCursor, execute_values = extras.Json, extras.RealDictCursor, extras.execute_values
+            TRANSACTION_STATUS_IDLE = driver.extensions.TRANSACTION_STATUS_IDLE
+            TRANSACTION_STATUS_UNKNOWN = driver.extensions.TRANSACTION_STATUS_UNKNOWN
+            InstrumentedConnection = _instrumented_connection_class(driver)
+            psycopg2 = driver  # last: other threads skip the lock once this is set
+    return psycopg2
+
+
+class PoolError(Exception):
+    """The pool is closed, or no connection became free within its timeout."""
+
+
+class ConnectionPool:
+    """A small, thread-safe pool of PostgreSQL connections with blocking checkout."""
+
+    def __init__(self, dsn, min_size, max_size, timeout, healthcheck_idle_seconds):
+        self.dsn = dsn
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.healthcheck_idle_seconds = healthcheck_idle_seconds
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []  # list of (connection, returned_at) tuples
+        self._size = 0   # connections currently open (idle + checked out)
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_seconds': 0.0,
+            'timeouts': 0,
+            'reconnects': 0,
+            'connections_opened': 0,
+        }
+
+        for _ in range(self.min_size):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        load_driver()
+        try:
+            conn = psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection if metrics.METRICS_ENABLED else None)
+        except psycopg2.OperationalError as e:
+            print(f"FATAL: Could not connect to PostgreSQL database: {e}")
+            raise
+        with self._cond:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        """Checks that an idle connection is still usable before handing it out."""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_idle_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """Checks a connection out of the pool, waiting up to `timeout` seconds if all are busy."""
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = time.monotonic()
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot before connecting so concurrent callers respect max_size.
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"({self.max_size} in use)."
+                    )
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+            if waited:
+                self._stats['wait_time_seconds'] += time.monotonic() - wait_started
+            self._stats['checkouts'] += 1
+
+        # Connecting and health checks happen outside the lock.
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_healthy(conn, idle_since):
+                self._close_quietly(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._stats['reconnects'] += 1
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
         return conn
-    except psycopg2.OperationalError as e:
-        print(f"FATAL: Could not connect to PostgreSQL database: {e}")
-        # In a real app, you might want to exit or handle this more gracefully
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, discarding it if it is broken."""
+        if not discard and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status == TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pid': self.pid,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'checked_out': self._size - len(self._idle),
+            })
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns this process's connection pool (the backend's ConnectionPool), creating it
+    on first use.
+
+    The pool is keyed to the current PID: a pool inherited across a gunicorn fork is
+    abandoned (its sockets belong to the parent) and a fresh one is created in the worker.
+    """
+    global _pool
+    pid = os.getpid()
+    if _pool is not None and _pool.pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != pid:
+            _pool = get_storage().ConnectionPool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                timeout=DB_POOL_TIMEOUT_SECONDS,
+                healthcheck_idle_seconds=DB_POOL_HEALTHCHECK_IDLE_SECONDS,
+            )
+    return _pool
+
+
+@storage_function
+@contextmanager
+def get_db_connection(write=False):
+    """Context manager that checks a pooled connection out and returns it afterwards.
+
+    The transaction is committed if the block exits normally and rolled back otherwise.
+    Connections that failed at the network level are dropped instead of being reused.
+    `write` tells backends with a single writer (SQLite) to take the write lock up front;
+    PostgreSQL ignores it.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    discard = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception as e:
+        discard = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
         raise
+    finally:
+        pool.putconn(conn, discard=discard)
 
-def init_db():
-    """Initializes the database and creates the observations table if it doesn't exist."""
-    conn = get_db_connection()
-    # Use a RealDictCursor to get dictionary-like rows
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        # Note the changes for PostgreSQL:
-        # - SERIAL PRIMARY KEY for auto-incrementing integer
-        # - BYTEA for binary data (replaces BLOB)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS observations (
-                id SERIAL PRIMARY KEY,
-                date_str TEXT NOT NULL,
-                floor TEXT NOT NULL,
-                location TEXT NOT NULL,
-                description TEXT,
-                impact TEXT,
-                likelihood INTEGER,
-                severity INTEGER,
-                risk_rating INTEGER,
-                corrective_action TEXT,
-                responsible_person TEXT,
-                deadline TEXT,
-                photo_bytes BYTEA
+
+def get_pool_stats():
+    """Returns pool statistics (checked-out connections, waits, wait time) for monitoring."""
+    if _pool is None or _pool.pid != os.getpid():
+        return {'pid': os.getpid(), 'size': 0, 'idle': 0, 'checked_out': 0}
+    return _pool.stats()
+
+
+def close_pool():
+    """Closes every idle connection in this process's pool (e.g. on worker shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+# --- Time Partitioning ---
+# `python manage.py partition-observations` turns observations into a table partitioned by
+# month of observed_at (optional; worthwhile once years of history pile up). Date-range
+# queries then only scan the months they cover, and whole months can be detached or
+# dropped (manage.py drop-partitions) instead of deleting rows one by one. Rows outside
+# the monthly partitions land in observations_default.
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))
+_PARTITION_NAME_RE = r'^observations_\d{4}_\d{2}$'
+
+def _add_months(month, count):
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return datetime.date(month.year + years, month_index + 1, 1)
+
+def _partition_name(month):
+    return f"observations_{month:%Y_%m}"
+
+def _is_partitioned(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'observations'::regclass")
+        return cur.fetchone()[0] == 'p'
+
+def _observation_columns(cur, table='observations'):
+    # Column names in table order, without generated columns (which can't be inserted).
+    cur.execute('''
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+    ''', (table,))
+    return [row[0] for row in cur.fetchall()]
+
+def _monthly_partitions(cur):
+    """Returns {first day of month: partition name} for the existing monthly partitions."""
+    cur.execute('''
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'observations'::regclass AND c.relname ~ %s
+    ''', (_PARTITION_NAME_RE,))
+    return {datetime.date(int(name[13:17]), int(name[18:20]), 1): name for (name,) in cur.fetchall()}
+
+def _announce_table_rewrite(cur):
+    # Rows changed without going through the observations triggers: bump the data version
+    # and log a truncate, so report caches and open pages reload in full.
+    cur.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'observations' RETURNING version")
+    version = cur.fetchone()[0]
+    cur.execute("INSERT INTO observation_changes (version, observation_id, op) VALUES (%s, NULL, 'T')", (version,))
+    cur.execute("SELECT pg_notify(%s, %s)", (DATA_CHANGED_CHANNEL, str(version)))
+
+@storage_function
+def ensure_observation_partitions(conn, first_month=None):
+    """Creates the missing monthly partitions from `first_month` (default: this month) up to
+    PARTITION_MONTHS_AHEAD months ahead, and the default partition. Returns the names created.
+
+    Rows already sitting in the default partition for one of those months are moved into
+    the new partition, which briefly locks the table.
+    """
+    this_month = datetime.date.today().replace(day=1)
+    first_month = min(first_month or this_month, this_month)
+    last_month = _add_months(this_month, PARTITION_MONTHS_AHEAD)
+    with conn.cursor() as cur:
+        # Workers starting together would otherwise race to create the same partitions.
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('observations_partitions'))")
+        cur.execute("CREATE TABLE IF NOT EXISTS observations_default PARTITION OF observations DEFAULT")
+        existing = _monthly_partitions(cur)
+        missing = []
+        month = first_month
+        while month <= last_month:
+            if month not in existing:
+                missing.append(month)
+            month = _add_months(month, 1)
+        if not missing:
+            return []
+
+        # A new partition can't be attached while the default one holds rows for its range.
+        ranges_sql = " OR ".join("(observed_at >= %s AND observed_at < %s)" for _ in missing)
+        range_params = [bound for month in missing for bound in (month, _add_months(month, 1))]
+        cur.execute(f"SELECT count(*) FROM observations_default WHERE {ranges_sql}", range_params)
+        stranded = cur.fetchone()[0]
+        if stranded:
+            cur.execute("ALTER TABLE observations DETACH PARTITION observations_default")
+        for month in missing:
+            cur.execute(
+                f"CREATE TABLE {_partition_name(month)} PARTITION OF observations FOR VALUES FROM (%s) TO (%s)",
+                (month, _add_months(month, 1)),
             )
+        if stranded:
+            columns = ", ".join(_observation_columns(cur))
+            cur.execute(f"INSERT INTO observations ({columns}) SELECT {columns} FROM observations_default WHERE {ranges_sql}", range_params)
+            # The insert above added these rows to the rollups again; the detached delete won't remove them.
+            cur.execute("SELECT to_regclass('observation_rollups') IS NOT NULL")
+            if cur.fetchone()[0]:
+                cur.execute(_rollup_upsert_sql(f"SELECT *, -1 AS sign FROM observations_default WHERE {ranges_sql}"), range_params)
+            cur.execute(f"DELETE FROM observations_default WHERE {ranges_sql}", range_params)
+            cur.execute("ALTER TABLE observations ATTACH PARTITION observations_default DEFAULT")
+            print(f"Moved {stranded} observations from observations_default into their monthly partitions.")
+    return [_partition_name(month) for month in missing]
+
+@storage_function
+def create_upcoming_partitions():
+    """Runs ensure_observation_partitions if observations is partitioned. Returns the names
+    of the partitions created, or None if observations isn't partitioned.
+
+    migrate() calls it on every deploy; schedule `python manage.py ensure-partitions` daily
+    as well, so inserts keep landing in monthly partitions between deploys.
+    """
+    with get_db_connection() as conn:
+        if not _is_partitioned(conn):
+            return None
+        return ensure_observation_partitions(conn)
+
+@storage_function
+def partition_observations_table():
+    """Rebuilds observations as a table partitioned by month of observed_at.
+
+    Copies every row in a single transaction that holds an exclusive lock on the table, so
+    run it in a maintenance window. Indexes and triggers are recreated by init_db()
+    afterwards. Returns the number of rows copied, or None if it was already partitioned.
+    """
+    with get_db_connection() as conn:
+        if _is_partitioned(conn):
+            return None
+        with conn.cursor() as cur:
+            cur.execute("LOCK TABLE observations IN ACCESS EXCLUSIVE MODE")
+            cur.execute("SELECT min(observed_at) FROM observations")
+            oldest = cur.fetchone()[0]
+            cur.execute("ALTER TABLE observations RENAME TO observations_unpartitioned")
+            cur.execute('''
+                CREATE TABLE observations (LIKE observations_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED)
+                PARTITION BY RANGE (observed_at)
+            ''')
+            # Unique constraints on a partitioned table must include the partition key.
+            cur.execute("ALTER TABLE observations ADD CONSTRAINT observations_partitioned_pkey PRIMARY KEY (id, observed_at)")
+        ensure_observation_partitions(conn, oldest.date().replace(day=1) if oldest else None)
+        with conn.cursor() as cur:
+            columns = ", ".join(_observation_columns(cur))
+            cur.execute(f"INSERT INTO observations ({columns}) SELECT {columns} FROM observations_unpartitioned")
+            copied = cur.rowcount
+            cur.execute("ALTER SEQUENCE observations_id_seq OWNED BY observations.id")
+            cur.execute("DROP TABLE observations_unpartitioned")
+            _announce_table_rewrite(cur)
+    init_db()
+    return copied
+
+@storage_function
+def drop_observation_partitions(before_month, detach_only=False):
+    """Drops (or just detaches, keeping them as standalone tables) the monthly partitions
+    that end on or before `before_month`. Returns [(partition name, row count)].
+
+    Photos of the dropped rows stay in the photo store until `manage.py prune-photos`.
+    """
+    before_month = before_month.replace(day=1)
+    with get_db_connection() as conn:
+        if not _is_partitioned(conn):
+            raise ValueError("observations is not partitioned; run `python manage.py partition-observations` first.")
+        removed = []
+        with conn.cursor() as cur:
+            for month, name in sorted(_monthly_partitions(cur).items()):
+                if _add_months(month, 1) > before_month:
+                    continue
+                cur.execute(f"SELECT count(*) FROM {name}")
+                removed.append((name, cur.fetchone()[0]))
+                # Detaching bypasses the observations triggers; take the rows out of the rollups.
+                cur.execute(_rollup_upsert_sql(f"SELECT *, -1 AS sign FROM {name}"))
+                cur.execute(f"ALTER TABLE observations DETACH PARTITION {name}")
+                if not detach_only:
+                    cur.execute(f"DROP TABLE {name}")
+            if removed:
+                _announce_table_rewrite(cur)
+    return removed
+
+# --- Schema ---
+# One function per migration (see MIGRATIONS), each adding its part of the schema through
+# the cursor it's given. They check before they change (IF NOT EXISTS, CREATE OR REPLACE),
+# so a step can run again safely and databases created before migrations existed adopt
+# them as they are.
+def _create_observations_table(cur):
+    # Note the changes for PostgreSQL:
+    # - SERIAL PRIMARY KEY for auto-incrementing integer
+    # - BYTEA for binary data (replaces BLOB)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS observations (
+            id SERIAL PRIMARY KEY,
+            date_str TEXT NOT NULL,
+            floor TEXT NOT NULL,
+            location TEXT NOT NULL,
+            description TEXT,
+            impact TEXT,
+            likelihood INTEGER,
+            severity INTEGER,
+            risk_rating INTEGER,
+            corrective_action TEXT,
+            responsible_person TEXT,
+            deadline TEXT,
+            photo_bytes BYTEA
+        )
+    ''')
+    # Supports keyset pagination of the "Highest Risk" sort (see get_observations_page).
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_risk_id_idx ON observations ((COALESCE(risk_rating, 0)), id)")
+
+def _add_photo_columns(cur):
+    # Precomputed thumbnails stored next to the original photo (see photo_processing.py).
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS photo_thumb BYTEA")
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS photo_excel_thumb BYTEA")
+    # Content addresses of photos kept in an external store instead (see photo_store.py).
+    # Indexed so deleting an observation can tell whether a deduplicated blob is still used.
+    for key_column in PHOTO_KEY_COLUMNS.values():
+        cur.execute(f"ALTER TABLE observations ADD COLUMN IF NOT EXISTS {key_column} TEXT")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS observations_{key_column}_idx ON observations ({key_column}) WHERE {key_column} IS NOT NULL")
+
+def _add_search_indexes(cur):
+    # Full-text search over the card text. Location is weighted highest, then floor,
+    # then description, which feeds the "Best Match" ranking.
+    cur.execute('''
+        ALTER TABLE observations ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(location, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(floor, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'C')
+        ) STORED
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_search_vector_idx ON observations USING GIN (search_vector)")
+    # Trigram indexes serve both substring (ILIKE) and fuzzy (word similarity) matches
+    # on the short location/floor fields, e.g. "lobbby" or "B1".
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_location_trgm_idx ON observations USING GIN (location gin_trgm_ops)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_floor_trgm_idx ON observations USING GIN (floor gin_trgm_ops)")
+
+def _add_analysis_status(cur):
+    # Existing rows were analysed synchronously, hence the 'complete' default.
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS analysis_status TEXT NOT NULL DEFAULT 'complete'")
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS analysis_started_at TIMESTAMPTZ")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_analysis_pending_idx ON observations (id) WHERE analysis_status <> 'complete'")
+
+def _add_updated_at(cur):
+    # Last-modified time per row; with max(id) and count(*) it versions the table
+    # (see get_export_version), so unchanged reports can be served from cache.
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()")
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION observations_touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = now();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cur.execute("DROP TRIGGER IF EXISTS observations_touch_updated_at ON observations")
+    cur.execute('''
+        CREATE TRIGGER observations_touch_updated_at BEFORE UPDATE ON observations
+        FOR EACH ROW EXECUTE FUNCTION observations_touch_updated_at()
+    ''')
+
+def _add_observed_at(cur):
+    # When the observation was made, as a real timestamp: date_str is display text
+    # (%d-%b-%Y) that can't be range-filtered or sorted. Rows from before this column
+    # existed are backfilled from date_str once, falling back to updated_at.
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS observed_at TIMESTAMPTZ")
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION observations_parse_date_str(value TEXT) RETURNS TIMESTAMPTZ AS $$
+        BEGIN
+            IF value !~ '^\\s*\\d{1,2}-[A-Za-z]{3}-\\d{4}\\s*$' THEN
+                RETURN NULL;
+            END IF;
+            RETURN to_date(value, 'DD-Mon-YYYY')::timestamptz;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;  -- e.g. 31-Feb-2024
+        END
+        $$ LANGUAGE plpgsql STABLE
+    ''')
+    cur.execute("SELECT attnotnull FROM pg_attribute WHERE attrelid = 'observations'::regclass AND attname = 'observed_at'")
+    if not cur.fetchone()['attnotnull']:
+        cur.execute("UPDATE observations SET observed_at = COALESCE(observations_parse_date_str(date_str), updated_at) WHERE observed_at IS NULL")
+        if cur.rowcount:
+            print(f"Backfilled observed_at for {cur.rowcount} observations.")
+        cur.execute("ALTER TABLE observations ALTER COLUMN observed_at SET DEFAULT now()")
+        cur.execute("ALTER TABLE observations ALTER COLUMN observed_at SET NOT NULL")
+    # Serves the date sorts (keyset pagination) and date-range filters.
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_observed_at_id_idx ON observations (observed_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_floor_idx ON observations (floor)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_responsible_person_idx ON observations (lower(responsible_person))")
+
+def _add_dedup_columns(cur):
+    # LSH band hashes and MinHash signature of the text as submitted; rows sharing a
+    # band hash are duplicate candidates. duplicate_of points a repeat report at the
+    # first report of the hazard, whose report_count counts every report of it.
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS dedup_bands BIGINT[]")
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS dedup_signature INTEGER[]")
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS duplicate_of INTEGER")
+    cur.execute("ALTER TABLE observations ADD COLUMN IF NOT EXISTS report_count INTEGER NOT NULL DEFAULT 1")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_dedup_bands_idx ON observations USING GIN (dedup_bands)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_duplicate_of_idx ON observations (duplicate_of) WHERE duplicate_of IS NOT NULL")
+
+def _create_data_versions(cur):
+    # Table-wide change counter for the report query cache (see ReportCache), plus a
+    # log of which rows each version changed, so open report pages can fetch just
+    # the deltas (see get_observation_changes). Every statement that writes
+    # observations bumps the version and announces it on DATA_CHANGED_CHANNEL.
+    # The row lock on data_versions is held until commit, so versions are handed
+    # out in commit order and a reader never sees version N before N-1.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute("INSERT INTO data_versions (name) VALUES ('observations') ON CONFLICT (name) DO NOTHING")
+    # op is 'I'nsert, 'U'pdate, 'D'elete or 'T'runcate (observation_id NULL).
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS observation_changes (
+            version BIGINT NOT NULL,
+            observation_id INTEGER,
+            op CHAR(1) NOT NULL
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS observation_changes_version_idx ON observation_changes (version)")
+    cur.execute(f'''
+        CREATE OR REPLACE FUNCTION observations_bump_version() RETURNS trigger AS $$
+        DECLARE
+            new_version BIGINT;
+        BEGIN
+            IF TG_OP <> 'TRUNCATE' THEN
+                -- Statements that matched no rows (e.g. an idle analysis sweep) change nothing.
+                IF NOT EXISTS (SELECT 1 FROM changed_rows) THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+            UPDATE data_versions SET version = version + 1 WHERE name = 'observations'
+            RETURNING version INTO new_version;
+            IF TG_OP = 'TRUNCATE' THEN
+                INSERT INTO observation_changes (version, observation_id, op) VALUES (new_version, NULL, 'T');
+            ELSE
+                INSERT INTO observation_changes (version, observation_id, op)
+                SELECT new_version, id, left(TG_OP, 1) FROM changed_rows;
+            END IF;
+            IF new_version % {CHANGE_LOG_PRUNE_EVERY} = 0 THEN
+                DELETE FROM observation_changes WHERE version <= new_version - {CHANGE_LOG_KEEP_VERSIONS};
+            END IF;
+            PERFORM pg_notify('{DATA_CHANGED_CHANNEL}', new_version::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    # Transition tables allow only one event per trigger, hence one trigger per event.
+    cur.execute("DROP TRIGGER IF EXISTS observations_bump_version ON observations")
+    for event, transition in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD'), ('TRUNCATE', None)):
+        trigger_name = f"observations_bump_version_{event.lower()}"
+        referencing = f"REFERENCING {transition} TABLE AS changed_rows" if transition else ""
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON observations")
+        cur.execute(f'''
+            CREATE TRIGGER {trigger_name} AFTER {event} ON observations {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION observations_bump_version()
+        ''')
+
+def _create_dashboard_rollups(cur):
+    # Observation counts per dashboard dimension, per day (grain 'd') and per month
+    # (grain 'm', day = first of the month), kept current by statement triggers. The
+    # dashboard reads whole months from the month rows and only the partial months
+    # at the ends of its date range from the day rows, so it stays a few thousand
+    # small rows however long the history. Rows whose count drops to zero stay.
+    cur.execute("SELECT to_regclass('observation_rollups') IS NULL AS missing")
+    rollups_missing = cur.fetchone()['missing']
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS observation_rollups (
+            dimension TEXT NOT NULL,
+            grain CHAR(1) NOT NULL,
+            day DATE NOT NULL,
+            key1 TEXT NOT NULL,
+            key2 INTEGER NOT NULL,
+            count BIGINT NOT NULL,
+            risk_sum BIGINT NOT NULL,
+            PRIMARY KEY (dimension, grain, day, key1, key2)
+        )
+    ''')
+    cur.execute(f'''
+        CREATE OR REPLACE FUNCTION observations_update_rollups() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                DELETE FROM observation_rollups;
+            ELSIF TG_OP = 'INSERT' THEN
+                {_rollup_upsert_sql("SELECT *, 1 AS sign FROM new_rows")};
+            ELSIF TG_OP = 'DELETE' THEN
+                {_rollup_upsert_sql("SELECT *, -1 AS sign FROM old_rows")};
+            ELSE
+                {_rollup_upsert_sql(_ROLLUP_UPDATED_ROWS_SQL)};
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    for event, referencing in (
+        ('INSERT', "REFERENCING NEW TABLE AS new_rows"),
+        ('UPDATE', "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ('DELETE', "REFERENCING OLD TABLE AS old_rows"),
+        ('TRUNCATE', ""),
+    ):
+        trigger_name = f"observations_update_rollups_{event.lower()}"
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON observations")
+        cur.execute(f'''
+            CREATE TRIGGER {trigger_name} AFTER {event} ON observations {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION observations_update_rollups()
         ''')
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully (PostgreSQL).")
+    if rollups_missing:
+        _rebuild_rollups(cur)
+
+def _create_ai_analysis_cache(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS ai_analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            prompt_version TEXT NOT NULL,
+            result JSONB NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+
+# Migration version -> the step that applies it to PostgreSQL.
+MIGRATION_STEPS = {
+    1: _create_observations_table,
+    2: _add_photo_columns,
+    3: _add_search_indexes,
+    4: _add_analysis_status,
+    5: _add_updated_at,
+    6: _add_observed_at,
+    7: _add_dedup_columns,
+    8: _create_data_versions,
+    9: _create_dashboard_rollups,
+    10: _create_ai_analysis_cache,
+}
+
+
+# --- Schema Migrations ---
+# The app doesn't touch the schema when it starts; `python manage.py migrate` brings it up
+# to date once per deploy (the Procfile's release phase). Each migration runs once, in
+# order, in the same transaction that records its version in schema_migrations. Add
+# schema changes as a new entry at the end of MIGRATIONS, with a step of the same version
+# in every backend's MIGRATION_STEPS, rather than editing a shipped one.
+MIGRATIONS = [
+    (1, "observations table"),
+    (2, "photo thumbnails and photo store keys"),
+    (3, "search indexes"),
+    (4, "deferred AI analysis"),
+    (5, "updated_at"),
+    (6, "observed_at"),
+    (7, "near-duplicate detection"),
+    (8, "data versions and change log"),
+    (9, "dashboard rollups"),
+    (10, "AI analysis cache"),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+# Key of the advisory lock that makes concurrent migrate runs take turns.
+MIGRATION_LOCK_ID = 72617701
+
+@storage_function
+def get_schema_version():
+    """Returns the latest applied migration, or 0 if the database has never been migrated."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return 0
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            return cur.fetchone()[0]
+
+@storage_function
+@contextmanager
+def _migration_lock():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        try:
+            yield
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+
+def _record_migration(cur, version, name):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING", (version, name))
+
+@storage_function
+def _apply_migration(version, name):
+    # The step and its schema_migrations row commit together, or not at all.
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            MIGRATION_STEPS[version](cur)
+            _record_migration(cur, version, name)
+
+def migrate():
+    """Applies the MIGRATIONS newer than the database's schema version, in order, then
+    creates the coming months' partitions (see create_upcoming_partitions).
+    Returns the (version, name) pairs applied."""
+    applied = []
+    with _migration_lock():
+        current = get_schema_version()
+        for version, name in MIGRATIONS:
+            if version <= current:
+                continue
+            started = time.monotonic()
+            _apply_migration(version, name)
+            print(f"Applied migration {version} ({name}) in {time.monotonic() - started:.1f}s.")
+            applied.append((version, name))
+    created = create_upcoming_partitions()
+    if created:
+        print(f"Created partitions {', '.join(created)}.")
+    return applied
+
+def init_db():
+    """Runs every migration step, applied or not, and records the schema as current.
+
+    For scratch databases (the benchmarks) and for restoring indexes and triggers after
+    partition_observations_table rebuilds the table; deploys run migrate() instead.
+    """
+    with _migration_lock():
+        for version, name in MIGRATIONS:
+            _apply_migration(version, name)
+    print(f"Database initialized successfully (schema version {SCHEMA_VERSION}).")
 
 def add_observation_to_db(entry_data):
-    """Adds a new observation record to the database and returns the new ID."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        standardized_floor = entry_data['ai_analysis'].get('StandardizedFloor', entry_data.get('floor_from_user'))
-        likelihood = entry_data['ai_analysis'].get('Likelihood', 0)
-        severity = entry_data['ai_analysis'].get('Severity', 0)
-        
-        # Note the use of %s as placeholders for psycopg2
-        # Use RETURNING id to get the ID of the new row, as lastrowid is not standard
-        sql = '''
-            INSERT INTO observations (
-                date_str, floor, location, description, impact, 
-                likelihood, severity, risk_rating, corrective_action, 
-                responsible_person, deadline, photo_bytes
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING id;
-        '''
-        cur.execute(sql, (
-            entry_data.get('date_str'),
-            standardized_floor,
-            entry_data.get('location_from_user'),
-            entry_data['ai_analysis'].get('CorrectedDescription'),
-            entry_data['ai_analysis'].get('ImpactOnOperations'),
-            likelihood,
-            severity,
-            likelihood * severity,
-            entry_data['ai_analysis'].get('CorrectiveAction'),
-            entry_data['ai_analysis'].get('ResponsiblePerson'),
-            entry_data['ai_analysis'].get('DeadlineSuggestion'),
-            entry_data.get('photo_bytes')
-        ))
-        
-        # Fetch the returned ID
-        last_id = cur.fetchone()[0]
-        
-    conn.commit()
-    conn.close()
-    return last_id
-
-def get_observations_from_db(search_term=None, sort_by='date_newest'):
-    conn = get_db_connection()
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        query = "SELECT * FROM observations"
-        params = []
-
-        if search_term:
-            query += " WHERE description ILIKE %s OR location ILIKE %s OR floor ILIKE %s"
-            # Note: Using ILIKE for case-insensitive search in PostgreSQL
-            params.extend([f'%{search_term}%', f'%{search_term}%', f'%{search_term}%'])
-        
-        if sort_by == 'date_newest':
-            query += " ORDER BY id DESC"
-        elif sort_by == 'date_oldest':
-            query += " ORDER BY id ASC"
-        elif sort_by == 'risk_high':
-            query += " ORDER BY risk_rating DESC"
-        
-        cur.execute(query, params)
-        # fetchall() with RealDictCursor returns a list of dictionary-like objects
-        observations = cur.fetchall()
-        
-    conn.close()
-    
-    # Process photos. psycopg2 returns 'bytea' as bytes, which is what we need.
-    for obs in observations:
-        if obs['photo_bytes']:
-            # The object is already bytes-like, just needs base64 encoding
-            obs['photo_b64'] = base64.b64encode(obs['photo_bytes']).decode('utf-8')
-        else:
-            obs['photo_b64'] = None
+    """Adds a new observation record to the database and returns the new ID.
+
+    If `entry_data` has no 'ai_analysis', the observation is stored as the user typed it
+    with analysis_status 'pending', to be filled in later by update_observation_analysis.
+    'observed_at' defaults to the current time. 'dedup_bands', 'dedup_signature' and
+    'duplicate_of' are optional (see near_duplicates.py).
+    """
+    observation_id = _insert_observation(_observation_row(entry_data))
+    # The trigger's notification may not have reached this worker yet; make sure the
+    # user who just saved sees their observation on the next report load.
+    get_report_cache().mark_stale()
+    return observation_id
+
+def _observation_row(entry_data):
+    """Returns the column values of a new observation (see add_observation_to_db).
+    observed_at is None unless given; the backend fills in the current time."""
+    ai_analysis = entry_data.get('ai_analysis')
+    if ai_analysis is None:
+        ai_analysis = {'CorrectedDescription': entry_data.get('observation_text')}
+        analysis_status = ANALYSIS_PENDING
+    else:
+        analysis_status = ANALYSIS_COMPLETE
+    row = {
+        'date_str': entry_data.get('date_str'),
+        'observed_at': entry_data.get('observed_at'),
+        'floor': ai_analysis.get('StandardizedFloor', entry_data.get('floor_from_user')),
+        'location': entry_data.get('location_from_user'),
+        'analysis_status': analysis_status,
+    }
+    row.update(_analysis_columns(ai_analysis))
+    for field in ('photo_bytes', 'photo_thumb', 'photo_excel_thumb', 'photo_key', 'photo_thumb_key',
+                  'photo_excel_thumb_key', 'dedup_bands', 'dedup_signature', 'duplicate_of'):
+        row[field] = entry_data.get(field)
+    return row
+
+def _analysis_columns(ai_analysis):
+    # Observation columns filled in from an ai_module analysis dict.
+    likelihood = ai_analysis.get('Likelihood', 0)
+    severity = ai_analysis.get('Severity', 0)
+    return {
+        'description': ai_analysis.get('CorrectedDescription'),
+        'impact': ai_analysis.get('ImpactOnOperations'),
+        'likelihood': likelihood,
+        'severity': severity,
+        'risk_rating': likelihood * severity,
+        'corrective_action': ai_analysis.get('CorrectiveAction'),
+        'responsible_person': ai_analysis.get('ResponsiblePerson'),
+        'deadline': ai_analysis.get('DeadlineSuggestion'),
+    }
+
+@storage_function
+def _insert_observation(row):
+    """Inserts a row from _observation_row and returns its id."""
+    columns = list(row)
+    values = ", ".join("COALESCE(%(observed_at)s, now())" if column == 'observed_at' else f"%({column})s" for column in columns)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"INSERT INTO observations ({', '.join(columns)}) VALUES ({values}) RETURNING id", row)
+            return cur.fetchone()[0]
+
+# --- Bulk Import ---
+# Column order of the CSV stream fed to COPY by copy_observations_to_db (see bulk_import.py).
+BULK_IMPORT_COLUMNS = (
+    'date_str', 'observed_at', 'floor', 'location', 'description', 'impact',
+    'likelihood', 'severity', 'risk_rating', 'corrective_action',
+    'responsible_person', 'deadline', 'analysis_status', 'dedup_bands', 'dedup_signature',
+)
+
+@storage_function
+def copy_observations_to_db(csv_stream):
+    """Loads observations from a CSV stream (BULK_IMPORT_COLUMNS order, no header, empty
+    field = NULL) with a single COPY in one transaction. Returns the number of rows loaded."""
+    sql = f"COPY observations ({', '.join(BULK_IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.copy_expert(sql, csv_stream)
+            return cur.rowcount
+
+@storage_function
+def analyze_observations():
+    """Refreshes planner statistics after a bulk load so row estimates and plans stay accurate."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE observations")
+
+# --- Deferred AI Analysis ---
+# Observations are saved immediately and enriched by analysis_queue.py. A row moves from
+# 'pending' to 'processing' when a worker claims it, then to 'complete' or 'failed'.
+ANALYSIS_PENDING = 'pending'
+ANALYSIS_PROCESSING = 'processing'
+ANALYSIS_COMPLETE = 'complete'
+ANALYSIS_FAILED = 'failed'
+
+@storage_function
+def claim_analysis(observation_id):
+    """Marks a pending observation as being analysed. Returns its inputs, or None if
+    another worker already claimed it (or it no longer exists)."""
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('''
+                UPDATE observations
+                SET analysis_status = %s, analysis_started_at = now()
+                WHERE id = %s AND analysis_status = %s
+                RETURNING id, description AS observation_text, floor AS floor_input, location
+            ''', (ANALYSIS_PROCESSING, observation_id, ANALYSIS_PENDING))
+            return cur.fetchone()
+
+@storage_function
+def claim_pending_analyses(limit, stale_after_seconds, include_failed=False, exclude_ids=()):
+    """Claims up to `limit` observations that still need analysis.
+
+    Picks up rows that were never queued (e.g. the queue was full or the worker restarted)
+    and rows whose worker died mid-analysis. SKIP LOCKED lets every gunicorn worker sweep
+    concurrently without claiming the same row twice.
+    """
+    statuses = [ANALYSIS_PENDING, ANALYSIS_FAILED] if include_failed else [ANALYSIS_PENDING]
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('''
+                UPDATE observations
+                SET analysis_status = %(processing)s, analysis_started_at = now()
+                WHERE id IN (
+                    SELECT id FROM observations
+                    WHERE (analysis_status = ANY(%(statuses)s)
+                           OR (analysis_status = %(processing)s
+                               AND analysis_started_at < now() - make_interval(secs => %(stale_after)s)))
+                      AND NOT (id = ANY(%(exclude_ids)s))
+                    ORDER BY id
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, description AS observation_text, floor AS floor_input, location
+            ''', {'processing': ANALYSIS_PROCESSING, 'statuses': statuses, 'stale_after': stale_after_seconds, 'limit': limit, 'exclude_ids': list(exclude_ids)})
+            return cur.fetchall()
+
+def update_observation_analysis(observation_id, ai_analysis):
+    """Writes an AI analysis back to a claimed observation and marks it complete.
+
+    Pass ai_analysis=None to mark the analysis as failed; the user's original text is kept.
+    """
+    if ai_analysis is None:
+        _update_observation(observation_id, {'analysis_status': ANALYSIS_FAILED})
+        return
+    values = _analysis_columns(ai_analysis)
+    # An analysis without a floor or description keeps the ones the user typed.
+    if values['description'] is None:
+        del values['description']
+    if ai_analysis.get('StandardizedFloor') is not None:
+        values['floor'] = ai_analysis['StandardizedFloor']
+    values['analysis_status'] = ANALYSIS_COMPLETE
+    _update_observation(observation_id, values)
+
+@storage_function
+def _update_observation(observation_id, values):
+    """Sets the columns in `values` (a dict) on one observation."""
+    assignments = ", ".join(f"{column} = %({column})s" for column in values)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE observations SET {assignments} WHERE id = %(id)s", dict(values, id=observation_id))
+
+@storage_function
+def release_analysis(observation_id):
+    """Puts a claimed observation back to 'pending', for when the AI could not be reached;
+    the next sweep picks it up again."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE observations SET analysis_status = %s WHERE id = %s AND analysis_status = %s",
+                        (ANALYSIS_PENDING, observation_id, ANALYSIS_PROCESSING))
+
+# --- Near-Duplicate Detection ---
+# Storage side of near_duplicates.py.
+@storage_function
+def find_duplicate_candidates(bands, window_hours, limit, exclude_id=None):
+    """Returns recent original observations sharing at least one LSH band hash with `bands`,
+    newest first, with their dedup_signature for near_duplicates to verify."""
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('''
+                SELECT id, date_str, observed_at, floor, location, description, risk_rating,
+                       analysis_status, report_count, dedup_signature
+                FROM observations
+                WHERE dedup_bands && %(bands)s::bigint[]
+                  AND observed_at >= now() - make_interval(secs => %(window)s)
+                  AND duplicate_of IS NULL
+                  AND id IS DISTINCT FROM %(exclude_id)s
+                ORDER BY observed_at DESC
+                LIMIT %(limit)s
+            ''', {'bands': bands, 'window': window_hours * 3600, 'exclude_id': exclude_id, 'limit': limit})
+            return cur.fetchall()
+
+@storage_function
+def get_reusable_analysis(observation_id):
+    """Returns the AI analysis of a completed observation in the shape ai_module produces,
+    without the description (a repeat report keeps its own words), or None."""
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('''
+                SELECT impact, likelihood, severity, corrective_action, responsible_person, deadline
+                FROM observations WHERE id = %s AND analysis_status = %s
+            ''', (observation_id, ANALYSIS_COMPLETE))
+            return _reusable_analysis(cur.fetchone())
+
+def _reusable_analysis(row):
+    # get_reusable_analysis's row in the shape ai_module produces.
+    if row is None:
+        return None
+    return {
+        'ImpactOnOperations': row['impact'], 'Likelihood': row['likelihood'], 'Severity': row['severity'],
+        'CorrectiveAction': row['corrective_action'], 'ResponsiblePerson': row['responsible_person'],
+        'DeadlineSuggestion': row['deadline'],
+    }
+
+@storage_function
+def link_duplicate_report(observation_id):
+    """Counts one more report of an observation's hazard. Returns the new report_count,
+    or None if the observation no longer exists."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE observations SET report_count = report_count + 1 WHERE id = %s RETURNING report_count", (observation_id,))
+            row = cur.fetchone()
+    get_report_cache().mark_stale()
+    return row[0] if row else None
+
+@storage_function
+def get_observations_for_fingerprinting(limit, after_id=0, include_indexed=False):
+    """Returns (id, floor, location, description) dicts for observations without a dedup
+    signature (every observation with `include_indexed`), in id order after `after_id`."""
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f'''
+                SELECT id, floor, location, description FROM observations
+                WHERE id > %s{"" if include_indexed else " AND dedup_signature IS NULL"}
+                ORDER BY id LIMIT %s
+            ''', (after_id, limit))
+            return cur.fetchall()
+
+@storage_function
+def update_dedup_fingerprints(rows):
+    """Stores (id, band hashes, signature) triples; empty lists mark text with nothing to compare."""
+    if not rows:
+        return
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, '''
+                UPDATE observations AS o SET dedup_bands = v.bands, dedup_signature = v.signature
+                FROM (VALUES %s) AS v (id, bands, signature)
+                WHERE o.id = v.id
+            ''', rows, template="(%s, %s::bigint[], %s::integer[])")
+
+@storage_function
+def iter_dedup_fingerprints(fetch_size=2000):
+    """Yields {id, observed_at, dedup_bands, dedup_signature} for every original observation
+    with a signature, in observed_at order, through a server-side cursor."""
+    with get_db_connection() as conn:
+        with conn.cursor(name='observations_dedup', cursor_factory=RealDictCursor) as cur:
+            cur.execute('''
+                SELECT id, observed_at, dedup_bands, dedup_signature FROM observations
+                WHERE duplicate_of IS NULL AND cardinality(dedup_signature) > 0
+                ORDER BY observed_at, id
+            ''')
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows
+
+@storage_function
+def link_duplicate_clusters(clusters):
+    """Marks each cluster's duplicates as repeat reports of its original and adds them to
+    the original's report_count. `clusters` is [(original id, [duplicate ids])]."""
+    linked = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            for original_id, duplicate_ids in clusters:
+                cur.execute('''
+                    UPDATE observations SET duplicate_of = %s
+                    WHERE id = ANY(%s) AND duplicate_of IS NULL AND id <> %s
+                ''', (original_id, list(duplicate_ids), original_id))
+                newly_linked = cur.rowcount
+                if newly_linked:
+                    cur.execute("UPDATE observations SET report_count = report_count + %s WHERE id = %s", (newly_linked, original_id))
+                    linked += newly_linked
+    get_report_cache().mark_stale()
+    return linked
+
+@storage_function
+def get_analysis_statuses(observation_ids):
+    """Returns {id: analysis_status} for the given observations (missing IDs are omitted)."""
+    if not observation_ids:
+        return {}
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, analysis_status FROM observations WHERE id = ANY(%s)", (list(observation_ids),))
+            return dict(cur.fetchall())
+
+@storage_function
+def get_cached_ai_analysis(cache_key, max_age_seconds):
+    """Returns a cached AI analysis dict, or None if absent or older than `max_age_seconds`."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT result FROM ai_analysis_cache
+                WHERE cache_key = %s AND created_at > now() - make_interval(secs => %s)
+            ''', (cache_key, max_age_seconds))
+            row = cur.fetchone()
+    return row[0] if row else None
+
+@storage_function
+def store_cached_ai_analysis(cache_key, prompt_version, result):
+    """Stores (or refreshes) a cached AI analysis."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                INSERT INTO ai_analysis_cache (cache_key, prompt_version, result)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO UPDATE
+                SET result = EXCLUDED.result, prompt_version = EXCLUDED.prompt_version, created_at = now()
+            ''', (cache_key, prompt_version, Json(result)))
+
+@storage_function
+def delete_cached_ai_analyses(keep_prompt_version=None):
+    """Deletes cached AI analyses, except those for `keep_prompt_version` if given. Returns the count."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if keep_prompt_version is None:
+                cur.execute("DELETE FROM ai_analysis_cache")
+            else:
+                cur.execute("DELETE FROM ai_analysis_cache WHERE prompt_version <> %s", (keep_prompt_version,))
+            return cur.rowcount
+
+# Columns needed to render a report card. photo_bytes is deliberately left out: photos are
+# served separately by the /photos routes, so listing rows never reads the large BYTEA values.
+REPORT_CARD_COLUMNS = (
+    "id, date_str, floor, location, description, impact, likelihood, severity, "
+    "risk_rating, corrective_action, responsible_person, deadline, analysis_status, "
+    "duplicate_of, report_count, (photo_bytes IS NOT NULL OR photo_key IS NOT NULL) AS has_photo"
+)
+
+# Sort options for the report. Each is a list of (SQL expression, direction) pairs; the last
+# key is always the unique id so that keyset cursors are unambiguous.
+# Cast to float8 so the rank survives the round trip through a JSON cursor exactly.
+SEARCH_RANK_SQL = (
+    "(ts_rank_cd(search_vector, websearch_to_tsquery('english', %(search_term)s))"
+    " + greatest(word_similarity(%(search_term)s, location), word_similarity(%(search_term)s, floor)))::float8"
+)
+REPORT_SORT_KEYS = {
+    'date_newest': [('observed_at', 'DESC'), ('id', 'DESC')],
+    'date_oldest': [('observed_at', 'ASC'), ('id', 'ASC')],
+    'risk_high': [('COALESCE(risk_rating, 0)', 'DESC'), ('id', 'DESC')],
+    'relevance': [(SEARCH_RANK_SQL, 'DESC'), ('id', 'DESC')],
+}
+REPORT_PAGE_SIZE = 25
+
+# Markers wrapped around matched words by ts_headline; the UI turns them into <mark> elements.
+HIGHLIGHT_START = '\u27e6'
+HIGHLIGHT_STOP = '\u27e7'
+
+def _build_search_filter(search_term):
+    """Returns (WHERE clause, params dict) for the report search box.
+
+    Descriptions are matched with full-text search (GIN index on search_vector); location
+    and floor are matched by substring or fuzzy word similarity (pg_trgm GIN indexes).
+    """
+    if not search_term:
+        return "", {}
+    params = {'search_term': search_term, 'search_pattern': f'%{search_term}%'}
+    return (
+        " WHERE (search_vector @@ websearch_to_tsquery('english', %(search_term)s)"
+        " OR location ILIKE %(search_pattern)s OR floor ILIKE %(search_pattern)s"
+        " OR %(search_term)s <%% location OR %(search_term)s <%% floor)"
+    ), params
+
+@storage_function
+def _search_filter(search_term):
+    """Returns (FROM clause, [WHERE conditions], params) for the report search box."""
+    where_sql, params = _build_search_filter(search_term)
+    return "observations", [where_sql[len(" WHERE "):]] if where_sql else [], params
+
+# Report filters besides the search box, as taken by the report and export functions in a
+# `filters` dict: observed_at from/to (inclusive dates), exact floor, responsible person.
+REPORT_FILTER_FIELDS = ('date_from', 'date_to', 'floor', 'responsible_person')
+
+def normalize_report_filters(filters):
+    """Returns a dict with the set REPORT_FILTER_FIELDS of `filters`, dates parsed to
+    datetime.date. Raises ValueError for a date that isn't YYYY-MM-DD."""
+    normalized = {}
+    for field in REPORT_FILTER_FIELDS:
+        value = (filters or {}).get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if not value:
+            continue
+        if field in ('date_from', 'date_to') and not isinstance(value, datetime.date):
+            # DatePickerRange sends 'YYYY-MM-DD', possibly followed by a time.
+            value = datetime.date.fromisoformat(value[:10])
+        normalized[field] = value
+    return normalized
+
+def _filters_key(filters):
+    # Hashable form of normalized filters, for the report cache keys.
+    return tuple(sorted((field, str(value)) for field, value in filters.items()))
+
+def _build_report_filter(search_term, filters=None):
+    """Returns (FROM clause, WHERE clause, params dict) for the search box (the backend's
+    _search_filter) plus the report filters.
+
+    Dates compare against observed_at in the session time zone; on a partitioned table
+    a date range only scans the months it covers.
+    """
+    from_sql, conditions, params = _search_filter(search_term)
+    filters = normalize_report_filters(filters)
+    if 'date_from' in filters:
+        conditions.append(f"observed_at >= {_param('date_from')}")
+        params['date_from'] = filters['date_from']
+    if 'date_to' in filters:
+        conditions.append(f"observed_at < {_param('date_to_end')}")
+        params['date_to_end'] = filters['date_to'] + datetime.timedelta(days=1)
+    if 'floor' in filters:
+        conditions.append(f"floor = {_param('floor')}")
+        params['floor'] = filters['floor']
+    if 'responsible_person' in filters:
+        conditions.append(f"lower(responsible_person) = lower({_param('responsible_person')})")
+        params['responsible_person'] = filters['responsible_person']
+    return from_sql, (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+def _build_order_by(sort_by, search_term=None):
+    if sort_by == 'relevance' and not search_term:
+        # Nothing to rank against; fall back to the default order.
+        sort_by = 'date_newest'
+    report_sort_keys = get_storage().REPORT_SORT_KEYS
+    sort_keys = report_sort_keys.get(sort_by, report_sort_keys['date_newest'])
+    return sort_keys, " ORDER BY " + ", ".join(f"{expr} {direction}" for expr, direction in sort_keys)
+
+def is_descending_sort(sort_by, search_term=None):
+    """True if the report's sort order puts higher sort keys first."""
+    sort_keys, _ = _build_order_by(sort_by, (search_term or '').strip() or None)
+    return sort_keys[0][1] == 'DESC'
+
+@storage_function
+def get_observations_from_db(search_term=None, sort_by='date_newest', filters=None):
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            from_sql, where_sql, params = _build_report_filter(search_term, filters)
+            _, order_sql = _build_order_by(sort_by, search_term)
+            cur.execute(f"SELECT {REPORT_CARD_COLUMNS} FROM {from_sql}{where_sql}{order_sql}", params)
+            # fetchall() with RealDictCursor returns a list of dictionary-like objects
+            observations = cur.fetchall()
             
     return observations
 
+# Below this many (estimated) rows an exact count is cheap enough to run instead.
+EXACT_COUNT_THRESHOLD = 10000
+
+def _estimate_row_count(cur, from_sql, where_sql, params):
+    """Estimates how many rows match without counting large result sets.
+
+    Uses the planner's estimate, which is instant regardless of table size. For the
+    unfiltered table this is pg_class.reltuples as maintained by (auto)vacuum/analyze.
+    Small results are counted exactly so the report doesn't show "about 37" for 40 rows.
+    """
+    if not where_sql:
+        # A partitioned table has no statistics of its own; add up its partitions'.
+        cur.execute('''
+            SELECT COALESCE(sum(reltuples) FILTER (WHERE reltuples >= 0), -1)::bigint AS estimate FROM pg_class
+            WHERE oid = 'observations'::regclass AND relkind = 'r'
+               OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'observations'::regclass)
+        ''')
+        row = cur.fetchone()
+        # reltuples is -1 if the table has never been analyzed.
+        estimate = row['estimate'] if row else -1
+    else:
+        cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {from_sql}{where_sql}", params)
+        plan = cur.fetchone()['QUERY PLAN']
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < EXACT_COUNT_THRESHOLD:
+        cur.execute(f"SELECT count(*) AS exact FROM {from_sql}{where_sql}", params)
+        return cur.fetchone()['exact']
+    return estimate
+
+@storage_function
+def _count_report_rows(from_sql, where_sql, params):
+    """Returns the (estimated) number of rows of a _build_report_filter result."""
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            return _estimate_row_count(cur, from_sql, where_sql, params)
+
+# --- Report Query Cache ---
+# Report pages are cached per worker, keyed by the data version as well as the query, so
+# a write makes every older entry unreachable at once. The version lives in the
+# data_versions table and is bumped by statement triggers on observations (see _create_data_versions),
+# which covers form saves, deletes, bulk imports and background analysis updates alike.
+REPORT_CACHE_ENABLED = os.getenv('REPORT_CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv('REPORT_CACHE_MAX_ENTRIES', '256'))
+# Upper bound on how stale a page can be if a notification is ever missed.
+REPORT_CACHE_TTL_SECONDS = float(os.getenv('REPORT_CACHE_TTL_SECONDS', '60'))
+# How long a request waits for another thread already loading the same page.
+REPORT_CACHE_WAIT_SECONDS = float(os.getenv('REPORT_CACHE_WAIT_SECONDS', '5'))
+DATA_CHANGED_CHANNEL = 'observations_changed'
+# observation_changes keeps the rows changed by the last CHANGE_LOG_KEEP_VERSIONS versions
+# and is trimmed by the trigger every CHANGE_LOG_PRUNE_EVERY versions.
+CHANGE_LOG_KEEP_VERSIONS = 10000
+CHANGE_LOG_PRUNE_EVERY = 500
+# The listener checks its connection this often while no notifications arrive.
+LISTEN_KEEPALIVE_SECONDS = 30
+LISTEN_RETRY_SECONDS = 5
+
+
+@storage_function
+def get_data_version():
+    """Returns the current version of the observations table (see _create_data_versions)."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM data_versions WHERE name = 'observations'")
+            row = cur.fetchone()
+    return row[0] if row else 0
+
+
+class DataChangeListener:
+    """One LISTEN connection per process that passes every new data version to subscribers.
+
+    Runs on a daemon thread and reconnects after errors. Subscribers (the report cache,
+    live_events.py) are called on that thread with the version number, so they must
+    return quickly. After each (re)connect the current version is read and published,
+    since writes made while disconnected were not announced.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.connected = False
+        self.version = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._listen, name='data-change-listener', daemon=True).start()
+
+    def subscribe(self, callback):
+        """Calls `callback(version)` for every new version, starting with the current one."""
+        with self._lock:
+            self._subscribers.append(callback)
+            version = self.version
+        if version is not None:
+            callback(version)
+
+    def _publish(self, version):
+        with self._lock:
+            if self.version is not None and version <= self.version:
+                return
+            self.version = version
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(version)
+            except Exception as e:
+                print(f"Data change listener: Error in subscriber {callback}: {e}")
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = load_driver().connect(DATABASE_URL)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {DATA_CHANGED_CHANNEL}")
+                    cur.execute("SELECT version FROM data_versions WHERE name = 'observations'")
+                    row = cur.fetchone()
+                    self._publish(row[0] if row else 0)
+                    self.connected = True
+                    while True:
+                        if select.select([conn], [], [], LISTEN_KEEPALIVE_SECONDS) == ([], [], []):
+                            cur.execute("SELECT 1")  # detects a dropped connection
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            self._publish(int(conn.notifies.pop(0).payload))
+            except Exception as e:
+                print(f"Data change listener: Disconnected ({e}); retrying in {LISTEN_RETRY_SECONDS}s.")
+            finally:
+                self.connected = False
+                if conn is not None and not conn.closed:
+                    conn.close()
+            time.sleep(LISTEN_RETRY_SECONDS)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_data_change_listener():
+    """Returns this process's listener (keyed by PID, like get_pool), starting it on first use."""
+    global _listener
+    pid = os.getpid()
+    if _listener is not None and _listener.pid == pid:
+        return _listener
+    with _listener_lock:
+        if _listener is None or _listener.pid != pid:
+            _listener = get_storage().DataChangeListener()
+    return _listener
+
+
+class ReportCache:
+    """Per-process TTL cache of report pages, invalidated through LISTEN/NOTIFY.
+
+    Follows the data version published by this process's DataChangeListener. While the
+    listener is not connected, each lookup reads the version from data_versions instead
+    (a primary-key lookup), so results are never served from an older version than the
+    database has.
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.pid = os.getpid()
+        self._cache = TTLCache(maxsize=max(1, max_entries), ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> threading.Event for loads in progress
+        self._version = None  # highest data version seen
+        self._trusted = False  # False: read the version from the database on the next lookup
+        self._stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'invalidations': 0, 'saved_seconds': 0.0, 'query_seconds': 0.0}
+        self._listener = get_data_change_listener()
+        self._listener.subscribe(self._set_version)
+
+    # --- Versioning ---
+    def _set_version(self, version):
+        with self._lock:
+            if self._version is not None and version <= self._version:
+                return
+            if self._version is not None:
+                self._stats['invalidations'] += 1
+                # Old entries can no longer be hit; free them now rather than at TTL expiry.
+                self._cache.clear()
+            self._version = version
+
+    def mark_stale(self):
+        """Makes the next lookup read the version from the database instead of trusting
+        the listener, e.g. right after this process wrote to observations."""
+        with self._lock:
+            self._trusted = False
+
+    def current_version(self):
+        """Returns the latest data version, from the listener if it is connected."""
+        with self._lock:
+            if self._listener.connected and self._trusted:
+                return self._version
+            self._trusted = True
+        self._set_version(get_data_version())
+        with self._lock:
+            return self._version
+
+    # --- Lookups ---
+    def get_or_load(self, version, query_key, loader):
+        """Returns the cached result for `query_key` at data `version`, or calls `loader`.
+
+        Concurrent misses for the same key share one database query.
+        """
+        key = (version,) + query_key
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._stats['hits'] += 1
+                self._stats['saved_seconds'] += entry[1]
+                return entry[0]
+            pending = self._loading.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._loading[key] = threading.Event()
+
+        if not owner:
+            pending.wait(REPORT_CACHE_WAIT_SECONDS)
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    self._stats['coalesced'] += 1
+                    self._stats['saved_seconds'] += entry[1]
+                    return entry[0]
+            # The other load failed or is slow; run our own query without caching it.
+            return self._timed_load(loader)[0]
+
+        try:
+            result, seconds = self._timed_load(loader)
+            with self._lock:
+                self._cache[key] = (result, seconds)
+            return result
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.set()
+
+    def _timed_load(self, loader):
+        started = time.monotonic()
+        result = loader()
+        seconds = time.monotonic() - started
+        with self._lock:
+            self._stats['misses'] += 1
+            self._stats['query_seconds'] += seconds
+        return result, seconds
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'entries': len(self._cache), 'max_entries': int(self._cache.maxsize), 'version': self._version, 'listening': self._listener.connected})
+        lookups = stats['hits'] + stats['coalesced'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['coalesced']) / lookups, 4) if lookups else None
+        stats['saved_seconds'] = round(stats['saved_seconds'], 3)
+        stats['query_seconds'] = round(stats['query_seconds'], 3)
+        return stats
+
+
+class _NoReportCache:
+    """Stand-in used when REPORT_CACHE_ENABLED is off."""
+
+    def current_version(self):
+        return get_data_version()
+
+    def get_or_load(self, version, query_key, loader):
+        return loader()
+
+    def mark_stale(self):
+        pass
+
+    def stats(self):
+        return {'enabled': False}
+
+
+_report_cache = None
+_report_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """Returns this process's report cache (keyed by PID, like get_pool)."""
+    global _report_cache
+    if not REPORT_CACHE_ENABLED:
+        return _NoReportCache()
+    pid = os.getpid()
+    if _report_cache is not None and _report_cache.pid == pid:
+        return _report_cache
+    with _report_cache_lock:
+        if _report_cache is None or _report_cache.pid != pid:
+            _report_cache = ReportCache(REPORT_CACHE_MAX_ENTRIES, REPORT_CACHE_TTL_SECONDS)
+    return _report_cache
+
+
+def get_report_cache_stats():
+    """Returns hits, misses, hit ratio and the query time saved by the report cache in this process."""
+    if not REPORT_CACHE_ENABLED:
+        return {'enabled': False}
+    if _report_cache is None or _report_cache.pid != os.getpid():
+        return {'enabled': True, 'pid': os.getpid(), 'entries': 0}
+    return dict(_report_cache.stats(), enabled=True, pid=os.getpid())
+
+
+def _copy_page(page):
+    # Callers may modify the rows they get back, so never hand out the cached objects.
+    return dict(page, observations=[dict(row, sort_key=list(row['sort_key'])) for row in page['observations']],
+                next_cursor=list(page['next_cursor']) if page['next_cursor'] else None)
+
+
+def get_observations_page(search_term=None, sort_by='date_newest', cursor=None, page_size=REPORT_PAGE_SIZE, with_total=True, filters=None):
+    """Returns one page of report rows using keyset (seek) pagination.
+
+    `cursor` is the `next_cursor` value from the previous page (None for the first page).
+    Each page is an index range scan that starts where the previous page ended, so the
+    cost stays the same no matter how deep the user scrolls. When searching, each row
+    also gets a `description_highlighted` value with matches wrapped in HIGHLIGHT_START /
+    HIGHLIGHT_STOP. Every row has a `sort_key` list, its position in the sort order.
+    `filters` narrows the rows further (see REPORT_FILTER_FIELDS).
+    Results come from the report cache while the data is unchanged. Returns a dict:
+    {'observations': [...], 'next_cursor': list or None, 'total_estimate': int or None,
+     'version': data version the page is at least as new as}.
+    """
+    search_term = (search_term or '').strip() or None
+    filters = normalize_report_filters(filters)
+    cache = get_report_cache()
+    version = cache.current_version()
+    query_key = (search_term, sort_by, tuple(cursor) if cursor else None, page_size, with_total, _filters_key(filters))
+    page = cache.get_or_load(
+        version, query_key, lambda: _query_observations_page(search_term, sort_by, cursor, page_size, with_total, filters))
+    return dict(_copy_page(page), version=version)
+
+
+def _report_query(search_term, sort_by, from_sql, where_sql, suffix_sql=""):
+    """Returns (sort_keys, SQL) selecting card columns plus sort_key_N for each sort key."""
+    sort_keys, order_sql = _build_order_by(sort_by, search_term)
+    sort_columns = ", ".join(f"{expr} AS sort_key_{i}" for i, (expr, _) in enumerate(sort_keys))
+    query = f"SELECT {REPORT_CARD_COLUMNS}, {sort_columns} FROM {from_sql}{where_sql}{order_sql}{suffix_sql}"
+    if search_term:
+        # ts_headline re-parses the text, so run it in an outer query over the page only.
+        query = f'''
+            SELECT page.*, ts_headline('english', coalesce(page.description, ''),
+                       websearch_to_tsquery('english', %(search_term)s),
+                       'HighlightAll=TRUE, StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}') AS description_highlighted
+            FROM ({query}) page
+        '''
+        query += " ORDER BY " + ", ".join(f"sort_key_{i} {direction}" for i, (_, direction) in enumerate(sort_keys))
+    return sort_keys, query
+
+
+@storage_function
+def _report_rows(search_term, sort_by, from_sql, where_sql, params, suffix_sql=""):
+    """Runs the report query. Returns card rows with sort_key_N columns and, when
+    searching, description_highlighted."""
+    _, query = _report_query(search_term, sort_by, from_sql, where_sql, suffix_sql)
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+
+def _sort_key_value(value):
+    # Timestamps become fixed-width UTC strings: they survive the JSON round trip through
+    # the page's stores, compare in the right order in Python, and Postgres reads them
+    # back as timestamptz in keyset cursors.
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return value
+
+
+def _report_card_rows(rows, sort_keys):
+    # Shapes _report_rows results: a sort_key list per row and a boolean has_photo.
+    for row in rows:
+        row['sort_key'] = [_sort_key_value(row.pop(f'sort_key_{i}')) for i in range(len(sort_keys))]
+        row['has_photo'] = bool(row['has_photo'])
+    return rows
+
+
+def _query_observations_page(search_term, sort_by, cursor, page_size, with_total, filters=None):
+    from_sql, base_where_sql, base_params = _build_report_filter(search_term, filters)
+    sort_keys, _ = _build_order_by(sort_by, search_term)
+
+    where_sql, params = base_where_sql, dict(base_params)
+    if cursor:
+        # All keys in a sort share a direction, so a row-value comparison expresses
+        # "after the last row of the previous page" and can use the index directly.
+        operator = '<' if sort_keys[0][1] == 'DESC' else '>'
+        keyset_sql = (
+            f"({', '.join(expr for expr, _ in sort_keys)}) {operator} "
+            f"({', '.join(_param(f'cursor_{i}') for i in range(len(sort_keys)))})"
+        )
+        where_sql = f"{where_sql} AND {keyset_sql}" if where_sql else f" WHERE {keyset_sql}"
+        params.update({f'cursor_{i}': value for i, value in enumerate(cursor)})
+    # Fetch one extra row to find out whether there is another page.
+    params['limit'] = page_size + 1
+    rows = _report_card_rows(_report_rows(search_term, sort_by, from_sql, where_sql, params, f" LIMIT {_param('limit')}"), sort_keys)
+    total_estimate = None
+    if with_total and not cursor:
+        total_estimate = _count_report_rows(from_sql, base_where_sql, base_params)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = list(rows[-1]['sort_key'])
+
+    return {'observations': rows, 'next_cursor': next_cursor, 'total_estimate': total_estimate}
+
+
+@storage_function
+def _id_filter(observation_ids):
+    """Returns (WHERE condition, params) matching the ids in a list."""
+    return "id = ANY(%(observation_ids)s)", {'observation_ids': list(observation_ids)}
+
+
+def get_report_rows(observation_ids, search_term=None, sort_by='date_newest', filters=None):
+    """Returns the report rows (as get_observations_page) for `observation_ids` that match
+    the search and filters, in sort order. Used to patch individual cards into an open report.
+
+    Every open report receives the same change at once, so results are cached.
+    """
+    if not observation_ids:
+        return []
+    search_term = (search_term or '').strip() or None
+    filters = normalize_report_filters(filters)
+    observation_ids = tuple(sorted(set(observation_ids)))
+
+    def query_rows():
+        from_sql, where_sql, params = _build_report_filter(search_term, filters)
+        id_sql, id_params = _id_filter(observation_ids)
+        where_sql = f"{where_sql} AND {id_sql}" if where_sql else f" WHERE {id_sql}"
+        sort_keys, _ = _build_order_by(sort_by, search_term)
+        return _report_card_rows(_report_rows(search_term, sort_by, from_sql, where_sql, dict(params, **id_params)), sort_keys)
+
+    cache = get_report_cache()
+    rows = cache.get_or_load(cache.current_version(), ('rows', observation_ids, search_term, sort_by, _filters_key(filters)), query_rows)
+    return [dict(row, sort_key=list(row['sort_key'])) for row in rows]
+
+
+def get_report_total(search_term=None, filters=None):
+    """Returns the (estimated) number of rows matching the search, as on the first page."""
+    search_term = (search_term or '').strip() or None
+    filters = normalize_report_filters(filters)
+    cache = get_report_cache()
+    return cache.get_or_load(cache.current_version(), ('total', search_term, _filters_key(filters)),
+                             lambda: _count_report_rows(*_build_report_filter(search_term, filters)))
+
+
+def get_report_filter_options():
+    """Returns {'floors': [...], 'responsible_people': [...]} (people lower-cased) for the
+    report's filter dropdowns, cached until the data changes."""
+    cache = get_report_cache()
+    options = cache.get_or_load(cache.current_version(), ('filter_options',), _query_report_filter_options)
+    return {name: list(values) for name, values in options.items()}
+
+
+@storage_function
+def _query_report_filter_options():
+    # Each list is read with a loose index scan, one index probe per distinct value
+    # instead of a scan of every row.
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                WITH RECURSIVE floors AS (
+                    (SELECT floor AS value FROM observations ORDER BY floor LIMIT 1)
+                    UNION ALL
+                    SELECT (SELECT floor FROM observations WHERE floor > floors.value ORDER BY floor LIMIT 1)
+                    FROM floors WHERE floors.value IS NOT NULL
+                )
+                SELECT value FROM floors WHERE value IS NOT NULL
+            ''')
+            floors = [row[0] for row in cur.fetchall()]
+            cur.execute('''
+                WITH RECURSIVE people AS (
+                    (SELECT lower(responsible_person) AS value FROM observations
+                     WHERE lower(responsible_person) IS NOT NULL ORDER BY lower(responsible_person) LIMIT 1)
+                    UNION ALL
+                    SELECT (SELECT lower(responsible_person) FROM observations
+                            WHERE lower(responsible_person) > people.value ORDER BY lower(responsible_person) LIMIT 1)
+                    FROM people WHERE people.value IS NOT NULL
+                )
+                SELECT value FROM people WHERE value IS NOT NULL
+            ''')
+            people = [row[0] for row in cur.fetchall()]
+    return {'floors': floors, 'responsible_people': people}
+
+
+# --- Dashboard Aggregates ---
+# Rollup days are calendar days in this time zone.
+ROLLUP_TIME_ZONE = os.getenv('ROLLUP_TIME_ZONE', 'UTC')
+# Risk ratings from here up count as high risk (the "risk-high" and "risk-critical" cards).
+HIGH_RISK_THRESHOLD = 10
+DASHBOARD_TREND_BUCKETS = ('day', 'week', 'month')
+
+# Rows of an UPDATE whose dashboard dimensions changed: the old values come out (-1) and
+# the new ones go in (+1). Updates that only touch photos, text or status are skipped.
+_ROLLUP_UPDATED_ROWS_SQL = '''
+    SELECT n.*, 1 AS sign FROM new_rows n JOIN old_rows o ON o.id = n.id
+    WHERE (n.observed_at, n.floor, n.severity, n.risk_rating, n.responsible_person)
+          IS DISTINCT FROM (o.observed_at, o.floor, o.severity, o.risk_rating, o.responsible_person)
+    UNION ALL
+    SELECT o.*, -1 AS sign FROM old_rows o JOIN new_rows n ON n.id = o.id
+    WHERE (n.observed_at, n.floor, n.severity, n.risk_rating, n.responsible_person)
+          IS DISTINCT FROM (o.observed_at, o.floor, o.severity, o.risk_rating, o.responsible_person)
+'''
+
+def _rollup_upsert_sql(source_sql):
+    """SQL adding the observations selected by `source_sql` (observation columns plus a
+    `sign` of 1 or -1) to observation_rollups, one row per dimension, day and key:
+    'risk' (key2 = risk rating), 'floor_severity' (key1 = floor, key2 = severity) and
+    'person' (key1 = lower-cased responsible person, '' if unassigned), for both grains."""
+    return f'''
+        INSERT INTO observation_rollups AS r (dimension, grain, day, key1, key2, count, risk_sum)
+        SELECT d.dimension, g.grain, g.day, d.key1, d.key2, sum(src.sign), sum(src.sign * src.risk)
+        FROM (
+            SELECT (observed_at AT TIME ZONE '{ROLLUP_TIME_ZONE}')::date AS day, floor,
+                   COALESCE(severity, 0) AS severity, COALESCE(risk_rating, 0) AS risk,
+                   lower(COALESCE(responsible_person, '')) AS person, sign
+            FROM ({source_sql}) changed
+        ) src
+        CROSS JOIN LATERAL (VALUES ('risk', '', src.risk), ('floor_severity', src.floor, src.severity),
+                                   ('person', src.person, 0)) AS d(dimension, key1, key2)
+        CROSS JOIN LATERAL (VALUES ('d', src.day), ('m', date_trunc('month', src.day)::date)) AS g(grain, day)
+        GROUP BY d.dimension, g.grain, g.day, d.key1, d.key2
+        ON CONFLICT (dimension, grain, day, key1, key2) DO UPDATE
+        SET count = r.count + EXCLUDED.count, risk_sum = r.risk_sum + EXCLUDED.risk_sum
+    '''
+
+def _rebuild_rollups(cur):
+    # Writers are blocked (readers aren't) so no trigger delta lands mid-rebuild.
+    cur.execute("LOCK TABLE observations IN SHARE MODE")
+    cur.execute("DELETE FROM observation_rollups")
+    cur.execute(_rollup_upsert_sql("SELECT *, 1 AS sign FROM observations"))
+
+@storage_function
+def rebuild_dashboard_rollups():
+    """Recomputes observation_rollups from the observations table. Returns the row count.
+
+    The triggers keep the rollups exact; this is for repairs, e.g. after a manual edit
+    with triggers disabled or a change of ROLLUP_TIME_ZONE.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            _rebuild_rollups(cur)
+            cur.execute("SELECT count(*) FROM observation_rollups")
+            return cur.fetchone()[0]
+
+def _rollup_range_filter(date_from, date_to, months=True):
+    """Returns (WHERE clause, params) selecting the rollup rows that cover the days from
+    `date_from` to `date_to` (inclusive; None for open-ended) exactly once: month rows for
+    whole months in the range and day rows for the partial months at either end."""
+    # (grain, first day or None, end day or None, end inclusive)
+    ranges = [('d', date_from, date_to, True)]
+    if months:
+        # Whole months are [months_from, months_to); None means unbounded on that side.
+        months_from = date_from if date_from is None or date_from.day == 1 else _add_months(date_from.replace(day=1), 1)
+        months_to = None if date_to is None else (date_to + datetime.timedelta(days=1)).replace(day=1)
+        if months_from is None or months_to is None or months_from < months_to:
+            ranges = [('m', months_from, months_to, False)]
+            if months_from is not None:
+                ranges.append(('d', date_from, months_from, False))
+            if months_to is not None:
+                ranges.append(('d', months_to, date_to, True))
+    clauses, params = [], {}
+    for i, (grain, first, end, inclusive) in enumerate(ranges):
+        conditions = [f"grain = '{grain}'"]
+        if first is not None:
+            conditions.append(f"day >= {_param(f'first_{i}')}")
+            params[f'first_{i}'] = first
+        if end is not None:
+            conditions.append(f"day {'<=' if inclusive else '<'} {_param(f'end_{i}')}")
+            params[f'end_{i}'] = end
+        clauses.append("(" + " AND ".join(conditions) + ")")
+    return f" WHERE dimension = {_param('dimension')} AND (" + " OR ".join(clauses) + ")", params
+
+def get_dashboard_aggregates(date_from=None, date_to=None, trend_bucket='week'):
+    """Returns the dashboard's data for observations between two dates (inclusive, None for
+    open-ended), read from observation_rollups:
+
+    {'total', 'risk_sum', 'high_risk',
+     'risk_distribution': [(risk rating, count)],
+     'floor_severity': [(floor, severity, count)],
+     'people': [(person or '', count, risk sum)], largest first,
+     'trend': [(first day of bucket, count, risk sum, high-risk count)],
+     'version': data version}
+
+    Every observation counts as open: observations have no close-out status yet.
+    Cached per data version like the report pages.
+    """
+    if trend_bucket not in DASHBOARD_TREND_BUCKETS:
+        raise ValueError(f"trend_bucket must be one of {', '.join(DASHBOARD_TREND_BUCKETS)}")
+    where_sql, params = _rollup_range_filter(date_from, date_to)
+    # Weekly or daily trends need day rows; the range is short enough for those to be cheap.
+    trend_where_sql, trend_params = (where_sql, params) if trend_bucket == 'month' else _rollup_range_filter(date_from, date_to, months=False)
+
+    def query_aggregates():
+        risk_distribution, floor_severity, people, trend = _query_dashboard_rollups(
+            where_sql, params, trend_where_sql, trend_params, trend_bucket)
+        return {
+            'total': sum(count for _, count in risk_distribution),
+            'risk_sum': sum(risk_sum for _, _, risk_sum, _ in trend),
+            'high_risk': sum(count for risk, count in risk_distribution if risk >= HIGH_RISK_THRESHOLD),
+            'risk_distribution': risk_distribution, 'floor_severity': floor_severity, 'people': people, 'trend': trend,
+        }
+
+    cache = get_report_cache()
+    version = cache.current_version()
+    aggregates = cache.get_or_load(version, ('dashboard', str(date_from), str(date_to), trend_bucket), query_aggregates)
+    return dict(aggregates, version=version)
+
+@storage_function
+def _query_dashboard_rollups(where_sql, params, trend_where_sql, trend_params, trend_bucket):
+    """Reads get_dashboard_aggregates' lists from observation_rollups. Returns
+    (risk_distribution, floor_severity, people, trend)."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f'''
+                SELECT key2, sum(count) FROM observation_rollups{where_sql}
+                GROUP BY key2 HAVING sum(count) > 0 ORDER BY key2
+            ''', dict(params, dimension='risk'))
+            risk_distribution = [(risk, int(count)) for risk, count in cur.fetchall()]
+            cur.execute(f'''
+                SELECT key1, key2, sum(count) FROM observation_rollups{where_sql}
+                GROUP BY key1, key2 HAVING sum(count) > 0 ORDER BY key1, key2
+            ''', dict(params, dimension='floor_severity'))
+            floor_severity = [(floor, severity, int(count)) for floor, severity, count in cur.fetchall()]
+            cur.execute(f'''
+                SELECT key1, sum(count), sum(risk_sum) FROM observation_rollups{where_sql}
+                GROUP BY key1 HAVING sum(count) > 0 ORDER BY sum(count) DESC, key1
+            ''', dict(params, dimension='person'))
+            people = [(person, int(count), int(risk_sum)) for person, count, risk_sum in cur.fetchall()]
+            cur.execute(f'''
+                SELECT date_trunc(%(bucket)s, day)::date AS bucket, sum(count), sum(risk_sum),
+                       COALESCE(sum(count) FILTER (WHERE key2 >= %(high_risk)s), 0)
+                FROM observation_rollups{trend_where_sql}
+                GROUP BY 1 HAVING sum(count) > 0 ORDER BY 1
+            ''', dict(trend_params, dimension='risk', bucket=trend_bucket, high_risk=HIGH_RISK_THRESHOLD))
+            trend = [(bucket, int(count), int(risk_sum), int(high)) for bucket, count, risk_sum, high in cur.fetchall()]
+    return risk_distribution, floor_severity, people, trend
+
+
+def get_observation_changes(since_version, limit):
+    """Returns the rows changed after data version `since_version`.
+
+    Returns {'version': current version, 'changes': {observation_id: 'I'|'U'|'D'}} with
+    the latest operation per row, or None if the changes can't be listed: more than
+    `limit` rows changed, the table was truncated, or the log no longer reaches back to
+    `since_version` (see CHANGE_LOG_KEEP_VERSIONS). Callers should reload in full then.
+    """
+    cache = get_report_cache()
+    version = cache.current_version()
+    if since_version >= version:
+        # Nothing new; answered from the listener's version without a query.
+        return {'version': since_version, 'changes': {}}
+    delta = cache.get_or_load(version, ('changes', since_version, limit), lambda: _query_observation_changes(since_version, limit))
+    return dict(delta, changes=dict(delta['changes'])) if delta is not None else None
+
+
+@storage_function
+def _query_observation_changes(since_version, limit):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM data_versions WHERE name = 'observations'")
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            if since_version >= version:
+                return {'version': version, 'changes': {}}
+            cur.execute("SELECT min(version) FROM observation_changes")
+            oldest = cur.fetchone()[0]
+            if oldest is None or since_version < oldest - 1:
+                return None
+            cur.execute('''
+                SELECT DISTINCT ON (observation_id) observation_id, op
+                FROM observation_changes
+                WHERE version > %s AND version <= %s
+                ORDER BY observation_id, version DESC
+                LIMIT %s
+            ''', (since_version, version, limit + 1))
+            rows = cur.fetchall()
+    if len(rows) > limit or any(op == 'T' for _, op in rows):
+        return None
+    return {'version': version, 'changes': dict(rows)}
+
+# Stored renditions of an observation's photo. Rows that predate the thumbnail columns
+# (and have not been backfilled yet) only have the original.
+PHOTO_VARIANT_COLUMNS = {
+    'original': 'photo_bytes',
+    'thumb': 'photo_thumb',
+    'excel': 'photo_excel_thumb',
+}
+# The same renditions when they live in the external photo store (see photo_store.py).
+PHOTO_KEY_COLUMNS = {
+    'original': 'photo_key',
+    'thumb': 'photo_thumb_key',
+    'excel': 'photo_excel_thumb_key',
+}
+
+@storage_function
+def get_photo_from_db(observation_id, variant='original'):
+    """Returns (photo_bytes, is_requested_variant) for an observation, or (None, False).
+
+    If the requested thumbnail has not been generated yet, the original is returned
+    with is_requested_variant=False so the caller can downscale it itself.
+    """
+    column = PHOTO_VARIANT_COLUMNS[variant]
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COALESCE({column}, photo_bytes), {column} IS NOT NULL FROM observations WHERE id = %s", (observation_id,))
+            row = cur.fetchone()
+    if not row or row[0] is None:
+        return None, False
+    return bytes(row[0]), row[1]
+
+@storage_function
+def get_photo_key_from_db(observation_id, variant='original'):
+    """Returns (store key, is_requested_variant) for a photo kept in the photo store, or
+    (None, False) if the observation has none there (it may still have an inline photo).
+
+    Like get_photo_from_db, falls back to the original's key if the thumbnail is missing.
+    """
+    column, key_column = PHOTO_VARIANT_COLUMNS[variant], PHOTO_KEY_COLUMNS[variant]
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f'''
+                SELECT COALESCE({key_column}, CASE WHEN {column} IS NULL THEN photo_key END), {key_column} IS NOT NULL
+                FROM observations WHERE id = %s
+            ''', (observation_id,))
+            row = cur.fetchone()
+    if not row or row[0] is None:
+        return None, False
+    return row[0], row[1]
+
+@storage_function
+def get_photo_etag_from_db(observation_id, variant='original'):
+    """Returns a cheap validator for an observation's photo, or None if it has no photo.
+
+    Photos are never modified after insert (only thumbnails get filled in), so the ID plus
+    the stored sizes identify the content. octet_length() reads the TOAST header only,
+    not the photo itself.
+    """
+    column = PHOTO_VARIANT_COLUMNS[variant]
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT octet_length(photo_bytes), octet_length({column}) FROM observations WHERE id = %s", (observation_id,))
+            return _photo_etag(observation_id, variant, cur.fetchone())
+
+def _photo_etag(observation_id, variant, sizes):
+    # get_photo_etag_from_db's validator from (original size, variant size), or None.
+    if not sizes or sizes[0] is None:
+        return None
+    return f"obs-{observation_id}-{sizes[0]}-{variant}-{sizes[1] or 0}"
+
+@storage_function
+def get_observations_missing_thumbnails(limit, after_id=0):
+    """Returns up to `limit` (id, photo_bytes, photo_key) rows, in ID order, that still need
+    thumbnails. photo_bytes is None for photos kept in the photo store."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT id, photo_bytes, photo_key FROM observations
+                WHERE id > %s AND (photo_bytes IS NOT NULL OR photo_key IS NOT NULL)
+                  AND ((photo_thumb IS NULL AND photo_thumb_key IS NULL)
+                       OR (photo_excel_thumb IS NULL AND photo_excel_thumb_key IS NULL))
+                ORDER BY id ASC
+                LIMIT %s
+            ''', (after_id, limit))
+            return [(row[0], bytes(row[1]) if row[1] is not None else None, row[2]) for row in cur.fetchall()]
+
+@storage_function
+def get_inline_photos(limit, after_id=0):
+    """Returns up to `limit` (id, photo dict) rows, in ID order, that still have photo bytes
+    in the table. The dict has the photo_processing.process_photo fields."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT id, photo_bytes, photo_thumb, photo_excel_thumb FROM observations
+                WHERE id > %s AND (photo_bytes IS NOT NULL OR photo_thumb IS NOT NULL OR photo_excel_thumb IS NOT NULL)
+                ORDER BY id ASC
+                LIMIT %s
+            ''', (after_id, limit))
+            return [
+                (row[0], {field: bytes(value) if value is not None else None
+                          for field, value in zip(('photo_bytes', 'photo_thumb', 'photo_excel_thumb'), row[1:])})
+                for row in cur.fetchall()
+            ]
+
+@storage_function
+def update_photo_variants(rows):
+    """Stores processed photos. `rows` is a list of (id, photo dict from photo_processing.process_photo,
+    possibly passed through photo_store.store_photo). Store keys missing from the dict are kept."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            for observation_id, photo in rows:
+                cur.execute('''
+                    UPDATE observations
+                    SET photo_bytes = %s, photo_thumb = %s, photo_excel_thumb = %s,
+                        photo_key = COALESCE(%s, photo_key),
+                        photo_thumb_key = COALESCE(%s, photo_thumb_key),
+                        photo_excel_thumb_key = COALESCE(%s, photo_excel_thumb_key)
+                    WHERE id = %s
+                ''', (photo.get('photo_bytes'), photo.get('photo_thumb'), photo.get('photo_excel_thumb'),
+                      photo.get('photo_key'), photo.get('photo_thumb_key'), photo.get('photo_excel_thumb_key'),
+                      observation_id))
+
+@storage_function
+def get_referenced_photo_keys(keys):
+    """Returns the subset of photo store `keys` that some observation still refers to."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT key FROM unnest(%s::text[]) AS key
+                WHERE EXISTS (SELECT 1 FROM observations WHERE photo_key = key)
+                   OR EXISTS (SELECT 1 FROM observations WHERE photo_thumb_key = key)
+                   OR EXISTS (SELECT 1 FROM observations WHERE photo_excel_thumb_key = key)
+            ''', (keys,))
+            return {row[0] for row in cur.fetchall()}
+
+# Rows fetched per round trip by the export's server-side cursor.
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '200'))
+
+@storage_function
+def get_export_version(search_term=None, filters=None):
+    """Returns {'max_id', 'row_count', 'last_modified'} for the rows an export would contain.
+
+    Any insert, delete or update of those rows changes at least one of the three values,
+    so together they identify a report snapshot (see export_jobs.py).
+    """
+    from_sql, where_sql, params = _build_report_filter(search_term, filters)
+    with get_db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"SELECT max(id) AS max_id, count(*) AS row_count, max(updated_at) AS last_modified FROM {from_sql}{where_sql}", params)
+            return dict(cur.fetchone())
+
+@storage_function
+def iter_observations_for_export(search_term=None, sort_by='date_oldest', fetch_size=EXPORT_FETCH_SIZE, filters=None):
+    """Yields the observations for the Excel export, `fetch_size` rows at a time.
+
+    Takes the same search, sort and filter options as the report page. Uses a named
+    (server-side) cursor, so only one batch is in memory at once. The full-size photo is
+    only read for rows that have no pre-sized Excel thumbnail yet. Photos kept in the photo
+    store come back as keys (photo_excel_thumb_key, photo_key). The pooled connection
+    stays checked out until the generator is exhausted or closed.
+    """
+    from_sql, where_sql, params = _build_report_filter(search_term, filters)
+    _, order_sql = _build_order_by(sort_by, search_term)
+    with get_db_connection() as conn:
+        with conn.cursor(name='observations_export', cursor_factory=RealDictCursor) as cur:
+            cur.execute(f'''
+                SELECT id, date_str, floor, location, description, impact, likelihood, severity,
+                       risk_rating, corrective_action, responsible_person, deadline, photo_excel_thumb,
+                       CASE WHEN photo_excel_thumb IS NULL AND photo_excel_thumb_key IS NULL THEN photo_bytes END AS photo_bytes,
+                       photo_excel_thumb_key,
+                       CASE WHEN photo_excel_thumb_key IS NULL THEN photo_key END AS photo_key
+                FROM {from_sql}{where_sql}{order_sql}
+            ''', params)
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows
+
+@storage_function
 def delete_observation_from_db(observation_id):
-    """Deletes an observation record from the database by its ID."""
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        sql = "DELETE FROM observations WHERE id = %s;"
-        cur.execute(sql, (observation_id,))
-    conn.commit()
-    conn.close()
+    """Deletes an observation record from the database by its ID.
+
+    Returns the photo store keys the row referred to, for photo_store.release.
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            sql = "DELETE FROM observations WHERE id = %s RETURNING photo_key, photo_thumb_key, photo_excel_thumb_key;"
+            cur.execute(sql, (observation_id,))
+            row = cur.fetchone()
+            # Repeat reports of a deleted observation stand on their own again.
+            cur.execute("UPDATE observations SET duplicate_of = NULL WHERE duplicate_of = %s", (observation_id,))
+    get_report_cache().mark_stale()
     print(f"Observation with ID {observation_id} deleted from database.")
+    return [key for key in row or () if key]
+
@@ -0,0 +1,270 @@
+# excel_export.py
+"""Builds the Excel safety observation report without holding it in memory.
+
+Rows come from a server-side cursor in batches (database.iter_observations_for_export)
+and are written with openpyxl's write-only mode, which streams each row to disk as it is
+appended. Cells share a handful of named styles instead of carrying their own.
+
+Photos bypass openpyxl: it keeps a drawing object per picture in memory until the
+workbook is saved. Instead the pre-sized Excel thumbnails are appended to one scratch
+file, and once the cells are saved the drawing part is streamed into the .xlsx next to
+them (_add_pictures). Memory use therefore stays flat however many observations there are.
+Callers choose where the finished report goes (export_jobs.py keeps them as a cache).
+"""
+
+import os
+import shutil
+import tempfile
+import zipfile
+from array import array
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+from openpyxl.worksheet.cell_range import CellRange
+
+import database
+import photo_processing
+import photo_store
+
+REPORT_SHEET_TITLE = "Safety Observation Report"
+REPORT_HEADERS = ["ObsNo.", "Date of Observation", "Floor", "Location", "Description", "Impact", "Likelihood", "Severity", "Risk Rating", "Corrective Action Required", "Responsible Person", "Deadline", "Photo Evidence", "Closed Photo", "Status"]
+REPORT_COLUMN_WIDTHS = {'A': 8, 'B': 20, 'C': 15, 'D': 35, 'E': 60, 'F': 45, 'G': 12, 'H': 12, 'I': 12, 'J': 60, 'K': 20, 'L': 15, 'M': 22, 'N': 20, 'O': 12}
+REPORT_HEADER_ROW = 5
+REPORT_LOGO_PATH = os.path.join('assets', '25h Logos.png')
+REPORT_LOGO_SIZE_PX = (90, 80)
+
+# Photos are drawn at the size the Excel thumbnails are pre-rendered at (always JPEG),
+# so nothing has to scale or convert them.
+EXCEL_PHOTO_SIZE_PX = photo_processing.EXCEL_THUMB_SIZE_PX
+EXCEL_ROW_HEIGHT_FOR_PHOTO_PT = 90.0
+PHOTO_COLUMN_INDEX = REPORT_HEADERS.index('Photo Evidence')
+RISK_COLUMN_INDEX = REPORT_HEADERS.index('Risk Rating')
+
+# --- Shared Styles ---
+# Registered once per workbook; every cell refers to one of these by name.
+CENTERED = Alignment(horizontal='center', vertical='center')
+CENTERED_WRAPPED = Alignment(horizontal='center', vertical='center', wrap_text=True)
+TITLE_STYLE = NamedStyle('Report Title', font=Font(name='Calibri', size=16, bold=True, color="000080"), alignment=CENTERED)
+HEADER_STYLE = NamedStyle('Report Header', font=Font(name='Calibri', size=11, bold=True, color="FFFFFF"), fill=PatternFill(start_color="002060", end_color="002060", fill_type="solid"), alignment=CENTERED_WRAPPED)
+BODY_STYLE = NamedStyle('Report Body', alignment=CENTERED_WRAPPED)
+# (lowest risk rating, style) from the highest band down.
+RISK_STYLES = tuple(
+    (threshold, NamedStyle(f'Report Risk {label}', fill=PatternFill(start_color=color, end_color=color, fill_type="solid"), alignment=CENTERED_WRAPPED))
+    for threshold, label, color in ((16, 'Red', "F14219"), (10, 'Orange', "FF7A00"), (5, 'Yellow', "FFD406"), (1, 'Green', "04A227"))
+)
+
+# --- Drawing Part ---
+# The same markup openpyxl writes for images anchored to a cell, produced one picture at a time.
+EMU_PER_PIXEL = 9525
+_CONTENT_TYPES = (
+    '<Default Extension="jpeg" ContentType="image/jpeg" />'
+    '<Default Extension="png" ContentType="image/png" />'
+    '<Override PartName="/xl/drawings/drawing1.xml" ContentType="application/vnd.openxmlformats-officedocument.drawing+xml" />'
+)
+_SHEET_DRAWING_REF = b'<drawing xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" r:id="rId1" />'
+_SHEET_RELS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/drawing" Target="/xl/drawings/drawing1.xml" Id="rId1" />'
+    '</Relationships>'
+)
+_DRAWING_START = (
+    '<wsDr xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns="http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing">'
+)
+_DRAWING_ANCHOR = (
+    '<oneCellAnchor><from><col>{col}</col><colOff>0</colOff><row>{row}</row><rowOff>0</rowOff></from>'
+    '<ext cx="{cx}" cy="{cy}" /><pic><nvPicPr><cNvPr id="{n}" name="Image {n}" descr="Picture" /><cNvPicPr /></nvPicPr>'
+    '<blipFill><a:blip cstate="print" r:embed="rId{n}" /><a:stretch><a:fillRect /></a:stretch></blipFill>'
+    '<spPr><a:prstGeom prst="rect" /></spPr></pic><clientData /></oneCellAnchor>'
+)
+_RELS_START = '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+_IMAGE_REL = '<Relationship Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="/xl/media/image{n}.{ext}" Id="rId{n}" />'
+_STREAM_CHUNK_BYTES = 1024 * 1024
+# write_report calls its progress callback after this many rows.
+PROGRESS_EVERY_ROWS = 250
+
+
+def _risk_style(risk_rating):
+    for threshold, style in RISK_STYLES:
+        if risk_rating >= threshold:
+            return style
+    return BODY_STYLE
+
+
+def _styled_cell(sheet, value, style=BODY_STYLE):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.style = style.name
+    return cell
+
+
+def _excel_thumbnail(entry):
+    """Returns the pre-sized thumbnail, making one for photos not yet backfilled."""
+    if entry.get('photo_excel_thumb'):
+        return entry['photo_excel_thumb']
+    store = photo_store.get_store()
+    if store is not None and entry.get('photo_excel_thumb_key'):
+        return store.get(entry['photo_excel_thumb_key'])
+    original = entry.get('photo_bytes')
+    if original is None and store is not None and entry.get('photo_key'):
+        original = store.get(entry['photo_key'])
+    if original:
+        return photo_processing.make_excel_thumbnail(original)
+    return None
+
+
+def _write_header(sheet):
+    sheet.merged_cells.add(CellRange('A1:C4'))
+    sheet.merged_cells.add(CellRange('D1:O4'))
+    for col_letter, width in REPORT_COLUMN_WIDTHS.items():
+        sheet.column_dimensions[col_letter].width = width
+    sheet.append([None, None, None, _styled_cell(sheet, "SAFETY OBSERVATION REPORT", TITLE_STYLE)])
+    for _ in range(REPORT_HEADER_ROW - 2):
+        sheet.append([])
+    sheet.append([_styled_cell(sheet, header, HEADER_STYLE) for header in REPORT_HEADERS])
+
+
+class _PhotoSpool:
+    """Thumbnails appended to a single scratch file, remembered as (row, offset, length)."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w+b')
+        self.rows, self.offsets, self.lengths = array('I'), array('Q'), array('I')
+
+    def add(self, row_num, data):
+        self.rows.append(row_num)
+        self.offsets.append(self.file.tell())
+        self.lengths.append(len(data))
+        self.file.write(data)
+
+    def read(self, index):
+        self.file.seek(self.offsets[index])
+        return self.file.read(self.lengths[index])
+
+    def close(self):
+        self.file.close()
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _pictures(spool, logo_path):
+    """Yields (col, row, width_px, height_px, extension, read_bytes) for every picture, 0-based."""
+    if logo_path:
+        yield (0, 0) + REPORT_LOGO_SIZE_PX + ('png', lambda: _read_file(logo_path))
+    for index, row_num in enumerate(spool.rows):
+        yield (PHOTO_COLUMN_INDEX, row_num - 1) + EXCEL_PHOTO_SIZE_PX + ('jpeg', lambda index=index: spool.read(index))
+
+
+def _add_pictures(cells_path, path, pictures):
+    """Copies the workbook at `cells_path` to `path`, adding a drawing with `pictures`.
+
+    `pictures` is a callable returning a fresh iterator from _pictures; the drawing, its
+    relationships and the media files are each streamed in one pass over it.
+    """
+    with zipfile.ZipFile(cells_path) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            with source.open(info) as src, target.open(info.filename, 'w', force_zip64=True) as dst:
+                if info.filename == '[Content_Types].xml':
+                    dst.write(src.read().replace(b'</Types>', _CONTENT_TYPES.encode() + b'</Types>'))
+                elif info.filename == 'xl/worksheets/sheet1.xml':
+                    # The drawing reference goes last, just before the closing tag.
+                    end_tag = b'</worksheet>'
+                    remaining = info.file_size - len(end_tag)
+                    while remaining > 0:
+                        chunk = src.read(min(_STREAM_CHUNK_BYTES, remaining))
+                        dst.write(chunk)
+                        remaining -= len(chunk)
+                    if src.read() != end_tag:
+                        raise ValueError("Unexpected worksheet layout; cannot add pictures.")
+                    dst.write(_SHEET_DRAWING_REF + end_tag)
+                else:
+                    shutil.copyfileobj(src, dst, _STREAM_CHUNK_BYTES)
+
+        target.writestr('xl/worksheets/_rels/sheet1.xml.rels', _SHEET_RELS)
+        with target.open('xl/drawings/drawing1.xml', 'w', force_zip64=True) as dst:
+            dst.write(_DRAWING_START.encode())
+            for n, (col, row, width, height, _, _) in enumerate(pictures(), 1):
+                dst.write(_DRAWING_ANCHOR.format(col=col, row=row, cx=width * EMU_PER_PIXEL, cy=height * EMU_PER_PIXEL, n=n).encode())
+            dst.write(b'</wsDr>')
+        with target.open('xl/drawings/_rels/drawing1.xml.rels', 'w', force_zip64=True) as dst:
+            dst.write(_RELS_START.encode())
+            for n, (_, _, _, _, extension, _) in enumerate(pictures(), 1):
+                dst.write(_IMAGE_REL.format(n=n, ext=extension).encode())
+            dst.write(b'</Relationships>')
+        for n, (_, _, _, _, extension, read_bytes) in enumerate(pictures(), 1):
+            # Images are already compressed; deflating them again only costs CPU.
+            target.writestr(f'xl/media/image{n}.{extension}', read_bytes(), compress_type=zipfile.ZIP_STORED)
+
+
+def write_report(path, observations, photo_dir, progress=None):
+    """Writes the report for `observations` (an iterable of row dicts) to `path`.
+
+    Scratch files go in `photo_dir`, which must stay in place until this returns.
+    `progress`, if given, is called with the number of rows written so far.
+    Returns the number of observations written.
+    """
+    workbook = Workbook(write_only=True)
+    for style in (TITLE_STYLE, HEADER_STYLE, BODY_STYLE) + tuple(style for _, style in RISK_STYLES):
+        workbook.add_named_style(style)
+    sheet = workbook.create_sheet(REPORT_SHEET_TITLE)
+    # Every data row is photo height; only the title and header rows are set explicitly.
+    sheet.sheet_format.defaultRowHeight = EXCEL_ROW_HEIGHT_FOR_PHOTO_PT
+    sheet.sheet_format.customHeight = True
+    for row_num in range(1, REPORT_HEADER_ROW + 1):
+        sheet.row_dimensions[row_num].height = 15
+    _write_header(sheet)
+
+    spool = _PhotoSpool(os.path.join(photo_dir, 'photos.bin'))
+    row_num = REPORT_HEADER_ROW
+    for entry in observations:
+        row_num += 1
+        risk_rating = entry.get('risk_rating') or 0
+        values = [entry.get('id'), entry.get('date_str'), entry.get('floor'), entry.get('location'), entry.get('description'), entry.get('impact'), entry.get('likelihood'), entry.get('severity'), risk_rating, entry.get('corrective_action'), (entry.get('responsible_person') or '').title(), entry.get('deadline'), None, "Attach closed photo", "Open"]
+
+        try:
+            thumbnail = _excel_thumbnail(entry)
+        except Exception as e:
+            print(f"Error embedding photo for observation {entry.get('id')}: {e}")
+            thumbnail = None
+            values[PHOTO_COLUMN_INDEX] = "Error"
+        if thumbnail:
+            spool.add(row_num, thumbnail)
+        elif values[PHOTO_COLUMN_INDEX] is None:
+            values[PHOTO_COLUMN_INDEX] = "No Photo"
+
+        cells = [_styled_cell(sheet, value) for value in values]
+        cells[RISK_COLUMN_INDEX].style = _risk_style(risk_rating).name
+        sheet.append(cells)
+        if progress and (row_num - REPORT_HEADER_ROW) % PROGRESS_EVERY_ROWS == 0:
+            progress(row_num - REPORT_HEADER_ROW)
+
+    logo_path = REPORT_LOGO_PATH if os.path.exists(REPORT_LOGO_PATH) else None
+    try:
+        if not spool.rows and not logo_path:
+            workbook.save(path)
+        else:
+            cells_path = os.path.join(photo_dir, 'cells.xlsx')
+            workbook.save(cells_path)
+            _add_pictures(cells_path, path, lambda: _pictures(spool, logo_path))
+    finally:
+        spool.close()
+    return row_num - REPORT_HEADER_ROW
+
+
+def export_report(path, observations=None, progress=None):
+    """Writes a report to `path` and returns the number of rows in it.
+
+    By default every observation is exported, streamed from the database. See
+    write_report for `progress`.
+    """
+    if observations is None:
+        observations = database.iter_observations_for_export()
+    photo_dir = tempfile.mkdtemp(prefix='riskwatch-report-')
+    try:
+        return write_report(path, observations, photo_dir, progress)
+    finally:
+        shutil.rmtree(photo_dir, ignore_errors=True)
@@ -0,0 +1,227 @@
+# export_jobs.py
+"""Background Excel exports with a cache of finished report snapshots.
+
+An export is identified by the search/sort/filters it was made with and by the version of the
+rows it contains (database.get_export_version: max id, row count, last modified). If a
+file for that key already exists it is served straight away. Otherwise a worker thread
+builds it with excel_export.py while the page polls get_status() for progress.
+
+Files and job status live in EXPORT_CACHE_DIR, so every gunicorn worker on the host
+shares them. A lock file per key stops two workers building the same snapshot; a build
+whose lock has not been touched for EXPORT_JOB_STALE_SECONDS is treated as dead.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'riskwatch-exports'))
+EXPORT_CACHE_MAX_FILES = int(os.getenv('EXPORT_CACHE_MAX_FILES', '20'))
+EXPORT_JOB_WORKERS = int(os.getenv('EXPORT_JOB_WORKERS', '1'))
+EXPORT_JOB_STALE_SECONDS = float(os.getenv('EXPORT_JOB_STALE_SECONDS', '120'))
+# Bump when the workbook layout changes so existing snapshots are rebuilt.
+EXPORT_FORMAT_VERSION = 1
+
+STATUS_RUNNING = 'running'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def is_valid_key(key):
+    return bool(key and _KEY_RE.match(key))
+
+
+def make_key(search_term, sort_by, version, filters=None):
+    """Returns the cache key for a report of `version` (from database.get_export_version)."""
+    last_modified = version['last_modified']
+    payload = json.dumps([
+        EXPORT_FORMAT_VERSION, (search_term or '').strip().lower(), sort_by,
+        version['max_id'], version['row_count'], last_modified.isoformat() if last_modified else None,
+        _filters_json(filters),
+    ])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def _filters_json(filters):
+    # Normalized report filters with dates as ISO strings, for keys and status files.
+    return {field: str(value) for field, value in sorted(database.normalize_report_filters(filters).items())}
+
+
+def _path(key, extension):
+    return os.path.join(EXPORT_CACHE_DIR, f"{key}.{extension}")
+
+
+def report_path(key):
+    """Path of the finished workbook for `key` (it may not exist yet)."""
+    return _path(key, 'xlsx')
+
+
+def _report_filename(search_term):
+    date = datetime.datetime.now().strftime('%Y%m%d')
+    if not search_term:
+        return f"Full_Safety_Report_{date}.xlsx"
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', search_term).strip('_')[:40] or 'Search'
+    return f"Safety_Report_{slug}_{date}.xlsx"
+
+
+# --- Status Files ---
+def _write_status(key, **status):
+    """Replaces the job's status file atomically so readers never see a partial write."""
+    tmp_path = _path(key, f'json.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, _path(key, 'json'))
+    return status
+
+
+def get_status(key):
+    """Returns the job status dict for `key`, or None if there is no such export.
+
+    The dict has 'status' (running/ready/failed), 'rows_done', 'rows_total', 'filename'
+    and, for failures, 'error'.
+    """
+    try:
+        with open(_path(key, 'json')) as f:
+            status = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if status['status'] == STATUS_RUNNING and not _lock_is_live(key):
+        status.update(status=STATUS_FAILED, error="The export was interrupted.")
+    elif status['status'] == STATUS_READY and not os.path.exists(report_path(key)):
+        return None
+    status['key'] = key
+    return status
+
+
+# --- Build Locks ---
+def _lock_is_live(key):
+    try:
+        return time.time() - os.path.getmtime(_path(key, 'lock')) < EXPORT_JOB_STALE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def _claim(key):
+    """Creates the build lock for `key`. Returns False if a live build already holds it."""
+    lock_path = _path(key, 'lock')
+    for _ in range(2):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            if _lock_is_live(key):
+                return False
+            try:
+                os.remove(lock_path)  # left behind by a dead worker
+            except FileNotFoundError:
+                pass
+    return False
+
+
+def _release(key):
+    try:
+        os.remove(_path(key, 'lock'))
+    except FileNotFoundError:
+        pass
+
+
+# --- Building ---
+def _build(key, search_term, sort_by, status, filters=None):
+    tmp_path = _path(key, f'xlsx.{os.getpid()}.tmp')
+
+    def report_progress(rows_done):
+        os.utime(_path(key, 'lock'))  # heartbeat
+        _write_status(key, **dict(status, rows_done=rows_done))
+
+    started = time.monotonic()
+    try:
+        import excel_export  # loads openpyxl, which only exports need
+        observations = database.iter_observations_for_export(search_term, sort_by, filters=filters)
+        row_count = excel_export.export_report(tmp_path, observations, progress=report_progress)
+        os.replace(tmp_path, report_path(key))
+        _write_status(key, **dict(status, status=STATUS_READY, rows_done=row_count, rows_total=row_count))
+        print(f"Export: Built report {key} ({row_count} rows) in {time.monotonic() - started:.1f}s.")
+    except Exception as e:
+        print(f"Export: Error building report {key}: {e}")
+        _write_status(key, **dict(status, status=STATUS_FAILED, error=str(e)))
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+    finally:
+        _release(key)
+    _evict_old_reports()
+
+
+def _evict_old_reports():
+    """Keeps the EXPORT_CACHE_MAX_FILES most recently used snapshots and deletes the rest."""
+    try:
+        reports = [entry for entry in os.scandir(EXPORT_CACHE_DIR) if entry.name.endswith('.xlsx')]
+    except FileNotFoundError:
+        return
+    reports.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in reports[EXPORT_CACHE_MAX_FILES:]:
+        key = entry.name[:-len('.xlsx')]
+        for path in (entry.path, _path(key, 'json')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Returns this process's build threads (keyed by PID, like analysis_queue.get_backend)."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(1, EXPORT_JOB_WORKERS), thread_name_prefix='report-export')
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def start_export(search_term=None, sort_by='date_newest', filters=None):
+    """Returns the status of the report for the current data, starting a build if needed.
+
+    If the rows have not changed since a previous export the status is already 'ready'.
+    `filters` are the report filters (database.REPORT_FILTER_FIELDS); a malformed date
+    raises ValueError.
+    """
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    filters = _filters_json(filters)
+    version = database.get_export_version(search_term, filters)
+    key = make_key(search_term, sort_by, version, filters)
+
+    status = get_status(key)
+    if status and status['status'] == STATUS_READY:
+        os.utime(report_path(key))  # mark as recently used
+        return status
+    if status and status['status'] == STATUS_RUNNING:
+        return status
+    if not _claim(key):
+        return get_status(key) or {'key': key, 'status': STATUS_RUNNING, 'rows_done': 0, 'rows_total': version['row_count']}
+
+    status = _write_status(
+        key, status=STATUS_RUNNING, rows_done=0, rows_total=version['row_count'],
+        filename=_report_filename(search_term), search_term=search_term, sort_by=sort_by, filters=filters,
+    )
+    try:
+        _get_executor().submit(_build, key, search_term, sort_by, status, filters)
+    except Exception:
+        _release(key)
+        raise
+    return dict(status, key=key)
@@ -0,0 +1,277 @@
+# floor_normalizer.py
+"""Deterministic mapping of free-text floor input ("B1", "G", "lvl 2") to standard labels.
+
+Runs before the AI call: when the input resolves confidently, the prompt no longer asks
+Gemini to do it. The normaliser is built from a list of standard floor labels, so each
+property can have its own set (see FLOOR_SETS_FILE).
+"""
+
+import json
+import os
+import re
+import threading
+
+# The standard labels used across the app. Spellings are kept as stored in existing data.
+DEFAULT_FLOORS = [
+    "basement 4", "basement 3", "basement 2", "basement 1", "groundfloor",
+    "first floor", "second floor", "third floor", "forth floor", "fifth floor",
+    "sixth floor", "seventh floor", "eighth floor", "nineth floor", "roof top"
+]
+
+# Optional JSON file mapping a floor-set name to its list of labels, e.g.
+# {"beach-resort": ["basement 1", "groundfloor", "first floor", "roof top"]}.
+# FLOOR_SET picks the set this deployment uses; 'default' is DEFAULT_FLOORS.
+FLOOR_SETS_FILE = os.getenv('FLOOR_SETS_FILE')
+FLOOR_SET = os.getenv('FLOOR_SET', 'default')
+
+# Matches at or above this confidence are used without asking the AI.
+CONFIDENT_THRESHOLD = 0.8
+
+ROOF = 'roof'
+
+_ORDINAL_WORDS = {
+    'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'forth': 4, 'fifth': 5,
+    'sixth': 6, 'seventh': 7, 'eighth': 8, 'ninth': 9, 'nineth': 9, 'tenth': 10,
+    'eleventh': 11, 'twelfth': 12,
+}
+_CARDINAL_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+}
+_NUMBER_WORDS = {**_CARDINAL_WORDS, **_ORDINAL_WORDS}
+
+# Words that only say "this is a floor" and carry no level information.
+_FILLER_WORDS = {'floor', 'flr', 'fl', 'level', 'lvl', 'lev', 'lv', 'l', 'f', 'storey', 'story', 'the', 'on', 'at', 'no', 'number'}
+_BASEMENT_WORDS = {'basement', 'bsmt', 'bsmnt', 'base', 'b', 'cellar', 'underground', 'ug'}
+_GROUND_WORDS = {'ground', 'groundfloor', 'grd', 'gnd', 'g', 'gf'}
+_ROOF_WORDS = {'roof', 'rooftop', 'rt', 'roofdeck', 'terrace'}
+
+# Vocabulary for typo correction. Short abbreviations are excluded: a one-letter edit
+# turns "g" into "b", which is exactly the kind of guess we must not make.
+_SPELLING_VOCABULARY = sorted(
+    {w for w in set(_NUMBER_WORDS) | _FILLER_WORDS | _BASEMENT_WORDS | _GROUND_WORDS | _ROOF_WORDS if len(w) >= 4}
+    | {'top', 'deck'}
+)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s-]")
+# Splits "b1" -> "b 1", "lvl2" -> "lvl 2", "2nd" stays "2nd".
+_LETTER_DIGIT_RE = re.compile(r"(?<=[a-z])(?=\d)|(?<=\d)(?=[a-z]{3,})")
+_ORDINAL_SUFFIX_RE = re.compile(r"^(\d+)(st|nd|rd|th)$")
+
+
+def _edit_distance(a, b, limit):
+    """Edit distance between a and b counting adjacent transpositions ("thrid") as one
+    edit (optimal string alignment). Returns limit + 1 once it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+def _tokenise(text):
+    text = _PUNCTUATION_RE.sub(' ', str(text).lower())
+    text = _LETTER_DIGIT_RE.sub(' ', text)
+    # Keep "-1" as a number but treat other dashes as separators.
+    text = re.sub(r"(?<!\S)-(?=\d)", " minus ", text).replace('-', ' ')
+    return text.split()
+
+
+def _correct_spelling(token):
+    """Returns the closest vocabulary word for a misspelt token, or None."""
+    if token.isdigit() or len(token) < 4:
+        return None
+    limit = 1 if len(token) <= 5 else 2
+    best, best_distance = None, limit + 1
+    for word in _SPELLING_VOCABULARY:
+        distance = _edit_distance(token, word, limit)
+        if distance < best_distance:
+            best, best_distance = word, distance
+    return best
+
+
+def _parse_level(tokens):
+    """Interprets tokens as a level: negative for basements, 0 ground, ROOF, or None."""
+    words = [t for t in tokens if t not in _FILLER_WORDS]
+    if not words:
+        return None
+
+    basement = negative = False
+    ground = roof = False
+    numbers = []
+    for word in words:
+        match = _ORDINAL_SUFFIX_RE.match(word)
+        if match:
+            numbers.append(int(match.group(1)))
+        elif word.isdigit():
+            numbers.append(int(word))
+        elif word in _NUMBER_WORDS:
+            numbers.append(_NUMBER_WORDS[word])
+        elif word in _BASEMENT_WORDS:
+            basement = True
+        elif word in _GROUND_WORDS:
+            ground = True
+        elif word in _ROOF_WORDS or word in ('top', 'deck'):
+            roof = True
+        elif word == 'minus':
+            negative = True
+        else:
+            return None  # An unknown word: don't guess.
+
+    if len(numbers) > 1 or (roof and (numbers or basement or ground)) or (ground and (numbers or basement)):
+        return None
+    if roof:
+        return ROOF
+    if ground:
+        return 0
+    if basement or negative:
+        # A bare "B" could be any basement level; leave that to the AI.
+        if not numbers or numbers[0] <= 0:
+            return None
+        return -numbers[0]
+    if numbers:
+        return numbers[0]
+    return None
+
+
+class FloorMatch:
+    """Result of normalising one input: the standard label and how sure we are."""
+
+    __slots__ = ('label', 'confidence', 'method')
+
+    def __init__(self, label, confidence, method):
+        self.label = label
+        self.confidence = confidence
+        self.method = method
+
+    @property
+    def confident(self):
+        return self.confidence >= CONFIDENT_THRESHOLD
+
+    def __repr__(self):
+        return f"FloorMatch({self.label!r}, confidence={self.confidence}, method={self.method!r})"
+
+
+class FloorNormalizer:
+    """Maps free-text floor input onto one property's list of standard floor labels."""
+
+    def __init__(self, floors):
+        self.floors = list(floors)
+        self._by_level = {}
+        self._exact = {}
+        for label in self.floors:
+            key = ' '.join(_tokenise(label))
+            self._exact[key] = label
+            self._exact[key.replace(' ', '')] = label
+            level = _parse_level(_tokenise(label))
+            if level is not None:
+                self._by_level.setdefault(level, label)
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    def normalise(self, text):
+        """Returns a FloorMatch, or None if the input can't be mapped to a known floor."""
+        if not text or not str(text).strip():
+            return None
+        tokens = _tokenise(text)
+        key = ' '.join(tokens)
+        with self._memo_lock:
+            if key in self._memo:
+                return self._memo[key]
+        match = self._normalise_tokens(tokens, key)
+        with self._memo_lock:
+            if len(self._memo) > 4096:
+                self._memo.clear()
+            self._memo[key] = match
+        return match
+
+    def _normalise_tokens(self, tokens, key):
+        # 1. The input already is (a spacing variant of) a standard label.
+        label = self._exact.get(key) or self._exact.get(key.replace(' ', ''))
+        if label:
+            return FloorMatch(label, 1.0, 'exact')
+
+        # 2. Abbreviations, ordinals and numbers: "B1", "G", "lvl 2", "2nd floor".
+        level = _parse_level(tokens)
+        if level is not None and level in self._by_level:
+            return FloorMatch(self._by_level[level], 1.0, 'pattern')
+
+        # 3. Typos: correct each unknown word, then try again.
+        corrected = []
+        changed = False
+        for token in tokens:
+            known = token.isdigit() or _ORDINAL_SUFFIX_RE.match(token) or token in _NUMBER_WORDS \
+                or token in _FILLER_WORDS or token in _BASEMENT_WORDS or token in _GROUND_WORDS or token in _ROOF_WORDS
+            replacement = None if known else _correct_spelling(token)
+            if replacement:
+                changed = True
+            corrected.append(replacement or token)
+        if changed:
+            corrected_key = ' '.join(corrected)
+            label = self._exact.get(corrected_key) or self._exact.get(corrected_key.replace(' ', ''))
+            if label:
+                return FloorMatch(label, 0.9, 'spelling')
+            level = _parse_level(corrected)
+            if level is not None and level in self._by_level:
+                return FloorMatch(self._by_level[level], 0.9, 'spelling')
+
+        # 4. Whole-label fuzzy match for labels that aren't level-shaped (e.g. "mezzanine").
+        best, best_distance = None, 3
+        for label_key, label in self._exact.items():
+            distance = _edit_distance(key, label_key, 2)
+            if distance < best_distance:
+                best, best_distance = label, distance
+        if best is not None:
+            return FloorMatch(best, 0.8 if best_distance == 1 else 0.6, 'fuzzy')
+        return None
+
+
+def _load_floor_sets():
+    floor_sets = {'default': DEFAULT_FLOORS}
+    if FLOOR_SETS_FILE:
+        with open(FLOOR_SETS_FILE, encoding='utf-8') as f:
+            floor_sets.update(json.load(f))
+    return floor_sets
+
+
+_normalizers = {}
+_normalizers_lock = threading.Lock()
+
+
+def get_normalizer(floor_set=None):
+    """Returns the (cached) normaliser for a named floor set, FLOOR_SET by default."""
+    floor_set = floor_set or FLOOR_SET
+    normalizer = _normalizers.get(floor_set)
+    if normalizer is None:
+        with _normalizers_lock:
+            normalizer = _normalizers.get(floor_set)
+            if normalizer is None:
+                floor_sets = _load_floor_sets()
+                if floor_set not in floor_sets:
+                    raise KeyError(f"Unknown floor set '{floor_set}'. Known sets: {', '.join(floor_sets)}")
+                normalizer = _normalizers[floor_set] = FloorNormalizer(floor_sets[floor_set])
+    return normalizer
+
+
+def normalise_floor(text, floor_set=None):
+    """Convenience wrapper: normalises `text` with the configured floor set."""
+    return get_normalizer(floor_set).normalise(text)
+
+
+def resolve_floor(text, floor_set=None):
+    """Returns the standard label for `text` if the match is confident, otherwise None."""
+    match = normalise_floor(text, floor_set)
+    return match.label if match and match.confident else None
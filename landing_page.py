@@ -57,29 +57,32 @@ def create_layout(app_instance):
 
 def register_callbacks(app):
     """Registers callbacks for the landing page."""
+    # Both only flip a style or class, so they run in the browser instead of costing a
+    # round trip to the server on every tap.
 
     # Callback for the desktop dropdown
-    @app.callback(
+    app.clientside_callback(
+        """
+        function(nClicks, currentStyle) {
+            var open = currentStyle && currentStyle.display === 'block';
+            return {display: open ? 'none' : 'block'};
+        }
+        """,
         Output('services-dropdown-content', 'style'),
         Input('services-dropdown-toggle', 'n_clicks'),
         State('services-dropdown-content', 'style'),
         prevent_initial_call=True
     )
-    def toggle_services_dropdown(n_clicks, current_style):
-        if current_style and current_style.get('display') == 'block':
-            return {'display': 'none'}
-        else:
-            return {'display': 'block'}
 
     # Callback for the mobile menu (sandwich button)
-    @app.callback(
+    app.clientside_callback(
+        """
+        function(nClicks, currentClass) {
+            return (currentClass || '').indexOf('active') !== -1 ? 'nav-links' : 'nav-links active';
+        }
+        """,
         Output('nav-links-ul', 'className'),
         Input('mobile-menu-toggle', 'n_clicks'),
         State('nav-links-ul', 'className'),
         prevent_initial_call=True
     )
-    def toggle_mobile_menu(n_clicks, current_class):
-        if 'active' in current_class:
-            return "nav-links"
-        else:
-            return "nav-links active"
\ No newline at end of file
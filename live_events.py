@@ -0,0 +1,135 @@
+# live_events.py
+"""Server-Sent Events stream that tells open report pages when observations change.
+
+The database announces every change to the observations table with NOTIFY (see
+database._create_data_versions). Each worker has a single LISTEN connection
+(database.get_data_change_listener); this module fans its data version out to every
+connected browser. The stream only carries the new version number. The page then asks
+for the rows changed since the version it is showing (observation_app's
+sync_report_changes), which are usually served from the report cache.
+
+An idle stream costs one blocked thread and no database connection, so run gunicorn
+with threaded workers (see Procfile). LIVE_EVENTS_MAX_CLIENTS caps the streams per
+worker so that ordinary requests always have threads left; pages turned away fall back
+to polling.
+"""
+
+import os
+import threading
+import time
+
+from flask import Response
+
+import database
+
+LIVE_EVENTS_ENABLED = os.getenv('LIVE_EVENTS_ENABLED', '1') not in ('0', 'false', 'False')
+# Keep this below the gunicorn thread count (--threads) of a worker.
+LIVE_EVENTS_MAX_CLIENTS = int(os.getenv('LIVE_EVENTS_MAX_CLIENTS', '80'))
+# Comment lines sent on idle streams so proxies don't time them out.
+LIVE_EVENTS_HEARTBEAT_SECONDS = float(os.getenv('LIVE_EVENTS_HEARTBEAT_SECONDS', '20'))
+# Streams are closed after this long; the browser reconnects, possibly to another worker.
+LIVE_EVENTS_MAX_STREAM_SECONDS = float(os.getenv('LIVE_EVENTS_MAX_STREAM_SECONDS', '3600'))
+# How long the browser waits before reconnecting after the stream ends.
+LIVE_EVENTS_RETRY_MS = 5000
+
+
+class EventHub:
+    """Holds the latest data version and wakes every stream waiting for a newer one.
+
+    Streams only ever need the newest version, so there is no per-client queue: a slow
+    client simply skips the versions it missed.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.version = None
+        self.clients = 0
+        self._cond = threading.Condition()
+        self._stats = {'streams_opened': 0, 'streams_rejected': 0, 'events_published': 0}
+        database.get_data_change_listener().subscribe(self._publish)
+
+    def _publish(self, version):
+        with self._cond:
+            if self.version is not None and version <= self.version:
+                return
+            self.version = version
+            self._stats['events_published'] += 1
+            self._cond.notify_all()
+
+    def open_stream(self):
+        """Reserves a client slot. Returns False if this worker is already full."""
+        with self._cond:
+            if self.clients >= LIVE_EVENTS_MAX_CLIENTS:
+                self._stats['streams_rejected'] += 1
+                return False
+            self.clients += 1
+            self._stats['streams_opened'] += 1
+            return True
+
+    def close_stream(self):
+        with self._cond:
+            self.clients -= 1
+
+    def wait_for_version(self, newer_than, timeout):
+        """Blocks until the version is above `newer_than` or `timeout` passes; returns it."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version is not None and (newer_than is None or self.version > newer_than), timeout)
+            return self.version
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, clients=self.clients, max_clients=LIVE_EVENTS_MAX_CLIENTS, version=self.version)
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_hub():
+    """Returns this process's hub (keyed by PID, like database.get_pool)."""
+    global _hub
+    pid = os.getpid()
+    if _hub is not None and _hub.pid == pid:
+        return _hub
+    with _hub_lock:
+        if _hub is None or _hub.pid != pid:
+            _hub = EventHub()
+    return _hub
+
+
+def get_live_events_stats():
+    """Returns connected clients and stream counters for this process."""
+    if _hub is None or _hub.pid != os.getpid():
+        return {'pid': os.getpid(), 'clients': 0}
+    return dict(_hub.stats(), pid=os.getpid())
+
+
+def _events(hub):
+    """Yields SSE messages: a 'version' event for each new data version, heartbeats otherwise."""
+    yield f"retry: {LIVE_EVENTS_RETRY_MS}\n\n"
+    deadline = time.monotonic() + LIVE_EVENTS_MAX_STREAM_SECONDS
+    sent = None
+    while time.monotonic() < deadline:
+        version = hub.wait_for_version(sent, LIVE_EVENTS_HEARTBEAT_SECONDS)
+        if version is not None and version != sent:
+            sent = version
+            yield f"event: version\ndata: {version}\n\n"
+        else:
+            # Also how a closed connection is noticed: the write fails and the stream ends.
+            yield ": heartbeat\n\n"
+
+
+def event_stream_response():
+    """Flask response for the observation event stream, or 503 if it can't take a client."""
+    if not LIVE_EVENTS_ENABLED:
+        return Response("Live updates are disabled.", status=503)
+    hub = get_hub()
+    if not hub.open_stream():
+        return Response("Too many live connections on this worker.", status=503, headers={'Retry-After': '60'})
+    response = Response(_events(hub), mimetype='text/event-stream')
+    # Runs when the server closes the response, even if the stream never started.
+    response.call_on_close(hub.close_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
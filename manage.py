@@ -0,0 +1,374 @@
+# manage.py
+"""Maintenance commands for RiskWatch. Run `python manage.py --help` for the list."""
+
+import argparse
+import datetime
+import sys
+import time
+
+import ai_cache
+import ai_module
+import analysis_queue
+import bulk_import
+import database
+import near_duplicates
+import photo_processing
+import photo_store
+
+
+def cmd_migrate(args):
+    """Brings the database schema up to date (see database.MIGRATIONS)."""
+    current = database.get_schema_version()
+    pending = [(version, name) for version, name in database.MIGRATIONS if version > current]
+    if args.status:
+        print(f"Schema version {current} of {database.SCHEMA_VERSION}.")
+        for version, name in pending:
+            print(f"  Pending: {version} ({name})")
+        return 1 if pending else 0
+    started = time.monotonic()
+    applied = database.migrate()
+    if applied:
+        print(f"Migrated to schema version {applied[-1][0]} in {time.monotonic() - started:.1f}s.")
+    else:
+        print(f"Schema is up to date (version {database.SCHEMA_VERSION}).")
+    return 0
+
+
+def _schema_is_current():
+    """Returns True if the database is at database.SCHEMA_VERSION, else says why not."""
+    current = database.get_schema_version()
+    if current < database.SCHEMA_VERSION:
+        print(f"The database schema is at version {current} of {database.SCHEMA_VERSION}; run `python manage.py migrate` first.")
+    elif current > database.SCHEMA_VERSION:
+        print(f"The database schema is at version {current}, newer than this code ({database.SCHEMA_VERSION}); deploy the matching code first.")
+    return current == database.SCHEMA_VERSION
+
+
+def cmd_backfill_photos(args):
+    """Generates thumbnails (and optionally re-encodes originals) for existing photos."""
+    if not _schema_is_current():
+        return 1
+    store = photo_store.get_store()
+    processed = failed = 0
+    last_id = 0
+    started = time.monotonic()
+    while True:
+        batch = database.get_observations_missing_thumbnails(args.batch_size, after_id=last_id)
+        if not batch:
+            break
+        updates = []
+        for observation_id, photo_bytes, photo_key in batch:
+            last_id = observation_id
+            try:
+                if photo_bytes is None:
+                    photo_bytes = store.get(photo_key)
+                photo = photo_processing.process_photo(photo_bytes, reencode_original=args.reencode_originals)
+                updates.append((observation_id, photo_store.store_photo(photo)))
+            except Exception as e:
+                failed += 1
+                print(f"  Skipping observation #{observation_id}: {e}")
+        # One transaction per batch keeps locks short and makes the command resumable.
+        database.update_photo_variants(updates)
+        processed += len(updates)
+        print(f"  Processed {processed} photos (up to #{last_id}) in {time.monotonic() - started:.1f}s")
+    print(f"Photo backfill complete: {processed} updated, {failed} skipped.")
+    return 0
+
+
+def cmd_process_pending_analyses(args):
+    """Runs AI analysis for observations left pending (or failed) by the background queue, in batches."""
+    if not _schema_is_current():
+        return 1
+    started = time.monotonic()
+    processed = analysis_queue.process_pending(limit=args.limit, include_failed=args.include_failed)
+    print(f"Analysed {processed} observations in {time.monotonic() - started:.1f}s.")
+    return 0
+
+
+def cmd_clear_ai_cache(args):
+    """Deletes cached AI analyses (by default only those made with an older prompt)."""
+    if not _schema_is_current():
+        return 1
+    keep = None if args.all else ai_module.PROMPT_VERSION
+    removed = ai_cache.invalidate(current_prompt_version=keep)
+    print(f"Removed {removed} cached AI analyses (current prompt version: {ai_module.PROMPT_VERSION}).")
+    return 0
+
+
+def cmd_import(args):
+    """Bulk-loads observations from a CSV, XLSX or JSONL file."""
+    if not _schema_is_current():
+        return 1
+
+    def report_progress(summary):
+        rate = summary['imported'] / summary['elapsed_seconds'] if summary['elapsed_seconds'] else 0
+        print(f"  {summary['imported']} rows loaded, {summary['rejected']} rejected ({rate:.0f} rows/s)")
+
+    try:
+        summary = bulk_import.import_file(
+            args.path, file_format=args.format, analyse=args.analyse,
+            chunk_size=args.chunk_size, dry_run=args.dry_run, progress=report_progress,
+        )
+    except bulk_import.ImportStopped as e:
+        print(f"Import stopped: {e}")
+        return 1
+    for line_number, message in summary['errors']:
+        print(f"  Line {line_number}: {message}")
+    if summary['rejected'] > len(summary['errors']):
+        print(f"  ... and {summary['rejected'] - len(summary['errors'])} more rejected rows.")
+    verb = "Validated" if args.dry_run else "Imported"
+    print(f"{verb} {summary['imported']} of {summary['read']} rows in {summary['elapsed_seconds']:.1f}s "
+          f"({summary['pending_analysis']} waiting for AI analysis).")
+    if summary['pending_analysis'] and not args.dry_run:
+        if args.analyse_now:
+            cmd_process_pending_analyses(argparse.Namespace(limit=None, include_failed=False))
+        else:
+            print("Run `python manage.py process-pending-analyses` or let the web workers pick them up.")
+    return 1 if summary['rejected'] and args.strict else 0
+
+
+def cmd_migrate_photos(args):
+    """Moves photos stored inline in the observations table into the photo store."""
+    store = photo_store.get_store()
+    if store is None:
+        print("PHOTO_STORE_URL is not set; configure the photo store first (see photo_store.py).")
+        return 1
+    if not _schema_is_current():
+        return 1
+    moved = failed = bytes_moved = 0
+    last_id = 0
+    started = time.monotonic()
+    while True:
+        batch = database.get_inline_photos(args.batch_size, after_id=last_id)
+        if not batch:
+            break
+        updates = []
+        for observation_id, photo in batch:
+            last_id = observation_id
+            try:
+                stored = photo_store.store_photo(photo)
+            except Exception as e:
+                failed += 1
+                print(f"  Skipping observation #{observation_id}: {e}")
+                continue
+            if args.keep_inline:
+                stored = dict(stored, **photo)
+            updates.append((observation_id, stored))
+            bytes_moved += sum(len(value) for value in photo.values() if value)
+        # Blobs are written before the row is updated, so an interrupted run leaves no
+        # dangling keys; running the command again carries on where it stopped.
+        database.update_photo_variants(updates)
+        moved += len(updates)
+        print(f"  Moved {moved} photos (up to #{last_id}, {bytes_moved / 2**20:.1f} MiB) in {time.monotonic() - started:.1f}s")
+    stats = store.stats()
+    print(f"Photo migration complete: {moved} observations moved, {failed} skipped. "
+          f"{stats['writes']} blobs written ({stats['bytes_written'] / 2**20:.1f} MiB), {stats['deduplicated']} duplicates skipped.")
+    if moved and not args.keep_inline:
+        print("Run VACUUM (or pg_repack) on observations to return the freed space to the operating system.")
+    return 0
+
+
+def cmd_prune_photos(args):
+    """Deletes blobs in the photo store that no observation refers to."""
+    store = photo_store.get_store()
+    if store is None:
+        print("PHOTO_STORE_URL is not set; there is no photo store to prune.")
+        return 1
+    if not _schema_is_current():
+        return 1
+    # Skip recent blobs: an upload writes its blob before the observation row is committed.
+    cutoff = time.time() - args.min_age_hours * 3600
+    checked = removed = 0
+
+    def prune(keys):
+        unused = set(keys) - database.get_referenced_photo_keys(keys)
+        for key in unused:
+            if not args.dry_run:
+                store.delete(key)
+        return len(unused)
+
+    batch = []
+    for key, modified_at in store.iter_keys():
+        if modified_at > cutoff:
+            continue
+        batch.append(key)
+        if len(batch) >= 1000:
+            checked += len(batch)
+            removed += prune(batch)
+            batch = []
+    if batch:
+        checked += len(batch)
+        removed += prune(batch)
+    verb = "Would delete" if args.dry_run else "Deleted"
+    print(f"{verb} {removed} of {checked} blobs older than {args.min_age_hours}h that no observation uses.")
+    return 0
+
+
+def cmd_partition_observations(args):
+    """Converts observations into a table partitioned by month (see database.py)."""
+    if not _schema_is_current():
+        return 1
+    started = time.monotonic()
+    try:
+        copied = database.partition_observations_table()
+    except ValueError as e:
+        print(e)
+        return 1
+    if copied is None:
+        created = database.create_upcoming_partitions()
+        print(f"observations is already partitioned; created {len(created)} missing monthly partitions.")
+        return 0
+    print(f"Partitioned observations by month: copied {copied} rows in {time.monotonic() - started:.1f}s.")
+    return 0
+
+
+def cmd_ensure_partitions(args):
+    """Creates the monthly partitions for the coming PARTITION_MONTHS_AHEAD months."""
+    if not _schema_is_current():
+        return 1
+    created = database.create_upcoming_partitions()
+    if created is None:
+        print("observations isn't partitioned; nothing to do.")
+    else:
+        print(f"Created {len(created)} monthly partitions{': ' + ', '.join(created) if created else ''}.")
+    return 0
+
+
+def _month(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got '{value}'")
+
+
+def cmd_drop_partitions(args):
+    """Drops (or detaches) the monthly partitions of observations older than --before."""
+    if not _schema_is_current():
+        return 1
+    try:
+        removed = database.drop_observation_partitions(args.before, detach_only=args.detach_only)
+    except ValueError as e:
+        print(e)
+        return 1
+    for name, row_count in removed:
+        print(f"  {'Detached' if args.detach_only else 'Dropped'} {name} ({row_count} observations)")
+    if args.detach_only and removed:
+        print("Detached partitions are ordinary tables now; archive them (e.g. pg_dump -t) and drop them when done.")
+    elif removed and photo_store.get_store() is not None:
+        print("Run `python manage.py prune-photos` to delete the photos of the dropped observations.")
+    print(f"{len(removed)} partitions removed.")
+    return 0
+
+
+def cmd_rebuild_rollups(args):
+    """Recomputes the dashboard rollups from the observations table."""
+    if not _schema_is_current():
+        return 1
+    started = time.monotonic()
+    rows = database.rebuild_dashboard_rollups()
+    print(f"Rebuilt {rows} dashboard rollup rows in {time.monotonic() - started:.1f}s.")
+    return 0
+
+
+def cmd_find_duplicates(args):
+    """Fingerprints observations that have none yet, then groups existing near-duplicates."""
+    if not _schema_is_current():
+        return 1
+    started = time.monotonic()
+
+    def report_progress(updated, last_id):
+        print(f"  Fingerprinted {updated} observations (up to #{last_id}) in {time.monotonic() - started:.1f}s")
+
+    indexed = near_duplicates.index_missing(reindex=args.reindex, progress=report_progress)
+    if indexed:
+        print(f"Fingerprinted {indexed} observations.")
+    clusters = near_duplicates.cluster_existing(threshold=args.threshold, window_hours=args.window_hours)
+    for original_id, duplicate_ids in clusters[:args.show]:
+        print(f"  #{original_id}: repeated by {', '.join(f'#{i}' for i in duplicate_ids)}")
+    if len(clusters) > args.show:
+        print(f"  ... and {len(clusters) - args.show} more groups.")
+    duplicates = sum(len(duplicate_ids) for _, duplicate_ids in clusters)
+    print(f"Found {duplicates} repeat reports of {len(clusters)} observations in {time.monotonic() - started:.1f}s.")
+    if args.apply and clusters:
+        linked = database.link_duplicate_clusters(clusters)
+        print(f"Linked {linked} repeat reports to the observation they repeat.")
+    elif clusters:
+        print("Run again with --apply to link them.")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="RiskWatch maintenance commands.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate = subparsers.add_parser('migrate', help="Create or upgrade the database schema; run once per deploy, before the app starts.")
+    migrate.add_argument('--status', action='store_true', help="Only show the schema version and pending migrations (exit 1 if any are pending).")
+    migrate.set_defaults(func=cmd_migrate)
+
+    backfill = subparsers.add_parser('backfill-photos', help="Create thumbnails for photos stored before the ingest pipeline existed.")
+    backfill.add_argument('--batch-size', type=int, default=50, help="Rows processed per transaction (default: 50).")
+    backfill.add_argument('--reencode-originals', action='store_true', help="Also downscale and re-encode the stored originals to shrink the table.")
+    backfill.set_defaults(func=cmd_backfill_photos)
+
+    migrate_photos = subparsers.add_parser('migrate-photos', help="Move photos stored in the database into the photo store (PHOTO_STORE_URL).")
+    migrate_photos.add_argument('--batch-size', type=int, default=50, help="Rows moved per transaction (default: 50).")
+    migrate_photos.add_argument('--keep-inline', action='store_true', help="Also keep the bytes in the table (e.g. for a trial run).")
+    migrate_photos.set_defaults(func=cmd_migrate_photos)
+
+    prune_photos = subparsers.add_parser('prune-photos', help="Delete blobs in the photo store that no observation refers to.")
+    prune_photos.add_argument('--min-age-hours', type=float, default=24, help="Only consider blobs at least this old (default: 24).")
+    prune_photos.add_argument('--dry-run', action='store_true', help="Only count the blobs that would be deleted.")
+    prune_photos.set_defaults(func=cmd_prune_photos)
+
+    partition = subparsers.add_parser('partition-observations', help="Rebuild observations as a table partitioned by month (locks the table while it runs).")
+    partition.set_defaults(func=cmd_partition_observations)
+
+    ensure_partitions = subparsers.add_parser('ensure-partitions', help="Create the coming months' partitions of observations; schedule daily (migrate also runs it).")
+    ensure_partitions.set_defaults(func=cmd_ensure_partitions)
+
+    drop_partitions = subparsers.add_parser('drop-partitions', help="Drop the monthly partitions of observations that end before a given month.")
+    drop_partitions.add_argument('--before', type=_month, required=True, help="First month to keep, as YYYY-MM.")
+    drop_partitions.add_argument('--detach-only', action='store_true', help="Detach the partitions into standalone tables for archiving instead of dropping them.")
+    drop_partitions.set_defaults(func=cmd_drop_partitions)
+
+    rollups = subparsers.add_parser('rebuild-rollups', help="Recompute the dashboard rollups (they are normally kept current by triggers).")
+    rollups.set_defaults(func=cmd_rebuild_rollups)
+
+    duplicates = subparsers.add_parser('find-duplicates', help="Find (and with --apply, link) observations that repeat an earlier report.")
+    duplicates.add_argument('--threshold', type=float, default=None, help=f"Minimum similarity, 0-1 (default: {near_duplicates.DUPLICATE_SIMILARITY}).")
+    duplicates.add_argument('--window-hours', type=float, default=None, help=f"Only compare observations this close in time (default: {near_duplicates.DUPLICATE_WINDOW_HOURS:g}).")
+    duplicates.add_argument('--show', type=int, default=20, help="How many groups to list (default: 20).")
+    duplicates.add_argument('--apply', action='store_true', help="Mark the repeats as duplicates of the earliest report in each group.")
+    duplicates.add_argument('--reindex', action='store_true', help="Recompute every fingerprint, e.g. after changing near_duplicates.py.")
+    duplicates.set_defaults(func=cmd_find_duplicates)
+
+    pending = subparsers.add_parser('process-pending-analyses', help="Run AI analysis for observations still waiting for it.")
+    pending.add_argument('--limit', type=int, default=None, help="Stop after this many observations.")
+    pending.add_argument('--include-failed', action='store_true', help="Also retry observations whose analysis failed.")
+    pending.set_defaults(func=cmd_process_pending_analyses)
+
+    clear_cache = subparsers.add_parser('clear-ai-cache', help="Delete cached AI analyses made with an outdated prompt.")
+    clear_cache.add_argument('--all', action='store_true', help="Delete every cached analysis, including current ones.")
+    clear_cache.set_defaults(func=cmd_clear_ai_cache)
+
+    importer = subparsers.add_parser('import', help="Bulk-load observations from a CSV, XLSX or JSONL file.")
+    importer.add_argument('path', help="File to import. Headers may match the Excel report or the database columns.")
+    importer.add_argument('--format', choices=bulk_import.SUPPORTED_FORMATS, default=None, help="File format (default: from the extension).")
+    importer.add_argument('--analyse', choices=bulk_import.ANALYSE_MODES, default=bulk_import.ANALYSE_MISSING,
+                          help="Which rows to queue for AI analysis (default: rows without Likelihood/Severity).")
+    importer.add_argument('--analyse-now', action='store_true', help="Run the queued AI analyses before exiting.")
+    importer.add_argument('--chunk-size', type=int, default=bulk_import.BULK_IMPORT_CHUNK_SIZE, help="Rows per COPY transaction.")
+    importer.add_argument('--dry-run', action='store_true', help="Validate the file without loading anything.")
+    importer.add_argument('--strict', action='store_true', help="Exit with status 1 if any row was rejected.")
+    importer.set_defaults(func=cmd_import)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
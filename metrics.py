@@ -0,0 +1,355 @@
+# metrics.py
+"""In-process metrics for the hot paths, served in Prometheus text format at /metrics.
+
+What is measured:
+- Dash callbacks registered through instrument_callbacks: their own run time and errors,
+  and separately the rest of the request (Dash decoding the inputs and serialising the
+  outputs), plus the size of the response sent to the browser;
+- database queries, labelled with the database.py function that ran them, and the rows
+  they returned (see database.InstrumentedConnection);
+- AI model calls: latency by outcome, token usage and unparseable responses (ai_module);
+- named stages inside callbacks, such as decoding an uploaded photo (see stage());
+- every HTTP request: latency and response size by route.
+
+Everything is counted in fixed-bucket histograms and counters held by the process, so
+recording a value costs one lock and a few additions, cheap enough to leave on. The
+Procfile runs a single threaded worker; with more workers each one answers /metrics with
+its own numbers.
+
+If SLOW_REQUEST_LOG_MS is set, requests slower than that are printed with a breakdown of
+where their time went (callback, Dash, database, AI and stages).
+"""
+
+import bisect
+import functools
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from dash.exceptions import PreventUpdate
+from flask import Response, abort, request
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') not in ('0', 'false', 'False')
+METRICS_URL = '/metrics'
+# If set, /metrics requires "Authorization: Bearer <token>".
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Requests taking at least this long are logged with a timing breakdown; 0 disables the log.
+SLOW_REQUEST_LOG_MS = float(os.getenv('SLOW_REQUEST_LOG_MS', '0'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_METRIC_NAME_RE = re.compile(r'[^a-zA-Z0-9_]+')
+
+
+# --- Metric Types ---
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, **extra):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra.items()]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """A monotonically increasing value per combination of label values."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.labels, label_values)} {_format_value(value)}" for label_values, value in values]
+        return lines
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum, per combination of label values."""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def render(self):
+        with self._lock:
+            values = sorted((label_values, list(entry)) for label_values, entry in self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, label_values, le=_format_value(bound))} {cumulative}")
+            labels = _label_text(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+_registry = []
+
+HTTP_REQUEST_SECONDS = Histogram('riskwatch_http_request_seconds', "Time to produce an HTTP response (streamed bodies excluded).", ('route', 'method', 'status'))
+HTTP_RESPONSE_BYTES = Histogram('riskwatch_http_response_bytes', "Size of HTTP response bodies.", ('route',), SIZE_BUCKETS)
+CALLBACK_SECONDS = Histogram('riskwatch_callback_seconds', "Run time of Dash callback functions.", ('callback',))
+CALLBACK_OVERHEAD_SECONDS = Histogram('riskwatch_callback_overhead_seconds', "Rest of a callback request: Dash decoding inputs and serialising outputs.", ('callback',))
+CALLBACK_RESPONSE_BYTES = Histogram('riskwatch_callback_response_bytes', "Size of the JSON payload a callback sends to the browser.", ('callback',), SIZE_BUCKETS)
+CALLBACK_ERRORS = Counter('riskwatch_callback_errors_total', "Dash callbacks that raised an exception.", ('callback',))
+DB_QUERY_SECONDS = Histogram('riskwatch_db_query_seconds', "Database query time by the database.py function that ran the query.", ('function',))
+DB_ROWS = Counter('riskwatch_db_rows_total', "Rows returned or changed by database queries.", ('function',))
+AI_CALL_SECONDS = Histogram('riskwatch_ai_call_seconds', "AI model call time including retries, by prompt kind and outcome.", ('kind', 'outcome'))
+AI_TOKENS = Counter('riskwatch_ai_tokens_total', "Tokens used by AI model calls.", ('kind', 'direction'))
+AI_PARSE_FAILURES = Counter('riskwatch_ai_parse_failures_total', "AI responses (or batch entries) that could not be used.", ('kind',))
+STAGE_SECONDS = Histogram('riskwatch_stage_seconds', "Time spent in named stages of request handling.", ('stage',))
+
+
+# --- Per-Request Timings ---
+class _RequestTimings:
+    """Where the current request's time went, for the slow-request log."""
+
+    __slots__ = ('started', 'callback', 'callback_seconds', 'db_seconds', 'db_queries', 'ai_seconds', 'ai_calls', 'stages')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.callback = None
+        self.callback_seconds = 0.0
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.ai_seconds = 0.0
+        self.ai_calls = 0
+        self.stages = {}
+
+
+# Set while a Flask request is handled on this thread; work on background threads
+# (the analysis queue, exports) is counted in the metrics but belongs to no request.
+_request = threading.local()
+
+
+def _current():
+    return getattr(_request, 'timings', None)
+
+
+def observe_query(function, seconds, rows):
+    """Records one database query (called by database.InstrumentedConnection's cursors)."""
+    DB_QUERY_SECONDS.observe(seconds, function)
+    if rows is not None and rows >= 0:
+        DB_ROWS.inc(rows, function)
+    timings = _current()
+    if timings is not None:
+        timings.db_seconds += seconds
+        timings.db_queries += 1
+
+
+def observe_ai_call(kind, outcome, seconds, prompt_tokens=None, response_tokens=None):
+    """Records one AI model call; the token counts come from the response's usage metadata."""
+    AI_CALL_SECONDS.observe(seconds, kind, outcome)
+    if prompt_tokens:
+        AI_TOKENS.inc(prompt_tokens, kind, 'prompt')
+    if response_tokens:
+        AI_TOKENS.inc(response_tokens, kind, 'response')
+    timings = _current()
+    if timings is not None:
+        timings.ai_seconds += seconds
+        timings.ai_calls += 1
+
+
+def count_ai_parse_failure(kind):
+    AI_PARSE_FAILURES.inc(1, kind)
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as a named stage of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, name)
+        timings = _current()
+        if timings is not None:
+            timings.stages[name] = timings.stages.get(name, 0.0) + elapsed
+
+
+# --- Dash Callbacks ---
+def timed_callback(func):
+    """Wraps a callback function so that its run time and errors are recorded."""
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = _current()
+        if timings is not None:
+            timings.callback = name
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except PreventUpdate:
+            raise
+        except Exception:
+            CALLBACK_ERRORS.inc(1, name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            CALLBACK_SECONDS.observe(elapsed, name)
+            if timings is not None:
+                timings.callback_seconds += elapsed
+    return wrapper
+
+
+class _InstrumentedCallbacks:
+    """Stands in for the Dash app in the register_callbacks functions: callbacks declared
+    with .callback are timed, everything else is passed through to the app."""
+
+    def __init__(self, app):
+        self._app = app
+
+    def callback(self, *args, **kwargs):
+        register = self._app.callback(*args, **kwargs)
+        return lambda func: register(timed_callback(func))
+
+    def __getattr__(self, name):
+        return getattr(self._app, name)
+
+
+def instrument_callbacks(app):
+    """Returns an object to register callbacks on instead of `app` so that they are timed."""
+    return _InstrumentedCallbacks(app) if METRICS_ENABLED else app
+
+
+# --- HTTP Requests ---
+def _start_request():
+    _request.timings = _RequestTimings()
+
+
+def _response_size(response):
+    if response.is_streamed:
+        return None
+    if response.direct_passthrough:  # files sent by send_file
+        return response.content_length
+    return response.calculate_content_length()
+
+
+def _log_slow_request(timings, elapsed, size):
+    parts = []
+    if timings.callback:
+        parts.append(f"callback {timings.callback_seconds * 1000:.0f} ms")
+        parts.append(f"dash {(elapsed - timings.callback_seconds) * 1000:.0f} ms")
+    parts.append(f"db {timings.db_seconds * 1000:.0f} ms in {timings.db_queries} queries")
+    if timings.ai_calls:
+        parts.append(f"ai {timings.ai_seconds * 1000:.0f} ms in {timings.ai_calls} calls")
+    parts += [f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.stages.items()]
+    if size is not None:
+        parts.append(f"{size:,} bytes")
+    callback = f" [{timings.callback}]" if timings.callback else ""
+    print(f"Slow request: {request.method} {request.path}{callback} took {elapsed * 1000:.0f} ms ({'; '.join(parts)})")
+
+
+def _finish_request(response):
+    timings = _current()
+    if timings is None:
+        return response
+    elapsed = time.perf_counter() - timings.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    size = _response_size(response)
+    HTTP_REQUEST_SECONDS.observe(elapsed, route, request.method, str(response.status_code))
+    if size is not None:
+        HTTP_RESPONSE_BYTES.observe(size, route)
+    if timings.callback:
+        CALLBACK_OVERHEAD_SECONDS.observe(max(0.0, elapsed - timings.callback_seconds), timings.callback)
+        if size is not None:
+            CALLBACK_RESPONSE_BYTES.observe(size, timings.callback)
+    if SLOW_REQUEST_LOG_MS and elapsed * 1000 >= SLOW_REQUEST_LOG_MS:
+        _log_slow_request(timings, elapsed, size)
+    return response
+
+
+def _end_request(exc=None):
+    _request.timings = None
+
+
+# --- Exposition ---
+def _stats_lines(prefix, stats):
+    """Flattens a get_*_stats() dict into untyped samples: numbers as they are, strings as
+    a sample with the string in a 'value' label."""
+    lines = []
+    for key, value in stats.items():
+        if key == 'pid':
+            continue
+        name = _METRIC_NAME_RE.sub('_', f"{prefix}_{key}")
+        if isinstance(value, dict):
+            lines += _stats_lines(name, value)
+        elif isinstance(value, bool):
+            lines.append(f"{name} {int(value)}")
+        elif isinstance(value, (int, float)):
+            lines.append(f"{name} {_format_value(value)}")
+        elif isinstance(value, str):
+            lines.append(f'{name}{{value="{_escape(value)}"}} 1')
+    return lines
+
+
+def render(stats_sources=None):
+    """Returns every metric, and the stats of each {name: get_*_stats function}, as
+    Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for source, get_stats in (stats_sources or {}).items():
+        try:
+            lines += _stats_lines(f"riskwatch_{source}", get_stats())
+        except Exception as e:
+            print(f"Metrics: Could not collect {source} stats: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+def register_routes(server, stats_sources=None):
+    """Times every request to `server` and serves the metrics at METRICS_URL.
+
+    `stats_sources` maps a name to one of the modules' get_*_stats functions, whose
+    numbers are included as well.
+    """
+    if not METRICS_ENABLED:
+        return
+    server.before_request(_start_request)
+    server.after_request(_finish_request)
+    server.teardown_request(_end_request)
+
+    @server.route(METRICS_URL)
+    def serve_metrics():
+        if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+            abort(403)
+        return Response(render(stats_sources), content_type='text/plain; version=0.0.4; charset=utf-8')
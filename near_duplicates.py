@@ -0,0 +1,228 @@
+# near_duplicates.py
+"""Finds observations that report the same hazard as one being submitted.
+
+Each observation gets a MinHash signature of the character shingles in its location and
+description, computed from the text as the user typed it (before the AI rewrites it).
+The signature is cut into LSH bands whose hashes, salted with the standard floor label,
+are stored in observations.dedup_bands under a GIN index. Observations that share a band
+hash are candidates; their signatures then estimate how similar they really are.
+
+A lookup touches only the few rows that share a band within the time window, so it stays
+in the low milliseconds however large the table grows.
+"""
+
+import os
+import re
+import zlib
+
+import numpy as np
+
+import database
+import floor_normalizer
+
+# Only observations made within this many hours of each other count as duplicates.
+DUPLICATE_WINDOW_HOURS = float(os.getenv('DUPLICATE_WINDOW_HOURS', '72'))
+# Estimated Jaccard similarity of the shingle sets above which two reports are duplicates.
+DUPLICATE_SIMILARITY = float(os.getenv('DUPLICATE_SIMILARITY', '0.5'))
+DUPLICATE_MAX_MATCHES = 3
+# Upper bound on candidate rows read per lookup (most recent first).
+DUPLICATE_MAX_CANDIDATES = 50
+
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+# 32 bands of 2 rows: pairs at the similarity threshold share a band with ~99.9% probability.
+LSH_BANDS = 32
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+# Changing anything above changes the signatures; bump this and run
+# `python manage.py find-duplicates --reindex` so stored ones are recomputed.
+SIGNATURE_VERSION = 1
+
+_STOP_WORDS = frozenset(['a', 'an', 'the', 'and', 'or', 'of', 'in', 'on', 'at', 'by', 'to', 'near', 'is', 'are', 'there', 'was', 'with', 'next'])
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# Multiply-shift hashing: (a * x + b) mod 2**64, top 32 bits. Fixed seed, so signatures
+# computed by any process are comparable.
+_random = np.random.default_rng(20240611 + SIGNATURE_VERSION)
+_MULTIPLIERS = _random.integers(1, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _random.integers(0, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _mix(values):
+    """splitmix64 finaliser, applied elementwise to a uint64 array."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+_BAND_SALTS = _mix(np.arange(1, LSH_BANDS + 1, dtype=np.uint64))
+
+
+def _shingles(text):
+    """Character shingles of each word, plus the words themselves, so that typos and
+    word-order changes only cost part of the match."""
+    words = [word for word in _WORD_RE.findall(str(text or '').lower()) if word not in _STOP_WORDS]
+    shingles = set(words)
+    for word in words:
+        padded = f" {word} "
+        shingles.update(padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1))
+    return shingles
+
+
+def _floor_key(floor):
+    floor = str(floor or '').strip()
+    return (floor_normalizer.resolve_floor(floor) or floor).lower()
+
+
+class Fingerprint:
+    """MinHash signature and LSH band hashes of one observation's text."""
+
+    __slots__ = ('signature', 'bands')
+
+    def __init__(self, signature, bands):
+        self.signature = signature
+        self.bands = bands
+
+    def similarity(self, other_signature):
+        """Estimated Jaccard similarity to another stored signature."""
+        if not other_signature or len(other_signature) != len(self.signature):
+            return 0.0
+        return float(np.count_nonzero(np.asarray(other_signature, dtype=np.int32) == self.signature)) / len(self.signature)
+
+    def copy_values(self):
+        """(dedup_bands, dedup_signature) as Postgres array literals, for COPY."""
+        return '{' + ','.join(map(str, self.bands)) + '}', '{' + ','.join(map(str, self.signature.tolist())) + '}'
+
+
+def fingerprint(floor, location, description):
+    """Returns the Fingerprint of an observation, or None if it has no usable text."""
+    shingles = _shingles(f"{location or ''} {description or ''}")
+    if not shingles:
+        return None
+    values = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    hashed = (_MULTIPLIERS[:, None] * values[None, :] + _OFFSETS[:, None]) >> np.uint64(32)
+    # Stored as INTEGER[], so shift the unsigned 32-bit minimums into the signed range.
+    signature = (hashed.min(axis=1).astype(np.int64) - 2**31).astype(np.int32)
+    # One 64-bit hash per band of its rows, the band number and the floor, so observations
+    # on different floors never share a band.
+    band_hashes = _BAND_SALTS ^ np.uint64(zlib.crc32(_floor_key(floor).encode('utf-8')))
+    for row in signature.view(np.uint32).astype(np.uint64).reshape(LSH_BANDS, LSH_ROWS).T:
+        band_hashes = _mix(band_hashes ^ row)
+    return Fingerprint(signature, band_hashes.view(np.int64).tolist())
+
+
+def find_duplicates(floor, location, description, threshold=None, window_hours=None, exclude_id=None):
+    """Returns up to DUPLICATE_MAX_MATCHES earlier observations that look like the same
+    hazard, most similar first, as candidate row dicts with an added 'similarity'.
+
+    Only original observations are returned (not ones already linked to another), so a
+    new report is always matched to the first report of the hazard.
+    """
+    fp = fingerprint(floor, location, description)
+    if fp is None:
+        return []
+    threshold = DUPLICATE_SIMILARITY if threshold is None else threshold
+    window_hours = DUPLICATE_WINDOW_HOURS if window_hours is None else window_hours
+    matches = []
+    for row in database.find_duplicate_candidates(fp.bands, window_hours, DUPLICATE_MAX_CANDIDATES, exclude_id=exclude_id):
+        similarity = fp.similarity(row.pop('dedup_signature'))
+        if similarity >= threshold:
+            matches.append(dict(row, similarity=similarity))
+    matches.sort(key=lambda match: (-match['similarity'], match['id']))
+    return matches[:DUPLICATE_MAX_MATCHES]
+
+
+# --- Batch Mode ---
+class _DisjointSet:
+    """Union-find over observation ids; each cluster's root is the member added first."""
+
+    def __init__(self):
+        self.parent = {}
+        self.order = {}
+
+    def add(self, item):
+        self.order.setdefault(item, len(self.order))
+
+    def find(self, item):
+        root = item
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent.get(item, item)
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if self.order[b] < self.order[a]:
+                a, b = b, a
+            self.parent[b] = a
+
+
+def index_missing(batch_size=500, reindex=False, progress=None):
+    """Computes fingerprints for observations that have none (imported before this
+    existed, or all of them with `reindex`). Returns the number of rows updated."""
+    updated = 0
+    last_id = 0
+    while True:
+        rows = database.get_observations_for_fingerprinting(batch_size, after_id=last_id, include_indexed=reindex)
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        updates = []
+        for row in rows:
+            fp = fingerprint(row['floor'], row['location'], row['description'])
+            updates.append((row['id'], fp.bands if fp else [], fp.signature.tolist() if fp else []))
+        database.update_dedup_fingerprints(updates)
+        updated += len(updates)
+        if progress:
+            progress(updated, last_id)
+    return updated
+
+
+def cluster_existing(threshold=None, window_hours=None):
+    """Groups observations that are near-duplicates of each other, in one pass over the
+    table in observed_at order. Returns [(original id, [duplicate ids])], largest first;
+    the original is the earliest observation of the cluster.
+
+    Only observations within `window_hours` of each other are compared, so memory use is
+    bounded by the number of observations in one window.
+    """
+    threshold = DUPLICATE_SIMILARITY if threshold is None else threshold
+    window = (DUPLICATE_WINDOW_HOURS if window_hours is None else window_hours) * 3600
+    clusters = _DisjointSet()
+    buckets = {}   # band hash -> ids in the current window
+    recent = {}    # id -> (timestamp, signature, bands), for the current window, oldest first
+    for row in database.iter_dedup_fingerprints():
+        timestamp = row['observed_at'].timestamp()
+        while recent:
+            oldest_id = next(iter(recent))
+            oldest_time, _, oldest_bands = recent[oldest_id]
+            if oldest_time >= timestamp - window:
+                break
+            del recent[oldest_id]
+            for band in oldest_bands:
+                ids = buckets.get(band)
+                if ids is not None:
+                    ids.discard(oldest_id)
+                    if not ids:
+                        del buckets[band]
+        signature = np.asarray(row['dedup_signature'], dtype=np.int32)
+        candidates = set()
+        for band in row['dedup_bands']:
+            candidates.update(buckets.get(band, ()))
+        clusters.add(row['id'])
+        for candidate_id in candidates:
+            other = recent[candidate_id][1]
+            if np.count_nonzero(other == signature) / len(signature) >= threshold:
+                clusters.union(candidate_id, row['id'])
+        recent[row['id']] = (timestamp, signature, row['dedup_bands'])
+        for band in row['dedup_bands']:
+            buckets.setdefault(band, set()).add(row['id'])
+
+    grouped = {}
+    for observation_id in list(clusters.parent):
+        root = clusters.find(observation_id)
+        if root != observation_id:
+            grouped.setdefault(root, []).append(observation_id)
+    return sorted(((root, sorted(ids)) for root, ids in grouped.items()), key=lambda cluster: (-len(cluster[1]), cluster[0]))
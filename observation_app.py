@@ -3,25 +3,32 @@
 import os
 import datetime
 import base64
-import io
+import tempfile
 
 import dash
-from dash import dcc, html, Input, Output, State, no_update, ALL
+from dash import dcc, html, Input, Output, State, no_update, ALL, Patch
 from dash.exceptions import PreventUpdate
+from flask import Response, abort, jsonify, redirect, request, send_file
 
 # Import shared custom modules
+import analysis_queue
+import bulk_import
 import database
-from ai_module import get_ai_analysis
-
-# --- ADDED IMPORTS FOR PSYCOPG2 ---
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-# Imports for Excel Generation
-from openpyxl import Workbook
-from openpyxl.drawing.image import Image as OpenpyxlImage
-from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl.utils import get_column_letter
+import export_jobs
+import floor_normalizer
+import live_events
+import metrics
+import near_duplicates
+import photo_processing
+import photo_store
+
+REPORT_DOWNLOAD_URL = '/reports/observations.xlsx'
+LIVE_EVENTS_URL = '/events/observations'
+# Changes are pushed over LIVE_EVENTS_URL (see assets/live-updates.js); this slower poll
+# only matters when the event stream can't connect.
+REPORT_CHANGES_POLL_MS = int(os.getenv('REPORT_CHANGES_POLL_MS', '60000'))
+# Above this many changed rows the report is re-rendered instead of patched.
+REPORT_MAX_DELTA_CHANGES = 100
 
 # --- HELPER FUNCTION TO BUILD RESPONSIVE HEADER ---
 def _build_app_header(page_type='form'):
@@ -31,7 +38,16 @@ def _build_app_header(page_type='form'):
         nav_links = [
             dcc.Link('Home', href='/', className='header-nav-link'),
             dcc.Link('Add Observation', href='/observation', className='header-nav-link'),
-            html.Button("Download Full Report as Excel", id='download-report-button', className="nav-download-button"),
+            dcc.Link('Dashboard', href='/dashboard', className='header-nav-link'),
+            # Starts a background export of the current search/sort (see export_jobs.py).
+            html.Button("Download Full Report as Excel", id='download-report-button', n_clicks=0, className="nav-download-button"),
+            dcc.Link('Log Out', href='/', className='header-nav-link')
+        ]
+    elif page_type == 'dashboard':
+        nav_links = [
+            dcc.Link('Home', href='/', className='header-nav-link'),
+            dcc.Link('Add Observation', href='/observation', className='header-nav-link'),
+            dcc.Link('View Full Report', href='/report', className='header-nav-link'),
             dcc.Link('Log Out', href='/', className='header-nav-link')
         ]
     else:
@@ -39,6 +55,7 @@ def _build_app_header(page_type='form'):
         nav_links = [
             dcc.Link('Home', href='/', className='header-nav-link'),
             dcc.Link('View Full Report', href='/report', className='header-nav-link'),
+            dcc.Link('Dashboard', href='/dashboard', className='header-nav-link'),
             dcc.Link('Log Out', href='/', className='header-nav-link')
         ]
 
@@ -59,10 +76,10 @@ def _build_app_header(page_type='form'):
 def build_observation_form_page():
     """Builds the layout for the updated observation submission form."""
     return html.Div([
-        # The dcc.Download component must exist in the layout for the callback to work,
-        # even if the button isn't on this page. It's invisible.
-        dcc.Download(id='download-excel'),
-        html.Ul(id='flash-messages-container', className="flash-messages"),
+        html.Ul(id='flash-messages-container', className="flash-messages", children=[]),
+        # IDs of observations submitted from this page whose AI analysis hasn't finished yet.
+        dcc.Store(id='store-pending-analysis', data=[]),
+        dcc.Interval(id='analysis-status-interval', interval=3000, disabled=True),
         html.Div(className="observation-form-container", children=[
             _build_app_header(page_type='form'), # Use the helper to build the header
             html.Div(className="form-content", children=[
@@ -94,7 +111,9 @@ def build_observation_form_page():
                 ]),
                 html.Div(className="submit-button-container", children=[
                     html.Button("Add Observation to Database", id="add-button", n_clicks=0, className="submit-button-style")
-                ])
+                ]),
+                # Filled when the submission looks like an observation that was already reported.
+                html.Div(id='duplicate-panel', className="duplicate-panel")
             ])
         ])
     ])
@@ -103,11 +122,24 @@ def build_observation_form_page():
 def build_report_page():
     """Builds the layout for the updated, full-width report page."""
     return html.Div([
-        dcc.Download(id='download-excel'),
         # Components for delete functionality
         dcc.ConfirmDialog(id='confirm-delete-dialog', message='Are you sure you want to delete this observation? It cannot be undone.'),
         dcc.Store(id='store-id-to-delete'),
         dcc.Store(id='store-refresh-signal', data=0),
+        # Sort keys of the cards on the page (the last key is the observation id) and the
+        # data version they reflect; changes since then are patched in (see sync_report_changes).
+        dcc.Store(id='store-report-index', data=[]),
+        dcc.Store(id='store-report-version'),
+        dcc.Interval(id='report-changes-interval', interval=REPORT_CHANGES_POLL_MS),
+        # Latest data version pushed by the server; set from assets/live-updates.js.
+        dcc.Store(id='store-live-version'),
+        # Cards on the page still waiting for AI analysis; polled until they are done.
+        dcc.Store(id='store-report-pending-ids', data=[]),
+        dcc.Interval(id='report-analysis-interval', interval=5000, disabled=True),
+        # Excel export running in the background; polled until the file is ready.
+        dcc.Store(id='store-export-key'),
+        dcc.Store(id='store-export-download-url'),
+        dcc.Interval(id='export-status-interval', interval=1000, disabled=True),
 
         html.Div(className="report-page-container", children=[
             _build_app_header(page_type='report'),
@@ -115,6 +147,7 @@ def build_report_page():
                 html.H1("Full Safety Observation Report", className="form-title"),
                 # Container for status messages (e.g., deletion confirmation)
                 html.Div(id='delete-status-message'),
+                html.Div(id='export-status-message'),
                 html.Div(className="report-controls", children=[
                     dcc.Input(id='search-input', type='text', placeholder='Search in descriptions, locations, floors...', debounce=True, className='search-bar'),
                     html.Div(className="sort-dropdown-wrapper", children=[
@@ -124,104 +157,442 @@ def build_report_page():
                                 {'label': 'Sort by Newest First', 'value': 'date_newest'},
                                 {'label': 'Sort by Oldest First', 'value': 'date_oldest'},
                                 {'label': 'Sort by Highest Risk', 'value': 'risk_high'},
+                                {'label': 'Sort by Best Match', 'value': 'relevance'},
                             ], value='date_newest', clearable=False
                         )
                     ]),
+                    # Narrow the report by when, where and who (see database.REPORT_FILTER_FIELDS).
+                    html.Div(className="report-filter", children=[
+                        dcc.DatePickerRange(id='date-range-filter', display_format='DD-MMM-YYYY', clearable=True,
+                                            start_date_placeholder_text='From date', end_date_placeholder_text='To date')
+                    ]),
+                    html.Div(className="report-filter", children=[
+                        dcc.Dropdown(id='floor-filter', placeholder='All floors')
+                    ]),
+                    html.Div(className="report-filter", children=[
+                        dcc.Dropdown(id='responsible-filter', placeholder='Anyone responsible')
+                    ]),
                 ]),
-                html.Div(id='report-content-container')
+                html.P(id='report-summary', className='report-summary'),
+                html.Div(id='report-content-container'),
+                # Keyset cursor for the next page; None when everything has been loaded.
+                dcc.Store(id='store-report-cursor'),
+                html.Div(className="load-more-container", children=[
+                    # Clicked automatically when scrolled into view (see assets/infinite-scroll.js).
+                    html.Button("Load More", id='load-more-button', n_clicks=0, className='load-more-button', style={'display': 'none'})
+                ])
             ])
         ])
     ])
 
 
-# --- Helper Function for Excel Generation ---
-def generate_excel_for_download(observations_data):
-    EXCEL_PHOTO_TARGET_WIDTH_PX = 150
-    EXCEL_PHOTO_TARGET_HEIGHT_PX = 112
-    EXCEL_ROW_HEIGHT_FOR_PHOTO_PT = 90.0
-    EXCEL_PHOTO_COLUMN_WIDTH_UNITS = 22
-
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "Safety Observation Report"
-
-    green_fill = PatternFill(start_color="04A227", end_color="04A227", fill_type="solid")
-    yellow_fill = PatternFill(start_color="FFD406", end_color="FFD406", fill_type="solid")
-    orange_fill = PatternFill(start_color="FF7A00", end_color="FF7A00", fill_type="solid")
-    red_fill = PatternFill(start_color="F14219", end_color="F14219", fill_type="solid")
-
-    sheet.merge_cells('A1:C4')
-    logo_path = os.path.join('assets', '25h Logos.png')
-    if os.path.exists(logo_path):
-        logo = OpenpyxlImage(logo_path)
-        logo.height = 80; logo.width = 90
-        sheet.add_image(logo, 'A1')
-
-    title_font = Font(name='Calibri', size=16, bold=True, color="000080")
-    header_font = Font(name='Calibri', size=11, bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="002060", end_color="002060", fill_type="solid")
-
-    sheet.merge_cells('D1:O4')
-    title_cell = sheet['D1']
-    title_cell.value = "SAFETY OBSERVATION REPORT"
-    title_cell.font = title_font
-    title_cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    header_row = 5
-    headers = ["ObsNo.", "Date of Observation", "Floor", "Location", "Description", "Impact", "Likelihood", "Severity", "Risk Rating", "Corrective Action Required", "Responsible Person", "Deadline", "Photo Evidence", "Closed Photo", "Status"]
-    for col_idx, header_text in enumerate(headers, 1):
-        cell = sheet.cell(row=header_row, column=col_idx)
-        cell.value = header_text; cell.font = header_font; cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-
-    col_widths = {'A': 8, 'B': 20, 'C': 15, 'D': 35, 'E': 60, 'F': 45, 'G': 12, 'H': 12, 'I': 12, 'J': 60, 'K': 20, 'L': 15, 'M': EXCEL_PHOTO_COLUMN_WIDTH_UNITS, 'N': 20, 'O': 12}
-    for col_letter, width in col_widths.items(): sheet.column_dimensions[col_letter].width = width
-    for entry in observations_data:
-        risk_rating = entry.get('risk_rating', 0)
-        row_values = [entry.get('id'), entry.get('date_str'), entry.get('floor'), entry.get('location'), entry.get('description'), entry.get('impact'), entry.get('likelihood'), entry.get('severity'), risk_rating, entry.get('corrective_action'), entry.get('responsible_person', '').title(), entry.get('deadline'), None, "Attach closed photo", "Open"]
-        sheet.append(row_values)
-        new_row_num = sheet.max_row
-        sheet.row_dimensions[new_row_num].height = EXCEL_ROW_HEIGHT_FOR_PHOTO_PT
-        for col_idx_loop in range(1, len(headers) + 1):
-            sheet.cell(row=new_row_num, column=col_idx_loop).alignment = Alignment(wrap_text=True, vertical='center', horizontal='center')
-        risk_cell = sheet.cell(row=new_row_num, column=headers.index("Risk Rating") + 1)
-        if 1 <= risk_rating <= 4: risk_cell.fill = green_fill
-        elif 5 <= risk_rating <= 9: risk_cell.fill = yellow_fill
-        elif 10 <= risk_rating <= 15: risk_cell.fill = orange_fill
-        elif risk_rating >= 16: risk_cell.fill = red_fill
-        
-        photo_bytes_data = entry.get('photo_bytes')
-        if photo_bytes_data:
-            try:
-                img = OpenpyxlImage(io.BytesIO(photo_bytes_data))
-                img.width, img.height = EXCEL_PHOTO_TARGET_WIDTH_PX, EXCEL_PHOTO_TARGET_HEIGHT_PX
-                sheet.add_image(img, get_column_letter(headers.index('Photo Evidence') + 1) + str(new_row_num))
-            except Exception as e:
-                print(f"Error embedding photo: {e}")
-                sheet.cell(row=new_row_num, column=(headers.index('Photo Evidence') + 1)).value = "Error"
+# --- Report Card Helpers ---
+def _build_observation_card(obs):
+    """Builds the report card for one observation row."""
+    risk = obs.get('risk_rating', 0)
+    risk_class = 'risk-low'
+    if 5 <= risk <= 9: risk_class = 'risk-medium'
+    elif 10 <= risk <= 15: risk_class = 'risk-high'
+    elif risk >= 16: risk_class = 'risk-critical'
+    # --- MODIFIED CARD STRUCTURE FOR LAYOUT FIX ---
+    return html.Div(className="obs-card", children=[
+        html.Div(className="card-body", children=[
+            html.Div(className="card-main", children=[
+                html.H3(f"Obs #{obs['id']}: {obs['location']} ({obs['floor']})"),
+                *_build_analysis_badge(obs.get('analysis_status')),
+                *_build_duplicate_badges(obs),
+                html.P([html.B("Date: "), obs['date_str']]),
+                html.P([html.B("Impact: "), obs['impact']]),
+                html.P([html.B("Description: "), *_highlight_matches(obs.get('description_highlighted') or obs['description'])]),
+                html.P([html.B("Corrective Action: "), obs['corrective_action']]),
+                html.P([html.B("Assigned To: "), f"{str(obs.get('responsible_person', 'N/A')).title()} | ", html.B("Deadline: "), f"{obs.get('deadline', 'N/A')}"])
+            ]),
+            html.Div(className="card-sidebar", children=[
+                html.Div(className="risk-box", children=[html.P("Risk Rating", className="risk-title"), html.P(risk, className=f"risk-value {risk_class}")]),
+                # Photos are fetched lazily from the /photos route (see assets/lazy-photos.js)
+                # instead of being embedded in the callback payload.
+                html.Img(**{'data-src': f"/photos/{obs['id']}/thumb"}, className="card-photo lazy-photo") if obs['has_photo']
+                else html.Img(src='/assets/placeholder.png', className="card-photo")
+            ])
+        ]),
+        html.Div(className="card-footer", children=[
+            html.Button('Delete Observation', id={'type': 'delete-button', 'index': obs['id']}, n_clicks=0, className='card-delete-button')
+        ])
+    ])
+
+_ANALYSIS_BADGES = {
+    database.ANALYSIS_PENDING: ("AI analysis pending...", "analysis-badge analysis-pending"),
+    database.ANALYSIS_PROCESSING: ("AI analysis in progress...", "analysis-badge analysis-pending"),
+    database.ANALYSIS_FAILED: ("AI analysis failed - showing the original observation", "analysis-badge analysis-failed"),
+}
+
+def _build_analysis_badge(analysis_status):
+    """Returns a status badge for observations that haven't been analysed (yet)."""
+    if analysis_status not in _ANALYSIS_BADGES:
+        return []
+    text, class_name = _ANALYSIS_BADGES[analysis_status]
+    return [html.P(text, className=class_name)]
+
+def _build_duplicate_badges(obs):
+    """Marks repeat reports and observations that were reported more than once."""
+    badges = []
+    if obs.get('duplicate_of'):
+        badges.append(html.P(f"Repeat report of #{obs['duplicate_of']}", className="analysis-badge duplicate-badge"))
+    if (obs.get('report_count') or 1) > 1:
+        badges.append(html.P(f"Reported {obs['report_count']} times", className="analysis-badge duplicate-badge"))
+    return badges
+
+def _build_duplicate_panel(matches):
+    """Lists earlier observations a submission seems to repeat, with what to do about it."""
+    items = []
+    for match in matches:
+        actions = [html.Button(f"Same hazard: add my report to #{match['id']}", n_clicks=0, className="duplicate-action-button",
+                               id={'type': 'duplicate-action', 'action': 'link', 'index': match['id']})]
+        if match['analysis_status'] == database.ANALYSIS_COMPLETE:
+            actions.append(html.Button(f"Save mine with #{match['id']}'s analysis", n_clicks=0, className="duplicate-action-button",
+                                       id={'type': 'duplicate-action', 'action': 'reuse', 'index': match['id']}))
+        reported = f" | reported {match['report_count']} times" if match['report_count'] > 1 else ""
+        items.append(html.Div(className="duplicate-match", children=[
+            html.P([html.B(f"Obs #{match['id']}: {match['location']} ({match['floor']})"),
+                    f" | {match['date_str']}{reported} | {match['similarity']:.0%} similar"]),
+            html.P(match['description'], className="duplicate-description"),
+            html.Div(actions, className="duplicate-actions"),
+        ]))
+    return [
+        html.H3("This may already have been reported"),
+        *items,
+        html.Button("Not the same: save as a new observation", n_clicks=0, className="duplicate-action-button",
+                    id={'type': 'duplicate-action', 'action': 'new', 'index': 0}),
+    ]
+
+def _pending_ids(observations):
+    return [obs['id'] for obs in observations if obs.get('analysis_status') in (database.ANALYSIS_PENDING, database.ANALYSIS_PROCESSING)]
+
+def _highlight_matches(text):
+    """Turns search-match markers from the database into <mark> elements."""
+    if not text or database.HIGHLIGHT_START not in text:
+        return [text]
+    parts = []
+    for chunk in text.split(database.HIGHLIGHT_START):
+        matched, sep, rest = chunk.partition(database.HIGHLIGHT_STOP)
+        if sep:
+            parts.append(html.Mark(matched, className='search-match'))
+            if rest:
+                parts.append(rest)
+        elif chunk:
+            parts.append(chunk)
+    return parts
+
+def _load_more_style(next_cursor):
+    return {'display': 'block'} if next_cursor else {'display': 'none'}
+
+def _format_report_summary(total_estimate):
+    if total_estimate is None:
+        return ''
+    if total_estimate >= database.EXACT_COUNT_THRESHOLD:
+        return f"About {total_estimate:,} observations"
+    return f"{total_estimate:,} observation{'s' if total_estimate != 1 else ''}"
+
+def _report_filters(start_date, end_date, floor, responsible_person):
+    """The report filter controls as a `filters` dict for the database functions."""
+    return {'date_from': start_date, 'date_to': end_date, 'floor': floor, 'responsible_person': responsible_person}
+
+def _render_report(search_term, sort_by, filters=None):
+    """Full render of the first report page. Returns the outputs of update_report_view."""
+    page = database.get_observations_page(search_term, sort_by, filters=filters)
+    observations = page['observations']
+    if not observations:
+        return html.P("No observations found.", style={'textAlign': 'center', 'padding': '50px'}), None, {'display': 'none'}, '', [], True, [], page['version']
+    cards = [_build_observation_card(obs) for obs in observations]
+    pending_ids = _pending_ids(observations)
+    index = [obs['sort_key'] for obs in observations]
+    return cards, page['next_cursor'], _load_more_style(page['next_cursor']), _format_report_summary(page['total_estimate']), pending_ids, not pending_ids, index, page['version']
+
+
+# --- Incremental Report Updates ---
+def _sort_position(index, sort_key, descending):
+    """Returns where a row with `sort_key` goes among the loaded cards' sort keys."""
+    for position, existing in enumerate(index):
+        if (sort_key > existing) if descending else (sort_key < existing):
+            return position
+    return len(index)
+
+def _patch_report(index, has_more, changes, rows, descending):
+    """Turns the loaded cards into the current data with one operation per changed row.
+
+    `index` holds the sort keys of the cards on the page, `changes` maps changed ids to
+    their operation and `rows` are the changed rows that (still) match the view, in sort
+    order. Cards whose position is unchanged are replaced in place; others are removed
+    and re-inserted where they now belong. Rows sorting after the last loaded card are
+    left for "Load More" while there are more pages. Returns (cards Patch, index Patch,
+    new index).
+    """
+    positions = {sort_key[-1]: position for position, sort_key in enumerate(index)}
+    pending_rows = {row['id']: row for row in rows}
+    cards, index_patch = Patch(), Patch()
+    removed = []
+    for obs_id in changes:
+        position = positions.get(obs_id)
+        if position is None:
+            continue
+        row = pending_rows.get(obs_id)
+        if row is not None and row['sort_key'] == index[position]:
+            cards[position] = _build_observation_card(pending_rows.pop(obs_id))
         else:
-            sheet.cell(row=new_row_num, column=(headers.index('Photo Evidence') + 1)).value = "No Photo"
-            
-    excel_stream = io.BytesIO(); workbook.save(excel_stream); excel_stream.seek(0)
-    return excel_stream
+            removed.append(position)
+
+    new_index = list(index)
+    # Highest position first, so the positions still to delete stay valid.
+    for position in sorted(removed, reverse=True):
+        del cards[position]
+        del index_patch[position]
+        del new_index[position]
+    for row in pending_rows.values():
+        position = _sort_position(new_index, row['sort_key'], descending)
+        if position == len(new_index) and has_more:
+            continue
+        cards.insert(position, _build_observation_card(row))
+        index_patch.insert(position, row['sort_key'])
+        new_index.insert(position, row['sort_key'])
+    return cards, index_patch, new_index
+
+
+# --- Photo Serving Helpers ---
+PHOTO_CACHE_CONTROL = 'private, max-age=86400'
+
+def _photo_response(observation_id, variant):
+    store = photo_store.get_store()
+    if store is not None:
+        key, is_variant = database.get_photo_key_from_db(observation_id, variant)
+        if key is not None:
+            return _stored_photo_response(store, key, variant == 'thumb' and not is_variant)
+
+    etag = database.get_photo_etag_from_db(observation_id, variant)
+    if etag is None:
+        abort(404)
+
+    # Answer conditional GETs without reading the photo at all.
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        photo_bytes, is_variant = database.get_photo_from_db(observation_id, variant)
+        if photo_bytes is None:
+            abort(404)
+        if variant == 'thumb' and not is_variant:
+            photo_bytes = _fallback_thumbnail(observation_id, photo_bytes)
+        response = Response(photo_bytes, mimetype=photo_processing.guess_mimetype(photo_bytes))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = PHOTO_CACHE_CONTROL
+    return response
+
+def _fallback_thumbnail(observation_id, photo_bytes):
+    # Row has not been backfilled yet (see `python manage.py backfill-photos`).
+    try:
+        return photo_processing.make_card_thumbnail(photo_bytes)
+    except Exception as e:
+        print(f"Error creating thumbnail for observation {observation_id}: {e}")
+        # Fall back to the original image rather than showing a broken card.
+        return photo_bytes
+
+def _stored_photo_response(store, key, make_thumbnail):
+    """Serves a blob from the photo store. The key is the content hash, so it is the ETag."""
+    etag = f"{key}-thumb" if make_thumbnail else key
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif make_thumbnail:
+        photo_bytes = _fallback_thumbnail(key, store.get(key))
+        response = Response(photo_bytes, mimetype=photo_processing.guess_mimetype(photo_bytes))
+    elif isinstance(store, photo_store.S3PhotoStore):
+        # Let the browser fetch it from S3 directly, which also handles Range requests.
+        response = redirect(store.signed_url(key))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    else:
+        path = store.path(key)
+        try:
+            with open(path, 'rb') as f:
+                mimetype = photo_processing.guess_mimetype(f.read(12))
+        except FileNotFoundError:
+            print(f"Photo store: Blob {key} is missing from {store.root}.")
+            abort(404)
+        # send_file hands the open file to the server (os.sendfile under gunicorn) and
+        # answers Range and conditional requests itself.
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag)
+        response.headers['Cache-Control'] = PHOTO_CACHE_CONTROL
+        return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = PHOTO_CACHE_CONTROL
+    return response
+
+
+# --- Flask Route Registration Function ---
+def register_routes(server):
+    """Registers plain Flask routes (non-Dash endpoints) for the observation app."""
+
+    @server.route('/photos/<int:observation_id>')
+    def serve_photo(observation_id):
+        return _photo_response(observation_id, 'original')
+
+    @server.route('/photos/<int:observation_id>/thumb')
+    def serve_photo_thumbnail(observation_id):
+        return _photo_response(observation_id, 'thumb')
+
+    @server.route(REPORT_DOWNLOAD_URL)
+    def download_full_report():
+        return _report_download_response()
+
+    @server.route('/reports/exports/<key>/status')
+    def report_export_status(key):
+        status = export_jobs.get_status(key) if export_jobs.is_valid_key(key) else None
+        if status is None:
+            abort(404)
+        return jsonify(_export_status_json(status))
+
+    @server.route('/reports/exports/<key>/download')
+    def download_report_export(key):
+        status = export_jobs.get_status(key) if export_jobs.is_valid_key(key) else None
+        if status is None or status['status'] != export_jobs.STATUS_READY:
+            abort(404)
+        return _send_report(status)
+
+    @server.route(LIVE_EVENTS_URL)
+    def observation_events():
+        """Server-Sent Events: a 'version' event whenever observations change (see live_events.py)."""
+        return live_events.event_stream_response()
+
+    @server.route('/import/observations', methods=['POST'])
+    def import_observations():
+        """Bulk upload: POST a CSV/XLSX/JSONL file as multipart field 'file' (see bulk_import.py)."""
+        return _import_response(request.files.get('file'), request.args.get('analyse', bulk_import.ANALYSE_MISSING))
+
+
+# --- Excel Report Export Helpers ---
+def _export_urls(key):
+    return f"/reports/exports/{key}/status", f"/reports/exports/{key}/download"
+
+def _export_status_json(status):
+    status_url, download_url = _export_urls(status['key'])
+    body = dict(status, status_url=status_url)
+    if status['status'] == export_jobs.STATUS_READY:
+        body['download_url'] = download_url
+    return body
+
+def _export_status_message(status):
+    """Progress line shown under the report title while an export runs."""
+    if status['status'] == export_jobs.STATUS_FAILED:
+        return html.Div(f"The Excel report could not be generated: {status.get('error')}", className="message-error")
+    if status['status'] == export_jobs.STATUS_READY:
+        _, download_url = _export_urls(status['key'])
+        return html.Div(["Your Excel report is ready. If the download didn't start, ", html.A("download it here", href=download_url), "."], className="message-success")
+    rows_done, rows_total = status.get('rows_done') or 0, status.get('rows_total') or 0
+    percent = f" ({100 * rows_done // rows_total}%)" if rows_total else ""
+    return html.Div(f"Preparing Excel report: {rows_done:,} of {rows_total:,} observations{percent}...", className="message-success")
+
+def _report_download_response():
+    """Serves the report for ?search=&sort= (plus the filters ?date_from=&date_to=&floor=
+    &responsible_person=) if it is cached, otherwise starts building it and answers 202
+    with a status URL to poll."""
+    filters = {field: request.args.get(field) for field in database.REPORT_FILTER_FIELDS}
+    try:
+        status = export_jobs.start_export(request.args.get('search') or None, request.args.get('sort', 'date_newest'), filters)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid filter: {e}"}), 400
+    if status['status'] == export_jobs.STATUS_READY:
+        return _send_report(status)
+    return jsonify(_export_status_json(status)), 202
+
+def _send_report(status):
+    # Snapshots never change once written, so conditional GETs and range requests are safe.
+    return send_file(export_jobs.report_path(status['key']), as_attachment=True, download_name=status['filename'], conditional=True, max_age=0)
+
+
+# --- Bulk Import Helper ---
+def _import_response(upload, analyse):
+    if upload is None or not upload.filename:
+        return jsonify({'error': "No file uploaded; send it as multipart field 'file'."}), 400
+    try:
+        file_format = bulk_import.detect_format(upload.filename)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if analyse not in bulk_import.ANALYSE_MODES:
+        return jsonify({'error': f"analyse must be one of: {', '.join(bulk_import.ANALYSE_MODES)}"}), 400
+
+    # Spool to disk so large spreadsheets are streamed rather than held in memory.
+    with tempfile.NamedTemporaryFile(suffix=f'.{file_format}') as spooled:
+        upload.save(spooled)
+        spooled.flush()
+        try:
+            summary = bulk_import.import_file(spooled.name, file_format=file_format, analyse=analyse)
+        except bulk_import.ImportStopped as e:
+            print(f"Error importing {upload.filename}: {e}")
+            return jsonify({'error': f"Import stopped: {e}", 'imported': e.summary['imported']}), 500
+    if summary['pending_analysis']:
+        # Make sure this worker's queue is running; its idle sweep picks up the imported rows.
+        analysis_queue.get_backend()
+    summary['errors'] = [{'line': line, 'message': message} for line, message in summary['errors']]
+    return jsonify(summary)
 
 
 # --- Callback Registration Function ---
 def register_callbacks(app):
     """Registers all callbacks for the observation app."""
 
-    @app.callback(
+    # The sandwich menu only flips a class, so it runs in the browser without a round trip.
+    app.clientside_callback(
+        """
+        function(nClicks, currentClass) {
+            return (currentClass || '').indexOf('active') !== -1 ? 'header-nav' : 'header-nav active';
+        }
+        """,
         Output('obs-header-nav', 'className'),
         Input('obs-mobile-menu-toggle', 'n_clicks'),
         State('obs-header-nav', 'className'),
         prevent_initial_call=True
     )
-    def toggle_obs_mobile_menu(n_clicks, current_class):
-        if 'active' in current_class:
-            return "header-nav"
-        else:
-            return "header-nav active"
             
+    def _submit_observation(floor_input, location, observation, photo_contents, duplicate_of=None, reuse_analysis=False):
+        """Saves a submission and queues its AI analysis, unless it reuses the analysis of
+        the observation it repeats. Returns the outputs of add_observation."""
+        photo = {}
+        if photo_contents:
+            try:
+                with metrics.stage('photo_decode'):
+                    photo_bytes = base64.b64decode(photo_contents.split(',')[1])
+                # Normalise orientation, cap resolution and precompute thumbnails once at ingest.
+                with metrics.stage('photo_processing'):
+                    photo = photo_processing.process_photo(photo_bytes)
+                # Content-addressed, so a photo uploaded twice is only stored once.
+                with metrics.stage('photo_store'):
+                    photo = photo_store.store_photo(photo)
+            except Exception as e:
+                print(f"Error processing uploaded photo: {e}")
+                return [html.Li("The attached file could not be read as an image.", className="warning")], no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
+        # Save straight away; the AI analysis runs in the background (see analysis_queue.py).
+        # Standardise the floor locally where possible so the card is right even before the AI replies.
+        standardized_floor = floor_normalizer.resolve_floor(floor_input) or floor_input
+        new_entry = {'date_str': datetime.datetime.now().strftime("%d-%b-%Y"), 'floor_from_user': standardized_floor, 'location_from_user': location, 'observation_text': observation, 'duplicate_of': duplicate_of, **photo}
+        fingerprint = near_duplicates.fingerprint(floor_input, location, observation)
+        if fingerprint:
+            new_entry.update(dedup_bands=fingerprint.bands, dedup_signature=fingerprint.signature.tolist())
+        analysis = database.get_reusable_analysis(duplicate_of) if reuse_analysis else None
+        if analysis:
+            new_entry['ai_analysis'] = dict(analysis, CorrectedDescription=observation, StandardizedFloor=standardized_floor)
+        last_id = database.add_observation_to_db(new_entry)
+        if duplicate_of:
+            database.link_duplicate_report(duplicate_of)
+        flash_messages = Patch()
+        if analysis:
+            flash_messages.append(html.Li(f"Observation #{last_id} saved with the analysis of observation #{duplicate_of}.", className="success"))
+            return flash_messages, '', '', '', None, '', no_update, no_update, []
+        if analysis_queue.submit_analysis(last_id):
+            message = f"Observation #{last_id} saved. AI analysis in progress..."
+        else:
+            message = f"Observation #{last_id} saved. The AI is busy, so analysis will follow shortly."
+        pending = Patch()
+        pending.append(last_id)
+        flash_messages.append(html.Li(message, className="success"))
+        return flash_messages, '', '', '', None, '', pending, False, []
+
     @app.callback(
         Output('flash-messages-container', 'children'),
         Output('floor-input', 'value'),
@@ -229,6 +600,9 @@ def register_callbacks(app):
         Output('observation-textarea', 'value'),
         Output('photo-upload', 'contents'),
         Output('selected-file-name', 'children', allow_duplicate=True),
+        Output('store-pending-analysis', 'data'),
+        Output('analysis-status-interval', 'disabled'),
+        Output('duplicate-panel', 'children'),
         Input('add-button', 'n_clicks'),
         State('floor-input', 'value'),
         State('location-input', 'value'),
@@ -238,81 +612,265 @@ def register_callbacks(app):
     )
     def add_observation(n_clicks, floor_input, location, observation, photo_contents):
         if not all([floor_input, location, observation]):
-            return html.Li("Floor, Location, and Observation fields are required.", className="warning"), no_update, no_update, no_update, no_update, no_update
-        photo_bytes = base64.b64decode(photo_contents.split(',')[1]) if photo_contents else None
-        ai_analysis = get_ai_analysis(observation, floor_input, location)
-        new_entry = {'date_str': datetime.datetime.now().strftime("%d-%b-%Y"), 'floor_from_user': floor_input, 'location_from_user': location, 'ai_analysis': ai_analysis, 'photo_bytes': photo_bytes}
-        last_id = database.add_observation_to_db(new_entry)
-        success_message = html.Li(f"Observation #{last_id} successfully saved.", className="success")
-        return success_message, '', '', '', None, ''
+            return [html.Li("Floor, Location, and Observation fields are required.", className="warning")], no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
+        # Checked before the photo is processed or the AI is asked: a repeat report may
+        # need neither.
+        with metrics.stage('duplicate_check'):
+            matches = near_duplicates.find_duplicates(floor_input, location, observation)
+        if matches:
+            return [html.Li("This looks like an observation that was already reported. Choose below how to save it.", className="warning")], no_update, no_update, no_update, no_update, no_update, no_update, no_update, _build_duplicate_panel(matches)
+        return _submit_observation(floor_input, location, observation, photo_contents)
+
+    @app.callback(
+        Output('flash-messages-container', 'children', allow_duplicate=True),
+        Output('floor-input', 'value', allow_duplicate=True),
+        Output('location-input', 'value', allow_duplicate=True),
+        Output('observation-textarea', 'value', allow_duplicate=True),
+        Output('photo-upload', 'contents', allow_duplicate=True),
+        Output('selected-file-name', 'children', allow_duplicate=True),
+        Output('store-pending-analysis', 'data', allow_duplicate=True),
+        Output('analysis-status-interval', 'disabled', allow_duplicate=True),
+        Output('duplicate-panel', 'children', allow_duplicate=True),
+        Input({'type': 'duplicate-action', 'action': ALL, 'index': ALL}, 'n_clicks'),
+        State('floor-input', 'value'),
+        State('location-input', 'value'),
+        State('observation-textarea', 'value'),
+        State('photo-upload', 'contents'),
+        prevent_initial_call=True
+    )
+    def resolve_duplicate(n_clicks_list, floor_input, location, observation, photo_contents):
+        if not any(n_clicks_list):
+            raise PreventUpdate
+        action = dash.callback_context.triggered_id
+        if not all([floor_input, location, observation]):
+            return [html.Li("Floor, Location, and Observation fields are required.", className="warning")], no_update, no_update, no_update, no_update, no_update, no_update, no_update, []
+        if action['action'] == 'new':
+            return _submit_observation(floor_input, location, observation, photo_contents)
+        if action['action'] == 'reuse':
+            return _submit_observation(floor_input, location, observation, photo_contents, duplicate_of=action['index'], reuse_analysis=True)
+        report_count = database.link_duplicate_report(action['index'])
+        if report_count is None:
+            return [html.Li(f"Observation #{action['index']} no longer exists. Submit again to save yours.", className="warning")], no_update, no_update, no_update, no_update, no_update, no_update, no_update, []
+        flash_messages = Patch()
+        flash_messages.append(html.Li(f"Your report was added to observation #{action['index']}, now reported {report_count} times.", className="success"))
+        return flash_messages, '', '', '', None, '', no_update, no_update, []
+
+    @app.callback(
+        Output('flash-messages-container', 'children', allow_duplicate=True),
+        Output('store-pending-analysis', 'data', allow_duplicate=True),
+        Output('analysis-status-interval', 'disabled', allow_duplicate=True),
+        Input('analysis-status-interval', 'n_intervals'),
+        State('store-pending-analysis', 'data'),
+        prevent_initial_call=True
+    )
+    def poll_analysis_status(n_intervals, pending_ids):
+        if not pending_ids:
+            return no_update, [], True
+        statuses = database.get_analysis_statuses(pending_ids)
+        flash_messages = Patch()
+        still_pending = []
+        for obs_id in pending_ids:
+            status = statuses.get(obs_id)
+            if status == database.ANALYSIS_COMPLETE:
+                flash_messages.append(html.Li(f"AI analysis of observation #{obs_id} is complete.", className="success"))
+            elif status == database.ANALYSIS_FAILED:
+                flash_messages.append(html.Li(f"AI analysis of observation #{obs_id} failed. It was saved as entered.", className="warning"))
+            elif status is not None:
+                still_pending.append(obs_id)
+        if still_pending == pending_ids:
+            raise PreventUpdate
+        return flash_messages, still_pending, not still_pending
 
     @app.callback(
         Output('report-content-container', 'children'),
+        Output('store-report-cursor', 'data'),
+        Output('load-more-button', 'style'),
+        Output('report-summary', 'children'),
+        Output('store-report-pending-ids', 'data'),
+        Output('report-analysis-interval', 'disabled'),
+        Output('store-report-index', 'data'),
+        Output('store-report-version', 'data'),
         Input('url', 'pathname'),
         Input('search-input', 'value'),
         Input('sort-dropdown', 'value'),
-        Input('store-refresh-signal', 'data') # Listens for the signal to refresh
+        Input('date-range-filter', 'start_date'),
+        Input('date-range-filter', 'end_date'),
+        Input('floor-filter', 'value'),
+        Input('responsible-filter', 'value'),
     )
-    def update_report_view(pathname, search_term, sort_by, refresh_signal):
+    def update_report_view(pathname, search_term, sort_by, start_date, end_date, floor, responsible_person):
         if pathname != '/report': raise PreventUpdate
-        observations = database.get_observations_from_db(search_term, sort_by)
-        if not observations: return html.P("No observations found.", style={'textAlign': 'center', 'padding': '50px'})
-        cards = []
-        for obs in observations:
-            risk = obs.get('risk_rating', 0)
-            risk_class = 'risk-low'
-            if 5 <= risk <= 9: risk_class = 'risk-medium'
-            elif 10 <= risk <= 15: risk_class = 'risk-high'
-            elif risk >= 16: risk_class = 'risk-critical'
-            # --- MODIFIED CARD STRUCTURE FOR LAYOUT FIX ---
-            card = html.Div(className="obs-card", children=[
-                html.Div(className="card-body", children=[
-                    html.Div(className="card-main", children=[
-                        html.H3(f"Obs #{obs['id']}: {obs['location']} ({obs['floor']})"),
-                        html.P([html.B("Date: "), obs['date_str']]),
-                        html.P([html.B("Impact: "), obs['impact']]),
-                        html.P([html.B("Description: "), obs['description']]),
-                        html.P([html.B("Corrective Action: "), obs['corrective_action']]),
-                        html.P([html.B("Assigned To: "), f"{str(obs.get('responsible_person', 'N/A')).title()} | ", html.B("Deadline: "), f"{obs.get('deadline', 'N/A')}"])
-                    ]),
-                    html.Div(className="card-sidebar", children=[
-                        html.Div(className="risk-box", children=[html.P("Risk Rating", className="risk-title"), html.P(risk, className=f"risk-value {risk_class}")]),
-                        html.Img(src=f"data:image/png;base64,{obs['photo_b64']}" if obs['photo_b64'] else '/assets/placeholder.png', className="card-photo")
-                    ])
-                ]),
-                html.Div(className="card-footer", children=[
-                    html.Button('Delete Observation', id={'type': 'delete-button', 'index': obs['id']}, n_clicks=0, className='card-delete-button')
-                ])
-            ])
-            cards.append(card)
-        return cards
-        
+        return _render_report(search_term, sort_by, _report_filters(start_date, end_date, floor, responsible_person))
+
     @app.callback(
-        Output('download-excel', 'data'),
-        Input('download-report-button', 'n_clicks'),
+        Output('floor-filter', 'options'),
+        Output('responsible-filter', 'options'),
+        Input('url', 'pathname'),
+        Input('store-report-version', 'data'),
+    )
+    def update_report_filter_options(pathname, version):
+        if pathname != '/report': raise PreventUpdate
+        options = database.get_report_filter_options()
+        return options['floors'], [{'label': person.title(), 'value': person} for person in options['responsible_people']]
+
+    @app.callback(
+        Output('report-content-container', 'children', allow_duplicate=True),
+        Output('store-report-cursor', 'data', allow_duplicate=True),
+        Output('load-more-button', 'style', allow_duplicate=True),
+        Output('report-summary', 'children', allow_duplicate=True),
+        Output('store-report-pending-ids', 'data', allow_duplicate=True),
+        Output('report-analysis-interval', 'disabled', allow_duplicate=True),
+        Output('store-report-index', 'data', allow_duplicate=True),
+        Output('store-report-version', 'data', allow_duplicate=True),
+        Input('store-refresh-signal', 'data'), # Bumped after a deletion or a finished analysis
+        Input('report-changes-interval', 'n_intervals'),
+        Input('store-live-version', 'data'),
+        State('search-input', 'value'),
+        State('sort-dropdown', 'value'),
+        State('date-range-filter', 'start_date'),
+        State('date-range-filter', 'end_date'),
+        State('floor-filter', 'value'),
+        State('responsible-filter', 'value'),
+        State('store-report-index', 'data'),
+        State('store-report-version', 'data'),
+        State('store-report-cursor', 'data'),
+        State('store-report-pending-ids', 'data'),
+        prevent_initial_call=True
+    )
+    def sync_report_changes(refresh_signal, n_intervals, live_version, search_term, sort_by, start_date, end_date, floor, responsible_person, index, version, cursor, pending_ids):
+        """Applies the rows changed since the page's data version as card patches."""
+        if version is None: raise PreventUpdate
+        filters = _report_filters(start_date, end_date, floor, responsible_person)
+        delta = database.get_observation_changes(version, REPORT_MAX_DELTA_CHANGES)
+        if delta is not None and not delta['changes']:
+            raise PreventUpdate
+        if delta is None or not index:
+            # Too much changed (or nothing was shown yet): a full render is cheaper.
+            return _render_report(search_term, sort_by, filters)
+
+        changes = delta['changes']
+        rows = database.get_report_rows([obs_id for obs_id, op in changes.items() if op != 'D'], search_term, sort_by, filters)
+        cards, index_patch, new_index = _patch_report(index, cursor is not None, changes, rows, database.is_descending_sort(sort_by, search_term))
+        if not new_index and cursor is None:
+            return _render_report(search_term, sort_by, filters)
+        shown_ids = {sort_key[-1] for sort_key in new_index}
+        pending_ids = [obs_id for obs_id in pending_ids or [] if obs_id not in changes]
+        pending_ids += [obs_id for obs_id in _pending_ids(rows) if obs_id in shown_ids]
+        summary = _format_report_summary(database.get_report_total(search_term, filters))
+        return cards, no_update, no_update, summary, pending_ids, not pending_ids, index_patch, delta['version']
+
+    @app.callback(
+        Output('report-content-container', 'children', allow_duplicate=True),
+        Output('store-report-cursor', 'data', allow_duplicate=True),
+        Output('load-more-button', 'style', allow_duplicate=True),
+        Output('store-report-pending-ids', 'data', allow_duplicate=True),
+        Output('report-analysis-interval', 'disabled', allow_duplicate=True),
+        Output('store-report-index', 'data', allow_duplicate=True),
+        Input('load-more-button', 'n_clicks'),
+        State('search-input', 'value'),
+        State('sort-dropdown', 'value'),
+        State('date-range-filter', 'start_date'),
+        State('date-range-filter', 'end_date'),
+        State('floor-filter', 'value'),
+        State('responsible-filter', 'value'),
+        State('store-report-cursor', 'data'),
+        prevent_initial_call=True
+    )
+    def load_more_observations(n_clicks, search_term, sort_by, start_date, end_date, floor, responsible_person, cursor):
+        if not cursor: raise PreventUpdate
+        filters = _report_filters(start_date, end_date, floor, responsible_person)
+        page = database.get_observations_page(search_term, sort_by, cursor=cursor, filters=filters)
+        # Append only the new cards instead of re-sending the ones already on the page.
+        patched_cards = Patch()
+        patched_cards.extend([_build_observation_card(obs) for obs in page['observations']])
+        index = Patch()
+        index.extend([obs['sort_key'] for obs in page['observations']])
+        new_pending_ids = _pending_ids(page['observations'])
+        if new_pending_ids:
+            pending_ids = Patch()
+            pending_ids.extend(new_pending_ids)
+            return patched_cards, page['next_cursor'], _load_more_style(page['next_cursor']), pending_ids, False, index
+        return patched_cards, page['next_cursor'], _load_more_style(page['next_cursor']), no_update, no_update, index
+
+    @app.callback(
+        Output('store-refresh-signal', 'data', allow_duplicate=True),
+        Output('report-analysis-interval', 'disabled', allow_duplicate=True),
+        Input('report-analysis-interval', 'n_intervals'),
+        State('store-report-pending-ids', 'data'),
+        State('store-refresh-signal', 'data'),
         prevent_initial_call=True
     )
-    def download_full_report(n_clicks):
-        conn = database.get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM observations ORDER BY id ASC")
-            obs_for_excel = cur.fetchall()
-        conn.close()
-
-        if not obs_for_excel:
+    def poll_report_analysis_status(n_intervals, pending_ids, refresh_count):
+        if not pending_ids:
+            return no_update, True
+        statuses = database.get_analysis_statuses(pending_ids)
+        if all(statuses.get(obs_id) in (database.ANALYSIS_PENDING, database.ANALYSIS_PROCESSING) for obs_id in pending_ids):
             raise PreventUpdate
+        # At least one card has its analysis now; patch it in (see sync_report_changes).
+        return (refresh_count or 0) + 1, no_update
 
-        excel_stream = generate_excel_for_download(obs_for_excel)
-        filename = f"Full_Safety_Report_{datetime.datetime.now().strftime('%Y%m%d')}.xlsx"
-        return dcc.send_bytes(excel_stream.read(), filename)
+    @app.callback(
+        Output('store-export-key', 'data'),
+        Output('export-status-message', 'children'),
+        Output('export-status-interval', 'disabled'),
+        Output('store-export-download-url', 'data'),
+        Input('download-report-button', 'n_clicks'),
+        State('search-input', 'value'),
+        State('sort-dropdown', 'value'),
+        State('date-range-filter', 'start_date'),
+        State('date-range-filter', 'end_date'),
+        State('floor-filter', 'value'),
+        State('responsible-filter', 'value'),
+        prevent_initial_call=True
+    )
+    def start_report_export(n_clicks, search_term, sort_by, start_date, end_date, floor, responsible_person):
+        if not n_clicks: raise PreventUpdate
+        # Exports what is on screen; an unchanged report is served from the cache at once.
+        status = export_jobs.start_export(search_term or None, sort_by, _report_filters(start_date, end_date, floor, responsible_person))
+        if status['status'] == export_jobs.STATUS_READY:
+            # A new URL each click, so a repeat download of the same snapshot still fires.
+            return status['key'], _export_status_message(status), True, f"{_export_urls(status['key'])[1]}?n={n_clicks}"
+        return status['key'], _export_status_message(status), status['status'] != export_jobs.STATUS_RUNNING, no_update
 
     @app.callback(
+        Output('export-status-message', 'children', allow_duplicate=True),
+        Output('export-status-interval', 'disabled', allow_duplicate=True),
+        Output('store-export-download-url', 'data', allow_duplicate=True),
+        Input('export-status-interval', 'n_intervals'),
+        State('store-export-key', 'data'),
+        prevent_initial_call=True
+    )
+    def poll_report_export(n_intervals, export_key):
+        status = export_jobs.get_status(export_key) if export_key else None
+        if status is None:
+            return no_update, True, no_update
+        if status['status'] == export_jobs.STATUS_READY:
+            return _export_status_message(status), True, _export_urls(export_key)[1]
+        return _export_status_message(status), status['status'] != export_jobs.STATUS_RUNNING, no_update
+
+    # Start the download in the browser once the file is ready. The route answers with an
+    # attachment, so the report page stays where it is.
+    app.clientside_callback(
+        """
+        function(downloadUrl) {
+            if (downloadUrl) { window.location.assign(downloadUrl); }
+        }
+        """,
+        Input('store-export-download-url', 'data'),
+        prevent_initial_call=True
+    )
+
+    # Echo the chosen file's name in the browser; the photo itself is only sent on submit.
+    app.clientside_callback(
+        """
+        function(filename) {
+            return filename ? 'File selected: ' + filename : '';
+        }
+        """,
         Output('selected-file-name', 'children'),
         Input('photo-upload', 'filename'),
         prevent_initial_call=True
     )
-    def update_filename_display(filename):
-        return f"File selected: {filename}" if filename else ""
 
     # --- NEW CALLBACKS FOR DELETION ---
 
@@ -335,7 +893,7 @@ def register_callbacks(app):
         obs_id_to_delete = ctx.triggered_id['index']
         return True, obs_id_to_delete
 
-    # 2. When the user confirms deletion, delete from DB and trigger a page refresh.
+    # 2. When the user confirms deletion, delete from DB and signal sync_report_changes to drop the card.
     @app.callback(
         Output('store-refresh-signal', 'data'),
         Output('delete-status-message', 'children'),
@@ -349,7 +907,8 @@ def register_callbacks(app):
             return no_update, no_update
 
         try:
-            database.delete_observation_from_db(obs_id)
+            photo_keys = database.delete_observation_from_db(obs_id)
+            photo_store.release(photo_keys)
             message = html.Div(f"Observation #{obs_id} was successfully deleted.", className="message-success")
             return refresh_count + 1, message
         except Exception as e:
@@ -0,0 +1,103 @@
+# photo_processing.py
+
+import io
+
+from PIL import Image, ImageOps
+
+# --- Ingest Settings ---
+# Phone cameras deliver 12+ megapixel JPEGs; nothing in the app needs more than this.
+PHOTO_MAX_DIMENSION_PX = 2048
+PHOTO_JPEG_QUALITY = 85
+
+# Report cards are at most 250px wide; thumbnails are 2x for high-DPI screens.
+CARD_THUMB_MAX_PX = 500
+CARD_THUMB_JPEG_QUALITY = 80
+
+# Matches the size the Excel report draws photos at (see excel_export.py).
+EXCEL_THUMB_SIZE_PX = (150, 112)
+EXCEL_THUMB_JPEG_QUALITY = 75
+
+
+def _to_rgb(img):
+    """JPEG has no alpha channel or palette, so flatten those onto white."""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def _encode_jpeg(img, quality):
+    out = io.BytesIO()
+    # EXIF is not carried over: orientation has already been applied to the pixels,
+    # and dropping it also strips GPS and device metadata from stored photos.
+    img.save(out, format='JPEG', quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _open_normalised(photo_bytes):
+    """Opens an image, applies its EXIF orientation and flattens it to RGB."""
+    img = Image.open(io.BytesIO(photo_bytes))
+    img.load()
+    img = ImageOps.exif_transpose(img)
+    return _to_rgb(img)
+
+
+def make_card_thumbnail(photo_bytes):
+    """Returns a report-card sized JPEG thumbnail of a photo."""
+    img = _open_normalised(photo_bytes)
+    img.thumbnail((CARD_THUMB_MAX_PX, CARD_THUMB_MAX_PX), Image.LANCZOS)
+    return _encode_jpeg(img, CARD_THUMB_JPEG_QUALITY)
+
+
+def make_excel_thumbnail(photo_bytes):
+    """Returns a JPEG cropped and scaled to exactly the size photos are drawn at in Excel."""
+    img = _open_normalised(photo_bytes)
+    img = ImageOps.fit(img, EXCEL_THUMB_SIZE_PX, Image.LANCZOS)
+    return _encode_jpeg(img, EXCEL_THUMB_JPEG_QUALITY)
+
+
+def process_photo(photo_bytes, reencode_original=True):
+    """Runs the ingest pipeline on an uploaded photo.
+
+    Returns a dict with the (optionally re-encoded) original and its two thumbnails:
+    {'photo_bytes': ..., 'photo_thumb': ..., 'photo_excel_thumb': ...}.
+    Raises an exception from Pillow if the bytes are not a readable image.
+    """
+    img = _open_normalised(photo_bytes)
+
+    if reencode_original:
+        original = img.copy()
+        original.thumbnail((PHOTO_MAX_DIMENSION_PX, PHOTO_MAX_DIMENSION_PX), Image.LANCZOS)
+        encoded = _encode_jpeg(original, PHOTO_JPEG_QUALITY)
+        # Small, already well-compressed uploads can grow when re-encoded. Keep those as
+        # uploaded unless they needed downscaling.
+        if original.size != img.size or len(encoded) < len(photo_bytes):
+            photo_bytes = encoded
+
+    card_thumb = img.copy()
+    card_thumb.thumbnail((CARD_THUMB_MAX_PX, CARD_THUMB_MAX_PX), Image.LANCZOS)
+
+    excel_thumb = ImageOps.fit(img, EXCEL_THUMB_SIZE_PX, Image.LANCZOS)
+
+    return {
+        'photo_bytes': photo_bytes,
+        'photo_thumb': _encode_jpeg(card_thumb, CARD_THUMB_JPEG_QUALITY),
+        'photo_excel_thumb': _encode_jpeg(excel_thumb, EXCEL_THUMB_JPEG_QUALITY),
+    }
+
+
+def guess_mimetype(data):
+    """Sniffs the image format from its magic bytes (the first 12 bytes are enough)."""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
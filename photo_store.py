@@ -0,0 +1,264 @@
+# photo_store.py
+"""Content-addressed storage for observation photos outside the database.
+
+Each blob is stored under the SHA-256 of its bytes, so identical uploads (and identical
+thumbnails) are kept once. The observations table then only holds the keys
+(photo_key, photo_thumb_key, photo_excel_thumb_key) instead of BYTEA values.
+
+PHOTO_STORE_URL selects the backend:
+- unset: photos stay inline in the observations table, as before;
+- file:///var/lib/riskwatch/photos: a local directory, sharded as ab/cd/<key>;
+- s3://bucket/optional/prefix: Amazon S3 or any S3-compatible service (set
+  PHOTO_STORE_S3_ENDPOINT for MinIO and similar). Needs boto3 (`pip install boto3`).
+
+`python manage.py migrate-photos` moves photos already stored inline into the store.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from urllib.parse import urlparse
+
+import database
+import photo_processing
+
+PHOTO_STORE_URL = os.getenv('PHOTO_STORE_URL')
+PHOTO_STORE_S3_ENDPOINT = os.getenv('PHOTO_STORE_S3_ENDPOINT')
+# Lifetime of the signed URLs that S3-backed photo requests are redirected to.
+PHOTO_STORE_S3_URL_EXPIRY_SECONDS = int(os.getenv('PHOTO_STORE_S3_URL_EXPIRY_SECONDS', '3600'))
+
+# Fields of a photo dict (see photo_processing.process_photo) and the columns holding
+# their keys once they live in the store.
+PHOTO_KEY_FIELDS = {
+    'photo_bytes': 'photo_key',
+    'photo_thumb': 'photo_thumb_key',
+    'photo_excel_thumb': 'photo_excel_thumb_key',
+}
+
+_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def make_key(data):
+    """Returns the content address (SHA-256, hex) of a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _check_key(key):
+    # Keys end up in file paths and object names, so only accept real digests.
+    if not key or not _KEY_RE.match(key):
+        raise ValueError(f"Invalid photo key: {key!r}")
+    return key
+
+
+class LocalPhotoStore:
+    """Blobs in a local directory, as <root>/ab/cd/<key>, written atomically."""
+
+    def __init__(self, root):
+        self.root = root
+        self._stats = {'writes': 0, 'deduplicated': 0, 'bytes_written': 0}
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        _check_key(key)
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, data):
+        """Stores `data` if it isn't stored yet. Returns its key."""
+        key = make_key(data)
+        path = self.path(key)
+        if os.path.exists(path):
+            self._count(deduplicated=1)
+            return key
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._count(writes=1, bytes_written=len(data))
+        return key
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self):
+        """Yields (key, modified time as a Unix timestamp) for every stored blob."""
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if _KEY_RE.match(filename):
+                    try:
+                        yield filename, os.path.getmtime(os.path.join(directory, filename))
+                    except FileNotFoundError:
+                        pass
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend='file', location=self.root)
+
+
+class S3PhotoStore:
+    """Blobs in an S3 bucket, as <prefix>ab/cd/<key>.
+
+    `client` is a boto3 S3 client; by default one is created for PHOTO_STORE_S3_ENDPOINT
+    (or AWS itself) using the usual AWS_* environment variables.
+    """
+
+    def __init__(self, bucket, prefix='', client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("The s3:// photo store needs boto3 (pip install boto3).")
+            client = boto3.client('s3', endpoint_url=PHOTO_STORE_S3_ENDPOINT)
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = client
+        self._stats = {'writes': 0, 'deduplicated': 0, 'bytes_written': 0}
+        self._lock = threading.Lock()
+
+    def object_name(self, key):
+        _check_key(key)
+        return f"{self.prefix}{key[:2]}/{key[2:4]}/{key}"
+
+    def _exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_name(key))
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put(self, data):
+        key = make_key(data)
+        if self._exists(key):
+            self._count(deduplicated=1)
+            return key
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.object_name(key), Body=data,
+            ContentType=photo_processing.guess_mimetype(data),
+            # Content never changes under a key.
+            CacheControl='private, max-age=31536000, immutable',
+        )
+        self._count(writes=1, bytes_written=len(data))
+        return key
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_name(key))['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_name(key))
+
+    def iter_keys(self):
+        """Yields (key, modified time as a Unix timestamp) for every stored blob."""
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                name = item['Key'].rsplit('/', 1)[-1]
+                if _KEY_RE.match(name):
+                    yield name, item['LastModified'].timestamp()
+
+    def signed_url(self, key):
+        """Time-limited URL the browser can fetch the blob from (S3 handles Range requests)."""
+        return self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self.object_name(key)},
+            ExpiresIn=PHOTO_STORE_S3_URL_EXPIRY_SECONDS,
+        )
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend='s3', location=f"s3://{self.bucket}/{self.prefix}")
+
+
+def open_store(url):
+    """Returns the backend for a PHOTO_STORE_URL value, or None if it is empty."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        return LocalPhotoStore(os.path.abspath(parsed.netloc + parsed.path))
+    if parsed.scheme == 's3':
+        return S3PhotoStore(parsed.netloc, parsed.path)
+    raise ValueError(f"Unsupported PHOTO_STORE_URL '{url}'; use file:///path or s3://bucket/prefix.")
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Returns the configured store, or None if photos are kept in the database.
+
+    Keyed by PID like database.get_pool, since boto3 clients must not cross a fork.
+    """
+    global _store, _store_pid
+    if not PHOTO_STORE_URL:
+        return None
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            _store = open_store(PHOTO_STORE_URL)
+            _store_pid = os.getpid()
+    return _store
+
+
+def store_photo(photo):
+    """Moves the bytes of a photo dict (from photo_processing.process_photo) into the store.
+
+    Returns a dict for database.add_observation_to_db / update_photo_variants with the
+    *_key fields set and the byte fields None. Without a store the dict is returned as is.
+    """
+    store = get_store()
+    if store is None or not photo:
+        return photo
+    stored = dict(photo)
+    for field, key_field in PHOTO_KEY_FIELDS.items():
+        if photo.get(field) is not None:
+            stored[key_field] = store.put(photo[field])
+            stored[field] = None
+    return stored
+
+
+def release(keys):
+    """Deletes the blobs in `keys` that no observation refers to any more.
+
+    Called after an observation is deleted; shared (deduplicated) blobs stay.
+    """
+    store = get_store()
+    keys = {key for key in keys or () if key}
+    if store is None or not keys:
+        return 0
+    unused = keys - database.get_referenced_photo_keys(keys)
+    for key in unused:
+        try:
+            store.delete(key)
+        except Exception as e:
+            print(f"Photo store: Could not delete blob {key}: {e}")
+    return len(unused)
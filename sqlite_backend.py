@@ -0,0 +1,1146 @@
+# sqlite_backend.py
+"""SQLite storage for observations, for single-site installs and development.
+
+Selected by a DATABASE_URL of the form sqlite:///relative/path.db or
+sqlite:////absolute/path.db (see database.STORAGE_BACKENDS). database.get_storage() then
+returns this module: it has every database.py storage function, with the same signature,
+and the rest of the app keeps calling `database.*`. The report cache, filters, paging and
+result shaping stay in database.py; this module only runs the SQL.
+
+The database file is opened in WAL mode: readers never block the writer or each other,
+across gunicorn workers too, and writers queue on a busy timeout. Connections are pooled
+per process (like database.ConnectionPool) and keep their compiled statements between
+checkouts, so repeated queries skip SQL parsing and planning.
+
+Differences from PostgreSQL:
+- search uses an FTS5 index (Porter stemming) plus substring matches on location and
+  floor; there is no fuzzy (trigram) matching of misspelt words;
+- the data version goes up once per changed row rather than per statement, and other
+  processes see new versions by polling (SQLITE_POLL_SECONDS) instead of LISTEN/NOTIFY;
+- report totals are always exact counts;
+- observations can't be partitioned.
+"""
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from zoneinfo import ZoneInfo
+
+import database
+import metrics
+
+# --- Connection Settings ---
+# How long a writer waits for another process's write transaction before giving up.
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+# Page cache per connection, and how much of the file is memory-mapped for reads.
+SQLITE_CACHE_SIZE_MB = int(os.getenv('SQLITE_CACHE_SIZE_MB', '32'))
+SQLITE_MMAP_SIZE_MB = int(os.getenv('SQLITE_MMAP_SIZE_MB', '256'))
+# Compiled statements kept per connection; the report alone uses a few dozen shapes.
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv('SQLITE_STATEMENT_CACHE_SIZE', '256'))
+# How often the data change listener checks for writes made by other processes.
+SQLITE_POLL_SECONDS = float(os.getenv('SQLITE_POLL_SECONDS', '0.5'))
+
+# Timestamps are stored as fixed-width UTC text, so they sort and compare correctly as
+# strings and match the sort keys of report cursors (database._sort_key_value).
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Column weights of the FTS5 ranking: location, floor, description (as setweight A/B/C).
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)
+
+# Named query parameters, as sqlite3 writes them (see database._param).
+PARAMETER_FORMAT = ':{}'
+
+
+def database_path(url):
+    """Returns the file path of a sqlite:/// URL."""
+    parsed = urlparse(url)
+    path = parsed.path[1:] if parsed.path.startswith('/') else parsed.path
+    if parsed.netloc or not path:
+        raise ValueError(f"Expected sqlite:///path/to/file.db, got {url!r}")
+    return path
+
+
+def _timestamp(value):
+    """Returns a datetime, date or ISO string as stored timestamp text (naive = local time)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return value.astimezone(datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _ago(seconds):
+    return _timestamp(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=seconds))
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    return datetime.datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+
+# Columns declared TIMESTAMPTZ come back as aware datetimes, as from psycopg2. Dates (the
+# report filters and rollup days in database.py) are passed as 'YYYY-MM-DD'.
+sqlite3.register_converter('TIMESTAMPTZ', _parse_timestamp)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+
+
+def _rollup_day(value):
+    """Calendar day of a stored timestamp in ROLLUP_TIME_ZONE, as 'YYYY-MM-DD'."""
+    return _parse_timestamp(value).astimezone(ZoneInfo(database.ROLLUP_TIME_ZONE)).date().isoformat()
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+# --- Query Instrumentation ---
+def _query_origin():
+    """Name of the function in this module that ran the current query, used as its metric label."""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals is not globals():
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else 'other'
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each query to metrics.py, like database.InstrumentedConnection's."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(_query_origin(), time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_query(_query_origin(), time.perf_counter() - started, self.rowcount)
+
+
+class Connection(sqlite3.Connection):
+    """Connection whose cursors can return dict rows (like RealDictCursor) and are timed."""
+
+    instrumented = False
+
+    def cursor(self, dict_rows=False):
+        cur = super().cursor(TimedCursor) if self.instrumented else super().cursor()
+        if dict_rows:
+            cur.row_factory = _dict_row
+        return cur
+
+
+def connect(instrumented=True):
+    """Opens a connection to the DATABASE_URL file with this module's pragmas applied."""
+    conn = sqlite3.connect(
+        database_path(database.DATABASE_URL), timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None, check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE_SIZE, factory=Connection)
+    conn.instrumented = instrumented and metrics.METRICS_ENABLED
+    cur = sqlite3.Connection.cursor(conn)
+    # WAL mode persists in the file. With NORMAL sync a power cut can lose the last few
+    # commits (an app crash can't), but never corrupts the database.
+    cur.execute("PRAGMA journal_mode = WAL")
+    cur.execute("PRAGMA synchronous = NORMAL")
+    cur.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    cur.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_MB * 1024}")
+    cur.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cur.execute("PRAGMA temp_store = MEMORY")
+    conn.create_function('rollup_day', 1, _rollup_day, deterministic=True)
+    return conn
+
+
+class ConnectionPool(database.ConnectionPool):
+    """database.ConnectionPool for SQLite connections. Connections are kept open between
+    checkouts so their statement caches stay warm."""
+
+    def _connect(self):
+        conn = connect()
+        with self._cond:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        if time.monotonic() - idle_since < self.healthcheck_idle_seconds:
+            return True
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def putconn(self, conn, discard=False):
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+        with self._cond:
+            if discard or self._closed:
+                self._close_quietly(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                # Lets SQLite refresh statistics for the queries this connection ran.
+                try:
+                    conn.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+        super().closeall()
+
+
+@contextmanager
+def get_db_connection(write=False):
+    """Context manager that checks a pooled connection out inside a transaction.
+
+    Pass write=True for blocks that write: the transaction then takes the write lock up
+    front (BEGIN IMMEDIATE), so it waits its turn instead of failing when a read turns
+    into a write while another process is writing. Commits on success, rolls back otherwise.
+    """
+    pool = database.get_pool()
+    conn = pool.getconn()
+    try:
+        conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+# --- Unsupported Maintenance ---
+def _postgres_only():
+    raise ValueError("Partitioning observations needs PostgreSQL; the SQLite backend keeps a single table.")
+
+
+def ensure_observation_partitions(conn, first_month=None):
+    _postgres_only()
+
+
+def partition_observations_table():
+    _postgres_only()
+
+
+def drop_observation_partitions(before_month, detach_only=False):
+    _postgres_only()
+
+
+def create_upcoming_partitions():
+    return None  # observations is never partitioned here, so there is nothing to create.
+
+
+# --- Schema ---
+def _rollup_day_sql(expr):
+    # The built-in substr keeps the triggers usable from the sqlite3 shell; other time
+    # zones need the rollup_day() function that connect() registers.
+    if database.ROLLUP_TIME_ZONE in ('UTC', 'Etc/UTC'):
+        return f"substr({expr}, 1, 10)"
+    return f"rollup_day({expr})"
+
+
+def _rollup_upsert_sql(row, sign):
+    """Statement adding (sign 1) or removing (sign -1) the trigger row `row` (NEW or OLD)
+    to observation_rollups, with the dimensions of database._rollup_upsert_sql."""
+    day = _rollup_day_sql(f"{row}.observed_at")
+    return f'''
+        INSERT INTO observation_rollups (dimension, grain, day, key1, key2, count, risk_sum)
+        SELECT d.dimension, g.grain, g.day, d.key1, d.key2, {sign}, {sign} * COALESCE({row}.risk_rating, 0)
+        FROM (SELECT 'risk' AS dimension, '' AS key1, COALESCE({row}.risk_rating, 0) AS key2
+              UNION ALL SELECT 'floor_severity', {row}.floor, COALESCE({row}.severity, 0)
+              UNION ALL SELECT 'person', lower(COALESCE({row}.responsible_person, '')), 0) AS d,
+             (SELECT 'd' AS grain, {day} AS day
+              UNION ALL SELECT 'm', substr({day}, 1, 8) || '01') AS g
+        WHERE true
+        ON CONFLICT (dimension, grain, day, key1, key2) DO UPDATE
+        SET count = count + excluded.count, risk_sum = risk_sum + excluded.risk_sum;
+    '''
+
+
+def _bump_version_sql(row, op):
+    return f'''
+        UPDATE data_versions SET version = version + 1 WHERE name = 'observations';
+        INSERT INTO observation_changes (version, observation_id, op)
+        SELECT version, {row}.id, '{op}' FROM data_versions WHERE name = 'observations';
+    '''
+
+
+def _create_triggers(cur, triggers):
+    # Recreated whenever their migration runs, so init_db() picks up changes to their definitions.
+    for name, definition in triggers.items():
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"CREATE TRIGGER {name} {definition}")
+
+
+# One function per database.MIGRATIONS entry, like database.MIGRATION_STEPS. The SQLite
+# backend came after most of the columns, so its observations table has them all from
+# the start, and the later steps add the indexes, tables and triggers that go with them.
+def _create_observations_table(cur):
+    # The photo columns come last: SQLite walks a row's overflow pages to reach the
+    # columns after a large value, which listing queries would otherwise pay for.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS observations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_str TEXT NOT NULL,
+            observed_at TIMESTAMPTZ NOT NULL,
+            floor TEXT NOT NULL,
+            location TEXT NOT NULL,
+            description TEXT,
+            impact TEXT,
+            likelihood INTEGER,
+            severity INTEGER,
+            risk_rating INTEGER,
+            corrective_action TEXT,
+            responsible_person TEXT,
+            deadline TEXT,
+            analysis_status TEXT NOT NULL DEFAULT 'complete',
+            analysis_started_at TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ NOT NULL,
+            dedup_bands TEXT,
+            dedup_signature TEXT,
+            duplicate_of INTEGER,
+            report_count INTEGER NOT NULL DEFAULT 1,
+            photo_key TEXT,
+            photo_thumb_key TEXT,
+            photo_excel_thumb_key TEXT,
+            photo_thumb BLOB,
+            photo_excel_thumb BLOB,
+            photo_bytes BLOB
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_risk_id_idx ON observations (COALESCE(risk_rating, 0), id)")
+
+
+def _add_photo_columns(cur):
+    for key_column in database.PHOTO_KEY_COLUMNS.values():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS observations_{key_column}_idx ON observations ({key_column}) WHERE {key_column} IS NOT NULL")
+
+
+def _add_search_indexes(cur):
+    # Full-text index (external content: the text is only stored in observations).
+    cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS observations_fts USING fts5 (
+            location, floor, description,
+            content = 'observations', content_rowid = 'id',
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        )
+    ''')
+    _create_triggers(cur, {
+        'observations_fts_insert': '''
+            AFTER INSERT ON observations BEGIN
+                INSERT INTO observations_fts (rowid, location, floor, description) VALUES (NEW.id, NEW.location, NEW.floor, NEW.description);
+            END''',
+        'observations_fts_update': '''
+            AFTER UPDATE OF location, floor, description ON observations BEGIN
+                INSERT INTO observations_fts (observations_fts, rowid, location, floor, description)
+                VALUES ('delete', OLD.id, OLD.location, OLD.floor, OLD.description);
+                INSERT INTO observations_fts (rowid, location, floor, description) VALUES (NEW.id, NEW.location, NEW.floor, NEW.description);
+            END''',
+        'observations_fts_delete': '''
+            AFTER DELETE ON observations BEGIN
+                INSERT INTO observations_fts (observations_fts, rowid, location, floor, description)
+                VALUES ('delete', OLD.id, OLD.location, OLD.floor, OLD.description);
+            END''',
+    })
+
+
+def _add_analysis_status(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_analysis_pending_idx ON observations (id) WHERE analysis_status <> 'complete'")
+
+
+def _add_updated_at(cur):
+    # The column is in the table, and the writes set it (there is no touch trigger).
+    pass
+
+
+def _add_observed_at(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_observed_at_id_idx ON observations (observed_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_floor_idx ON observations (floor)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_responsible_person_idx ON observations (lower(responsible_person))")
+
+
+def _add_dedup_columns(cur):
+    # LSH band index for near-duplicate lookups (the GIN index on dedup_bands in PostgreSQL).
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS observation_dedup_bands (
+            band INTEGER NOT NULL,
+            observation_id INTEGER NOT NULL,
+            PRIMARY KEY (band, observation_id)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS observation_dedup_bands_observation_idx ON observation_dedup_bands (observation_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observations_duplicate_of_idx ON observations (duplicate_of) WHERE duplicate_of IS NOT NULL")
+    _create_triggers(cur, {
+        'observations_dedup_bands_insert': '''
+            AFTER INSERT ON observations WHEN NEW.dedup_bands IS NOT NULL BEGIN
+                INSERT OR IGNORE INTO observation_dedup_bands (band, observation_id) SELECT value, NEW.id FROM json_each(NEW.dedup_bands);
+            END''',
+        'observations_dedup_bands_update': '''
+            AFTER UPDATE OF dedup_bands ON observations BEGIN
+                DELETE FROM observation_dedup_bands WHERE observation_id = OLD.id;
+                INSERT OR IGNORE INTO observation_dedup_bands (band, observation_id) SELECT value, NEW.id FROM json_each(NEW.dedup_bands);
+            END''',
+        'observations_dedup_bands_delete': '''
+            AFTER DELETE ON observations BEGIN
+                DELETE FROM observation_dedup_bands WHERE observation_id = OLD.id;
+            END''',
+    })
+
+
+def _create_data_versions(cur):
+    # Data version and change log (see database._create_data_versions), one version per row.
+    cur.execute("CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)")
+    cur.execute("INSERT INTO data_versions (name) VALUES ('observations') ON CONFLICT (name) DO NOTHING")
+    cur.execute("CREATE TABLE IF NOT EXISTS observation_changes (version INTEGER NOT NULL, observation_id INTEGER, op TEXT NOT NULL)")
+    cur.execute("CREATE INDEX IF NOT EXISTS observation_changes_version_idx ON observation_changes (version)")
+    _create_triggers(cur, {
+        'observations_bump_version_insert': f"AFTER INSERT ON observations BEGIN {_bump_version_sql('NEW', 'I')} END",
+        'observations_bump_version_update': f"AFTER UPDATE ON observations BEGIN {_bump_version_sql('NEW', 'U')} END",
+        'observations_bump_version_delete': f"AFTER DELETE ON observations BEGIN {_bump_version_sql('OLD', 'D')} END",
+        'observation_changes_prune': f'''
+            AFTER INSERT ON observation_changes WHEN NEW.version % {database.CHANGE_LOG_PRUNE_EVERY} = 0 BEGIN
+                DELETE FROM observation_changes WHERE version <= NEW.version - {database.CHANGE_LOG_KEEP_VERSIONS};
+            END''',
+    })
+
+
+def _create_dashboard_rollups(cur):
+    # Dashboard rollups (see database.get_dashboard_aggregates).
+    cur.execute("SELECT count(*) FROM sqlite_master WHERE name = 'observation_rollups'")
+    rollups_missing = cur.fetchone()[0] == 0
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS observation_rollups (
+            dimension TEXT NOT NULL,
+            grain TEXT NOT NULL,
+            day TEXT NOT NULL,
+            key1 TEXT NOT NULL,
+            key2 INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            risk_sum INTEGER NOT NULL,
+            PRIMARY KEY (dimension, grain, day, key1, key2)
+        ) WITHOUT ROWID
+    ''')
+    rollup_columns = "observed_at, floor, severity, risk_rating, responsible_person"
+    _create_triggers(cur, {
+        'observations_update_rollups_insert': f"AFTER INSERT ON observations BEGIN {_rollup_upsert_sql('NEW', 1)} END",
+        'observations_update_rollups_update': f'''
+            AFTER UPDATE OF {rollup_columns} ON observations
+            WHEN (NEW.observed_at, NEW.floor, NEW.severity, NEW.risk_rating, NEW.responsible_person)
+                 IS NOT (OLD.observed_at, OLD.floor, OLD.severity, OLD.risk_rating, OLD.responsible_person) BEGIN
+                {_rollup_upsert_sql('OLD', -1)}
+                {_rollup_upsert_sql('NEW', 1)}
+            END''',
+        'observations_update_rollups_delete': f"AFTER DELETE ON observations BEGIN {_rollup_upsert_sql('OLD', -1)} END",
+    })
+    if rollups_missing:
+        _rebuild_rollups(cur)
+
+
+def _create_ai_analysis_cache(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS ai_analysis_cache (
+            cache_key TEXT PRIMARY KEY,
+            prompt_version TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL
+        )
+    ''')
+
+
+MIGRATION_STEPS = {
+    1: _create_observations_table,
+    2: _add_photo_columns,
+    3: _add_search_indexes,
+    4: _add_analysis_status,
+    5: _add_updated_at,
+    6: _add_observed_at,
+    7: _add_dedup_columns,
+    8: _create_data_versions,
+    9: _create_dashboard_rollups,
+    10: _create_ai_analysis_cache,
+}
+
+
+# --- Schema Migrations ---
+def get_schema_version():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'")
+        if cur.fetchone() is None:
+            return 0
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cur.fetchone()[0]
+
+
+@contextmanager
+def _migration_lock():
+    # No advisory locks in SQLite. Overlapping runs take turns on the write lock instead,
+    # and each applies a (re-runnable) migration the other may already have recorded.
+    yield
+
+
+def _record_migration(cur, version, name):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL
+        )
+    ''')
+    cur.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?) ON CONFLICT (version) DO NOTHING",
+                (version, name, _now()))
+
+
+def _apply_migration(version, name):
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        MIGRATION_STEPS[version](cur)
+        _record_migration(cur, version, name)
+
+
+# --- Writes ---
+def _insert_observation(row):
+    row = dict(row, observed_at=_timestamp(row['observed_at']) or _now(), updated_at=_now())
+    for column in ('dedup_bands', 'dedup_signature'):
+        row[column] = json.dumps(list(row[column])) if row[column] is not None else None
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"INSERT INTO observations ({', '.join(row)}) VALUES ({', '.join(':' + column for column in row)}) RETURNING id", row)
+        return cur.fetchone()[0]
+
+
+def _array_literal_to_json(value):
+    # bulk_import writes arrays as PostgreSQL literals ('{1,2}') for COPY.
+    return '[' + value.strip('{}') + ']' if value else None
+
+
+def copy_observations_to_db(csv_stream):
+    """Loads observations from a CSV stream in database.BULK_IMPORT_COLUMNS order (see
+    database.copy_observations_to_db) in one transaction. Returns the number of rows loaded."""
+    import csv
+    columns = database.BULK_IMPORT_COLUMNS
+    observed_at, bands, signature = (columns.index(name) for name in ('observed_at', 'dedup_bands', 'dedup_signature'))
+    now = _now()
+
+    def rows():
+        for record in csv.reader(csv_stream):
+            values = [value if value != '' else None for value in record]
+            values[observed_at] = _timestamp(values[observed_at]) or now
+            values[bands] = _array_literal_to_json(values[bands])
+            values[signature] = _array_literal_to_json(values[signature])
+            yield values + [now]
+
+    placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.executemany(f"INSERT INTO observations ({', '.join(columns)}, updated_at) VALUES ({placeholders})", rows())
+        return cur.rowcount
+
+
+def analyze_observations():
+    """Refreshes the query planner's statistics after a bulk load."""
+    with get_db_connection(write=True) as conn:
+        conn.cursor().execute("ANALYZE")
+
+
+# --- Deferred AI Analysis ---
+_CLAIM_RETURNING_SQL = "RETURNING id, description AS observation_text, floor AS floor_input, location"
+
+
+def claim_analysis(observation_id):
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f'''
+            UPDATE observations SET analysis_status = ?, analysis_started_at = ?, updated_at = ?
+            WHERE id = ? AND analysis_status = ?
+            {_CLAIM_RETURNING_SQL}
+        ''', (database.ANALYSIS_PROCESSING, _now(), _now(), observation_id, database.ANALYSIS_PENDING))
+        return cur.fetchone()
+
+
+def claim_pending_analyses(limit, stale_after_seconds, include_failed=False, exclude_ids=()):
+    """Claims up to `limit` observations that still need analysis. SQLite runs one write
+    transaction at a time, so concurrent sweeps can't claim the same row twice."""
+    statuses = [database.ANALYSIS_PENDING, database.ANALYSIS_FAILED] if include_failed else [database.ANALYSIS_PENDING]
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f'''
+            UPDATE observations SET analysis_status = :processing, analysis_started_at = :now, updated_at = :now
+            WHERE id IN (
+                SELECT id FROM observations
+                WHERE (analysis_status IN (SELECT value FROM json_each(:statuses))
+                       OR (analysis_status = :processing AND analysis_started_at < :stale_before))
+                  AND id NOT IN (SELECT value FROM json_each(:exclude_ids))
+                ORDER BY id
+                LIMIT :limit
+            )
+            {_CLAIM_RETURNING_SQL}
+        ''', {'processing': database.ANALYSIS_PROCESSING, 'now': _now(), 'statuses': json.dumps(statuses),
+              'stale_before': _ago(stale_after_seconds), 'exclude_ids': json.dumps(list(exclude_ids)), 'limit': limit})
+        return sorted(cur.fetchall(), key=lambda row: row['id'])
+
+
+def _update_observation(observation_id, values):
+    values = dict(values, updated_at=_now())
+    with get_db_connection(write=True) as conn:
+        conn.cursor().execute(f"UPDATE observations SET {', '.join(f'{column} = :{column}' for column in values)} WHERE id = :id",
+                              dict(values, id=observation_id))
+
+
+def release_analysis(observation_id):
+    with get_db_connection(write=True) as conn:
+        conn.cursor().execute("UPDATE observations SET analysis_status = ?, updated_at = ? WHERE id = ? AND analysis_status = ?",
+                              (database.ANALYSIS_PENDING, _now(), observation_id, database.ANALYSIS_PROCESSING))
+
+
+def get_analysis_statuses(observation_ids):
+    if not observation_ids:
+        return {}
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, analysis_status FROM observations WHERE id IN (SELECT value FROM json_each(?))",
+                    (json.dumps(list(observation_ids)),))
+        return dict(cur.fetchall())
+
+
+# --- Near-Duplicate Detection ---
+def find_duplicate_candidates(bands, window_hours, limit, exclude_id=None):
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute('''
+            SELECT id, date_str, observed_at, floor, location, description, risk_rating,
+                   analysis_status, report_count, dedup_signature
+            FROM observations
+            WHERE id IN (SELECT observation_id FROM observation_dedup_bands
+                         WHERE band IN (SELECT value FROM json_each(:bands)))
+              AND observed_at >= :since
+              AND duplicate_of IS NULL
+              AND id IS NOT :exclude_id
+            ORDER BY observed_at DESC
+            LIMIT :limit
+        ''', {'bands': json.dumps(list(bands)), 'since': _ago(window_hours * 3600), 'exclude_id': exclude_id, 'limit': limit})
+        rows = cur.fetchall()
+    for row in rows:
+        row['dedup_signature'] = json.loads(row['dedup_signature']) if row['dedup_signature'] else None
+    return rows
+
+
+def get_reusable_analysis(observation_id):
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute('''
+            SELECT impact, likelihood, severity, corrective_action, responsible_person, deadline
+            FROM observations WHERE id = ? AND analysis_status = ?
+        ''', (observation_id, database.ANALYSIS_COMPLETE))
+        return database._reusable_analysis(cur.fetchone())
+
+
+def link_duplicate_report(observation_id):
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE observations SET report_count = report_count + 1, updated_at = ? WHERE id = ? RETURNING report_count",
+                    (_now(), observation_id))
+        row = cur.fetchone()
+    database.get_report_cache().mark_stale()
+    return row[0] if row else None
+
+
+def get_observations_for_fingerprinting(limit, after_id=0, include_indexed=False):
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f'''
+            SELECT id, floor, location, description FROM observations
+            WHERE id > ?{"" if include_indexed else " AND dedup_signature IS NULL"}
+            ORDER BY id LIMIT ?
+        ''', (after_id, limit))
+        return cur.fetchall()
+
+
+def update_dedup_fingerprints(rows):
+    if not rows:
+        return
+    with get_db_connection(write=True) as conn:
+        conn.cursor().executemany(
+            "UPDATE observations SET dedup_bands = ?, dedup_signature = ? WHERE id = ?",
+            [(json.dumps(list(bands)), json.dumps(list(signature)), observation_id) for observation_id, bands, signature in rows])
+
+
+def iter_dedup_fingerprints(fetch_size=2000):
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute('''
+            SELECT id, observed_at, dedup_bands, dedup_signature FROM observations
+            WHERE duplicate_of IS NULL AND json_array_length(dedup_signature) > 0
+            ORDER BY observed_at, id
+        ''')
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                row['dedup_bands'] = json.loads(row['dedup_bands'] or '[]')
+                row['dedup_signature'] = json.loads(row['dedup_signature'])
+            yield from rows
+
+
+def link_duplicate_clusters(clusters):
+    linked = 0
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        for original_id, duplicate_ids in clusters:
+            cur.execute('''
+                UPDATE observations SET duplicate_of = ?, updated_at = ?
+                WHERE id IN (SELECT value FROM json_each(?)) AND duplicate_of IS NULL AND id <> ?
+            ''', (original_id, _now(), json.dumps(list(duplicate_ids)), original_id))
+            newly_linked = cur.rowcount
+            if newly_linked:
+                cur.execute("UPDATE observations SET report_count = report_count + ?, updated_at = ? WHERE id = ?",
+                            (newly_linked, _now(), original_id))
+                linked += newly_linked
+    database.get_report_cache().mark_stale()
+    return linked
+
+
+# --- AI Analysis Cache ---
+def get_cached_ai_analysis(cache_key, max_age_seconds):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT result FROM ai_analysis_cache WHERE cache_key = ? AND created_at > ?", (cache_key, _ago(max_age_seconds)))
+        row = cur.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def store_cached_ai_analysis(cache_key, prompt_version, result):
+    with get_db_connection(write=True) as conn:
+        conn.cursor().execute('''
+            INSERT INTO ai_analysis_cache (cache_key, prompt_version, result, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (cache_key) DO UPDATE
+            SET result = excluded.result, prompt_version = excluded.prompt_version, created_at = excluded.created_at
+        ''', (cache_key, prompt_version, json.dumps(result), _now()))
+
+
+def delete_cached_ai_analyses(keep_prompt_version=None):
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        if keep_prompt_version is None:
+            cur.execute("DELETE FROM ai_analysis_cache")
+        else:
+            cur.execute("DELETE FROM ai_analysis_cache WHERE prompt_version <> ?", (keep_prompt_version,))
+        return cur.rowcount
+
+
+# --- Report Queries ---
+SEARCH_RANK_SQL = (
+    "(COALESCE(search_hits.rank, 0.0)"
+    " + (CASE WHEN location LIKE :search_pattern OR floor LIKE :search_pattern THEN 1.0 ELSE 0.0 END))"
+)
+REPORT_SORT_KEYS = dict(database.REPORT_SORT_KEYS, relevance=[(SEARCH_RANK_SQL, 'DESC'), ('id', 'DESC')])
+
+# Parts of a websearch_to_tsquery-style search: "quoted phrases", -negated terms, OR.
+_SEARCH_PART_RE = re.compile(r'(-?)"([^"]*)"?|(-?)([^\s"]+)')
+_SEARCH_WORD_RE = re.compile(r'\w+')
+
+
+def fts_query(search_term):
+    """Translates a search box entry into an FTS5 query with the websearch_to_tsquery
+    syntax used on PostgreSQL: words must all match, "quoted phrases" match in order,
+    `or` between terms matches either and a leading `-` excludes a term. Returns None if
+    nothing searchable is left."""
+    query = ''
+    pending_or = False
+    for negate_phrase, phrase, negate_word, word in _SEARCH_PART_RE.findall(search_term):
+        text = phrase or word
+        if not phrase and word.lower() == 'or':
+            pending_or = bool(query)
+            continue
+        words = _SEARCH_WORD_RE.findall(text)
+        if not words:
+            continue
+        term = '"' + ' '.join(words) + '"'
+        if negate_phrase or negate_word:
+            # FTS5's NOT needs a left-hand side; a leading exclusion is dropped.
+            if query:
+                query += f" NOT {term}"
+        elif query:
+            query += f" {'OR' if pending_or else 'AND'} {term}"
+        else:
+            query = term
+        pending_or = False
+    return query or None
+
+
+def _search_filter(search_term):
+    """Returns (FROM clause, [WHERE conditions], params) for the report search box. A
+    search joins the FTS5 matches as search_hits (hit_id, rank)."""
+    if not search_term:
+        return "observations", [], {}
+    params = {'search_pattern': f'%{search_term}%', 'fts_query': fts_query(search_term) or '""'}
+    weights = ', '.join(map(str, SEARCH_WEIGHTS))
+    from_sql = (
+        "observations LEFT JOIN (SELECT rowid AS hit_id, -bm25(observations_fts, "
+        f"{weights}) AS rank FROM observations_fts WHERE observations_fts MATCH :fts_query) AS search_hits ON hit_id = id"
+    )
+    return from_sql, ["(hit_id IS NOT NULL OR location LIKE :search_pattern OR floor LIKE :search_pattern)"], params
+
+
+def _report_rows(search_term, sort_by, from_sql, where_sql, params, suffix_sql=""):
+    sort_keys, order_sql = database._build_order_by(sort_by, search_term)
+    sort_columns = ", ".join(f"{expr} AS sort_key_{i}" for i, (expr, _) in enumerate(sort_keys))
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f"SELECT {database.REPORT_CARD_COLUMNS}, {sort_columns} FROM {from_sql}{where_sql}{order_sql}{suffix_sql}", params)
+        rows = cur.fetchall()
+        if search_term and rows:
+            # highlight() only works in a query on the FTS table, so it runs over the page only.
+            highlighted = {}
+            if fts_query(search_term):
+                cur.execute('''
+                    SELECT rowid AS id, highlight(observations_fts, 2, :start, :stop) AS description
+                    FROM observations_fts WHERE observations_fts MATCH :fts_query
+                      AND rowid IN (SELECT value FROM json_each(:ids))
+                ''', {'start': database.HIGHLIGHT_START, 'stop': database.HIGHLIGHT_STOP,
+                      'fts_query': params['fts_query'], 'ids': json.dumps([row['id'] for row in rows])})
+                highlighted = {row['id']: row['description'] for row in cur.fetchall()}
+            for row in rows:
+                row['description_highlighted'] = highlighted.get(row['id'], row['description'] or '')
+    return rows
+
+
+def get_observations_from_db(search_term=None, sort_by='date_newest', filters=None):
+    from_sql, where_sql, params = database._build_report_filter(search_term, filters)
+    _, order_sql = database._build_order_by(sort_by, search_term)
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f"SELECT {database.REPORT_CARD_COLUMNS} FROM {from_sql}{where_sql}{order_sql}", params)
+        observations = cur.fetchall()
+    for row in observations:
+        row['has_photo'] = bool(row['has_photo'])
+    return observations
+
+
+def _count_report_rows(from_sql, where_sql, params):
+    # Counting is cheap at the table sizes SQLite is meant for, so there is no estimate.
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT count(*) FROM {from_sql}{where_sql}", params)
+        return cur.fetchone()[0]
+
+
+def _id_filter(observation_ids):
+    return "id IN (SELECT value FROM json_each(:observation_ids))", {'observation_ids': json.dumps(list(observation_ids))}
+
+
+def _query_report_filter_options():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        # Both are read from their indexes (a covering scan), not from the table.
+        cur.execute("SELECT DISTINCT floor FROM observations WHERE floor IS NOT NULL ORDER BY floor")
+        floors = [row[0] for row in cur.fetchall()]
+        cur.execute('''
+            SELECT DISTINCT lower(responsible_person) FROM observations
+            WHERE lower(responsible_person) IS NOT NULL ORDER BY lower(responsible_person)
+        ''')
+        people = [row[0] for row in cur.fetchall()]
+    return {'floors': floors, 'responsible_people': people}
+
+
+# --- Data Versions ---
+def get_data_version():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE name = 'observations'")
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+class DataChangeListener(database.DataChangeListener):
+    """database.DataChangeListener for SQLite, which has no LISTEN/NOTIFY: polls the file's
+    PRAGMA data_version (which changes when another connection commits) and reads the data
+    version only when it did."""
+
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = connect(instrumented=False)
+                cur = conn.cursor()
+                seen = None
+                while True:
+                    cur.execute("PRAGMA data_version")
+                    file_version = cur.fetchone()[0]
+                    if file_version != seen:
+                        seen = file_version
+                        cur.execute("SELECT version FROM data_versions WHERE name = 'observations'")
+                        row = cur.fetchone()
+                        self._publish(row[0] if row else 0)
+                    self.connected = True
+                    time.sleep(SQLITE_POLL_SECONDS)
+            except Exception as e:
+                print(f"Data change listener: Error ({e}); retrying in {database.LISTEN_RETRY_SECONDS}s.")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    conn.close()
+            time.sleep(database.LISTEN_RETRY_SECONDS)
+
+
+def _query_observation_changes(since_version, limit):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE name = 'observations'")
+        row = cur.fetchone()
+        version = row[0] if row else 0
+        if since_version >= version:
+            return {'version': version, 'changes': {}}
+        cur.execute("SELECT min(version) FROM observation_changes")
+        oldest = cur.fetchone()[0]
+        if oldest is None or since_version < oldest - 1:
+            return None
+        # The latest operation per row: SQLite returns the row with max(version) alongside it.
+        cur.execute('''
+            SELECT observation_id, op, max(version) FROM observation_changes
+            WHERE version > ? AND version <= ?
+            GROUP BY observation_id
+            LIMIT ?
+        ''', (since_version, version, limit + 1))
+        rows = [(observation_id, op) for observation_id, op, _ in cur.fetchall()]
+    if len(rows) > limit or any(op == 'T' for _, op in rows):
+        return None
+    return {'version': version, 'changes': dict(rows)}
+
+
+# --- Dashboard Aggregates ---
+def _rebuild_rollups(cur):
+    cur.execute("DELETE FROM observation_rollups")
+    cur.execute(f'''
+        WITH src AS (
+            SELECT {_rollup_day_sql('observed_at')} AS day, floor, COALESCE(severity, 0) AS severity,
+                   COALESCE(risk_rating, 0) AS risk, lower(COALESCE(responsible_person, '')) AS person
+            FROM observations
+        ), dims AS (
+            SELECT 'risk' AS dimension, '' AS key1, risk AS key2, risk, day FROM src
+            UNION ALL SELECT 'floor_severity', floor, severity, risk, day FROM src
+            UNION ALL SELECT 'person', person, 0, risk, day FROM src
+        )
+        INSERT INTO observation_rollups (dimension, grain, day, key1, key2, count, risk_sum)
+        SELECT dimension, grain, CASE grain WHEN 'd' THEN day ELSE substr(day, 1, 8) || '01' END AS bucket,
+               key1, key2, count(*), sum(risk)
+        FROM dims, (SELECT 'd' AS grain UNION ALL SELECT 'm') AS g
+        GROUP BY dimension, grain, bucket, key1, key2
+    ''')
+
+
+def rebuild_dashboard_rollups():
+    """Recomputes observation_rollups from the observations table. Returns the row count."""
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        _rebuild_rollups(cur)
+        cur.execute("SELECT count(*) FROM observation_rollups")
+        return cur.fetchone()[0]
+
+
+def _trend_bucket(day, trend_bucket):
+    # The first day of the bucket, as date_trunc does (weeks start on Monday).
+    if trend_bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if trend_bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _query_dashboard_rollups(where_sql, params, trend_where_sql, trend_params, trend_bucket):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT key2, sum(count) FROM observation_rollups{where_sql}
+            GROUP BY key2 HAVING sum(count) > 0 ORDER BY key2
+        ''', dict(params, dimension='risk'))
+        risk_distribution = cur.fetchall()
+        cur.execute(f'''
+            SELECT key1, key2, sum(count) FROM observation_rollups{where_sql}
+            GROUP BY key1, key2 HAVING sum(count) > 0 ORDER BY key1, key2
+        ''', dict(params, dimension='floor_severity'))
+        floor_severity = cur.fetchall()
+        cur.execute(f'''
+            SELECT key1, sum(count), sum(risk_sum) FROM observation_rollups{where_sql}
+            GROUP BY key1 HAVING sum(count) > 0 ORDER BY sum(count) DESC, key1
+        ''', dict(params, dimension='person'))
+        people = cur.fetchall()
+        cur.execute(f'''
+            SELECT day, sum(count), sum(risk_sum), sum(CASE WHEN key2 >= :high_risk THEN count ELSE 0 END)
+            FROM observation_rollups{trend_where_sql}
+            GROUP BY day ORDER BY day
+        ''', dict(trend_params, dimension='risk', high_risk=database.HIGH_RISK_THRESHOLD))
+        days = cur.fetchall()
+    # SQLite has no date_trunc: days are added up into their weeks or months here.
+    buckets = {}
+    for day, count, risk_sum, high in days:
+        totals = buckets.setdefault(_trend_bucket(datetime.date.fromisoformat(day), trend_bucket), [0, 0, 0])
+        totals[0] += count
+        totals[1] += risk_sum
+        totals[2] += high
+    trend = [(bucket, count, risk_sum, high) for bucket, (count, risk_sum, high) in sorted(buckets.items()) if count > 0]
+    return risk_distribution, floor_severity, people, trend
+
+
+# --- Photos ---
+def get_photo_from_db(observation_id, variant='original'):
+    column = database.PHOTO_VARIANT_COLUMNS[variant]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COALESCE({column}, photo_bytes), {column} IS NOT NULL FROM observations WHERE id = ?", (observation_id,))
+        row = cur.fetchone()
+    if not row or row[0] is None:
+        return None, False
+    return bytes(row[0]), bool(row[1])
+
+
+def get_photo_key_from_db(observation_id, variant='original'):
+    column, key_column = database.PHOTO_VARIANT_COLUMNS[variant], database.PHOTO_KEY_COLUMNS[variant]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f'''
+            SELECT COALESCE({key_column}, CASE WHEN {column} IS NULL THEN photo_key END), {key_column} IS NOT NULL
+            FROM observations WHERE id = ?
+        ''', (observation_id,))
+        row = cur.fetchone()
+    if not row or row[0] is None:
+        return None, False
+    return row[0], bool(row[1])
+
+
+def get_photo_etag_from_db(observation_id, variant='original'):
+    column = database.PHOTO_VARIANT_COLUMNS[variant]
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT length(photo_bytes), length({column}) FROM observations WHERE id = ?", (observation_id,))
+        return database._photo_etag(observation_id, variant, cur.fetchone())
+
+
+def get_observations_missing_thumbnails(limit, after_id=0):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT id, photo_bytes, photo_key FROM observations
+            WHERE id > ? AND (photo_bytes IS NOT NULL OR photo_key IS NOT NULL)
+              AND ((photo_thumb IS NULL AND photo_thumb_key IS NULL)
+                   OR (photo_excel_thumb IS NULL AND photo_excel_thumb_key IS NULL))
+            ORDER BY id ASC
+            LIMIT ?
+        ''', (after_id, limit))
+        return [(row[0], bytes(row[1]) if row[1] is not None else None, row[2]) for row in cur.fetchall()]
+
+
+def get_inline_photos(limit, after_id=0):
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT id, photo_bytes, photo_thumb, photo_excel_thumb FROM observations
+            WHERE id > ? AND (photo_bytes IS NOT NULL OR photo_thumb IS NOT NULL OR photo_excel_thumb IS NOT NULL)
+            ORDER BY id ASC
+            LIMIT ?
+        ''', (after_id, limit))
+        return [
+            (row[0], {field: bytes(value) if value is not None else None
+                      for field, value in zip(('photo_bytes', 'photo_thumb', 'photo_excel_thumb'), row[1:])})
+            for row in cur.fetchall()
+        ]
+
+
+def update_photo_variants(rows):
+    with get_db_connection(write=True) as conn:
+        conn.cursor().executemany('''
+            UPDATE observations
+            SET photo_bytes = ?, photo_thumb = ?, photo_excel_thumb = ?,
+                photo_key = COALESCE(?, photo_key),
+                photo_thumb_key = COALESCE(?, photo_thumb_key),
+                photo_excel_thumb_key = COALESCE(?, photo_excel_thumb_key),
+                updated_at = ?
+            WHERE id = ?
+        ''', [(photo.get('photo_bytes'), photo.get('photo_thumb'), photo.get('photo_excel_thumb'),
+               photo.get('photo_key'), photo.get('photo_thumb_key'), photo.get('photo_excel_thumb_key'),
+               _now(), observation_id) for observation_id, photo in rows])
+
+
+def get_referenced_photo_keys(keys):
+    keys = list(keys)
+    if not keys:
+        return set()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT value FROM json_each(?) AS k
+            WHERE EXISTS (SELECT 1 FROM observations WHERE photo_key = k.value)
+               OR EXISTS (SELECT 1 FROM observations WHERE photo_thumb_key = k.value)
+               OR EXISTS (SELECT 1 FROM observations WHERE photo_excel_thumb_key = k.value)
+        ''', (json.dumps(keys),))
+        return {row[0] for row in cur.fetchall()}
+
+
+# --- Export ---
+def get_export_version(search_term=None, filters=None):
+    from_sql, where_sql, params = database._build_report_filter(search_term, filters)
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f"SELECT max(id) AS max_id, count(*) AS row_count, max(updated_at) AS last_modified FROM {from_sql}{where_sql}", params)
+        version = cur.fetchone()
+    version['last_modified'] = _parse_timestamp(version['last_modified'])
+    return version
+
+
+def iter_observations_for_export(search_term=None, sort_by='date_oldest', fetch_size=database.EXPORT_FETCH_SIZE, filters=None):
+    """Yields the observations for the Excel export, `fetch_size` rows at a time (see
+    database.iter_observations_for_export). The read transaction keeps the export on one
+    snapshot while writers carry on."""
+    from_sql, where_sql, params = database._build_report_filter(search_term, filters)
+    _, order_sql = database._build_order_by(sort_by, search_term)
+    with get_db_connection() as conn:
+        cur = conn.cursor(dict_rows=True)
+        cur.execute(f'''
+            SELECT id, date_str, floor, location, description, impact, likelihood, severity,
+                   risk_rating, corrective_action, responsible_person, deadline, photo_excel_thumb,
+                   CASE WHEN photo_excel_thumb IS NULL AND photo_excel_thumb_key IS NULL THEN photo_bytes END AS photo_bytes,
+                   photo_excel_thumb_key,
+                   CASE WHEN photo_excel_thumb_key IS NULL THEN photo_key END AS photo_key
+            FROM {from_sql}{where_sql}{order_sql}
+        ''', params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def delete_observation_from_db(observation_id):
+    with get_db_connection(write=True) as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM observations WHERE id = ? RETURNING photo_key, photo_thumb_key, photo_excel_thumb_key", (observation_id,))
+        row = cur.fetchone()
+        cur.execute("UPDATE observations SET duplicate_of = NULL, updated_at = ? WHERE duplicate_of = ?", (_now(), observation_id))
+    database.get_report_cache().mark_stale()
+    print(f"Observation with ID {observation_id} deleted from database.")
+    return [key for key in row or () if key]